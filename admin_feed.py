@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Admin Live Feed
+New orders, new product requests and status changes pushed to the open
+admin pages (server-sent events), so /admin and /admin/requests update
+row by row instead of being reloaded to re-run their full list queries.
+
+Every order/request write appends a row to `admin_events` in the same
+transaction (see Repository._record_events); its id is the change cursor.
+A page renders its list together with the newest event id and streams
+from there: nothing written between the list query and the stream is lost,
+and a reconnecting stream resumes from Last-Event-ID.
+
+One thread per app process polls the table (an `id > cursor` read on the
+primary key, ADMIN_EVENTS_POLL_S) while at least one stream is open and
+keeps the latest events in memory; streams wait on it rather than each
+querying the database. A stream that fell further behind than the buffer
+catches up from the table. Streams hold a server thread each (gunicorn's
+gthread workers, see gunicorn.conf.py), so they are capped per process
+(ADMIN_EVENTS_MAX_STREAMS, 503 over it) and end after ADMIN_EVENTS_STREAM_S
+for the browser to reconnect; pages that can't stream poll the JSON route.
+
+Routes (registered on the app by init_admin_feed):
+    GET  /admin/events          text/event-stream (?after=<id> or Last-Event-ID)
+    GET  /api/admin/events      JSON: {"events": [...], "cursor": id} (?after=<id>&limit=)
+
+Usage:
+    python admin_feed.py tail               # print events as they come
+    python admin_feed.py prune              # forget events older than ADMIN_EVENTS_KEEP_S
+
+Environment:
+    ADMIN_EVENTS_POLL_S         how often the feed looks for new events (default 1)
+    ADMIN_EVENTS_STREAM_S       a stream ends (and the browser reconnects) after this (default 120)
+    ADMIN_EVENTS_MAX_STREAMS    open streams per app process (default 4)
+    ADMIN_EVENTS_KEEP_S         events are kept this long (default 604800)
+    ADMIN_EVENTS_PRUNE_EVERY    the app drops older events once per this many it writes (default 1000);
+                                the events.prune job and `prune` do the same on a schedule
+"""
+
+import os
+import json
+import time
+import logging
+import argparse
+import threading
+from collections import deque
+
+from dotenv import load_dotenv
+from flask import Response, request, session, jsonify
+
+from repository import open_repository, is_postgres_url, ADMIN_EVENTS_KEEP_S as KEEP_S
+from workflow import WORKFLOWS
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+POLL_S = float(os.getenv("ADMIN_EVENTS_POLL_S", "1"))
+STREAM_S = float(os.getenv("ADMIN_EVENTS_STREAM_S", "120"))
+MAX_STREAMS = int(os.getenv("ADMIN_EVENTS_MAX_STREAMS", "4"))
+HEARTBEAT_S = 15  # a comment line now and then keeps proxies from timing the stream out
+RETRY_MS = 3000
+BUFFER_SIZE = 500
+MAX_LIMIT = 500
+
+logger = logging.getLogger(__name__)
+
+
+def event(row):
+    """An admin_events row as sent to the pages"""
+    return {"id": row["id"], "kind": row["kind"], "item_id": row["item_id"], "action": row["action"],
+            "status": row["status"], "at": row["created_at"], "data": json.loads(row["payload"])}
+
+
+def sse(entry):
+    return f"id: {entry['id']}\ndata: {json.dumps(entry)}\n\n"
+
+
+class EventFeed:
+    """The latest admin events of this process, polled by one thread while streams are open"""
+
+    def __init__(self, repo, poll=POLL_S, size=BUFFER_SIZE, max_streams=MAX_STREAMS):
+        self.repo = repo
+        self.poll = poll
+        self.max_streams = max_streams
+        self.events = deque(maxlen=size)
+        self.floor = 0      # the buffer holds every event after this id
+        self.cursor = None  # newest id the poller has read (None until it started)
+        self.streams = 0
+        self.running = False
+        self.changed = threading.Condition()
+
+    def subscribe(self):
+        """Count a new stream in (starting the poller); False when the process has too many"""
+        with self.changed:
+            if self.streams >= self.max_streams:
+                return False
+            self.streams += 1
+            if not self.running:
+                # idle until now: start again from the newest event rather than replaying the gap
+                self.running, self.cursor = True, None
+                threading.Thread(target=self._run, name="admin-feed", daemon=True).start()
+            return True
+
+    def unsubscribe(self):
+        with self.changed:
+            self.streams -= 1
+
+    def _run(self):
+        while True:
+            with self.changed:
+                if not self.streams:
+                    self.running = False
+                    return
+                cursor = self.cursor
+            try:
+                if cursor is None:
+                    rows, cursor = [], self.repo.latest_admin_event(primary=True)
+                else:
+                    rows = self.repo.admin_events(cursor, MAX_LIMIT)
+            except Exception as e:
+                logger.error(f"Admin feed poll failed: {e}")
+                rows = None
+            finally:
+                self.repo.release()
+            if rows is not None:
+                self._publish(rows, cursor)
+            if not rows or len(rows) < MAX_LIMIT:
+                time.sleep(self.poll)
+
+    def _publish(self, rows, cursor):
+        with self.changed:
+            if self.cursor is None:
+                self.events.clear()
+                self.floor = cursor
+            for row in rows:
+                if len(self.events) == self.events.maxlen:
+                    self.floor = self.events[0]["id"]
+                self.events.append(event(row))
+            self.cursor = rows[-1]["id"] if rows else cursor
+            self.changed.notify_all()
+
+    def wait(self, after, timeout):
+        """Events with an id above `after`, waiting up to `timeout` seconds for the first one"""
+        deadline = time.monotonic() + timeout
+        with self.changed:
+            while True:
+                if self.cursor is not None:
+                    if after < self.floor:
+                        break  # older than the buffer
+                    events = [entry for entry in self.events if entry["id"] > after]
+                    if events:
+                        return events
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    return []
+                self.changed.wait(left)
+        return [event(row) for row in self.repo.admin_events(after, MAX_LIMIT)]
+
+
+def _default_is_admin():
+    return bool(session.get("admin"))
+
+
+def _cursor(value):
+    try:
+        return max(int(value), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+def init_admin_feed(app, repo, is_admin=_default_is_admin, feed=None):
+    """The admin event stream and its JSON fallback; returns the EventFeed"""
+    feed = feed or EventFeed(repo)
+    # status labels for the rows the pages add themselves
+    app.jinja_env.globals["workflows"] = WORKFLOWS
+
+    def admin_events():
+        if not is_admin():
+            return jsonify({"error": "Admin access required"}), 401
+        after = _cursor(request.headers.get("Last-Event-ID") or request.args.get("after"))
+        if after is None:
+            after = repo.latest_admin_event()
+        if not feed.subscribe():
+            return jsonify({"error": "Too many open streams"}), 503, {"Retry-After": str(int(STREAM_S))}
+
+        def stream(after):
+            yield f"retry: {RETRY_MS}\n\n"
+            deadline = time.monotonic() + STREAM_S
+            while True:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    return
+                events = feed.wait(after, min(HEARTBEAT_S, left))
+                if events:
+                    after = events[-1]["id"]
+                    yield "".join(sse(entry) for entry in events)
+                else:
+                    yield ": ping\n\n"
+
+        response = Response(stream(after), mimetype="text/event-stream",
+                            headers={"X-Accel-Buffering": "no"})  # nginx: pass each event on at once
+        # the server closes the response when the client leaves, even before the first event
+        response.call_on_close(feed.unsubscribe)
+        response.call_on_close(repo.release)
+        return response
+
+    def api_admin_events():
+        if not is_admin():
+            return jsonify({"error": "Admin access required"}), 401
+        after = _cursor(request.args.get("after"))
+        if after is None:
+            return jsonify({"success": True, "events": [], "cursor": repo.latest_admin_event()})
+        limit = min(max(request.args.get("limit", 100, type=int), 1), MAX_LIMIT)
+        events = [event(row) for row in repo.admin_events(after, limit)]
+        return jsonify({"success": True, "events": events, "cursor": events[-1]["id"] if events else after})
+
+    app.add_url_rule("/admin/events", "admin_events", admin_events)
+    app.add_url_rule("/api/admin/events", "api_admin_events", api_admin_events)
+    app.extensions["admin_feed"] = feed
+    return feed
+
+
+# -- command line ------------------------------------------------------------
+
+def _tail(repo, after):
+    print(f"📡 Following admin events after #{after} (Ctrl+C to stop)")
+    try:
+        while True:
+            rows = repo.admin_events(after, MAX_LIMIT)
+            for row in rows:
+                entry = event(row)
+                print(f"#{entry['id']} {entry['kind']} {entry['item_id']} {entry['action']} {entry['status']} "
+                      f"{json.dumps(entry['data'], ensure_ascii=False)}")
+                after = entry["id"]
+            repo.release()
+            if len(rows) < MAX_LIMIT:
+                time.sleep(POLL_S)
+    except KeyboardInterrupt:
+        pass
+
+
+def main():
+    load_dotenv()
+    database_url = os.getenv("DATABASE_URL", "")
+    default = database_url if is_postgres_url(database_url) else \
+        os.getenv("DB_PATH", os.path.join(BASE_DIR, "database.db"))
+
+    parser = argparse.ArgumentParser(description="Follow or prune the admin event feed")
+    parser.add_argument("--db", default=default, help="SQLite path or PostgreSQL URL")
+    commands = parser.add_subparsers(dest="command", required=True)
+    command = commands.add_parser("tail", help="print events as they come")
+    command.add_argument("--after", type=int, help="start after this event id (default: the newest)")
+    command = commands.add_parser("prune", help="delete old events")
+    command.add_argument("--keep", type=float, default=KEEP_S, help="seconds of events to keep")
+    args = parser.parse_args()
+
+    repo = open_repository(args.db)
+    try:
+        repo.init_schema()
+        if args.command == "prune":
+            deleted = repo.prune_admin_events(time.time() - args.keep)
+            print(f"🧹 Deleted {deleted} events older than {args.keep / 3600:.0f} h")
+        else:
+            _tail(repo, repo.latest_admin_event(primary=True) if args.after is None else args.after)
+    finally:
+        repo.close()
+
+
+if __name__ == "__main__":
+    main()
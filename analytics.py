@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Sales Analytics
+Admin reports served from the rollup tables that the repository keeps
+current on every write (sales_daily: orders/units/revenue per day x product
+x wilaya; orders_daily: whole orders per day x wilaya; request_status_daily:
+product request counts per status). A week's report reads a few hundred
+rollup rows instead of scanning orders.
+Days are UTC, like created_at.
+
+Routes (registered on the app by init_analytics):
+    GET  /admin/analytics              dashboard (?days=7|30|90|365)
+    GET  /api/analytics/<report>       JSON: top_products, by_state, by_day, requests
+    POST /admin/analytics/rebuild      recompute the rollups from orders/product_requests
+                                       (as a background job with JOBS_ENABLED, see jobs.py)
+
+Usage (rebuild after bulk imports or manual SQL edits):
+    python analytics.py rebuild             # everything
+    python analytics.py rebuild --days 7    # only the last week
+"""
+
+import os
+import time
+import argparse
+from datetime import datetime, timedelta
+
+from flask import render_template, request, redirect, url_for, session, flash, jsonify
+
+PERIODS = (7, 30, 90, 365)
+
+
+def _default_is_admin():
+    return bool(session.get("admin"))
+
+
+def date_range(days, today=None):
+    """(since, until) day strings covering the last `days` days including today"""
+    today = today or datetime.utcnow().date()
+    return (today - timedelta(days=days - 1)).isoformat(), today.isoformat()
+
+
+def _rows(rows):
+    return [dict(row) for row in rows]
+
+
+def reports(repo, days, limit=10):
+    since, until = date_range(days)
+    with repo.read_snapshot():
+        return {
+            "since": since,
+            "until": until,
+            "top_products": _rows(repo.top_products(since, until, limit)),
+            "by_state": _rows(repo.revenue_by_state(since, until)),
+            "by_day": _rows(repo.sales_by_day(since, until)),
+            "requests": _rows(repo.request_status_totals(since, until)),
+        }
+
+
+def init_analytics(app, repo, is_admin=_default_is_admin, jobs=None):
+    """The /admin/analytics dashboard and its JSON API (rebuilds go to `jobs` when workers run)"""
+
+    def period():
+        days = request.args.get("days", 7, type=int)
+        return days if days in PERIODS else 7
+
+    def admin_analytics():
+        if not is_admin():
+            return redirect(url_for("login"))
+        days = period()
+        started = time.perf_counter()
+        data = reports(repo, days)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        totals = {key: sum(row[key] or 0 for row in data["by_day"]) for key in ("order_count", "units", "revenue")}
+        return render_template("admin_analytics.html", data=data, totals=totals, days=days,
+                               periods=PERIODS, elapsed_ms=elapsed_ms)
+
+    def api_analytics(report):
+        if not is_admin():
+            return jsonify({"error": "Admin access required"}), 401
+        since, until = date_range(period())
+        limit = max(1, min(request.args.get("limit", 10, type=int), 100))
+        queries = {
+            "top_products": lambda: repo.top_products(since, until, limit),
+            "by_state": lambda: repo.revenue_by_state(since, until),
+            "by_day": lambda: repo.sales_by_day(since, until),
+            "requests": lambda: repo.request_status_totals(since, until),
+        }
+        if report not in queries:
+            return jsonify({"error": f"Unknown report: {report}"}), 404
+        return jsonify({"success": True, "since": since, "until": until, "rows": _rows(queries[report]())})
+
+    def admin_analytics_rebuild():
+        if not is_admin():
+            return redirect(url_for("login"))
+        if jobs is not None and jobs.enabled:
+            # one rebuild per minute however often the button is pressed
+            if jobs.enqueue("analytics.rebuild", unique_key=f"analytics.rebuild@{int(time.time() // 60)}"):
+                flash("ستتم إعادة حساب الإحصائيات في الخلفية خلال لحظات.", "success")
+            else:
+                flash("إعادة حساب الإحصائيات جارية بالفعل.", "success")
+            return redirect(url_for("admin_analytics"))
+        started = time.perf_counter()
+        repo.rebuild_rollups()
+        flash(f"تمت إعادة حساب الإحصائيات في {time.perf_counter() - started:.1f} ثانية.", "success")
+        return redirect(url_for("admin_analytics"))
+
+    app.add_url_rule("/admin/analytics", "admin_analytics", admin_analytics)
+    app.add_url_rule("/api/analytics/<report>", "api_analytics", api_analytics)
+    app.add_url_rule("/admin/analytics/rebuild", "admin_analytics_rebuild", admin_analytics_rebuild,
+                     methods=["POST"])
+
+
+def main():
+    from dotenv import load_dotenv
+    from repository import open_repository, is_postgres_url
+
+    load_dotenv()
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    database_url = os.getenv("DATABASE_URL", "")
+    default = database_url if is_postgres_url(database_url) else \
+        os.getenv("DB_PATH", os.path.join(base_dir, "database.db"))
+
+    parser = argparse.ArgumentParser(description="Maintain the sales rollup tables")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.add_argument("--db", default=default, help="SQLite path or PostgreSQL URL")
+    parser.add_argument("--days", type=int, help="only rebuild the last N days")
+    args = parser.parse_args()
+
+    repo = open_repository(args.db)
+    repo.init_schema()
+    since = date_range(args.days)[0] if args.days else None
+    started = time.perf_counter()
+    repo.rebuild_rollups(since)
+    repo.close()
+    print(f"✓ Rollups rebuilt{f' since {since}' if since else ''} in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,26 @@
 import os
-import sqlite3
 import logging
 from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, Response
-from werkzeug.utils import secure_filename
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
 import csv
 import io
+from contextlib import closing
+from vendor_assets import register_vendor_assets
+from profiling import init_profiling
+from query_log import init_query_log
+from repository import open_repository, is_postgres_url
+from cart import init_cart
+from analytics import init_analytics
+from jobs import init_jobs
+from queues import init_queues
+from admin_feed import init_admin_feed
+from catalog import init_catalog
+from facets import init_facets
+from recommend import init_recommendations
+from http_cache import init_http_cache, product_keys
+from uploads import init_uploads, SavedImage
+from workflow import REQUESTS, InvalidTransition
 
 # Load environment variables
 from dotenv import load_dotenv
@@ -17,100 +31,64 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 
 app = Flask(__name__)
 app.secret_key = os.getenv('SECRET_KEY', 'your-fallback-secret-key-change-this')
+register_vendor_assets(app)
+http_cache = init_http_cache(app)
+init_profiling(app)
+init_query_log(app)
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 UPLOAD_FOLDER = os.path.join("static", "uploads")
 app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
 os.makedirs(os.path.join(BASE_DIR, UPLOAD_FOLDER), exist_ok=True)
+uploads = init_uploads(app, os.path.join(BASE_DIR, UPLOAD_FOLDER))
 
 # Load admin credentials from environment variables
 ADMIN_USERNAME = os.getenv('ADMIN_USERNAME', 'admin')
 ADMIN_PASSWORD = os.getenv('ADMIN_PASSWORD', 'changeme')
-DB_PATH = os.path.join(BASE_DIR, "database.db")
+DB_PATH = os.getenv('DB_PATH', os.path.join(BASE_DIR, "database.db"))
+# A PostgreSQL DATABASE_URL takes over from the local SQLite file
+DATABASE_URL = os.getenv('DATABASE_URL', '')
+USE_POSTGRES = is_postgres_url(DATABASE_URL)
+
+# Optional read replica for catalog/reporting reads: a replica DSN under
+# PostgreSQL, or a snapshot file refreshed from DB_PATH under SQLite
+DB_REPLICA = os.getenv('DATABASE_REPLICA_URL') if USE_POSTGRES else os.getenv('DB_REPLICA_PATH')
+
+repo = open_repository(DATABASE_URL if USE_POSTGRES else DB_PATH, DB_REPLICA)
+repo.init_app(app)
+init_cart(app, repo)
+jobs = init_jobs(app, repo)
+init_analytics(app, repo, jobs=jobs)
+init_queues(app, repo)
+init_admin_feed(app, repo)
+category_nav = init_catalog(app, repo)
+facet_index = init_facets(app, repo)
+recommendations = init_recommendations(app, repo)
+
+def catalog_changed(pid=None):
+    """Drop cached catalog views after a catalog write (the product page bundles showing `pid`, or all
+    of them for category and bulk changes, and proxy copies)"""
+    category_nav.invalidate()
+    facet_index.invalidate()
+    repo.invalidate_product_bundles(pid)  # all of them when pid is None: category names and lists
+    http_cache.purge(pid)
+
+def images_saved(images):
+    """Have a worker make the placeholders of images saved without them (JOBS_ENABLED)"""
+    if jobs.enabled and images:
+        jobs.enqueue("images.measure", {"paths": [image.path for image in images]})
 
 def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """The request thread's long-lived connection (see repository.py)"""
+    return repo.connection()
 
 def init_db():
     """Initialize database with proper error handling for production"""
     try:
-        logging.info(f"Initializing database at: {DB_PATH}")
-        logging.info(f"Admin credentials from env: username='{ADMIN_USERNAME}', password_length={len(ADMIN_PASSWORD)}")
+        logging.info(f"Initializing database at: {'PostgreSQL (DATABASE_URL)' if USE_POSTGRES else DB_PATH}")
         
-        with get_db_connection() as conn:
-            conn.execute("""
-                CREATE TABLE IF NOT EXISTS products (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT NOT NULL,
-                    price REAL NOT NULL DEFAULT 0,
-                    desc TEXT,
-                    image TEXT,
-                    category_id INTEGER,
-                    FOREIGN KEY(category_id) REFERENCES categories(id)
-                )
-            """)
-            conn.execute("""
-                CREATE TABLE IF NOT EXISTS orders (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    product_id INTEGER,
-                    quantity INTEGER,
-                    first_name TEXT,
-                    last_name TEXT,
-                    state TEXT,
-                    phone TEXT,
-                    email TEXT,
-                    address TEXT,
-                    notes TEXT,
-                    total_price REAL,
-                    FOREIGN KEY(product_id) REFERENCES products(id)
-                )
-            """)
-            # Product requests table for inquiries
-            conn.execute("""
-                CREATE TABLE IF NOT EXISTS product_requests (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    product_id INTEGER NOT NULL,
-                    user_name TEXT NOT NULL,
-                    email TEXT,
-                    phone TEXT NOT NULL,
-                    state TEXT NOT NULL,
-                    address TEXT,
-                    quantity INTEGER NOT NULL DEFAULT 1,
-                    message TEXT,
-                    status TEXT DEFAULT 'pending',
-                    total_price REAL,
-                    created_at DATETIME NOT NULL DEFAULT (datetime('now')),
-                    FOREIGN KEY(product_id) REFERENCES products(id)
-                )
-            """)
-            # Admins table for authentication
-            conn.execute("""
-                CREATE TABLE IF NOT EXISTS admins (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    username TEXT UNIQUE NOT NULL,
-                    password_hash TEXT NOT NULL
-                )
-            """)
-            # Add categories table
-            conn.execute("""
-                CREATE TABLE IF NOT EXISTS categories (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT NOT NULL UNIQUE,
-                    description TEXT
-                )
-            """)
-            # Add product_images table for multiple images per product
-            conn.execute("""
-                CREATE TABLE IF NOT EXISTS product_images (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    product_id INTEGER NOT NULL,
-                    image_path TEXT NOT NULL,
-                    is_primary BOOLEAN DEFAULT FALSE,
-                    FOREIGN KEY(product_id) REFERENCES products(id) ON DELETE CASCADE
-                )
-            """)
+        repo.init_schema()
+        with closing(repo.connect()) as conn, conn:
             # Seed default admin if not exists
             result = conn.execute(
                 "INSERT OR IGNORE INTO admins (username, password_hash) VALUES (?, ?)",
@@ -139,57 +117,43 @@ init_db()
 # الصفحة الرئيسية - عرض المنتجات
 @app.route("/")
 def index():
-    with get_db_connection() as conn:
-        products = conn.execute("SELECT * FROM products ORDER BY id DESC").fetchall()
+    products = repo.list_products()
     return render_template("index.html", products=products)
 
 # صفحة المنتج - تعرض تفاصيل المنتج + زر اضافة للكمية
 @app.route("/product/<int:pid>")
 def product(pid):
-    with get_db_connection() as conn:
-        product = conn.execute("SELECT * FROM products WHERE id=?", (pid,)).fetchone()
-        if not product:
-            flash("المنتج غير موجود.", "error")
-            return redirect(url_for("index"))
-        
-        # Fetch all images for this product
-        images = conn.execute("SELECT * FROM product_images WHERE product_id=? ORDER BY is_primary DESC, id ASC", (pid,)).fetchall()
+    # product, images and related products in one precomputed bundle
+    bundle = repo.product_bundle(pid)
+    if not bundle:
+        flash("المنتج غير موجود.", "error")
+        return redirect(url_for("index"))
     
-    return render_template("product.html", product=product, images=images)
+    also_ordered = recommendations.products(pid)
+    product_keys(*bundle["related"], *also_ordered)  # purged when any product shown here changes
+    return render_template("product.html", product=bundle["product"], images=bundle["images"],
+                           related=bundle["related"], also_ordered=also_ordered)
 
 # استقبال الطلب مباشرة من صفحة المنتج - عرض نموذج المعلومات
 @app.route("/order/<int:pid>", methods=["GET", "POST"])
 def order(pid):
-    print(f"[DEBUG] Order route called - PID: {pid}, Method: {request.method}")
-    print(f"[DEBUG] Form data: {dict(request.form)}")
-    print(f"[DEBUG] Args data: {dict(request.args)}")
-    
-    with get_db_connection() as conn:
-        product = conn.execute("SELECT * FROM products WHERE id=?", (pid,)).fetchone()
+    product = repo.get_product(pid)
     if not product:
-        print(f"[DEBUG] Product not found for PID: {pid}")
         flash("المنتج غير موجود", "error")
         return redirect(url_for("index"))
     
-    print(f"[DEBUG] Product found: {product['name']}")
-    
     if request.method == "GET":
-        print(f"[DEBUG] GET request - showing customer info form")
         # عرض نموذج المعلومات
         quantity = request.args.get("quantity", 1, type=int)
-        print(f"[DEBUG] Quantity from args: {quantity}")
         return render_template("customer_info.html", product=product, quantity=quantity)
     
     # Check if this is just a POST from product page with quantity
     if "first_name" not in request.form:
-        print(f"[DEBUG] POST from product page (no first_name) - redirecting to GET with quantity")
         # This is from the product page, just get quantity and redirect to GET to show customer info form
         quantity = request.form.get("quantity", 1, type=int)
-        print(f"[DEBUG] Quantity from form: {quantity}")
         return redirect(url_for("order", pid=pid, quantity=quantity))
     
     # POST - معالجة النموذج
-    print(f"[DEBUG] Processing customer info form")
     quantity = request.form.get("quantity", 1, type=int)
     first_name = request.form.get("first_name", "").strip()
     last_name = request.form.get("last_name", "").strip()
@@ -197,51 +161,21 @@ def order(pid):
     state = request.form.get("state", "").strip()
     address = request.form.get("address", "").strip()
     notes = request.form.get("notes", "").strip()
-    
-    print(f"[DEBUG] Customer info: name='{first_name}', phone='{phone}', state='{state}', quantity={quantity}")
 
     # التحقق من الحقول المطلوبة (العنوان اختياري)
     if not all([first_name, phone, state]):
-        print(f"[DEBUG] Validation failed - missing required fields")
+        app.logger.debug("Order form for product %s is missing required fields", pid)
         flash("الرجاء تعبئة الحقول المطلوبة: الاسم، رقم الهاتف، والولاية", "error")
         return render_template("customer_info.html", product=product, quantity=quantity)
 
-    # حساب السعر الإجمالي
-    total_price = float(product["price"]) * quantity
-
-    # حفظ الطلب والطلبات في قاعدة البيانات
+    # حفظ الطلب في جدول الطلبات وجدول طلبات المنتجات في معاملة واحدة
+    email = request.form.get("email", "").strip() or None  # Optional email
     try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            # حفظ في جدول الطلبات (orders)
-            cursor.execute(
-                """
-                INSERT INTO orders 
-                (product_id, quantity, first_name, last_name, phone, state, address, notes, total_price)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """,
-                (pid, quantity, first_name, last_name, phone, state, address, notes, total_price)
-            )
-            order_id = cursor.lastrowid
-            
-            # حفظ في جدول طلبات المنتجات (product_requests) أيضاً
-            full_name = f"{first_name} {last_name}".strip()
-            email = request.form.get("email", "").strip() or None  # Optional email
-            cursor.execute(
-                """
-                INSERT INTO product_requests 
-                (product_id, user_name, email, phone, state, address, quantity, message, total_price, status)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 'ordered')
-                """,
-                (pid, full_name, email, phone, state, address, quantity, notes, total_price)
-            )
-            request_id = cursor.lastrowid
-            
-            conn.commit()
+        order_id = repo.create_order(product, quantity, first_name, phone, state, last_name=last_name,
+                                     email=email, address=address, notes=notes, log_request=True)
 
         # توجيه المستخدم إلى صفحة تأكيد الطلب
-        print(f"[DEBUG] Order saved successfully with ID: {order_id}, Request ID: {request_id}")
-        print(f"[DEBUG] Redirecting to order_confirmation with ID: {order_id}")
+        app.logger.debug("Order %s saved for product %s", order_id, pid)
         return redirect(url_for("order_confirmation", order_id=order_id))
     except Exception as e:
         print("Error saving order:", e)
@@ -251,19 +185,11 @@ def order(pid):
 # تأكيد الطلب - صفحة تعرض تفاصيل الطلب
 @app.route("/order/confirmation/<int:order_id>")
 def order_confirmation(order_id):
-    print(f"[DEBUG] Order confirmation route called with ID: {order_id}")
-    with get_db_connection() as conn:
-        order = conn.execute("""
-            SELECT o.*, p.name as product_name, p.price as unit_price
-            FROM orders o JOIN products p ON o.product_id = p.id
-            WHERE o.id = ?
-        """, (order_id,)).fetchone()
+    order = repo.get_order(order_id)
     if not order:
-        print(f"[DEBUG] Order not found for ID: {order_id}")
         flash("الطلب غير موجود.", "error")
         return redirect(url_for("index"))
-    print(f"[DEBUG] Order found: {order['product_name']} x {order['quantity']}")
-    return render_template("order_confirmation.html", order=order)
+    return render_template("order_confirmation.html", order=order, items=repo.get_order_items(order_id))
 
 # تسجيل الدخول للأدمن
 @app.route("/login", methods=["GET", "POST"])
@@ -272,10 +198,6 @@ def login():
         username = request.form.get("username", "").strip()
         password = request.form.get("password", "").strip()
         
-        # Debug logging
-        print(f"[DEBUG] Login attempt - Username: '{username}', Password length: {len(password)}")
-        print(f"[DEBUG] Form data: {dict(request.form)}")
-        
         # Look up admin in DB and verify password hash
         with get_db_connection() as conn:
             admin_row = conn.execute(
@@ -284,18 +206,11 @@ def login():
             ).fetchone()
         
         if admin_row:
-            print(f"[DEBUG] Found user: {admin_row['username']}")
-            password_valid = check_password_hash(admin_row["password_hash"], password)
-            print(f"[DEBUG] Password valid: {password_valid}")
-            
-            if password_valid:
+            if check_password_hash(admin_row["password_hash"], password):
                 session["admin"] = True
-                print(f"[DEBUG] Login successful, redirecting to admin")
                 return redirect(url_for("admin"))
-        else:
-            print(f"[DEBUG] No user found with username: '{username}'")
-        
-        print(f"[DEBUG] Login failed, showing error message")
+
+        app.logger.debug("Failed admin login")
         flash("اسم المستخدم أو كلمة المرور غير صحيحة.", "error")
     return render_template("login.html")
 
@@ -355,37 +270,32 @@ def admin():
                     products_with_errors.append(f"المنتج #{int(index)+1}: السعر يجب أن يكون قيمة موجبة")
                     continue
                 
-                # Handle image uploads (multiple images)
-                image_filenames = []
-                for image_file in image_files:
-                    if image_file and image_file.filename != "":
-                        # Validate file type
-                        if not image_file.filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.webp')):
-                            products_with_errors.append(f"المنتج #{int(index)+1}: نوع الصورة غير مدعوم")
-                            continue
-                            
-                        filename = secure_filename(image_file.filename)
-                        target = os.path.join(BASE_DIR, app.config["UPLOAD_FOLDER"], filename)
-                        image_file.save(target)
-                        image_filenames.append(f"uploads/{filename}")
+                # Handle image uploads (multiple images, checked and saved in parallel)
+                images, image_errors = uploads.save(image_files, placeholders=not jobs.enabled)
+                products_with_errors.extend(f"المنتج #{int(index)+1}: {error}" for error in image_errors)
+                main = images[0] if images else SavedImage(None, None, None, None)
                 
                 # Add product to database
                 try:
                     with get_db_connection() as conn:
                         cursor = conn.cursor()
                         # Insert product and get its ID
-                        cursor.execute("INSERT INTO products (name, price, desc, image, category_id) VALUES (?, ?, ?, ?, ?)",
-                                     (name, price, desc, image_filenames[0] if image_filenames else None, category_id))
+                        cursor.execute('INSERT INTO products (name, price, "desc", image, image_width, image_height, '
+                                       'image_placeholder, category_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                                     (name, price, desc, main.path, main.width, main.height, main.placeholder, category_id))
                         product_id = cursor.lastrowid
                         
                         # Insert all images into product_images table
-                        for i, image_path in enumerate(image_filenames):
+                        for i, image in enumerate(images):
                             is_primary = (i == 0)  # First image is primary
-                            cursor.execute("INSERT INTO product_images (product_id, image_path, is_primary) VALUES (?, ?, ?)",
-                                         (product_id, image_path, is_primary))
+                            cursor.execute("INSERT INTO product_images (product_id, image_path, is_primary, width, height, "
+                                           "placeholder) VALUES (?, ?, ?, ?, ?, ?)",
+                                         (product_id, image.path, is_primary, image.width, image.height, image.placeholder))
                         
                         conn.commit()
                         products_added += 1
+                        catalog_changed()
+                        images_saved(images)
                 except Exception as e:
                     products_with_errors.append(f"المنتج #{int(index)+1}: خطأ في حفظ المنتج - {str(e)}")
             
@@ -412,66 +322,17 @@ def admin():
     sort_by = request.args.get('sort', 'id')
     sort_order = request.args.get('order', 'DESC')
     
-    # Build query based on filters
-    base_query = """
-        SELECT p.*, c.name as category_name 
-        FROM products p 
-        LEFT JOIN categories c ON p.category_id = c.id
-    """
-    
-    count_query = "SELECT COUNT(*) as count FROM products p"
-    
-    where_clauses = []
-    params = []
-    
-    if search_query:
-        where_clauses.append("(p.name LIKE ? OR p.desc LIKE ?)")
-        params.extend([f"%{search_query}%", f"%{search_query}%"])
-        count_query += " WHERE p.name LIKE ? OR p.desc LIKE ?"
-    
-    if category_filter:
-        category_clause = "p.category_id = ?"
-        if where_clauses:
-            where_clauses.append(category_clause)
-        else:
-            where_clauses.append(category_clause)
-        params.append(category_filter)
-        if search_query:
-            count_query += " AND p.category_id = ?"
-        else:
-            count_query += " WHERE p.category_id = ?"
-    
-    if where_clauses:
-        base_query += " WHERE " + " AND ".join(where_clauses)
-    
-    # Add sorting
-    valid_sort_columns = ['id', 'name', 'price']
-    valid_sort_orders = ['ASC', 'DESC']
-    
-    if sort_by in valid_sort_columns and sort_order in valid_sort_orders:
-        base_query += f" ORDER BY p.{sort_by} {sort_order}"
-    else:
-        base_query += " ORDER BY p.id DESC"
-    
-    with get_db_connection() as conn:
-        products = conn.execute(base_query, params).fetchall()
-        orders = conn.execute("SELECT o.id, p.name as product_name, o.quantity, o.first_name, o.last_name, o.state, o.phone, (o.quantity * p.price) as total_price FROM orders o JOIN products p ON o.product_id = p.id ORDER BY o.id DESC").fetchall()
-        categories = conn.execute("SELECT * FROM categories ORDER BY name").fetchall()
-        
-        # Get total product count for statistics
-        if search_query or category_filter:
-            count_params = []
-            if search_query:
-                count_params.extend([f"%{search_query}%", f"%{search_query}%"])
-            if category_filter:
-                count_params.append(category_filter)
-            total_products = conn.execute(count_query, count_params).fetchone()['count']
-        else:
-            total_products = conn.execute("SELECT COUNT(*) as count FROM products").fetchone()['count']
+    with repo.read_snapshot():
+        # the live feed (admin_feed.py) picks up from this snapshot
+        events_cursor = repo.latest_admin_event()
+        products, total_products = repo.search_products(search_query, category_filter, sort_by, sort_order)
+        orders = repo.list_orders()
+        categories = repo.list_categories()
     
     return render_template("admin.html", 
                          products=products, 
                          orders=orders, 
+                         events_cursor=events_cursor,
                          categories=categories,
                          search_query=search_query,
                          category_filter=category_filter,
@@ -496,6 +357,7 @@ def add_category():
         with get_db_connection() as conn:
             conn.execute("INSERT INTO categories (name, description) VALUES (?, ?)", (name, description))
             conn.commit()
+        catalog_changed()
         flash("تمت إضافة الفئة بنجاح", "success")
     except Exception as e:
         flash(f"حدث خطأ أثناء إضافة الفئة: {str(e)}", "error")
@@ -510,14 +372,15 @@ def delete_category(category_id):
     
     try:
         with get_db_connection() as conn:
-            # Check if category has products
-            product_count = conn.execute("SELECT COUNT(*) as count FROM products WHERE category_id = ?", (category_id,)).fetchone()
-            if product_count['count'] > 0:
+            # Check if category has products (product_count is kept current by triggers)
+            category = conn.execute("SELECT product_count FROM categories WHERE id = ?", (category_id,)).fetchone()
+            if category and category['product_count'] > 0:
                 flash("لا يمكن حذف الفئة لأنها تحتوي على منتجات", "error")
                 return redirect(url_for("admin"))
             
             conn.execute("DELETE FROM categories WHERE id = ?", (category_id,))
             conn.commit()
+        catalog_changed()
         flash("تم حذف الفئة بنجاح", "success")
     except Exception as e:
         flash(f"حدث خطأ أثناء حذف الفئة: {str(e)}", "error")
@@ -559,22 +422,16 @@ def edit_product(pid):
                 flash("السعر يجب أن يكون قيمة موجبة", "error")
                 return render_template("edit_product.html", product=product, categories=categories)
             
-            # Handle image uploads (multiple images)
-            image_filenames = []
-            for image_file in image_files:
-                if image_file and image_file.filename != "":
-                    # Validate file type
-                    if not image_file.filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.webp')):
-                        flash("نوع الصورة غير مدعوم", "error")
-                        return render_template("edit_product.html", product=product, categories=categories)
-                        
-                    filename = secure_filename(image_file.filename)
-                    target = os.path.join(BASE_DIR, app.config["UPLOAD_FOLDER"], filename)
-                    image_file.save(target)
-                    image_filenames.append(f"uploads/{filename}")
+            # Handle image uploads (multiple images, checked and saved in parallel)
+            images, image_errors = uploads.save(image_files, placeholders=not jobs.enabled)
+            if image_errors:
+                for error in image_errors:
+                    flash(error, "error")
+                return render_template("edit_product.html", product=product, categories=categories)
             
             # Use first new image as main image, or keep existing if no new images
-            main_image = image_filenames[0] if image_filenames else product['image']
+            main = images[0] if images else SavedImage(product['image'], product['image_width'],
+                                                       product['image_height'], product['image_placeholder'])
             
             # Update product in database
             try:
@@ -583,18 +440,23 @@ def edit_product(pid):
                     # Update product
                     cursor.execute("""
                         UPDATE products 
-                        SET name = ?, price = ?, desc = ?, image = ?, category_id = ? 
+                        SET name = ?, price = ?, "desc" = ?, image = ?, image_width = ?, image_height = ?,
+                            image_placeholder = ?, category_id = ? 
                         WHERE id = ?
-                    """, (name, price, desc, main_image, category_id, pid))
+                    """, (name, price, desc, main.path, main.width, main.height, main.placeholder, category_id, pid))
                     
-                    # If new images were uploaded, add them to product_images table
-                    if image_filenames:
-                        for i, image_path in enumerate(image_filenames):
+                    # New images replace the current ones (image_gc.py removes the unused files)
+                    if images:
+                        cursor.execute("DELETE FROM product_images WHERE product_id = ?", (pid,))
+                        for i, image in enumerate(images):
                             is_primary = (i == 0)  # First image is primary
-                            cursor.execute("INSERT INTO product_images (product_id, image_path, is_primary) VALUES (?, ?, ?)",
-                                         (pid, image_path, is_primary))
+                            cursor.execute("INSERT INTO product_images (product_id, image_path, is_primary, width, "
+                                           "height, placeholder) VALUES (?, ?, ?, ?, ?, ?)",
+                                         (pid, image.path, is_primary, image.width, image.height, image.placeholder))
                     
                     conn.commit()
+                catalog_changed(pid)
+                images_saved(images)
                 flash("تم تحديث المنتج بنجاح", "success")
                 return redirect(url_for("admin"))
             except Exception as e:
@@ -609,13 +471,12 @@ def export_products():
         return redirect(url_for("login"))
     
     try:
-        with get_db_connection() as conn:
-            products = conn.execute("""
-                SELECT p.*, c.name as category_name 
-                FROM products p 
-                LEFT JOIN categories c ON p.category_id = c.id 
-                ORDER BY p.id DESC
-            """).fetchall()
+        products = repo.read_connection().execute("""
+            SELECT p.*, c.name as category_name 
+            FROM products p 
+            LEFT JOIN categories c ON p.category_id = c.id 
+            ORDER BY p.id DESC
+        """).fetchall()
         
         # Create CSV in memory
         output = io.StringIO()
@@ -649,20 +510,25 @@ def export_products():
         flash(f"حدث خطأ أثناء تصدير المنتجات: {str(e)}", "error")
         return redirect(url_for("admin"))
 
-# Export orders to CSV
+def date_range_args():
+    """(from, to) YYYY-MM-DD query arguments; a range also reads the archived months"""
+    bounds = []
+    for name in ("from", "to"):
+        value = request.args.get(name, "").strip()
+        try:
+            bounds.append(datetime.strptime(value, "%Y-%m-%d").strftime("%Y-%m-%d") if value else None)
+        except ValueError:
+            bounds.append(None)
+    return tuple(bounds)
+
+# Export orders to CSV (?from=&to= to include archived months)
 @app.route("/admin/export/orders")
 def export_orders():
     if not session.get("admin"):
         return redirect(url_for("login"))
     
     try:
-        with get_db_connection() as conn:
-            orders = conn.execute("""
-                SELECT o.*, p.name as product_name, (o.quantity * p.price) as total_price 
-                FROM orders o 
-                JOIN products p ON o.product_id = p.id 
-                ORDER BY o.id DESC
-            """).fetchall()
+        orders = repo.export_orders(*date_range_args())
         
         # Create CSV in memory
         output = io.StringIO()
@@ -685,7 +551,7 @@ def export_orders():
                 order['address'] or '',
                 order['notes'] or '',
                 order['total_price'],
-                datetime.now().strftime('%Y-%m-%d %H:%M:%S')  # You might want to add a created_at field to orders
+                order['created_at'] or ''
             ])
         
         # Create response
@@ -720,39 +586,22 @@ def api_product_request():
                 return jsonify({"error": f"Field '{field}' is required"}), 400
         
         # Get product details
-        with get_db_connection() as conn:
-            product = conn.execute("SELECT * FROM products WHERE id=?", (data['product_id'],)).fetchone()
-            if not product:
-                return jsonify({"error": "Product not found"}), 404
-        
-        # Calculate total price
-        quantity = data.get('quantity', 1)
-        total_price = float(product['price']) * quantity
+        product = repo.get_product(data['product_id'])
+        if not product:
+            return jsonify({"error": "Product not found"}), 404
         
         # Insert into product_requests table
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                """
-                INSERT INTO product_requests 
-                (product_id, user_name, email, phone, state, address, quantity, message, total_price, status)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """,
-                (
-                    data['product_id'],
-                    data['user_name'],
-                    data.get('email'),
-                    data['phone'],
-                    data['state'],
-                    data.get('address'),
-                    quantity,
-                    data.get('message'),
-                    total_price,
-                    'pending'
-                )
-            )
-            request_id = cursor.lastrowid
-            conn.commit()
+        quantity = data.get('quantity', 1)
+        request_id, total_price = repo.create_request(
+            product,
+            data['user_name'],
+            data['phone'],
+            data['state'],
+            quantity=quantity,
+            email=data.get('email'),
+            address=data.get('address'),
+            message=data.get('message')
+        )
         
         # Return success response
         response_data = {
@@ -766,11 +615,11 @@ def api_product_request():
             "created_at": datetime.now().isoformat()
         }
         
-        print(f"[DEBUG] API Product request created: ID {request_id}")
+        app.logger.debug("API product request %s created", request_id)
         return jsonify(response_data), 201
         
     except Exception as e:
-        print(f"[ERROR] API product request failed: {e}")
+        app.logger.error("API product request failed: %s", e)
         return jsonify({"error": "Failed to create product request"}), 500
 
 # API: Get all product requests (admin only)
@@ -782,15 +631,7 @@ def api_get_product_requests():
         return jsonify({"error": "Admin access required"}), 401
     
     try:
-        with get_db_connection() as conn:
-            requests = conn.execute(
-                """
-                SELECT pr.*, p.name as product_name, p.price as unit_price
-                FROM product_requests pr 
-                JOIN products p ON pr.product_id = p.id
-                ORDER BY pr.created_at DESC
-                """
-            ).fetchall()
+        requests = repo.list_requests(*date_range_args())
         
         # Convert to list of dictionaries
         requests_list = [dict(row) for row in requests]
@@ -802,7 +643,7 @@ def api_get_product_requests():
         }), 200
         
     except Exception as e:
-        print(f"[ERROR] Failed to fetch product requests: {e}")
+        app.logger.error("Failed to fetch product requests: %s", e)
         return jsonify({"error": "Failed to fetch requests"}), 500
 
 # API: Update product request status
@@ -817,21 +658,14 @@ def api_update_request_status(request_id):
         if not data or 'status' not in data:
             return jsonify({"error": "Status field required"}), 400
         
-        valid_statuses = ['pending', 'approved', 'rejected', 'completed', 'ordered']
-        if data['status'] not in valid_statuses:
-            return jsonify({"error": f"Invalid status. Valid options: {valid_statuses}"}), 400
+        if data['status'] not in REQUESTS.codes:
+            return jsonify({"error": f"Invalid status. Valid options: {list(REQUESTS.statuses)}"}), 400
         
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                "UPDATE product_requests SET status = ? WHERE id = ?",
-                (data['status'], request_id)
-            )
-            
-            if cursor.rowcount == 0:
+        try:
+            if not repo.update_request_status(request_id, data['status']):
                 return jsonify({"error": "Request not found"}), 404
-            
-            conn.commit()
+        except InvalidTransition as e:
+            return jsonify({"error": str(e)}), 409
         
         return jsonify({
             "success": True,
@@ -839,7 +673,7 @@ def api_update_request_status(request_id):
         }), 200
         
     except Exception as e:
-        print(f"[ERROR] Failed to update request status: {e}")
+        app.logger.error("Failed to update request status: %s", e)
         return jsonify({"error": "Failed to update status"}), 500
 
 # ========== WEB INTERFACE ENHANCEMENTS ==========
@@ -851,18 +685,12 @@ def admin_requests():
     if not session.get("admin"):
         return redirect(url_for("login"))
     
-    with get_db_connection() as conn:
-        requests = conn.execute(
-            """
-            SELECT pr.*, p.name as product_name, p.price as unit_price,
-                   p.image as product_image
-            FROM product_requests pr 
-            JOIN products p ON pr.product_id = p.id
-            ORDER BY pr.created_at DESC
-            """
-        ).fetchall()
+    # read first: the live feed replays anything newer than the list
+    events_cursor = repo.latest_admin_event()
+    requests = repo.list_requests()
     
-    return render_template("admin_requests.html", requests=requests)
+    return render_template("admin_requests.html", requests=requests, counts=repo.status_counts("requests"),
+                           workflow=REQUESTS, events_cursor=events_cursor)
 
 # Temporary debug route to reset admin user (REMOVE IN PRODUCTION)
 @app.route("/debug/reset-admin", methods=["GET"])
@@ -899,10 +727,12 @@ def delete(pid):
     if not session.get("admin"):
         return redirect(url_for("login"))
     try:
-        with get_db_connection() as conn:
-            conn.execute("DELETE FROM products WHERE id=?", (pid,))
-            conn.commit()
-        flash("تم حذف المنتج.", "success")
+        # its images go with it; image_gc.py removes the files nothing uses any more
+        if repo.delete_product(pid):
+            catalog_changed(pid)
+            flash("تم حذف المنتج.", "success")
+        else:
+            flash("المنتج غير موجود.", "error")
     except Exception as e:
         print("Error deleting product:", e)
         flash("حدث خطأ أثناء الحذف.", "error")
@@ -1,17 +1,36 @@
 import os
-from flask import Flask, render_template, request, redirect, url_for, session, flash
-from werkzeug.utils import secure_filename
+from flask import Flask, render_template, request, redirect, url_for, session, flash, abort
 from dotenv import load_dotenv
+from vendor_assets import register_vendor_assets
+from profiling import init_profiling
+from query_log import instrument_sqlalchemy, init_query_log
 from models import db, Product, Order
+from repository import repository_for_engine, normalize_database_url, engine_options
+from cart import init_cart
+from analytics import init_analytics
+from jobs import init_jobs
+from queues import init_queues
+from admin_feed import init_admin_feed
+from catalog import init_catalog
+from facets import init_facets
+from recommend import init_recommendations
+from http_cache import init_http_cache, product_keys
+from uploads import init_uploads
 
 # Load environment variables
 load_dotenv()
 
 app = Flask(__name__)
+register_vendor_assets(app)
+http_cache = init_http_cache(app)
+init_profiling(app)
+instrument_sqlalchemy()
+init_query_log(app)
 
 # Configuration from environment variables
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'mysecretkey')
-app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///database.db')
+app.config['SQLALCHEMY_DATABASE_URI'] = normalize_database_url(os.getenv('DATABASE_URL', 'sqlite:///database.db'))
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 # File upload configuration
@@ -19,6 +38,7 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 UPLOAD_FOLDER = os.path.join("static", "uploads")
 app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
 os.makedirs(os.path.join(BASE_DIR, UPLOAD_FOLDER), exist_ok=True)
+uploads = init_uploads(app, os.path.join(BASE_DIR, UPLOAD_FOLDER))
 
 # Admin credentials from environment variables
 ADMIN_USERNAME = os.getenv('ADMIN_USERNAME', 'admin')
@@ -27,22 +47,54 @@ ADMIN_PASSWORD = os.getenv('ADMIN_PASSWORD', '1234')
 # Initialize database
 db.init_app(app)
 
+# Hot storefront paths share the raw-SQL repository with app.py
+with app.app_context():
+    repo = repository_for_engine(db.engine, os.getenv('DATABASE_REPLICA_URL') or os.getenv('DB_REPLICA_PATH'))
+repo.init_app(app)
+init_cart(app, repo)
+jobs = init_jobs(app, repo)
+init_analytics(app, repo, jobs=jobs)
+init_queues(app, repo)
+init_admin_feed(app, repo)
+category_nav = init_catalog(app, repo)
+facet_index = init_facets(app, repo)
+recommendations = init_recommendations(app, repo)
+
+def catalog_changed(pid=None):
+    """Drop cached catalog views after a catalog write (the product page bundles showing `pid`, or all
+    of them for category and bulk changes, and proxy copies)"""
+    category_nav.invalidate()
+    facet_index.invalidate()
+    repo.invalidate_product_bundles(pid)  # all of them when pid is None: category names and lists
+    http_cache.purge(pid)
+
+def images_saved(images):
+    """Have a worker make the placeholders of images saved without them (JOBS_ENABLED)"""
+    if jobs.enabled and images:
+        jobs.enqueue("images.measure", {"paths": [image.path for image in images]})
+
 def init_db():
     """Initialize database tables"""
     with app.app_context():
         db.create_all()
+    repo.migrate()
 
 # الصفحة الرئيسية - عرض المنتجات
 @app.route("/")
 def index():
-    products = Product.query.order_by(Product.id.desc()).all()
+    products = repo.list_products()
     return render_template("index.html", products=products)
 
 # صفحة المنتج - تعرض تفاصيل المنتج + زر اضافة للكمية
 @app.route("/product/<int:pid>")
 def product(pid):
-    product = Product.query.get_or_404(pid)
-    return render_template("product.html", product=product)
+    bundle = repo.product_bundle(pid)
+    if not bundle:
+        abort(404)
+    also_ordered = recommendations.products(pid)
+    product_keys(*bundle["related"], *also_ordered)  # purged when any product shown here changes
+    return render_template("product.html", product=bundle["product"], images=bundle["images"],
+                           related=bundle["related"], also_ordered=also_ordered)
 
 # استقبال الطلب مباشرة من صفحة المنتج
 @app.route("/order/<int:pid>", methods=["POST"])
@@ -63,35 +115,19 @@ def order(pid):
         return redirect(url_for("product", pid=pid))
 
     # جلب معلومات المنتج
-    product = Product.query.get_or_404(pid)
-    
-    # حساب السعر الإجمالي
-    total_price = float(product.price) * quantity
+    product = repo.get_product(pid)
+    if not product:
+        abort(404)
 
     try:
-        # إنشاء طلب جديد
-        new_order = Order(
-            product_id=pid,
-            quantity=quantity,
-            first_name=first_name,
-            last_name=last_name,
-            phone=phone,
-            state=state,
-            email=email,
-            address=address,
-            notes=notes,
-            total_price=total_price
-        )
-        
         # حفظ الطلب في قاعدة البيانات
-        db.session.add(new_order)
-        db.session.commit()
+        order_id = repo.create_order(product, quantity, first_name, phone, state, last_name=last_name,
+                                     email=email, address=address, notes=notes)
 
         # توجيه المستخدم إلى صفحة تأكيد الطلب
-        return redirect(url_for("order_confirmation", order_id=new_order.id))
+        return redirect(url_for("order_confirmation", order_id=order_id))
         
     except Exception as e:
-        db.session.rollback()
         print("Error saving order:", e)
         flash("حدث خطأ أثناء حفظ الطلب. حاول مرة أخرى.", "error")
         return redirect(url_for("product", pid=pid))
@@ -99,8 +135,10 @@ def order(pid):
 # تأكيد الطلب - صفحة تعرض تفاصيل الطلب
 @app.route("/order/confirmation/<int:order_id>")
 def order_confirmation(order_id):
-    order = db.session.query(Order).join(Product).filter(Order.id == order_id).first_or_404()
-    return render_template("order_confirmation.html", order=order)
+    order = repo.get_order(order_id)
+    if not order:
+        abort(404)
+    return render_template("order_confirmation.html", order=order, items=repo.get_order_items(order_id))
 
 # تسجيل الدخول للأدمن
 @app.route("/login", methods=["GET", "POST"])
@@ -136,23 +174,28 @@ def admin():
             flash("الرجاء إدخال اسم المنتج والسعر بشكل صحيح.", "error")
             return redirect(url_for("admin"))
 
-        filename = None
-        if image_file and image_file.filename != "":
-            filename = secure_filename(image_file.filename)
-            target = os.path.join(BASE_DIR, app.config["UPLOAD_FOLDER"], filename)
-            image_file.save(target)
+        saved, errors = uploads.save([image_file], placeholders=not jobs.enabled)
+        if errors:
+            flash(errors[0], "error")
+            return redirect(url_for("admin"))
 
         try:
             # إنشاء منتج جديد
+            image = saved[0] if saved else None
             new_product = Product(
                 name=name,
                 price=price,
                 desc=desc,
-                image=f"uploads/{filename}" if filename else None
+                image=image.path if image else None,
+                image_width=image.width if image else None,
+                image_height=image.height if image else None,
+                image_placeholder=image.placeholder if image else None
             )
             
             db.session.add(new_product)
             db.session.commit()
+            catalog_changed()
+            images_saved(saved)
             flash("تم إضافة المنتج.", "success")
             
         except Exception as e:
@@ -163,10 +206,11 @@ def admin():
         return redirect(url_for("admin"))
 
     # جلب المنتجات والطلبات
+    events_cursor = repo.latest_admin_event()  # the live feed replays anything newer than the lists
     products = Product.query.order_by(Product.id.desc()).all()
     orders = db.session.query(Order, Product).join(Product).order_by(Order.id.desc()).all()
     
-    return render_template("admin.html", products=products, orders=orders)
+    return render_template("admin.html", products=products, orders=orders, events_cursor=events_cursor)
 
 # حذف منتج
 @app.route("/delete/<int:pid>", methods=["POST"])
@@ -175,13 +219,14 @@ def delete(pid):
         return redirect(url_for("login"))
         
     try:
-        product = Product.query.get_or_404(pid)
-        db.session.delete(product)
-        db.session.commit()
-        flash("تم حذف المنتج.", "success")
+        # its images go with it; image_gc.py removes the files nothing uses any more
+        if repo.delete_product(pid):
+            catalog_changed(pid)
+            flash("تم حذف المنتج.", "success")
+        else:
+            flash("المنتج غير موجود.", "error")
         
     except Exception as e:
-        db.session.rollback()
         print("Error deleting product:", e)
         flash("حدث خطأ أثناء الحذف.", "error")
         
@@ -1,16 +1,35 @@
 import os
-from flask import Flask, render_template, request, redirect, url_for, session, flash, send_from_directory
+from flask import Flask, render_template, request, redirect, url_for, session, flash, send_from_directory, abort
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
-from werkzeug.utils import secure_filename
 from dotenv import load_dotenv
 from datetime import datetime
 from email_validator import validate_email, EmailNotValidError
+from vendor_assets import register_vendor_assets
+from profiling import init_profiling
+from query_log import instrument_sqlalchemy, init_query_log
 from models import db, Product, Order, User
+from repository import repository_for_engine, normalize_database_url, engine_options
+from cart import init_cart
+from analytics import init_analytics
+from jobs import init_jobs
+from queues import init_queues
+from admin_feed import init_admin_feed
+from catalog import init_catalog
+from facets import init_facets
+from recommend import init_recommendations
+from http_cache import init_http_cache, product_keys
+from uploads import init_uploads
+from workflow import InvalidTransition
 
 # Load environment variables
 load_dotenv()
 
 app = Flask(__name__)
+register_vendor_assets(app)
+http_cache = init_http_cache(app)
+init_profiling(app, is_admin=lambda: current_user.is_authenticated and current_user.is_admin)
+instrument_sqlalchemy()
+init_query_log(app, is_admin=lambda: current_user.is_authenticated and current_user.is_admin)
 
 # File upload configuration
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -18,11 +37,13 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 # Configuration from environment variables
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'mysecretkey')
 # Use simple relative database path
-app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', f'sqlite:///{BASE_DIR}/app_database.db')
+app.config['SQLALCHEMY_DATABASE_URI'] = normalize_database_url(os.getenv('DATABASE_URL', f'sqlite:///{BASE_DIR}/app_database.db'))
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 UPLOAD_FOLDER = os.path.join("static", "uploads")
 app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
 os.makedirs(os.path.join(BASE_DIR, UPLOAD_FOLDER), exist_ok=True)
+uploads = init_uploads(app, os.path.join(BASE_DIR, UPLOAD_FOLDER))
 
 # Initialize database and login manager
 db.init_app(app)
@@ -32,6 +53,32 @@ login_manager.login_view = 'login'
 login_manager.login_message = 'يرجى تسجيل الدخول للوصول إلى هذه الصفحة.'
 login_manager.login_message_category = 'info'
 
+# Hot storefront paths share the raw-SQL repository with app.py
+with app.app_context():
+    repo = repository_for_engine(db.engine, os.getenv('DATABASE_REPLICA_URL') or os.getenv('DB_REPLICA_PATH'))
+repo.init_app(app)
+init_cart(app, repo, user_id=lambda: current_user.id if current_user.is_authenticated else None)
+jobs = init_jobs(app, repo, is_admin=lambda: current_user.is_authenticated and current_user.is_admin)
+init_analytics(app, repo, is_admin=lambda: current_user.is_authenticated and current_user.is_admin, jobs=jobs)
+init_queues(app, repo, is_admin=lambda: current_user.is_authenticated and current_user.is_admin)
+init_admin_feed(app, repo, is_admin=lambda: current_user.is_authenticated and current_user.is_admin)
+category_nav = init_catalog(app, repo)
+facet_index = init_facets(app, repo)
+recommendations = init_recommendations(app, repo)
+
+def catalog_changed(pid=None):
+    """Drop cached catalog views after a catalog write (the product page bundles showing `pid`, or all
+    of them for category and bulk changes, and proxy copies)"""
+    category_nav.invalidate()
+    facet_index.invalidate()
+    repo.invalidate_product_bundles(pid)  # all of them when pid is None: category names and lists
+    http_cache.purge(pid)
+
+def images_saved(images):
+    """Have a worker make the placeholders of images saved without them (JOBS_ENABLED)"""
+    if jobs.enabled and images:
+        jobs.enqueue("images.measure", {"paths": [image.path for image in images]})
+
 @login_manager.user_loader
 def load_user(user_id):
     return User.query.get(int(user_id))
@@ -40,6 +87,7 @@ def init_db():
     """Initialize database tables"""
     with app.app_context():
         db.create_all()
+        repo.migrate()
         
         # Create default admin user if it doesn't exist
         admin_user = User.query.filter_by(username='youcef').first()
@@ -58,7 +106,7 @@ def init_db():
 # الصفحة الرئيسية - عرض المنتجات
 @app.route("/")
 def index():
-    products = Product.query.order_by(Product.id.desc()).all()
+    products = repo.list_products()
     return render_template("index.html", products=products)
 
 # User Registration
@@ -207,8 +255,13 @@ def edit_profile():
 # صفحة المنتج - تعرض تفاصيل المنتج + زر اضافة للكمية
 @app.route("/product/<int:pid>")
 def product(pid):
-    product = Product.query.get_or_404(pid)
-    return render_template("product.html", product=product)
+    bundle = repo.product_bundle(pid)
+    if not bundle:
+        abort(404)
+    also_ordered = recommendations.products(pid)
+    product_keys(*bundle["related"], *also_ordered)  # purged when any product shown here changes
+    return render_template("product.html", product=bundle["product"], images=bundle["images"],
+                           related=bundle["related"], also_ordered=also_ordered)
 
 # استقبال الطلب مباشرة من صفحة المنتج
 @app.route("/order/<int:pid>", methods=["POST"])
@@ -237,36 +290,20 @@ def order(pid):
         return redirect(url_for("product", pid=pid))
 
     # جلب معلومات المنتج
-    product = Product.query.get_or_404(pid)
-    
-    # حساب السعر الإجمالي
-    total_price = float(product.price) * quantity
+    product = repo.get_product(pid)
+    if not product:
+        abort(404)
 
     try:
-        # إنشاء طلب جديد
-        new_order = Order(
-            product_id=pid,
-            user_id=current_user.id if current_user.is_authenticated else None,
-            quantity=quantity,
-            first_name=first_name,
-            last_name=last_name,
-            phone=phone,
-            state=state,
-            email=email,
-            address=address,
-            notes=notes,
-            total_price=total_price
-        )
-        
         # حفظ الطلب في قاعدة البيانات
-        db.session.add(new_order)
-        db.session.commit()
+        order_id = repo.create_order(product, quantity, first_name, phone, state, last_name=last_name,
+                                     email=email, address=address, notes=notes,
+                                     user_id=current_user.id if current_user.is_authenticated else None)
 
         # توجيه المستخدم إلى صفحة تأكيد الطلب
-        return redirect(url_for("order_confirmation", order_id=new_order.id))
+        return redirect(url_for("order_confirmation", order_id=order_id))
         
     except Exception as e:
-        db.session.rollback()
         print("Error saving order:", e)
         flash("حدث خطأ أثناء حفظ الطلب. حاول مرة أخرى.", "error")
         return redirect(url_for("product", pid=pid))
@@ -274,8 +311,10 @@ def order(pid):
 # تأكيد الطلب - صفحة تعرض تفاصيل الطلب
 @app.route("/order/confirmation/<int:order_id>")
 def order_confirmation(order_id):
-    order = Order.query.filter_by(id=order_id).first_or_404()
-    return render_template("order_confirmation.html", order=order)
+    order = repo.get_order(order_id)
+    if not order:
+        abort(404)
+    return render_template("order_confirmation.html", order=order, items=repo.get_order_items(order_id))
 
 # لوحة الإدارة - إضافة منتجات وعرض الطلبات
 @app.route("/admin", methods=["GET", "POST"])
@@ -295,23 +334,28 @@ def admin():
             flash("الرجاء إدخال اسم المنتج والسعر بشكل صحيح.", "error")
             return redirect(url_for("admin"))
 
-        filename = None
-        if image_file and image_file.filename != "":
-            filename = secure_filename(image_file.filename)
-            target = os.path.join(BASE_DIR, app.config["UPLOAD_FOLDER"], filename)
-            image_file.save(target)
+        saved, errors = uploads.save([image_file], placeholders=not jobs.enabled)
+        if errors:
+            flash(errors[0], "error")
+            return redirect(url_for("admin"))
 
         try:
             # إنشاء منتج جديد
+            image = saved[0] if saved else None
             new_product = Product(
                 name=name,
                 price=price,
                 desc=desc,
-                image=f"uploads/{filename}" if filename else None
+                image=image.path if image else None,
+                image_width=image.width if image else None,
+                image_height=image.height if image else None,
+                image_placeholder=image.placeholder if image else None
             )
             
             db.session.add(new_product)
             db.session.commit()
+            catalog_changed()
+            images_saved(saved)
             flash("تم إضافة المنتج.", "success")
             
         except Exception as e:
@@ -322,11 +366,13 @@ def admin():
         return redirect(url_for("admin"))
 
     # جلب المنتجات والطلبات
+    events_cursor = repo.latest_admin_event()  # the live feed replays anything newer than the lists
     products = Product.query.order_by(Product.id.desc()).all()
     orders = Order.query.join(Product).order_by(Order.created_at.desc()).all()
     users = User.query.order_by(User.created_at.desc()).all()
     
-    return render_template("admin.html", products=products, orders=orders, users=users)
+    return render_template("admin.html", products=products, orders=orders, users=users,
+                           events_cursor=events_cursor)
 
 # حذف منتج
 @app.route("/delete/<int:pid>", methods=["POST"])
@@ -337,13 +383,14 @@ def delete(pid):
         return redirect(url_for("index"))
         
     try:
-        product = Product.query.get_or_404(pid)
-        db.session.delete(product)
-        db.session.commit()
-        flash("تم حذف المنتج.", "success")
+        # its images go with it; image_gc.py removes the files nothing uses any more
+        if repo.delete_product(pid):
+            catalog_changed(pid)
+            flash("تم حذف المنتج.", "success")
+        else:
+            flash("المنتج غير موجود.", "error")
         
     except Exception as e:
-        db.session.rollback()
         print("Error deleting product:", e)
         flash("حدث خطأ أثناء الحذف.", "error")
         
@@ -357,14 +404,13 @@ def update_order_status(order_id):
         flash("ليس لديك صلاحية لتحديث الطلبات.", "error")
         return redirect(url_for("index"))
     
-    order = Order.query.get_or_404(order_id)
-    new_status = request.form.get("status")
-    
-    if new_status in ['pending', 'processing', 'shipped', 'delivered', 'cancelled']:
-        order.status = new_status
-        db.session.commit()
+    try:
+        if not repo.update_order_status(order_id, request.form.get("status", "")):
+            abort(404)
         flash("تم تحديث حالة الطلب.", "success")
-    else:
+    except InvalidTransition:
+        flash("لا يمكن نقل الطلب إلى هذه الحالة من حالته الحالية.", "error")
+    except ValueError:
         flash("حالة الطلب غير صحيحة.", "error")
     
     return redirect(url_for("admin"))
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Order Archiving
+Moves finished orders and product requests (delivered/cancelled,
+completed/rejected) older than ARCHIVE_AFTER_DAYS out of the live tables into
+one table per month: orders_2024_01 (with its order_items_2024_01) and
+product_requests_2024_01, listed in archive_partitions.
+
+The live tables, their indexes and the work queues stay the size of the
+recent business. Admin listings read only them unless a date range is given,
+in which case the months it overlaps are read too; an archived order is
+still found by id. The sales rollups keep counting archived orders.
+
+Rows move in small batches, one short write transaction each, so it is safe
+to run while the app takes orders. Deleted rows leave free pages behind;
+--vacuum gives them back to the filesystem (on SQLite the first run switches
+the file to incremental auto-vacuum, which needs one full VACUUM).
+
+Usage:
+    python archive.py run                        # archive everything past the horizon
+    python archive.py run --days 90 --vacuum
+    python archive.py watch --every 86400        # nightly (run next to the app)
+    python archive.py list                       # archive tables and their row counts
+
+Environment:
+    DB_PATH / DATABASE_URL   database (default database.db next to app.py)
+    ARCHIVE_AFTER_DAYS       horizon in days (default 180)
+    ARCHIVE_BATCH_SIZE       rows per transaction (default 500)
+    ARCHIVE_INTERVAL_S       period for `watch` (default 86400)
+"""
+
+import os
+import time
+import argparse
+from datetime import datetime, timedelta
+
+from dotenv import load_dotenv
+
+from repository import open_repository, is_postgres_url
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Only final statuses: anything an admin may still act on stays live
+ARCHIVE_STATUSES = {"orders": ("delivered", "cancelled"), "requests": ("completed", "rejected")}
+
+
+def cutoff(days, now=None):
+    """First day that stays live when archiving rows older than `days` days"""
+    return ((now or datetime.utcnow()) - timedelta(days=days)).strftime("%Y-%m-%d")
+
+
+def archive_all(repo, days, batch_size=500, vacuum=False):
+    """Archive every kind past the horizon; returns {kind: {month: rows}}"""
+    before = cutoff(days)
+    moved = {kind: repo.archive(kind, before, statuses, batch_size=batch_size)
+             for kind, statuses in ARCHIVE_STATUSES.items()}
+    if vacuum or any(moved.values()):
+        repo.compact(full=vacuum)
+    return moved
+
+
+def _report(moved, elapsed):
+    total = sum(sum(months.values()) for months in moved.values())
+    for kind, months in moved.items():
+        for month, count in sorted(months.items()):
+            print(f"  {kind:9} {month}  {count:8}")
+    print(f"✓ Archived {total} rows in {elapsed:.1f}s")
+
+
+def main():
+    load_dotenv()
+    database_url = os.getenv("DATABASE_URL", "")
+    default = database_url if is_postgres_url(database_url) else \
+        os.getenv("DB_PATH", os.path.join(BASE_DIR, "database.db"))
+
+    parser = argparse.ArgumentParser(description="Archive old finished orders and product requests")
+    parser.add_argument("--db", default=default, help="SQLite path or PostgreSQL URL")
+    commands = parser.add_subparsers(dest="command", required=True)
+    for name in ("run", "watch"):
+        command = commands.add_parser(name, help="archive once" if name == "run" else "archive periodically")
+        command.add_argument("--days", type=int, default=int(os.getenv("ARCHIVE_AFTER_DAYS", "180")))
+        command.add_argument("--batch-size", type=int, default=int(os.getenv("ARCHIVE_BATCH_SIZE", "500")))
+        command.add_argument("--vacuum", action="store_true", help="return freed space to the filesystem")
+        if name == "watch":
+            command.add_argument("--every", type=float, default=float(os.getenv("ARCHIVE_INTERVAL_S", "86400")))
+    commands.add_parser("list", help="list archive tables")
+    args = parser.parse_args()
+
+    repo = open_repository(args.db)
+    repo.init_schema()
+    try:
+        if args.command == "run":
+            started = time.perf_counter()
+            _report(archive_all(repo, args.days, args.batch_size, args.vacuum), time.perf_counter() - started)
+        elif args.command == "watch":
+            print(f"🗄 Archiving rows older than {args.days} days every {args.every:.0f}s")
+            while True:
+                started = time.perf_counter()
+                try:
+                    _report(archive_all(repo, args.days, args.batch_size, args.vacuum),
+                            time.perf_counter() - started)
+                except Exception as e:
+                    print(f"❌ Archiving failed: {e}")
+                finally:
+                    repo.release()
+                time.sleep(args.every)
+        elif args.command == "list":
+            for row in repo.archive_summary():
+                print(f"{row['table_name']:30} {row['row_count']:10}")
+    finally:
+        repo.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+"""
+Storefront Benchmark Suite
+Seeds a throwaway SQLite database with synthetic products/orders/requests,
+drives the hot routes through the Flask test client and/or a local gunicorn,
+and reports throughput, latency percentiles and DB time per request.
+
+Usage:
+    python benchmark.py --scale small
+    python benchmark.py --products 2000 --orders 50000 --requests 20000
+    python benchmark.py --mode both --save-baseline
+    python benchmark.py --compare            # exit code 1 on regression
+"""
+
+import os
+import sys
+import io
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+import contextlib
+import subprocess
+import urllib.parse
+import urllib.request
+import urllib.error
+import http.cookiejar
+from concurrent.futures import ThreadPoolExecutor
+
+from generate_data import generate, WILAYAS
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BASE_DIR, "bench_baseline.json")
+
+SCALES = {
+    "tiny": {"products": 50, "orders": 500, "requests": 200},
+    "small": {"products": 500, "orders": 10000, "requests": 5000},
+    "medium": {"products": 5000, "orders": 200000, "requests": 50000},
+    "large": {"products": 20000, "orders": 1000000, "requests": 200000},
+}
+
+ADMIN_USERNAME = "bench_admin"
+ADMIN_PASSWORD = "bench_password"
+
+WILAYA_NAMES = [name for name, _ in WILAYAS]
+
+
+# ---------------------------------------------------------------------------
+# Database seeding
+# ---------------------------------------------------------------------------
+
+def seed_database(db_path, products, orders, requests, seed=42):
+    """Fill an initialized database with synthetic rows; returns product ids"""
+    gen = generate(db_path, products=products, orders=orders, requests=requests,
+                   seed=seed, verbose=False)
+    return sorted(gen.product_ids)
+
+
+# ---------------------------------------------------------------------------
+# Measurements
+# ---------------------------------------------------------------------------
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[rank]
+
+
+def summarize(latencies, wall_time, db_times=None):
+    """Build the result dict for one scenario (times in milliseconds)"""
+    values = sorted(latencies)
+    result = {
+        "requests": len(values),
+        "rps": round(len(values) / wall_time, 1) if wall_time else 0.0,
+        "p50_ms": round(percentile(values, 50) * 1000, 2),
+        "p95_ms": round(percentile(values, 95) * 1000, 2),
+        "p99_ms": round(percentile(values, 99) * 1000, 2),
+        "db_ms": None,
+    }
+    if db_times is not None and values:
+        result["db_ms"] = round(sum(db_times) / len(values) * 1000, 3)
+    return result
+
+
+def server_db_time(header):
+    """Seconds of DB time reported by the app's Server-Timing header"""
+    for metric in (header or "").split(","):
+        name, _, params = metric.strip().partition(";")
+        if name == "db":
+            for param in params.split(";"):
+                key, _, value = param.strip().partition("=")
+                if key == "dur":
+                    return float(value) / 1000.0
+    return 0.0
+
+
+# ---------------------------------------------------------------------------
+# Scenarios
+# ---------------------------------------------------------------------------
+
+def order_form(rng, pid):
+    return {
+        "quantity": str(rng.randint(1, 3)),
+        "first_name": "بنشمارك",
+        "last_name": "اختبار",
+        "phone": "0555000000",
+        "state": rng.choice(WILAYA_NAMES),
+        "address": "حي الاختبار",
+        "notes": "",
+    }
+
+
+def request_payload(rng, pid):
+    return {
+        "product_id": pid,
+        "user_name": "بنشمارك",
+        "phone": "0666000000",
+        "state": rng.choice(WILAYA_NAMES),
+        "quantity": rng.randint(1, 3),
+    }
+
+
+# name -> (method, path builder, body builder, body kind, expected status)
+SCENARIOS = {
+    "index": ("GET", lambda pid: "/", None, None, 200),
+    "product": ("GET", lambda pid: f"/product/{pid}", None, None, 200),
+    "order": ("POST", lambda pid: f"/order/{pid}", order_form, "form", 302),
+    "api_request": ("POST", lambda pid: "/api/product-requests", request_payload, "json", 201),
+    "admin": ("GET", lambda pid: "/admin", None, None, 200),
+}
+
+
+def run_client(scenarios, product_ids, iterations, seed):
+    """Drive the scenarios in-process through Flask's test client"""
+    import app as app_module
+
+    rng = random.Random(seed)
+    client = app_module.app.test_client()
+    with client.session_transaction() as sess:
+        sess["admin"] = True
+
+    results = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        for name in scenarios:
+            method, path_for, body_for, kind, expected = SCENARIOS[name]
+            latencies, db_times = [], []
+            for i in range(iterations + max(1, iterations // 10)):
+                pid = rng.choice(product_ids)
+                kwargs = {}
+                if kind == "form":
+                    kwargs["data"] = body_for(rng, pid)
+                elif kind == "json":
+                    kwargs["json"] = body_for(rng, pid)
+                started = time.perf_counter()
+                response = client.open(path_for(pid), method=method, **kwargs)
+                elapsed = time.perf_counter() - started
+                db_time = server_db_time(response.headers.get("Server-Timing"))
+                if response.status_code != expected:
+                    raise RuntimeError(f"{name}: expected {expected}, got {response.status_code}")
+                if i < max(1, iterations // 10):
+                    continue  # warm-up
+                latencies.append(elapsed)
+                db_times.append(db_time)
+            wall = sum(latencies)
+            results[name] = summarize(latencies, wall, db_times)
+    return results
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def _opener(base_url):
+    jar = http.cookiejar.CookieJar()
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar), _NoRedirect)
+    data = urllib.parse.urlencode({"username": ADMIN_USERNAME, "password": ADMIN_PASSWORD}).encode()
+    try:
+        opener.open(base_url + "/login", data=data, timeout=30)
+    except urllib.error.HTTPError as e:
+        if e.code != 302:
+            raise
+    return opener
+
+
+def _http_call(opener, base_url, name, pid, rng):
+    method, path_for, body_for, kind, expected = SCENARIOS[name]
+    data, headers = None, {}
+    if kind == "form":
+        data = urllib.parse.urlencode(body_for(rng, pid)).encode()
+    elif kind == "json":
+        data = json.dumps(body_for(rng, pid)).encode()
+        headers["Content-Type"] = "application/json"
+    req = urllib.request.Request(base_url + path_for(pid), data=data, headers=headers, method=method)
+    started = time.perf_counter()
+    try:
+        with opener.open(req, timeout=60) as response:
+            response.read()
+            status, headers = response.status, response.headers
+    except urllib.error.HTTPError as e:
+        status, headers = e.code, e.headers
+    elapsed = time.perf_counter() - started
+    if status != expected:
+        raise RuntimeError(f"{name}: expected {expected}, got {status}")
+    return elapsed, server_db_time(headers.get("Server-Timing"))
+
+
+@contextlib.contextmanager
+def gunicorn_server(env, workers, port):
+    """Start a local gunicorn on app:app and wait until /health answers"""
+    cmd = [sys.executable, "-m", "gunicorn", "--config", "gunicorn.conf.py",
+           "--bind", f"127.0.0.1:{port}", "--workers", str(workers), "app:app"]
+    proc = subprocess.Popen(cmd, cwd=BASE_DIR, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.time() + 30
+        while True:
+            try:
+                with urllib.request.urlopen(base_url + "/health", timeout=2):
+                    break
+            except Exception:
+                if proc.poll() is not None or time.time() > deadline:
+                    raise RuntimeError("gunicorn failed to start")
+                time.sleep(0.2)
+        yield base_url
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def run_gunicorn(scenarios, product_ids, iterations, seed, env, workers, concurrency, port):
+    """Drive the scenarios over HTTP against a local gunicorn"""
+    results = {}
+    with gunicorn_server(env, workers, port) as base_url:
+        local = threading.local()
+
+        def call(args):
+            name, pid, call_seed = args
+            if not hasattr(local, "opener"):
+                local.opener = _opener(base_url)
+            return _http_call(local.opener, base_url, name, pid, random.Random(call_seed))
+
+        rng = random.Random(seed)
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for name in scenarios:
+                warmup = [(name, rng.choice(product_ids), rng.random()) for _ in range(concurrency)]
+                list(pool.map(call, warmup))
+                jobs = [(name, rng.choice(product_ids), rng.random()) for _ in range(iterations)]
+                started = time.perf_counter()
+                timings = list(pool.map(call, jobs))
+                wall = time.perf_counter() - started
+                results[name] = summarize([t[0] for t in timings], wall, [t[1] for t in timings])
+    return results
+
+
+# ---------------------------------------------------------------------------
+# Reporting and baselines
+# ---------------------------------------------------------------------------
+
+def print_report(mode, results):
+    print(f"\n=== {mode} ===")
+    print(f"{'scenario':<14}{'reqs':>7}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'db ms':>10}")
+    for name, r in results.items():
+        db = f"{r['db_ms']:.3f}" if r["db_ms"] is not None else "-"
+        print(f"{name:<14}{r['requests']:>7}{r['rps']:>10.1f}{r['p50_ms']:>10.2f}"
+              f"{r['p95_ms']:>10.2f}{r['p99_ms']:>10.2f}{db:>10}")
+
+
+def compare_to_baseline(report, baseline, tolerance):
+    """Return a list of human readable regressions against a stored baseline"""
+    regressions = []
+    for mode, results in report["results"].items():
+        for name, current in results.items():
+            base = baseline.get("results", {}).get(mode, {}).get(name)
+            if not base:
+                continue
+            if base["p95_ms"] and current["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+                regressions.append(f"{mode}/{name}: p95 {base['p95_ms']} → {current['p95_ms']} ms")
+            if base["rps"] and current["rps"] < base["rps"] * (1 - tolerance):
+                regressions.append(f"{mode}/{name}: throughput {base['rps']} → {current['rps']} req/s")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the storefront and order flow")
+    parser.add_argument("--scale", choices=SCALES, default="small")
+    parser.add_argument("--products", type=int)
+    parser.add_argument("--orders", type=int)
+    parser.add_argument("--requests", type=int)
+    parser.add_argument("--iterations", type=int, default=200, help="measured requests per scenario")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma separated list")
+    parser.add_argument("--mode", choices=["client", "gunicorn", "both"], default="client")
+    parser.add_argument("--workers", type=int, default=4, help="gunicorn workers")
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent HTTP clients")
+    parser.add_argument("--port", type=int, default=18765)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--compare", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative slowdown")
+    args = parser.parse_args(argv)
+
+    scale = dict(SCALES[args.scale])
+    for key in ("products", "orders", "requests"):
+        if getattr(args, key) is not None:
+            scale[key] = getattr(args, key)
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    workdir = tempfile.mkdtemp(prefix="luxora-bench-")
+    db_path = os.path.join(workdir, "bench.db")
+    os.environ.update({"DB_PATH": db_path, "ADMIN_USERNAME": ADMIN_USERNAME,
+                       "ADMIN_PASSWORD": ADMIN_PASSWORD,
+                       "PROFILE_DIR": os.path.join(workdir, "profiles"),
+                       "QUERY_LOG_DIR": os.path.join(workdir, "query_log")})
+    try:
+        print(f"🌱 Seeding {scale['products']} products, {scale['orders']} orders, "
+              f"{scale['requests']} requests into {db_path}")
+        started = time.perf_counter()
+        with contextlib.redirect_stderr(io.StringIO()):
+            import app as app_module  # init_db() creates the schema on import
+        product_ids = seed_database(db_path, scale["products"], scale["orders"],
+                                    scale["requests"], args.seed)
+        print(f"   done in {time.perf_counter() - started:.1f}s")
+
+        report = {"meta": {"scale": scale, "iterations": args.iterations,
+                           "python": sys.version.split()[0]}, "results": {}}
+        if args.mode in ("client", "both"):
+            report["results"]["client"] = run_client(scenarios, product_ids, args.iterations, args.seed)
+            print_report("Flask test client", report["results"]["client"])
+        if args.mode in ("gunicorn", "both"):
+            report["results"]["gunicorn"] = run_gunicorn(
+                scenarios, product_ids, args.iterations, args.seed, dict(os.environ),
+                args.workers, args.concurrency, args.port)
+            print_report(f"gunicorn ({args.workers} workers, {args.concurrency} clients)",
+                         report["results"]["gunicorn"])
+
+        if args.save_baseline:
+            with open(args.baseline, "w", encoding="utf-8") as fh:
+                json.dump(report, fh, indent=2, ensure_ascii=False)
+            print(f"\n💾 Baseline saved to {args.baseline}")
+
+        if args.compare:
+            if not os.path.exists(args.baseline):
+                print(f"\n⚠️ No baseline at {args.baseline} - run with --save-baseline first")
+                return 1
+            with open(args.baseline, encoding="utf-8") as fh:
+                baseline = json.load(fh)
+            if baseline.get("meta", {}).get("scale") != scale:
+                print("\n⚠️ Baseline was recorded at a different scale; comparison may be meaningless")
+            regressions = compare_to_baseline(report, baseline, args.tolerance)
+            if regressions:
+                print("\n❌ Regressions detected:")
+                for line in regressions:
+                    print(f"   - {line}")
+                return 1
+            print(f"\n✅ No regressions beyond {int(args.tolerance * 100)}% of baseline")
+        return 0
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -13,6 +13,9 @@ pip install -r requirements.txt
 echo "📁 Creating necessary directories..."
 mkdir -p static/uploads
 
+echo "🎨 Vendoring front-end assets..."
+python vendor_assets.py || echo "⚠️ Vendoring failed - pages will fall back to CDN assets"
+
 echo "🗄️ Initializing database..."
 python -c "
 import os
@@ -0,0 +1,142 @@
+"""
+Shopping Cart
+Cart kept in the signed session cookie as {product id: quantity}, so it
+costs no database writes until checkout. The cart page loads all of its
+products with one query, and checkout validates the whole cart and writes
+one order (header + lines + product_requests) in a single transaction
+through Repository.checkout().
+
+Routes (registered on the app by init_cart):
+    GET  /cart                     cart contents
+    POST /cart/add/<pid>           add `quantity` of a product (JSON when asked for, else redirect)
+    POST /cart/update              set quantities (qty_<pid> fields, 0 removes)
+    POST /cart/remove/<pid>
+    GET/POST /checkout             customer details -> order confirmation
+"""
+
+from flask import render_template, request, redirect, url_for, session, flash, jsonify
+
+SESSION_KEY = "cart"
+MAX_LINES = 30
+MAX_QUANTITY = 99
+
+
+def get_cart():
+    """{product id: quantity} from the session (ids are strings in the cookie)"""
+    cart = {}
+    for pid, quantity in (session.get(SESSION_KEY) or {}).items():
+        try:
+            pid, quantity = int(pid), int(quantity)
+        except (TypeError, ValueError):
+            continue
+        if quantity > 0:
+            cart[pid] = min(quantity, MAX_QUANTITY)
+    return cart
+
+
+def save_cart(cart):
+    session[SESSION_KEY] = {str(pid): quantity for pid, quantity in cart.items() if quantity > 0}
+
+
+def clear_cart():
+    session.pop(SESSION_KEY, None)
+
+
+def cart_count():
+    return sum(get_cart().values())
+
+
+def init_cart(app, repo, user_id=lambda: None):
+    """Register the cart routes; `user_id` returns the logged-in user's id (or None)"""
+
+    @app.context_processor
+    def _cart_context():
+        return {"cart_count": cart_count}
+
+    def cart_lines(cart):
+        products = {row["id"]: row for row in repo.get_products(cart)}
+        lines = [(products[pid], quantity) for pid, quantity in cart.items() if pid in products]
+        if len(lines) != len(cart):
+            # products deleted since they were added
+            save_cart({product["id"]: quantity for product, quantity in lines})
+        total = sum(float(product["price"]) * quantity for product, quantity in lines)
+        return lines, total
+
+    def cart_view():
+        lines, total = cart_lines(get_cart())
+        return render_template("cart.html", lines=lines, total=total)
+
+    def cart_add(pid):
+        wants_json = request.accept_mimetypes.best == "application/json"
+        quantity = max(1, min(request.form.get("quantity", 1, type=int) or 1, MAX_QUANTITY))
+        cart = get_cart()
+        error = None
+        if pid not in cart and len(cart) >= MAX_LINES:
+            error = f"لا يمكن إضافة أكثر من {MAX_LINES} منتجاً إلى السلة"
+        elif not repo.get_product(pid):
+            error = "المنتج غير موجود."
+        if error:
+            if wants_json:
+                return jsonify({"success": False, "error": error}), 400
+            flash(error, "error")
+            return redirect(url_for("cart"))
+        cart[pid] = min(cart.get(pid, 0) + quantity, MAX_QUANTITY)
+        save_cart(cart)
+        if wants_json:
+            return jsonify({"success": True, "count": sum(cart.values())})
+        flash("تمت إضافة المنتج إلى السلة.", "success")
+        return redirect(url_for("cart"))
+
+    def cart_update():
+        cart = get_cart()
+        for pid in list(cart):
+            quantity = request.form.get(f"qty_{pid}", type=int)
+            if quantity is not None:
+                cart[pid] = max(0, min(quantity, MAX_QUANTITY))
+        save_cart(cart)
+        return redirect(url_for("cart"))
+
+    def cart_remove(pid):
+        cart = get_cart()
+        cart.pop(pid, None)
+        save_cart(cart)
+        return redirect(url_for("cart"))
+
+    def checkout():
+        cart = get_cart()
+        if not cart:
+            flash("سلة التسوق فارغة.", "error")
+            return redirect(url_for("index"))
+        if request.method == "GET":
+            lines, total = cart_lines(cart)
+            return render_template("checkout.html", lines=lines, total=total, form={})
+
+        form = {name: request.form.get(name, "").strip()
+                for name in ("first_name", "last_name", "phone", "state", "email", "address", "notes")}
+        if not all([form["first_name"], form["phone"], form["state"]]):
+            flash("الرجاء تعبئة الحقول المطلوبة: الاسم، رقم الهاتف، والولاية", "error")
+            lines, total = cart_lines(cart)
+            return render_template("checkout.html", lines=lines, total=total, form=form)
+
+        try:
+            order_id, missing = repo.checkout(
+                cart, form["first_name"], form["phone"], form["state"], last_name=form["last_name"],
+                email=form["email"] or None, address=form["address"], notes=form["notes"],
+                user_id=user_id(), log_request=True)
+        except Exception as e:
+            app.logger.error(f"Checkout failed: {e}")
+            flash("حدث خطأ أثناء حفظ الطلب. حاول مرة أخرى.", "error")
+            lines, total = cart_lines(cart)
+            return render_template("checkout.html", lines=lines, total=total, form=form)
+        if missing:
+            save_cart({pid: quantity for pid, quantity in cart.items() if pid not in missing})
+            flash("بعض المنتجات لم تعد متوفرة وتمت إزالتها من السلة. راجع طلبك ثم أكّد من جديد.", "error")
+            return redirect(url_for("cart"))
+        clear_cart()
+        return redirect(url_for("order_confirmation", order_id=order_id))
+
+    app.add_url_rule("/cart", "cart", cart_view)
+    app.add_url_rule("/cart/add/<int:pid>", "cart_add", cart_add, methods=["POST"])
+    app.add_url_rule("/cart/update", "cart_update", cart_update, methods=["POST"])
+    app.add_url_rule("/cart/remove/<int:pid>", "cart_remove", cart_remove, methods=["POST"])
+    app.add_url_rule("/checkout", "checkout", checkout, methods=["GET", "POST"])
@@ -0,0 +1,68 @@
+"""
+Category Browsing
+Public category pages, keyset-paged on the (category_id, id) index so every
+page is one range scan however deep the shopper goes, and the category menu
+shown on every storefront page.
+
+Product counts come from categories.product_count, which database triggers
+keep current on every product insert/delete/move, so neither the menu nor
+the admin's category delete ever runs COUNT(*). The rendered menu is cached
+per worker for CATEGORY_NAV_TTL_S seconds and dropped right away when this
+worker changes categories or products (CategoryNav.invalidate()).
+
+Routes (registered on the app by init_catalog):
+    GET  /category/<id>          products, newest first (?after=<last product id>)
+"""
+
+import os
+import time
+
+from flask import render_template, request, redirect, url_for, flash
+from markupsafe import Markup
+
+PAGE_SIZE = 24
+NAV_TTL_S = float(os.getenv("CATEGORY_NAV_TTL_S", "60"))
+
+
+class CategoryNav:
+    """The rendered category menu, shared by all requests of this worker"""
+
+    def __init__(self, repo, ttl=NAV_TTL_S):
+        self.repo = repo
+        self.ttl = ttl
+        self._html = None
+        self._expires = 0.0
+
+    def invalidate(self):
+        self._expires = 0.0
+
+    def __call__(self):
+        now = time.monotonic()
+        if self._html is None or now >= self._expires:
+            # concurrent rebuilds render the same thing; last one wins
+            self._html = Markup(render_template("_category_nav.html", categories=self.repo.category_nav()))
+            self._expires = now + self.ttl
+        return self._html
+
+
+def init_catalog(app, repo, ttl=NAV_TTL_S):
+    """Register /category/<id> and the `category_nav()` template helper; returns the CategoryNav"""
+    nav = CategoryNav(repo, ttl)
+
+    @app.context_processor
+    def _catalog_context():
+        return {"category_nav": nav}
+
+    def category(category_id):
+        current = repo.get_category(category_id)
+        if not current:
+            flash("الفئة غير موجودة.", "error")
+            return redirect(url_for("index"))
+        after = request.args.get("after", type=int)
+        products = repo.category_products(category_id, after=after, limit=PAGE_SIZE)
+        next_after = products[-1]["id"] if len(products) == PAGE_SIZE else None
+        return render_template("category.html", category=current, products=products,
+                               next_after=next_after, paged=after is not None)
+
+    app.add_url_rule("/category/<int:category_id>", "category", category)
+    return nav
@@ -0,0 +1,165 @@
+"""
+Faceted Catalog Filtering
+One call returns a filtered page of products plus the count for every facet
+value (category, price range, has an image, new), computed from an
+in-memory bitset index instead of one COUNT(*) per facet.
+
+The index is built from a single products query: product i (newest first)
+is bit i of one Python int per facet value. A filter ANDs the selected
+facets (values of the same facet are ORed); a facet's counts apply every
+*other* selected facet, so shoppers see how many products each choice
+would leave. Each worker rebuilds it at most every FACET_INDEX_TTL_S
+seconds, and at once after this worker changes the catalog (invalidate()).
+
+Routes (registered on the app by init_facets):
+    GET  /api/products/facets    ?category=<id>&price=<range>&has_image=1&new=1 (repeatable),
+                                 &after=<last product id>&limit=
+"""
+
+import os
+import time
+import bisect
+import threading
+from datetime import datetime, timedelta
+
+from flask import request, jsonify
+
+PRICE_BUCKETS = (0, 2000, 10000, 50000, 200000)  # DZD, lower bounds
+NEW_DAYS = int(os.getenv("NEW_PRODUCT_DAYS", "30"))
+INDEX_TTL_S = float(os.getenv("FACET_INDEX_TTL_S", "300"))
+PAGE_SIZE = 24
+MAX_PAGE_SIZE = 100
+FACETS = ("category", "price", "has_image", "new")
+FACET_LABELS = {"has_image": {"1": "مع صورة"}, "new": {"1": f"جديد (آخر {NEW_DAYS} يوماً)"}}
+
+
+def price_bucket(price):
+    """Range key of a price: "2000-10000", or "200000+" for the last bucket"""
+    i = max(bisect.bisect_right(PRICE_BUCKETS, float(price or 0)) - 1, 0)
+    low = PRICE_BUCKETS[i]
+    return f"{low}+" if i == len(PRICE_BUCKETS) - 1 else f"{low}-{PRICE_BUCKETS[i + 1]}"
+
+
+def _bitsets(positions, size):
+    """{value: [positions]} -> {value: int with those bits set}"""
+    bitsets = {}
+    for value, bits in positions.items():
+        buffer = bytearray(size // 8 + 1)
+        for pos in bits:
+            buffer[pos >> 3] |= 1 << (pos & 7)
+        bitsets[value] = int.from_bytes(buffer, "little")
+    return bitsets
+
+
+class FacetIndex:
+    """Immutable bitsets over the catalog as it was at build time"""
+
+    def __init__(self, rows, category_names, now=None):
+        self.ids = [row["id"] for row in rows]
+        self._descending = [-pid for pid in self.ids]
+        self.all = (1 << len(self.ids)) - 1
+        self.category_names = category_names
+        new_since = ((now or datetime.utcnow()) - timedelta(days=NEW_DAYS)).strftime("%Y-%m-%d %H:%M:%S")
+        positions = {facet: {} for facet in FACETS}
+        for pos, row in enumerate(rows):
+            if row["category_id"] is not None:
+                positions["category"].setdefault(str(row["category_id"]), []).append(pos)
+            positions["price"].setdefault(price_bucket(row["price"]), []).append(pos)
+            if row["has_image"]:
+                positions["has_image"].setdefault("1", []).append(pos)
+            if row["created_at"] and str(row["created_at"]) >= new_since:
+                positions["new"].setdefault("1", []).append(pos)
+        self.facets = {facet: _bitsets(values, len(self.ids)) for facet, values in positions.items()}
+
+    def search(self, selected, after=None, limit=PAGE_SIZE):
+        """Filter by `selected` ({facet: values}); returns (page of ids, total, counts, next `after`)"""
+        masks = {}
+        for facet, values in selected.items():
+            if values and facet in self.facets:
+                mask = 0
+                for value in values:
+                    mask |= self.facets[facet].get(value, 0)
+                masks[facet] = mask
+        match = self.all
+        for mask in masks.values():
+            match &= mask
+
+        counts = {}
+        for facet, values in self.facets.items():
+            others = self.all
+            for other, mask in masks.items():
+                if other != facet:
+                    others &= mask
+            counts[facet] = {value: (bits & others).bit_count() for value, bits in values.items()}
+
+        start = bisect.bisect_right(self._descending, -after) if after is not None else 0
+        rest = match >> start
+        page = []
+        while rest and len(page) < limit:
+            lowest = rest & -rest
+            page.append(self.ids[start + lowest.bit_length() - 1])
+            rest ^= lowest
+        return page, match.bit_count(), counts, page[-1] if rest and page else None
+
+    def label(self, facet, value):
+        if facet == "category":
+            return self.category_names.get(int(value), value)
+        if facet == "price":
+            return value.replace("-", " - ").replace("+", " +") + " د.ج"
+        return FACET_LABELS.get(facet, {}).get(value, value)
+
+
+def _ordered(facet, counts):
+    """Price ranges cheapest first, other facets most products first"""
+    if facet == "price":
+        return sorted(counts.items(), key=lambda item: float(item[0].rstrip("+").split("-")[0]))
+    return sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+
+
+class FacetCache:
+    """The worker's current FacetIndex, rebuilt when stale or invalidated"""
+
+    def __init__(self, repo, ttl=INDEX_TTL_S):
+        self.repo = repo
+        self.ttl = ttl
+        self._index = None
+        self._expires = 0.0
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        self._expires = 0.0
+
+    def get(self):
+        if self._index is None or time.monotonic() >= self._expires:
+            with self._lock:  # one rebuild at a time; the others wait for it instead of repeating it
+                if self._index is None or time.monotonic() >= self._expires:
+                    with self.repo.read_snapshot():
+                        rows = self.repo.facet_rows()
+                        names = {row["id"]: row["name"] for row in self.repo.list_categories()}
+                    self._index = FacetIndex(rows, names)
+                    self._expires = time.monotonic() + self.ttl
+        return self._index
+
+
+def init_facets(app, repo, ttl=INDEX_TTL_S):
+    """Register the facet API; returns the FacetCache to invalidate on catalog writes"""
+    cache = FacetCache(repo, ttl)
+
+    def api_product_facets():
+        selected = {facet: request.args.getlist(facet) for facet in FACETS}
+        limit = max(1, min(request.args.get("limit", PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+        index = cache.get()
+        page, total, counts, next_after = index.search(selected, after=request.args.get("after", type=int),
+                                                       limit=limit)
+        products = {row["id"]: row for row in repo.get_products(page)}
+        facets = {
+            facet: [{"value": value, "label": index.label(facet, value), "count": count,
+                     "selected": value in selected[facet]}
+                    for value, count in _ordered(facet, values)]
+            for facet, values in counts.items()
+        }
+        return jsonify({"success": True, "total": total, "next": next_after, "facets": facets,
+                        "rows": [dict(products[pid]) for pid in page if pid in products]})
+
+    app.add_url_rule("/api/products/facets", "api_product_facets", api_product_facets)
+    return cache
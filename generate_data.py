@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+"""
+Synthetic Data Generator
+Populates a Luxora DZ SQLite database with a realistic Algerian catalog and
+order volume (58 wilayas, Arabic product names, images, users, requests)
+using batched bulk inserts, so performance work can be measured at scale.
+
+It writes to synthetic.db unless --db says otherwise, and refuses a
+database that already has products or orders unless --force is given: the
+bulk load turns durability off and is not meant for a live database.
+
+Usage:
+    python generate_data.py --products 5000 --orders 2000000 --requests 300000
+    python generate_data.py --db /tmp/load.db --orders 1000000 --skew 1.2 --users 50000
+"""
+
+import os
+import sys
+import time
+import random
+import sqlite3
+import argparse
+import itertools
+from datetime import datetime, timedelta
+
+from werkzeug.security import generate_password_hash
+
+from repository import Repository, backfill_order_items
+from workflow import ORDERS, REQUESTS
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DB = os.path.join(BASE_DIR, "synthetic.db")
+
+# (name, approximate population in thousands) - population drives order volume
+WILAYAS = [
+    ("أدرار", 400), ("الشلف", 1000), ("الأغواط", 450), ("أم البواقي", 650),
+    ("باتنة", 1100), ("بجاية", 950), ("بسكرة", 750), ("بشار", 270),
+    ("البليدة", 1000), ("البويرة", 700), ("تمنراست", 180), ("تبسة", 650),
+    ("تلمسان", 950), ("تيارت", 850), ("تيزي وزو", 1130), ("الجزائر", 3000),
+    ("الجلفة", 1100), ("جيجل", 640), ("سطيف", 1500), ("سعيدة", 330),
+    ("سكيكدة", 900), ("سيدي بلعباس", 600), ("عنابة", 610), ("قالمة", 480),
+    ("قسنطينة", 940), ("المدية", 820), ("مستغانم", 740), ("المسيلة", 990),
+    ("معسكر", 780), ("ورقلة", 450), ("وهران", 1450), ("البيض", 230),
+    ("إليزي", 40), ("برج بوعريريج", 630), ("بومرداس", 800), ("الطارف", 410),
+    ("تندوف", 60), ("تيسمسيلت", 300), ("الوادي", 650), ("خنشلة", 390),
+    ("سوق أهراس", 440), ("تيبازة", 590), ("ميلة", 770), ("عين الدفلى", 770),
+    ("النعامة", 190), ("عين تموشنت", 370), ("غرداية", 360), ("غليزان", 720),
+    ("تيميمون", 120), ("برج باجي مختار", 20), ("أولاد جلال", 170), ("بني عباس", 50),
+    ("عين صالح", 50), ("عين قزام", 15), ("تقرت", 250), ("جانت", 20),
+    ("المغير", 160), ("المنيعة", 60),
+]
+
+# category -> [(product noun, min price DZD, max price DZD)]
+CATALOG = {
+    "إلكترونيات": [
+        ("هاتف ذكي", 18000, 180000), ("سماعات لاسلكية", 2500, 35000),
+        ("حاسوب محمول", 55000, 350000), ("لوحة إلكترونية", 25000, 160000),
+        ("ساعة ذكية", 6000, 90000), ("شاشة تلفاز", 35000, 280000),
+        ("مكبر صوت بلوتوث", 3000, 40000), ("كاميرا مراقبة", 4500, 30000),
+    ],
+    "أجهزة منزلية": [
+        ("غسالة ملابس", 45000, 180000), ("ثلاجة", 60000, 320000),
+        ("مكنسة كهربائية", 9000, 75000), ("آلة قهوة", 7000, 95000),
+        ("خلاط كهربائي", 3500, 28000), ("مكيف هواء", 48000, 210000),
+        ("فرن كهربائي", 12000, 85000), ("مكواة بخار", 3000, 22000),
+    ],
+    "إكسسوارات": [
+        ("شاحن سريع", 900, 7000), ("كابل USB-C", 400, 3500),
+        ("غطاء هاتف", 500, 4500), ("بطارية متنقلة", 2500, 15000),
+        ("حامل هاتف للسيارة", 800, 5000), ("واقي شاشة", 300, 2500),
+        ("حقيبة حاسوب", 2500, 14000), ("فأرة لاسلكية", 1200, 9000),
+    ],
+}
+BRANDS = ["سامسونج", "شاومي", "أبل", "هواوي", "أوبو", "كوندور", "إيريس", "ستريم", "إل جي", "سوني", "فيليبس", "أنكر"]
+VARIANTS = ["برو", "ماكس", "لايت", "بلس", "ألترا", "2024", "2025", "إس", "نيو", "ميني"]
+COLORS = ["أسود", "أبيض", "أزرق", "رمادي", "ذهبي", "فضي", "أحمر", "أخضر"]
+DESCRIPTIONS = [
+    "{noun} من {brand} بجودة عالية وضمان لمدة {warranty} شهرا. اللون: {color}.",
+    "{noun} أصلي من {brand}، تصميم عصري وأداء ممتاز. متوفر باللون {color} مع توصيل لجميع الولايات.",
+    "احصل على {noun} {brand} الجديد بسعر تنافسي. ضمان {warranty} شهرا والدفع عند الاستلام.",
+    "{noun} {brand} عملي ومناسب للاستعمال اليومي، خفيف الوزن وسهل الاستخدام. اللون {color}.",
+]
+FIRST_NAMES = ["محمد", "أحمد", "يوسف", "عبد القادر", "سفيان", "أمين", "رياض", "كريم", "إسماعيل", "بلال",
+               "فاطمة", "أمينة", "سارة", "مريم", "خديجة", "نور الهدى", "إيمان", "ياسمين", "هاجر", "وفاء"]
+LAST_NAMES = ["بن علي", "بوزيد", "حداد", "مسعودي", "بلقاسم", "شريف", "زروقي", "بن يوسف", "قادري",
+              "عمراني", "بوعلام", "سعيدي", "مرابط", "بلعيد", "دحماني", "خليفي"]
+STREETS = ["حي النصر", "حي 5 جويلية", "شارع العربي بن مهيدي", "حي الأمير عبد القادر",
+           "شارع ديدوش مراد", "حي 1000 مسكن", "حي البدر", "شارع الاستقلال"]
+MESSAGES = ["هل المنتج متوفر؟", "أريد معرفة مدة التوصيل", "هل يوجد ضمان؟",
+            "هل يمكن الدفع عند الاستلام؟", "أريد لونا آخر إن أمكن", ""]
+
+# Weighted distributions: (value, weight)
+QUANTITY_WEIGHTS = [(1, 70), (2, 20), (3, 6), (4, 3), (5, 1)]
+ORDER_STATUS_WEIGHTS = [("pending", 15), ("processing", 10), ("shipped", 15), ("delivered", 55), ("cancelled", 5)]
+REQUEST_STATUS_WEIGHTS = [("pending", 30), ("ordered", 35), ("approved", 20), ("completed", 10), ("rejected", 5)]
+# Orders per hour of day (evening peak)
+HOUR_WEIGHTS = [1, 1, 1, 1, 1, 1, 2, 3, 4, 5, 6, 6, 6, 5, 5, 6, 7, 8, 9, 10, 10, 9, 6, 3]
+
+
+def cumulative(weights):
+    return list(itertools.accumulate(weights))
+
+
+def zipf_weights(n, skew):
+    """Rank-based weights 1/rank^skew; skew=0 is uniform"""
+    return [1.0 / (rank ** skew) for rank in range(1, n + 1)]
+
+
+def table_columns(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def ensure_schema(db_path):
+    """Create the storefront schema if it is missing, else bring it up to date"""
+    Repository(db_path).init_schema()
+
+
+def ensure_users_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username VARCHAR(100) UNIQUE NOT NULL,
+            email VARCHAR(120) UNIQUE NOT NULL,
+            password_hash VARCHAR(255) NOT NULL,
+            first_name VARCHAR(100),
+            last_name VARCHAR(100),
+            phone VARCHAR(20),
+            address TEXT,
+            is_admin BOOLEAN DEFAULT 0,
+            created_at DATETIME,
+            last_login DATETIME
+        )
+    """)
+
+
+class Generator:
+    """Produces and bulk-inserts synthetic rows into an existing database"""
+
+    def __init__(self, conn, seed=42, skew=1.1, wilaya_skew=1.0, days=365, batch_size=10000,
+                 image_ratio=0.85, verbose=True):
+        self.conn = conn
+        self.rng = random.Random(seed)
+        self.skew = skew
+        self.days = days
+        self.batch_size = batch_size
+        self.image_ratio = image_ratio
+        self.verbose = verbose
+        self.now = datetime.now().replace(microsecond=0)
+
+        self.wilaya_names = [name for name, _ in WILAYAS]
+        self.wilaya_cum = cumulative([pop ** wilaya_skew for _, pop in WILAYAS])
+        self.quantity_values, quantity_w = zip(*QUANTITY_WEIGHTS)
+        self.quantity_cum = cumulative(quantity_w)
+        self.order_statuses, order_w = zip(*ORDER_STATUS_WEIGHTS)
+        self.order_status_cum = cumulative(order_w)
+        self.request_statuses, request_w = zip(*REQUEST_STATUS_WEIGHTS)
+        self.request_status_cum = cumulative(request_w)
+        self.hour_cum = cumulative(HOUR_WEIGHTS)
+
+        self.product_ids = []
+        self.product_prices = {}
+        self.product_cum = []
+        self.user_ids = []
+
+    def log(self, message):
+        if self.verbose:
+            print(message)
+
+    def _insert(self, label, sql, rows, total):
+        """executemany in batches, one transaction per batch"""
+        started = time.perf_counter()
+        done = 0
+        while True:
+            chunk = list(itertools.islice(rows, self.batch_size))
+            if not chunk:
+                break
+            self.conn.executemany(sql, chunk)
+            self.conn.commit()
+            done += len(chunk)
+            if self.verbose and total >= self.batch_size * 5 and done % (self.batch_size * 5) == 0:
+                rate = done / (time.perf_counter() - started)
+                print(f"   {label}: {done:,}/{total:,} ({rate:,.0f} rows/s)")
+        elapsed = time.perf_counter() - started
+        self.log(f"✓ {done:,} {label} in {elapsed:.1f}s ({done / elapsed if elapsed else 0:,.0f} rows/s)")
+        return done
+
+    def _timestamp(self):
+        day = self.now - timedelta(days=self.rng.random() * self.days)
+        hour = self.rng.choices(range(24), cum_weights=self.hour_cum)[0]
+        moment = day.replace(hour=hour, minute=self.rng.randrange(60), second=self.rng.randrange(60))
+        return moment.strftime("%Y-%m-%d %H:%M:%S")
+
+    def _phone(self):
+        return self.rng.choice(["05", "06", "07"]) + f"{self.rng.randrange(10 ** 8):08d}"
+
+    def _person(self):
+        return self.rng.choice(FIRST_NAMES), self.rng.choice(LAST_NAMES)
+
+    def categories(self):
+        for name in CATALOG:
+            self.conn.execute("INSERT OR IGNORE INTO categories (name) VALUES (?)", (name,))
+        self.conn.commit()
+        return dict(self.conn.execute("SELECT name, id FROM categories"))
+
+    def products(self, count):
+        category_ids = self.categories()
+        start_id = (self.conn.execute("SELECT MAX(id) FROM products").fetchone()[0] or 0) + 1
+        has_images_table = bool(table_columns(self.conn, "product_images"))
+        images = []
+
+        def rows():
+            for offset in range(count):
+                pid = start_id + offset
+                category = self.rng.choice(list(CATALOG))
+                noun, low, high = self.rng.choice(CATALOG[category])
+                brand = self.rng.choice(BRANDS)
+                name = f"{noun} {brand} {self.rng.choice(VARIANTS)}"
+                desc = self.rng.choice(DESCRIPTIONS).format(
+                    noun=noun, brand=brand, color=self.rng.choice(COLORS),
+                    warranty=self.rng.choice([6, 12, 24]))
+                price = round(self.rng.uniform(low, high) / 100) * 100
+                image = None
+                if self.rng.random() < self.image_ratio:
+                    paths = [f"uploads/generated/p{pid}_{n}.jpg" for n in range(self.rng.randint(1, 4))]
+                    image = paths[0]
+                    images.extend((pid, path, n == 0) for n, path in enumerate(paths))
+                yield (pid, name, price, desc, image, category_ids.get(category))
+
+        self._insert("products", "INSERT INTO products (id, name, price, desc, image, category_id) "
+                     "VALUES (?, ?, ?, ?, ?, ?)", rows(), count)
+        if has_images_table and images:
+            self._insert("product images", "INSERT INTO product_images (product_id, image_path, is_primary) "
+                         "VALUES (?, ?, ?)", iter(images), len(images))
+        self.load_products()
+
+    def load_products(self):
+        """Cache product ids/prices and the popularity distribution"""
+        self.product_prices = dict(self.conn.execute("SELECT id, price FROM products"))
+        self.product_ids = list(self.product_prices)
+        # Popularity rank is independent of id so new products aren't always hot
+        self.rng.shuffle(self.product_ids)
+        self.product_cum = cumulative(zipf_weights(len(self.product_ids), self.skew))
+
+    def users(self, count):
+        ensure_users_table(self.conn)
+        password_hash = generate_password_hash("password123")
+        start = (self.conn.execute("SELECT MAX(id) FROM users").fetchone()[0] or 0) + 1
+
+        def rows():
+            for n in range(start, start + count):
+                first, last = self._person()
+                yield (f"user{n}", f"user{n}@example.dz", password_hash, first, last, self._phone(),
+                       f"{self.rng.choice(STREETS)}، {self.rng.choice(self.wilaya_names)}",
+                       0, self._timestamp())
+
+        self._insert("users", "INSERT INTO users (username, email, password_hash, first_name, last_name, "
+                     "phone, address, is_admin, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                     rows(), count)
+        self.user_ids = [row[0] for row in self.conn.execute("SELECT id FROM users WHERE is_admin = 0")]
+
+    def _pick_products(self, k):
+        return self.rng.choices(self.product_ids, cum_weights=self.product_cum, k=k)
+
+    def orders(self, count, guest_ratio=0.6):
+        if not self.product_ids:
+            self.load_products()
+        if not self.product_ids:
+            raise ValueError("No products in the database - generate products first")
+        columns = table_columns(self.conn, "orders")
+        extra = [c for c in ("user_id", "email", "status", "status_code", "created_at") if c in columns]
+        names = ["product_id", "quantity", "first_name", "last_name", "state", "phone",
+                 "address", "notes", "total_price"] + extra
+        sql = f"INSERT INTO orders ({', '.join(names)}) VALUES ({', '.join('?' * len(names))})"
+
+        def rows():
+            produced = 0
+            while produced < count:
+                k = min(self.batch_size, count - produced)
+                pids = self._pick_products(k)
+                states = self.rng.choices(self.wilaya_names, cum_weights=self.wilaya_cum, k=k)
+                quantities = self.rng.choices(self.quantity_values, cum_weights=self.quantity_cum, k=k)
+                statuses = self.rng.choices(self.order_statuses, cum_weights=self.order_status_cum, k=k)
+                for pid, state, quantity, status in zip(pids, states, quantities, statuses):
+                    first, last = self._person()
+                    row = [pid, quantity, first, last, state, self._phone(),
+                           f"{self.rng.choice(STREETS)}، {state}", "",
+                           self.product_prices[pid] * quantity]
+                    if "user_id" in extra:
+                        registered = self.user_ids and self.rng.random() > guest_ratio
+                        row.append(self.rng.choice(self.user_ids) if registered else None)
+                    if "email" in extra:
+                        row.append(None)
+                    if "status" in extra:
+                        row.append(status)
+                    if "status_code" in extra:
+                        row.append(ORDERS.code(status))
+                    if "created_at" in extra:
+                        row.append(self._timestamp())
+                    yield row
+                produced += k
+
+        self._insert("orders", sql, rows(), count)
+        if "product_name" in columns:
+            # one order_items line per order, priced like the order itself
+            started = time.perf_counter()
+            backfill_order_items(self.conn)
+            self.conn.commit()
+            self.log(f"✓ order lines in {time.perf_counter() - started:.1f}s")
+
+    def product_requests(self, count):
+        if not self.product_ids:
+            self.load_products()
+
+        def rows():
+            produced = 0
+            while produced < count:
+                k = min(self.batch_size, count - produced)
+                pids = self._pick_products(k)
+                states = self.rng.choices(self.wilaya_names, cum_weights=self.wilaya_cum, k=k)
+                quantities = self.rng.choices(self.quantity_values, cum_weights=self.quantity_cum, k=k)
+                statuses = self.rng.choices(self.request_statuses, cum_weights=self.request_status_cum, k=k)
+                for pid, state, quantity, status in zip(pids, states, quantities, statuses):
+                    first, last = self._person()
+                    yield (pid, f"{first} {last}", None, self._phone(), state,
+                           f"{self.rng.choice(STREETS)}، {state}", quantity, self.rng.choice(MESSAGES),
+                           self.product_prices[pid] * quantity, status, REQUESTS.code(status),
+                           self._timestamp())
+                produced += k
+
+        self._insert("product requests", """INSERT INTO product_requests (product_id, user_name, email,
+            phone, state, address, quantity, message, total_price, status, status_code, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""", rows(), count)
+
+
+def generate(db_path, products=1000, orders=100000, requests=20000, users=0, seed=42, skew=1.1,
+             wilaya_skew=1.0, days=365, batch_size=10000, image_ratio=0.85, verbose=True):
+    """Populate db_path (creating the schema if needed) and return the Generator"""
+    ensure_schema(db_path)
+    conn = sqlite3.connect(db_path)
+    # Bulk load settings: durability doesn't matter for a synthetic dataset
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA journal_mode = MEMORY")
+    try:
+        gen = Generator(conn, seed=seed, skew=skew, wilaya_skew=wilaya_skew, days=days,
+                        batch_size=batch_size, image_ratio=image_ratio, verbose=verbose)
+        if products:
+            gen.products(products)
+        if users:
+            gen.users(users)
+        if orders:
+            gen.orders(orders)
+        if requests:
+            gen.product_requests(requests)
+        if (orders or requests) and conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type='table' AND name='sales_daily'").fetchone():
+            started = time.perf_counter()
+            Repository(db_path).rebuild_rollups(conn=conn)
+            conn.commit()
+            gen.log(f"✓ analytics rollups in {time.perf_counter() - started:.1f}s")
+        conn.execute("ANALYZE")
+        conn.commit()
+        return gen
+    finally:
+        conn.close()
+
+
+def existing_rows(db_path):
+    """Products + orders already in db_path (0 for a new or empty database)"""
+    if not os.path.exists(db_path):
+        return 0
+    conn = sqlite3.connect(db_path)
+    try:
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+        return sum(conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                   for table in ("products", "orders") if table in tables)
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a realistic synthetic dataset")
+    parser.add_argument("--db", default=DEFAULT_DB, help="SQLite file to fill (default: synthetic.db)")
+    parser.add_argument("--products", type=int, default=1000)
+    parser.add_argument("--orders", type=int, default=100000)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=0)
+    parser.add_argument("--skew", type=float, default=1.1,
+                        help="Zipf exponent for product popularity (0 = uniform)")
+    parser.add_argument("--wilaya-skew", type=float, default=1.0,
+                        help="exponent applied to wilaya population weights (0 = uniform)")
+    parser.add_argument("--days", type=int, default=365, help="spread timestamps over this many days")
+    parser.add_argument("--image-ratio", type=float, default=0.85, help="share of products with images")
+    parser.add_argument("--batch", type=int, default=10000, help="rows per INSERT batch")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--force", action="store_true",
+                        help="also write into a database that already has products or orders")
+    args = parser.parse_args(argv)
+
+    rows = existing_rows(args.db)
+    if rows and not args.force:
+        sys.exit(f"❌ {args.db} already has {rows} products/orders - pick another --db or pass --force")
+
+    print(f"=== Generating synthetic data into {args.db} ===")
+    started = time.perf_counter()
+    generate(args.db, products=args.products, orders=args.orders, requests=args.requests,
+             users=args.users, seed=args.seed, skew=args.skew, wilaya_skew=args.wilaya_skew,
+             days=args.days, batch_size=args.batch, image_ratio=args.image_ratio)
+    print(f"✅ Done in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
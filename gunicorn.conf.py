@@ -1,5 +1,7 @@
 # Gunicorn configuration file for Luxora DZ
 import os
+import sys
+import subprocess
 
 # Server socket
 bind = f"0.0.0.0:{os.environ.get('PORT', 10000)}"
@@ -7,7 +9,9 @@ backlog = 2048
 
 # Worker processes
 workers = 4
-worker_class = "sync"
+# threads, so an open admin event stream (admin_feed.py) holds a thread, not a whole worker
+worker_class = "gthread"
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
 worker_connections = 1000
 timeout = 30
 keepalive = 2
@@ -26,3 +30,26 @@ proc_name = "luxora_dz"
 
 # Application
 wsgi_module = "app:app"
+
+# Background jobs (jobs.py): JOB_WORKERS worker processes run next to the app,
+# started and stopped with it, so the recurring jobs (pruning, recommendation
+# updates) run on the same machine and disk as the SQLite database. 0 when the
+# workers are deployed separately.
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 1))
+
+
+def when_ready(server):
+    if JOB_WORKERS > 0:
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "jobs.py")
+        server.job_worker = subprocess.Popen([sys.executable, script, "work", "--processes", str(JOB_WORKERS)])
+        server.log.info("Started %s job worker(s) (pid %s)", JOB_WORKERS, server.job_worker.pid)
+
+
+def on_exit(server):
+    worker = getattr(server, "job_worker", None)
+    if worker is not None and worker.poll() is None:
+        worker.terminate()  # workers finish their current job, then exit
+        try:
+            worker.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            worker.kill()
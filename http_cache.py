@@ -0,0 +1,135 @@
+"""
+HTTP Caching
+Every response gets a Cache-Control policy chosen by its endpoint, so a
+reverse proxy in front of the app (Varnish, Nginx) can serve the storefront
+without reaching a worker:
+
+- catalog pages (home, product, category) and their public JSON (facets,
+  also-ordered): `public, max-age=CACHE_MAX_AGE, s-maxage=CACHE_SHARED_MAX_AGE,
+  stale-while-revalidate=CACHE_STALE_WHILE_REVALIDATE` - for anonymous
+  visitors only. A request carrying a session (cart, admin login, a flashed
+  message) gets `private, no-cache`, since the page shows that session's cart
+  count, admin links or messages. Public responses never set a cookie and
+  carry `Vary: Cookie, Accept-Encoding`;
+- uploads, named by content hash (see uploads.py): `public, max-age=1 year,
+  immutable`;
+- everything else (admin, orders, cart, checkout, login, other APIs):
+  `private, no-store`.
+
+Public responses are tagged with surrogate keys in the CACHE_KEY_HEADER
+header (`xkey`, space separated): `catalog` on listings, `product-<id>` for
+every product a page shows. catalog_changed() in the apps calls
+HttpCache.purge(), which sends `PURGE /` with the keys in the same header to
+CACHE_PURGE_URL (Varnish with the xkey vmod, or any proxy speaking that
+convention) - once right away and once CACHE_REPURGE_S seconds later, after
+the other workers' in-memory caches (category menu, facet index) have caught
+up. Without CACHE_PURGE_URL nothing is sent and CACHE_SHARED_MAX_AGE bounds
+how stale the proxy may get.
+"""
+
+import os
+import re
+import logging
+import threading
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import request, session, g
+from flask.sessions import SecureCookieSessionInterface
+
+MAX_AGE = int(os.getenv("CACHE_MAX_AGE", "60"))
+SHARED_MAX_AGE = int(os.getenv("CACHE_SHARED_MAX_AGE", "600"))
+STALE_WHILE_REVALIDATE = int(os.getenv("CACHE_STALE_WHILE_REVALIDATE", "60"))
+KEY_HEADER = os.getenv("CACHE_KEY_HEADER", "xkey")
+PURGE_URL = os.getenv("CACHE_PURGE_URL", "")
+REPURGE_S = float(os.getenv("CACHE_REPURGE_S", "300"))
+PURGE_TIMEOUT_S = 2.0
+
+CATALOG_ENDPOINTS = ("index", "product", "category", "api_product_facets", "api_also_ordered")
+UPLOAD = re.compile(r"uploads/[^/]+-[0-9a-f]{12}\.(jpg|png|gif|webp)")  # content-hashed names only
+YEAR = 365 * 24 * 3600
+
+_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cache-purge")
+logger = logging.getLogger(__name__)
+
+
+def cache_keys(*keys):
+    """Tag the current response with surrogate keys (e.g. "product-5") so purges reach it"""
+    g.setdefault("cache_keys", set()).update(keys)
+
+
+def product_keys(*products):
+    """cache_keys() for every product (dict or row with an id) a page shows"""
+    cache_keys(*(f"product-{product['id']}" for product in products))
+
+
+class CacheSessionInterface(SecureCookieSessionInterface):
+    """Cookie sessions that never set a cookie on a publicly cacheable response"""
+
+    def save_session(self, app, session, response):
+        if response.cache_control.public:
+            return
+        super().save_session(app, session, response)
+
+
+class HttpCache:
+    """Sends purges for changed catalog content to the caching proxy"""
+
+    def __init__(self, purge_url=PURGE_URL, repurge_after=REPURGE_S, key_header=KEY_HEADER):
+        self.purge_url = purge_url
+        self.repurge_after = repurge_after
+        self.key_header = key_header
+
+    def _send(self, keys):
+        try:
+            purge = urllib.request.Request(self.purge_url, method="PURGE", headers={self.key_header: " ".join(keys)})
+            with urllib.request.urlopen(purge, timeout=PURGE_TIMEOUT_S) as response:
+                return response.status
+        except OSError as e:  # the proxy is down or refused: its TTLs still apply
+            logger.warning("Cache purge of %s failed: %s", " ".join(keys), e)
+            return None
+
+    def purge(self, pid=None):
+        """Purge the listings (and the pages showing product `pid`); returns the Future of the first purge"""
+        if not self.purge_url:
+            return None
+        keys = ["catalog"] + ([f"product-{pid}"] if pid is not None else [])
+        if self.repurge_after > 0:
+            timer = threading.Timer(self.repurge_after, _pool.submit, (self._send, keys))
+            timer.daemon = True
+            timer.start()
+        return _pool.submit(self._send, keys)
+
+
+def init_http_cache(app, catalog_endpoints=CATALOG_ENDPOINTS, purge_url=PURGE_URL):
+    """Set Cache-Control/Vary/surrogate keys on every response; returns the HttpCache for purges"""
+    app.session_interface = CacheSessionInterface()
+    catalog_endpoints = set(catalog_endpoints)
+    public = (f"public, max-age={MAX_AGE}, s-maxage={SHARED_MAX_AGE}, "
+              f"stale-while-revalidate={STALE_WHILE_REVALIDATE}")
+
+    @app.after_request
+    def _cache_policy(response):
+        endpoint = request.endpoint
+        if endpoint == "static":
+            if UPLOAD.fullmatch(request.view_args.get("filename", "")) and response.status_code == 200:
+                response.headers["Cache-Control"] = f"public, max-age={YEAR}, immutable"
+            return response  # other static files keep Flask's revalidation
+        if endpoint in catalog_endpoints:
+            response.vary.add("Cookie")
+            response.vary.add("Accept-Encoding")
+            # a session cookie on the request means a cart, a login or flashed messages on the page
+            anonymous = not session and app.config["SESSION_COOKIE_NAME"] not in request.cookies
+            if not anonymous or request.method not in ("GET", "HEAD") or response.status_code != 200:
+                response.headers["Cache-Control"] = "private, no-cache"
+                return response
+            response.headers["Cache-Control"] = public
+            keys = set(g.get("cache_keys", ()))
+            pid = request.view_args.get("pid")
+            keys.add("catalog" if pid is None else f"product-{pid}")  # one product's page goes with it
+            response.headers[KEY_HEADER] = " ".join(sorted(keys))
+            return response
+        response.headers["Cache-Control"] = "private, no-store"
+        return response
+
+    return HttpCache(purge_url)
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Upload Garbage Collection
+Reconciles static/uploads with the database: files that no product uses
+any more (products.image and product_images) are deleted, and so are
+product_images rows whose product is gone (left by deletes made before
+foreign keys were enforced) and temporary upload parts left by workers
+that died mid-upload.
+
+Deleting is conservative: the directory is listed *before* the references
+are read, files younger than IMAGE_GC_GRACE_S are never touched (an image
+is saved a moment before the product row that uses it is committed), only
+image files and upload parts are considered, and images the templates
+refer to directly (the logo) are kept. Files shared by several products
+(uploads are named by content hash) go only when the last one lets go.
+
+`measure` records the displayed size and placeholder (see uploads.py) of
+images stored before those were kept, so their pages can lazy-load them too.
+
+Usage:
+    python image_gc.py run                       # delete orphans now
+    python image_gc.py run --dry-run             # only list them
+    python image_gc.py watch --every 86400       # nightly (run next to the app)
+    python image_gc.py usage --top 20            # disk used per product, orphans, free space
+    python image_gc.py measure                   # sizes/placeholders of older images (--all: every image)
+
+Environment:
+    DB_PATH / DATABASE_URL   database (default database.db next to app.py)
+    UPLOAD_FOLDER            upload directory (default static/uploads next to app.py)
+    IMAGE_GC_GRACE_S         minimum age of a file before it may be deleted (default 3600)
+    IMAGE_GC_INTERVAL_S      period for `watch` (default 86400)
+"""
+
+import os
+import re
+import time
+import shutil
+import argparse
+
+from dotenv import load_dotenv
+
+from repository import open_repository, is_postgres_url
+from uploads import sniff, describe
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".gif", ".webp")
+PART_PREFIX, PART_SUFFIX = ".upload-", ".part"  # see uploads.UploadPart
+TEMPLATE_REFERENCE = re.compile(r"""['"]uploads/([^'"/]+)['"]""")
+
+
+def scan(directory):
+    """{file name: (bytes, mtime)} of the regular files directly in `directory`"""
+    files = {}
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_file(follow_symlinks=False):
+                stat = entry.stat(follow_symlinks=False)
+                files[entry.name] = (stat.st_size, stat.st_mtime)
+    return files
+
+
+def template_images(template_dir=os.path.join(BASE_DIR, "templates")):
+    """Upload file names the templates use literally, e.g. 'uploads/logo.jpg'"""
+    names = set()
+    for root, _dirs, files in os.walk(template_dir):
+        for name in files:
+            with open(os.path.join(root, name), encoding="utf-8", errors="replace") as f:
+                names.update(TEMPLATE_REFERENCE.findall(f.read()))
+    return names
+
+
+def _is_part(name):
+    return name.startswith(PART_PREFIX) and name.endswith(PART_SUFFIX)
+
+
+def find_orphans(repo, directory, grace, now=None, keep=()):
+    """(orphan file names, referenced paths missing from disk) without changing anything"""
+    files = scan(directory)  # listed first: anything uploaded after this is not a candidate
+    referenced = {path[len("uploads/"):] for path in repo.image_references() if path.startswith("uploads/")}
+    cutoff = (now or time.time()) - grace
+    orphans = sorted(name for name, (_size, mtime) in files.items()
+                     if mtime < cutoff and name not in referenced and name not in keep
+                     and (name.lower().endswith(IMAGE_EXTENSIONS) or _is_part(name)))
+    missing = sorted(f"uploads/{name}" for name in referenced if name not in files)
+    return orphans, missing
+
+
+def collect(repo, directory, grace, dry_run=False, now=None, keep=None):
+    """One GC pass; returns {"rows": orphan rows dropped, "files": [(name, bytes)], "missing": [paths]}"""
+    keep = template_images() if keep is None else keep
+    now = now or time.time()
+    rows = 0 if dry_run else repo.drop_orphan_image_rows()
+    orphans, missing = find_orphans(repo, directory, grace, now, keep)
+    removed = []
+    for name in orphans:
+        path = os.path.join(directory, name)
+        try:
+            stat = os.stat(path)
+            if stat.st_mtime >= now - grace:  # re-uploaded since it was listed
+                continue
+            if not dry_run:
+                os.unlink(path)
+        except FileNotFoundError:  # another collector got there first
+            continue
+        removed.append((name, stat.st_size))
+    return {"rows": rows, "files": removed, "missing": missing}
+
+
+def usage(repo, directory):
+    """(per product [{product_id, name, files, bytes}] largest first, totals)"""
+    files = scan(directory)
+    names = {row["id"]: row["name"] for row in repo.list_products()}
+    per_product = {}
+    referenced = set()
+    for path, product_ids in repo.image_references().items():
+        name = path[len("uploads/"):] if path.startswith("uploads/") else path
+        if name not in files:
+            continue
+        referenced.add(name)
+        for pid in product_ids:
+            entry = per_product.setdefault(pid, {"product_id": pid, "name": names.get(pid, "—"),
+                                                 "files": 0, "bytes": 0})
+            entry["files"] += 1
+            entry["bytes"] += files[name][0]
+    disk = shutil.disk_usage(directory)
+    totals = {
+        "referenced": sum(files[name][0] for name in referenced),
+        "parts": sum(size for name, (size, _mtime) in files.items() if _is_part(name)),
+        "unreferenced": sum(size for name, (size, _mtime) in files.items()
+                            if name not in referenced and not _is_part(name)),
+        "disk_total": disk.total,
+        "disk_free": disk.free,
+    }
+    return sorted(per_product.values(), key=lambda entry: -entry["bytes"]), totals
+
+
+def measure(repo, directory, everything=False, paths=None):
+    """Record the size and placeholder of images without them (or of `paths`); returns (measured, [unreadable paths]).
+    Product bundles are dropped unless `paths` is given: the caller knows the products to refresh."""
+    given = paths
+    if paths is None:
+        paths = sorted(repo.image_references()) if everything else repo.unmeasured_images()
+    sizes, unreadable = [], []
+    for path in paths:
+        try:
+            if not path.startswith("uploads/"):
+                raise FileNotFoundError(path)
+            with open(os.path.join(directory, path[len("uploads/"):]), "rb") as f:
+                image = sniff(f)
+                if image is None:
+                    raise ValueError(path)
+                sizes.append((path,) + describe(f, image[1], image[2]))
+        except (OSError, ValueError):
+            unreadable.append(path)
+    repo.set_image_sizes(sizes)
+    if sizes and given is None:
+        repo.invalidate_product_bundles()  # stored pages still lack the sizes
+    return len(sizes), unreadable
+
+
+def _mb(size):
+    return f"{size / (1024 * 1024):8.1f} MB"
+
+
+def _report(result, dry_run, elapsed):
+    verb = "Would delete" if dry_run else "Deleted"
+    for name, size in result["files"]:
+        print(f"  {name:60} {_mb(size)}")
+    for path in result["missing"]:
+        print(f"  ⚠ missing file: {path}")
+    freed = sum(size for _name, size in result["files"])
+    print(f"✓ {verb} {len(result['files'])} files ({_mb(freed).strip()}) and dropped "
+          f"{result['rows']} orphan image rows in {elapsed:.1f}s")
+
+
+def main():
+    load_dotenv()
+    database_url = os.getenv("DATABASE_URL", "")
+    default = database_url if is_postgres_url(database_url) else \
+        os.getenv("DB_PATH", os.path.join(BASE_DIR, "database.db"))
+
+    parser = argparse.ArgumentParser(description="Delete uploads no product uses and report disk usage")
+    parser.add_argument("--db", default=default, help="SQLite path or PostgreSQL URL")
+    parser.add_argument("--dir", default=os.path.join(BASE_DIR, os.getenv("UPLOAD_FOLDER", "static/uploads")),
+                        help="upload directory")
+    commands = parser.add_subparsers(dest="command", required=True)
+    for name in ("run", "watch"):
+        command = commands.add_parser(name, help="collect once" if name == "run" else "collect periodically")
+        command.add_argument("--grace", type=float, default=float(os.getenv("IMAGE_GC_GRACE_S", "3600")))
+        command.add_argument("--dry-run", action="store_true", help="only list what would be deleted")
+        if name == "watch":
+            command.add_argument("--every", type=float, default=float(os.getenv("IMAGE_GC_INTERVAL_S", "86400")))
+    command = commands.add_parser("usage", help="disk used per product")
+    command.add_argument("--top", type=int, default=20)
+    command = commands.add_parser("measure", help="record sizes and placeholders of older images")
+    command.add_argument("--all", action="store_true", help="measure every image again (e.g. after installing Pillow)")
+    args = parser.parse_args()
+
+    repo = open_repository(args.db)
+    repo.init_schema()
+    try:
+        if args.command == "run":
+            started = time.perf_counter()
+            _report(collect(repo, args.dir, args.grace, args.dry_run), args.dry_run, time.perf_counter() - started)
+        elif args.command == "watch":
+            print(f"🧹 Collecting unused uploads every {args.every:.0f}s")
+            while True:
+                started = time.perf_counter()
+                try:
+                    _report(collect(repo, args.dir, args.grace, args.dry_run), args.dry_run,
+                            time.perf_counter() - started)
+                except Exception as e:
+                    print(f"❌ Collection failed: {e}")
+                finally:
+                    repo.release()
+                time.sleep(args.every)
+        elif args.command == "usage":
+            products, totals = usage(repo, args.dir)
+            for entry in products[:args.top]:
+                print(f"  #{entry['product_id']:<6} {entry['name'][:40]:40} {entry['files']:4} files {_mb(entry['bytes'])}")
+            print(f"Referenced:   {_mb(totals['referenced'])}")
+            print(f"Unreferenced: {_mb(totals['unreferenced'])}")
+            print(f"Upload parts: {_mb(totals['parts'])}")
+            print(f"Disk:         {_mb(totals['disk_free'])} free of {_mb(totals['disk_total']).strip()}")
+        elif args.command == "measure":
+            started = time.perf_counter()
+            measured, unreadable = measure(repo, args.dir, args.all)
+            for path in unreadable:
+                print(f"  ⚠ unreadable image: {path}")
+            print(f"✓ Measured {measured} images in {time.perf_counter() - started:.1f}s")
+    finally:
+        repo.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+"""
+Background Jobs
+Slow work leaves the request: a route enqueues a job (a row in the `jobs`
+table of the app's own database - no broker) and `python jobs.py work`
+runs it in separate worker processes.
+
+- priorities: the highest `priority` due job goes first, then the oldest;
+- scheduled jobs: `delay`/`run_at` in the future, and recurring jobs from
+  JOB_SCHEDULE ("kind=seconds,..."), enqueued once per period by whichever
+  worker gets there first (the period is part of the job's unique key);
+- visibility timeout: a claimed job is leased to its worker for `timeout`
+  seconds; when the worker dies (or the job overruns) the lease runs out
+  and another worker takes the job again - handlers must be idempotent;
+- retries: a failed attempt is retried after JOB_BACKOFF_S * 2^(attempt-1)
+  seconds (at most JOB_BACKOFF_MAX_S, jittered) until `max_attempts`, then
+  the job stays failed for an admin to retry from /admin/jobs.
+
+A unique key allows one job per key until finished jobs are pruned
+(JOB_KEEP_S), so keys that should recur carry a time slot ("kind@slot").
+
+With JOBS_ENABLED=1 (a worker runs next to the app) the apps hand their
+slow steps to it: placeholders of uploaded images (uploads.py) and the
+analytics rollup rebuild. Without it they keep doing them inline.
+
+Jobs (handler(repo, payload) registered with @handler):
+    images.measure      placeholders/sizes of uploaded images   {"paths": [...]}
+    images.collect      delete unused uploads (image_gc.py run)
+    recommend.update    fold new orders into the recommendations (recommend.py update)
+    analytics.rebuild   recompute the sales rollups              {"since": "YYYY-MM-DD"} optional
+    jobs.prune          forget jobs finished more than JOB_KEEP_S ago
+    events.prune        forget admin feed events older than ADMIN_EVENTS_KEEP_S (admin_feed.py)
+
+Routes (registered on the app by init_jobs):
+    GET  /admin/jobs                 queue depth, latency and failures (?format=json)
+    POST /admin/jobs/<id>/retry      queue a failed job again
+
+Usage:
+    python jobs.py work                        # one worker
+    python jobs.py work --processes 4          # four worker processes
+    python jobs.py work --burst                # until nothing is due, then exit
+    python jobs.py enqueue images.collect --payload '{}' --delay 60
+    python jobs.py stats
+
+Environment:
+    DB_PATH / DATABASE_URL   database (default database.db next to app.py)
+    JOBS_ENABLED             1: the apps defer slow work to workers (default 0)
+    JOB_PROCESSES            worker processes for `work` (default 1)
+    JOB_POLL_S               how often an idle worker looks for jobs (default 1)
+    JOB_TIMEOUT_S            default lease of a claimed job (default 300)
+    JOB_MAX_ATTEMPTS         default attempts before a job fails (default 5)
+    JOB_BACKOFF_S            first retry delay (default 10)
+    JOB_BACKOFF_MAX_S        longest retry delay (default 3600)
+    JOB_KEEP_S               finished jobs are kept this long (default 604800)
+    JOB_SCHEDULE             recurring jobs (default "jobs.prune=3600,events.prune=3600,recommend.update=600")
+"""
+
+import os
+import json
+import time
+import random
+import signal
+import socket
+import logging
+import argparse
+import threading
+import multiprocessing
+from collections import namedtuple
+
+from dotenv import load_dotenv
+from flask import render_template, request, redirect, url_for, session, flash, jsonify
+
+import image_gc
+import recommend
+import admin_feed
+from http_cache import HttpCache
+from repository import open_repository, is_postgres_url
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+UPLOAD_DIR = os.path.join(BASE_DIR, os.getenv("UPLOAD_FOLDER", "static/uploads"))
+ENABLED = os.getenv("JOBS_ENABLED", "0") == "1"
+PROCESSES = int(os.getenv("JOB_PROCESSES", "1"))
+POLL_S = float(os.getenv("JOB_POLL_S", "1"))
+TIMEOUT_S = float(os.getenv("JOB_TIMEOUT_S", "300"))
+MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+BACKOFF_S = float(os.getenv("JOB_BACKOFF_S", "10"))
+BACKOFF_MAX_S = float(os.getenv("JOB_BACKOFF_MAX_S", "3600"))
+KEEP_S = float(os.getenv("JOB_KEEP_S", str(7 * 24 * 3600)))
+SCHEDULE = os.getenv("JOB_SCHEDULE", "jobs.prune=3600,events.prune=3600,recommend.update=600")
+LATENCY_WINDOW_S = 24 * 3600  # /admin/jobs latency covers the last day
+MAX_ERROR = 2000
+
+Handler = namedtuple("Handler", "fn priority timeout max_attempts")
+HANDLERS = {}
+
+logger = logging.getLogger(__name__)
+
+
+def handler(kind, priority=0, timeout=TIMEOUT_S, max_attempts=MAX_ATTEMPTS):
+    """Register fn(repo, payload) as the job `kind` with its default priority, lease and attempts"""
+    def register(fn):
+        HANDLERS[kind] = Handler(fn, priority, timeout, max_attempts)
+        return fn
+    return register
+
+
+def enqueue(repo, kind, payload=None, priority=None, delay=0, run_at=None, unique_key=None,
+            timeout=None, max_attempts=None, handlers=HANDLERS):
+    """Queue a `kind` job due in `delay` seconds (or at `run_at`); returns its id, None for a duplicate key"""
+    spec = handlers.get(kind)
+    if spec is None:
+        raise ValueError(f"unknown job kind {kind!r}")
+    return repo.enqueue_job(kind, json.dumps(payload or {}), spec.priority if priority is None else priority,
+                            time.time() + delay if run_at is None else run_at,
+                            spec.timeout if timeout is None else timeout,
+                            spec.max_attempts if max_attempts is None else max_attempts, unique_key)
+
+
+def backoff(attempt, base=BACKOFF_S, cap=BACKOFF_MAX_S):
+    """Seconds before retrying after failed attempt number `attempt` (jittered so retries spread out)"""
+    return min(cap, base * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+
+
+def parse_schedule(spec, handlers=HANDLERS):
+    """"kind=seconds,..." -> [(kind, seconds)]; ValueError for an unknown kind or a bad period"""
+    entries = []
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        kind, _, every = item.partition("=")
+        kind = kind.strip()
+        if kind not in handlers:
+            raise ValueError(f"unknown job kind {kind!r} in the job schedule")
+        try:
+            every = float(every)
+        except ValueError:
+            every = 0
+        if every <= 0:
+            raise ValueError(f"invalid job schedule entry {item!r}")
+        entries.append((kind, every))
+    return entries
+
+
+class Schedule:
+    """Recurring jobs: one `kind` job per `every` seconds, whichever worker gets there first"""
+
+    def __init__(self, entries):
+        self.entries = entries
+        self._slots = {}  # kind -> the last period this worker enqueued
+
+    def enqueue_due(self, repo, now=None, handlers=HANDLERS):
+        now = time.time() if now is None else now
+        for kind, every in self.entries:
+            slot = int(now // every)
+            if self._slots.get(kind) != slot:
+                enqueue(repo, kind, run_at=slot * every, unique_key=f"{kind}@{slot}", handlers=handlers)
+                self._slots[kind] = slot
+
+
+def run_job(repo, job, worker, handlers=HANDLERS):
+    """Run one claimed job and record the outcome; returns True when it succeeded"""
+    spec = handlers.get(job["kind"])
+    try:
+        if spec is None:
+            raise LookupError(f"no handler for job kind {job['kind']!r}")
+        spec.fn(repo, json.loads(job["payload"]))
+    except Exception as e:
+        repo.release()  # nothing the handler left half-done gets committed with the outcome
+        final = job["attempts"] >= job["max_attempts"]
+        logger.warning("Job %s (%s) attempt %s/%s failed: %s", job["id"], job["kind"], job["attempts"],
+                       job["max_attempts"], e, exc_info=True)
+        retry_at = None if final else time.time() + backoff(job["attempts"])
+        repo.fail_job(job["id"], worker, f"{type(e).__name__}: {e}"[:MAX_ERROR], retry_at)
+        return False
+    if not repo.finish_job(job["id"], worker):
+        logger.warning("Job %s (%s) finished after its lease ran out; it may run again", job["id"], job["kind"])
+    return True
+
+
+def work(repo, stop, handlers=HANDLERS, schedule=(), poll=POLL_S, burst=False, worker=None):
+    """Claim and run jobs until `stop` is set (with `burst`: until none is due); returns how many ran"""
+    worker = worker or f"{socket.gethostname()}:{os.getpid()}"
+    recurring = Schedule(schedule)
+    ran = 0
+    while not stop.is_set():
+        try:
+            recurring.enqueue_due(repo, handlers=handlers)
+        except Exception as e:  # never let the schedule keep this worker from claiming jobs
+            logger.warning("Could not enqueue recurring jobs: %s", e)
+            repo.release()
+        try:
+            job = repo.claim_job(worker)
+        except Exception as e:  # database busy or unreachable: try again later
+            logger.warning("Could not claim a job: %s", e)
+            job = None
+        if job is None:
+            repo.release()
+            if burst:
+                break
+            stop.wait(poll)
+            continue
+        try:
+            run_job(repo, job, worker, handlers)
+            ran += 1
+        except Exception as e:  # the outcome was not recorded: the job comes back when its lease runs out
+            logger.warning("Could not record the outcome of job %s: %s", job["id"], e)
+        finally:
+            repo.release()
+    return ran
+
+
+def summary(repo, now=None, window=LATENCY_WINDOW_S):
+    """Queue depth per kind/status (with the wait of the oldest due job), latency over `window`, failures"""
+    now = time.time() if now is None else now
+    stats = repo.job_stats(now - window, now)
+    depth = []
+    for row in stats["depth"]:
+        entry = dict(row)
+        entry["oldest_wait_s"] = now - row["oldest_run_at"] if row["status"] == "queued" and row["due"] else None
+        depth.append(entry)
+    return {
+        "window_s": window,
+        "depth": depth,
+        "latency": [dict(row) for row in stats["latency"]],
+        "failed": [dict(row) for row in stats["failed"]],
+    }
+
+
+# -- jobs -------------------------------------------------------------------
+
+@handler("images.measure", priority=10, timeout=120)
+def _measure_images(repo, payload):
+    """Placeholders of images an upload request saved without them"""
+    paths = payload["paths"]
+    image_gc.measure(repo, UPLOAD_DIR, paths=paths)
+    references = repo.image_references()
+    cache = HttpCache()
+    for pid in sorted({pid for path in paths for pid in references.get(path, ())}):
+        repo.invalidate_product_bundles(pid)
+        cache.purge(pid)
+
+
+@handler("images.collect", timeout=3600, max_attempts=1)
+def _collect_images(repo, payload):
+    image_gc.collect(repo, UPLOAD_DIR, float(os.getenv("IMAGE_GC_GRACE_S", "3600")))
+
+
+@handler("recommend.update", timeout=1800, max_attempts=3)
+def _update_recommendations(repo, payload):
+    recommend.update(repo)
+
+
+@handler("analytics.rebuild", priority=5, timeout=1800, max_attempts=3)
+def _rebuild_rollups(repo, payload):
+    repo.rebuild_rollups(since=payload.get("since"))
+
+
+@handler("jobs.prune", priority=-10)
+def _prune_jobs(repo, payload):
+    repo.prune_jobs(time.time() - KEEP_S)
+
+
+@handler("events.prune", priority=-10)
+def _prune_admin_events(repo, payload):
+    repo.prune_admin_events(time.time() - admin_feed.KEEP_S)
+
+
+# -- Flask integration -------------------------------------------------------
+
+class JobQueue:
+    """What routes use to enqueue; `enabled` when a worker runs next to the app (JOBS_ENABLED)"""
+
+    def __init__(self, repo, enabled=ENABLED):
+        self.repo = repo
+        self.enabled = enabled
+
+    def enqueue(self, kind, payload=None, **options):
+        """See enqueue(); returns the job id, or None when `unique_key` is already taken"""
+        return enqueue(self.repo, kind, payload, **options)
+
+
+def _default_is_admin():
+    return bool(session.get("admin"))
+
+
+def init_jobs(app, repo, is_admin=_default_is_admin, enabled=ENABLED):
+    """The /admin/jobs page; returns the JobQueue for routes"""
+    jobs = JobQueue(repo, enabled)
+
+    def admin_jobs():
+        if not is_admin():
+            if request.args.get("format") == "json":
+                return jsonify({"error": "Admin access required"}), 401
+            return redirect(url_for("login"))
+        data = summary(repo)
+        if request.args.get("format") == "json":
+            return jsonify(dict(data, success=True, enabled=jobs.enabled))
+        return render_template("admin_jobs.html", data=data, enabled=jobs.enabled, now=time.time())
+
+    def admin_jobs_retry(job_id):
+        if not is_admin():
+            return redirect(url_for("login"))
+        if repo.retry_job(job_id):
+            flash(f"أعيدت المهمة #{job_id} إلى قائمة الانتظار.", "success")
+        else:
+            flash(f"المهمة #{job_id} غير موجودة أو لم تفشل.", "error")
+        return redirect(url_for("admin_jobs"))
+
+    app.add_url_rule("/admin/jobs", "admin_jobs", admin_jobs)
+    app.add_url_rule("/admin/jobs/<int:job_id>/retry", "admin_jobs_retry", admin_jobs_retry, methods=["POST"])
+    app.extensions["jobs"] = jobs
+    return jobs
+
+
+# -- command line ------------------------------------------------------------
+
+def _worker_main(db, burst, schedule):
+    stop = threading.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_args: stop.set())  # finish the current job, then exit
+    repo = open_repository(db)
+    try:
+        ran = work(repo, stop, schedule=schedule, burst=burst)
+        print(f"✓ Worker {os.getpid()} ran {ran} jobs")
+    finally:
+        repo.close()
+
+
+def _serve(db, processes, burst, schedule):
+    if processes <= 1:
+        _worker_main(db, burst, schedule)
+        return
+    children = [multiprocessing.Process(target=_worker_main, args=(db, burst, schedule), name=f"job-worker-{i}")
+                for i in range(processes)]
+    for child in children:
+        child.start()
+
+    def forward(*_args):
+        for child in children:
+            if child.is_alive():
+                os.kill(child.pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, forward)
+    signal.signal(signal.SIGINT, forward)
+    for child in children:
+        child.join()
+
+
+def _print_stats(data):
+    print("Queue:")
+    for row in data["depth"]:
+        wait = f", oldest due waiting {row['oldest_wait_s']:.0f}s" if row["oldest_wait_s"] is not None else ""
+        print(f"  {row['kind']:20} {row['status']:8} {row['total']:6} ({row['due']} due{wait})")
+    print(f"Done in the last {data['window_s'] / 3600:.0f}h:")
+    for row in data["latency"]:
+        print(f"  {row['kind']:20} {row['done']:6}  wait avg {row['avg_wait_s']:.1f}s max {row['max_wait_s']:.1f}s"
+              f"  run avg {row['avg_run_s']:.1f}s max {row['max_run_s']:.1f}s")
+    for row in data["failed"]:
+        print(f"  ❌ #{row['id']} {row['kind']} after {row['attempts']} attempts: {row['last_error']}")
+
+
+def main():
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    database_url = os.getenv("DATABASE_URL", "")
+    default = database_url if is_postgres_url(database_url) else \
+        os.getenv("DB_PATH", os.path.join(BASE_DIR, "database.db"))
+
+    parser = argparse.ArgumentParser(description="Run background jobs queued by the app")
+    parser.add_argument("--db", default=default, help="SQLite path or PostgreSQL URL")
+    commands = parser.add_subparsers(dest="command", required=True)
+    command = commands.add_parser("work", help="run jobs")
+    command.add_argument("--processes", type=int, default=PROCESSES)
+    command.add_argument("--burst", action="store_true", help="exit once no job is due")
+    command.add_argument("--schedule", default=SCHEDULE, help='recurring jobs, "kind=seconds,..."')
+    command = commands.add_parser("enqueue", help="queue a job")
+    command.add_argument("kind", choices=sorted(HANDLERS))
+    command.add_argument("--payload", default="{}", help="JSON")
+    command.add_argument("--priority", type=int)
+    command.add_argument("--delay", type=float, default=0, help="seconds before it is due")
+    commands.add_parser("stats", help="queue depth, latency and failures")
+    args = parser.parse_args()
+    if args.command == "work":
+        try:
+            schedule = parse_schedule(args.schedule)
+        except ValueError as e:
+            parser.error(str(e))
+
+    repo = open_repository(args.db)
+    try:
+        repo.init_schema()
+        if args.command == "enqueue":
+            job_id = enqueue(repo, args.kind, json.loads(args.payload), args.priority, args.delay)
+            print(f"✓ Queued job #{job_id} ({args.kind})")
+        elif args.command == "stats":
+            _print_stats(summary(repo))
+    finally:
+        repo.close()
+    if args.command == "work":
+        print(f"⚙️ {args.processes} job worker(s)" + (f", recurring: {args.schedule}" if schedule else ""))
+        _serve(args.db, args.processes, args.burst, schedule)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,118 +1,360 @@
 #!/usr/bin/env python3
 """
 Data Migration Script
-Migrates data from the old SQLite database to the new SQLAlchemy structure
+Migrates data from the old SQLite database (database.db, app.py schema) into
+the SQLAlchemy database used by app_sql.py / app_with_users.py (DATABASE_URL).
+
+Tables are streamed in id order and inserted in batches. Old -> new id
+mappings are kept in memory (categories and products are matched by name,
+as before, so existing rows are reused instead of duplicated). Each batch is
+committed together with its progress row and id mappings in the target
+database, so an interrupted run resumes exactly where it stopped.
+
+Usage:
+    python migrate_data.py                       # asks for confirmation
+    python migrate_data.py --yes --batch-size 5000
+    python migrate_data.py --reset               # forget progress and start over
 """
 
-import sqlite3
 import os
+import sys
+import time
+import sqlite3
+import argparse
+from datetime import datetime
+
 from dotenv import load_dotenv
-from app_sql import app
-from models import db, Product, Order
+from sqlalchemy import (create_engine, select, delete, MetaData, Table, Column, Integer, String,
+                        Boolean, PrimaryKeyConstraint)
+
+from models import db
+from repository import normalize_database_url, engine_options
+from workflow import ORDERS, REQUESTS
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+progress_metadata = MetaData()
+migration_progress = Table(
+    "_migration_progress", progress_metadata,
+    Column("table_name", String(64), primary_key=True),
+    Column("last_source_id", Integer, nullable=False, default=0),
+    Column("copied", Integer, nullable=False, default=0),
+    Column("skipped", Integer, nullable=False, default=0),
+    Column("done", Boolean, nullable=False, default=False),
+)
+migration_id_map = Table(
+    "_migration_id_map", progress_metadata,
+    Column("table_name", String(64), nullable=False),
+    Column("old_id", Integer, nullable=False),
+    Column("new_id", Integer, nullable=False),
+    PrimaryKeyConstraint("table_name", "old_id"),
+)
+
+
+def default_target_url():
+    """DATABASE_URL, resolved the way Flask-SQLAlchemy does (relative SQLite paths live in instance/)"""
+    url = normalize_database_url(os.getenv("DATABASE_URL", "sqlite:///database.db"))
+    if url.startswith("sqlite:///") and not os.path.isabs(url[len("sqlite:///"):]):
+        return f"sqlite:///{os.path.join(BASE_DIR, 'instance', url[len('sqlite:///'):])}"
+    return url
+
+
+def _timestamp(value):
+    if isinstance(value, datetime):
+        return value
+    if value:
+        try:
+            return datetime.fromisoformat(str(value))
+        except ValueError:
+            pass
+    return datetime.utcnow()
+
+
+def _text(value, default=""):
+    return default if value is None else value
+
+
+def _get(row, columns, name, default=None):
+    """row[name] when the (possibly older) source table has that column - sqlite3.Row has no .get()"""
+    return row[name] if name in columns else default
+
+
+class Migration:
+    """Batched, resumable copy of the legacy tables into the SQLAlchemy schema"""
+
+    def __init__(self, source_path, engine, batch_size=5000, verbose=True):
+        self.source_path = source_path
+        self.engine = engine
+        self.batch_size = batch_size
+        self.log = print if verbose else (lambda *a, **k: None)
+        self.maps = {}           # table -> {old id: new id}
+        self.product_prices = {}  # old product id -> price, for orders missing total_price
+
+    # -- row transforms (source sqlite3.Row -> target dict) -----------------
+
+    def _category(self, row, columns):
+        return {"name": row["name"], "description": _get(row, columns, "description")}
+
+    def _product(self, row, columns):
+        self.product_prices[row["id"]] = row["price"] or 0
+        category_id = _get(row, columns, "category_id")
+        return {
+            "name": row["name"],
+            "price": row["price"] or 0,
+            "desc": _get(row, columns, "desc"),
+            "image": _get(row, columns, "image"),
+            "category_id": self.maps.get("categories", {}).get(category_id),
+            "created_at": _timestamp(_get(row, columns, "created_at")),
+        }
+
+    def _product_image(self, row, columns):
+        product_id = self.maps["products"].get(row["product_id"])
+        if product_id is None:
+            return None
+        return {"product_id": product_id, "image_path": row["image_path"],
+                "is_primary": bool(_get(row, columns, "is_primary", False))}
 
-def migrate_data():
+    def _order(self, row, columns):
+        product_id = self.maps["products"].get(row["product_id"])
+        if product_id is None:
+            return None
+        quantity = row["quantity"] or 1
+        total_price = _get(row, columns, "total_price")
+        if total_price is None:
+            total_price = self.product_prices.get(row["product_id"], 0) * quantity
+        status = _get(row, columns, "status")
+        status = status if status in ORDERS.codes else "pending"
+        return {
+            "product_id": product_id,
+            "user_id": None,  # the legacy database has no user accounts
+            "quantity": quantity,
+            "first_name": _text(row["first_name"]),
+            "last_name": _text(_get(row, columns, "last_name")),
+            "state": _text(_get(row, columns, "state")),
+            "phone": _text(row["phone"]),
+            "email": _get(row, columns, "email"),
+            "address": _text(_get(row, columns, "address")),
+            "notes": _text(_get(row, columns, "notes")),
+            "total_price": total_price,
+            "status": status,
+            "status_code": ORDERS.code(status),
+            "created_at": _timestamp(_get(row, columns, "created_at")),
+        }
+
+    def _product_request(self, row, columns):
+        product_id = self.maps["products"].get(row["product_id"])
+        if product_id is None:
+            return None
+        status = _get(row, columns, "status")
+        status = status if status in REQUESTS.codes else "pending"
+        return {
+            "product_id": product_id,
+            "user_name": _text(row["user_name"]),
+            "email": _get(row, columns, "email"),
+            "phone": _text(row["phone"]),
+            "state": _text(_get(row, columns, "state")),
+            "address": _get(row, columns, "address"),
+            "quantity": _get(row, columns, "quantity") or 1,
+            "message": _get(row, columns, "message"),
+            "status": status,
+            "status_code": REQUESTS.code(status),
+            "total_price": _get(row, columns, "total_price"),
+            "created_at": _timestamp(_get(row, columns, "created_at")),
+        }
+
+    # (source table, transform, natural key used to reuse existing target rows, keep id map)
+    @property
+    def steps(self):
+        return [
+            ("categories", self._category, "name", True),
+            ("products", self._product, "name", True),
+            ("product_images", self._product_image, None, False),
+            ("orders", self._order, None, False),
+            ("product_requests", self._product_request, None, False),
+        ]
+
+    # -- engine ---------------------------------------------------------------
+
+    def reset(self):
+        progress_metadata.create_all(self.engine)
+        with self.engine.begin() as conn:
+            conn.execute(delete(migration_progress))
+            conn.execute(delete(migration_id_map))
+
+    def run(self):
+        db.metadata.create_all(self.engine)
+        progress_metadata.create_all(self.engine)
+        source = sqlite3.connect(f"file:{self.source_path}?mode=ro", uri=True)
+        source.row_factory = sqlite3.Row
+        try:
+            tables = {row[0] for row in source.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+            with self.engine.connect() as conn:
+                for name, _transform, _key, keep_map in self.steps:
+                    if keep_map:
+                        rows = conn.execute(select(migration_id_map.c.old_id, migration_id_map.c.new_id)
+                                            .where(migration_id_map.c.table_name == name))
+                        self.maps[name] = dict(rows.all())
+            if "products" in tables:
+                # orders of already-migrated products may need the old prices when resuming
+                self.product_prices = dict(source.execute("SELECT id, price FROM products").fetchall())
+
+            results = {}
+            for name, transform, key, keep_map in self.steps:
+                if name not in tables:
+                    self.log(f"- {name}: not in source database, skipped")
+                    continue
+                results[name] = self._copy_table(source, name, transform, key, keep_map)
+            return results
+        finally:
+            source.close()
+
+    def _progress(self, conn, name):
+        row = conn.execute(select(migration_progress).where(migration_progress.c.table_name == name)).first()
+        if row is None:
+            conn.execute(migration_progress.insert().values(table_name=name, last_source_id=0, copied=0,
+                                                            skipped=0, done=False))
+            return {"last_source_id": 0, "copied": 0, "skipped": 0, "done": False}
+        return dict(row._mapping)
+
+    def _copy_table(self, source, name, transform, key, keep_map):
+        target = db.metadata.tables[name]
+        columns = {row[1] for row in source.execute(f"PRAGMA table_info({name})")}
+        with self.engine.begin() as conn:
+            progress = self._progress(conn, name)
+            existing = {}
+            if key:
+                existing = dict(conn.execute(select(target.c[key], target.c.id)).all())
+        if progress["done"]:
+            self.log(f"✓ {name}: already migrated ({progress['copied']} rows)")
+            return progress["copied"]
+
+        total = source.execute(f"SELECT COUNT(*) FROM {name} WHERE id > ?",
+                               (progress["last_source_id"],)).fetchone()[0]
+        if progress["last_source_id"]:
+            self.log(f"↻ {name}: resuming after id {progress['last_source_id']} ({total} rows left)")
+        started = time.perf_counter()
+        processed = 0
+        last_id = progress["last_source_id"]
+        id_map = self.maps.setdefault(name, {})
+
+        while True:
+            batch = source.execute(f"SELECT * FROM {name} WHERE id > ? ORDER BY id LIMIT ?",
+                                   (last_id, self.batch_size)).fetchall()
+            if not batch:
+                break
+            inserts, insert_old_ids, reused, duplicates, skipped = [], [], [], [], 0
+            pending = {}  # natural key -> index in inserts, for repeats inside one batch
+            for row in batch:
+                values = transform(row, columns)
+                if values is None:
+                    skipped += 1
+                elif key and values[key] in existing:
+                    reused.append((row["id"], existing[values[key]]))
+                elif key and values[key] in pending:
+                    duplicates.append((row["id"], values[key]))
+                else:
+                    if key:
+                        pending[values[key]] = len(inserts)
+                    inserts.append(values)
+                    insert_old_ids.append(row["id"])
+            last_id = batch[-1]["id"]
+
+            with self.engine.begin() as conn:
+                new_pairs = list(reused)
+                if inserts and keep_map:
+                    result = conn.execute(target.insert().returning(target.c.id, sort_by_parameter_order=True),
+                                          inserts)
+                    new_ids = [r[0] for r in result]
+                    new_pairs += list(zip(insert_old_ids, new_ids))
+                    existing.update((values[key], new_id) for values, new_id in zip(inserts, new_ids))
+                    new_pairs += [(old, new_ids[pending[name_key]]) for old, name_key in duplicates]
+                elif inserts:
+                    conn.execute(target.insert(), inserts)
+                if keep_map and new_pairs:
+                    conn.execute(migration_id_map.insert(),
+                                 [{"table_name": name, "old_id": old, "new_id": new} for old, new in new_pairs])
+                progress["copied"] += len(inserts) + len(reused) + len(duplicates)
+                progress["skipped"] += skipped
+                conn.execute(migration_progress.update()
+                             .where(migration_progress.c.table_name == name)
+                             .values(last_source_id=last_id, copied=progress["copied"],
+                                     skipped=progress["skipped"]))
+            id_map.update(new_pairs)
+
+            processed += len(batch)
+            elapsed = time.perf_counter() - started
+            self.log(f"  {name}: {processed}/{total} rows ({processed / elapsed if elapsed else 0:,.0f} rows/s)")
+
+        with self.engine.begin() as conn:
+            conn.execute(migration_progress.update().where(migration_progress.c.table_name == name)
+                         .values(done=True))
+        elapsed = time.perf_counter() - started
+        note = f", skipped {progress['skipped']} without a matching product" if progress["skipped"] else ""
+        self.log(f"✓ {name}: {progress['copied']} rows in {elapsed:.1f}s "
+                 f"({processed / elapsed if elapsed else 0:,.0f} rows/s){note}")
+        return progress["copied"]
+
+
+def migrate_data(source_path=None, target_url=None, batch_size=5000, reset=False, verbose=True):
     """Migrate data from old SQLite database to new structure"""
-    
-    # Path to the old database
-    old_db_path = os.path.join(os.path.dirname(__file__), 'database.db')
-    
-    if not os.path.exists(old_db_path):
-        print(f"Old database not found at {old_db_path}")
+    source_path = source_path or os.path.join(BASE_DIR, "database.db")
+    if not os.path.exists(source_path):
+        print(f"Old database not found at {source_path}")
         print("Starting with fresh database...")
-        return
-    
-    print("Starting data migration...")
-    
-    # Connect to old SQLite database
-    old_conn = sqlite3.connect(old_db_path)
-    old_conn.row_factory = sqlite3.Row
-    old_cursor = old_conn.cursor()
-    
-    with app.app_context():
-        # Create new tables
-        db.create_all()
-        
+        return {}
+
+    target_url = target_url or default_target_url()
+    if target_url.startswith("sqlite:///"):
+        os.makedirs(os.path.dirname(os.path.abspath(target_url[len("sqlite:///"):])), exist_ok=True)
+    engine = create_engine(target_url, **engine_options(target_url))
+    try:
+        migration = Migration(source_path, engine, batch_size=batch_size, verbose=verbose)
+        if reset:
+            migration.reset()
+        return migration.run()
+    finally:
+        engine.dispose()
+
+
+def backup_old_database(source_path=None):
+    """Create a consistent backup of the old database (safe while the app is writing)"""
+    source_path = source_path or os.path.join(BASE_DIR, "database.db")
+    if os.path.exists(source_path):
+        backup_path = os.path.join(os.path.dirname(source_path), "database_backup.db")
+        source = sqlite3.connect(source_path)
+        target = sqlite3.connect(backup_path)
         try:
-            # Migrate products
-            print("Migrating products...")
-            old_cursor.execute("SELECT * FROM products")
-            products = old_cursor.fetchall()
-            
-            for product_row in products:
-                # Check if product already exists
-                existing_product = Product.query.filter_by(name=product_row['name']).first()
-                if not existing_product:
-                    new_product = Product(
-                        name=product_row['name'],
-                        price=product_row['price'],
-                        desc=product_row['desc'],
-                        image=product_row['image']
-                    )
-                    db.session.add(new_product)
-            
-            db.session.commit()
-            products_count = Product.query.count()
-            print(f"✓ Migrated {products_count} products")
-            
-            # Migrate orders
-            print("Migrating orders...")
-            old_cursor.execute("SELECT * FROM orders")
-            orders = old_cursor.fetchall()
-            
-            for order_row in orders:
-                # Find the corresponding product in the new database
-                product = Product.query.filter_by(name=
-                    old_cursor.execute("SELECT name FROM products WHERE id=?", (order_row['product_id'],)).fetchone()['name']
-                ).first()
-                
-                if product:
-                    new_order = Order(
-                        product_id=product.id,
-                        quantity=order_row['quantity'],
-                        first_name=order_row['first_name'],
-                        last_name=order_row.get('last_name', ''),
-                        state=order_row['state'],
-                        phone=order_row['phone'],
-                        email=order_row.get('email', ''),
-                        address=order_row['address'],
-                        notes=order_row.get('notes', ''),
-                        total_price=order_row['total_price']
-                    )
-                    db.session.add(new_order)
-            
-            db.session.commit()
-            orders_count = Order.query.count()
-            print(f"✓ Migrated {orders_count} orders")
-            
-            print("✅ Migration completed successfully!")
-            
-        except Exception as e:
-            db.session.rollback()
-            print(f"❌ Migration failed: {e}")
-            raise
+            source.backup(target)
         finally:
-            old_conn.close()
-
-def backup_old_database():
-    """Create a backup of the old database"""
-    old_db_path = os.path.join(os.path.dirname(__file__), 'database.db')
-    if os.path.exists(old_db_path):
-        backup_path = os.path.join(os.path.dirname(__file__), 'database_backup.db')
-        import shutil
-        shutil.copy2(old_db_path, backup_path)
+            target.close()
+            source.close()
         print(f"✓ Old database backed up to {backup_path}")
 
+
 if __name__ == "__main__":
     # Load environment variables
     load_dotenv()
-    
+
+    parser = argparse.ArgumentParser(description="Migrate database.db into the SQLAlchemy database")
+    parser.add_argument("--source", default=os.path.join(BASE_DIR, "database.db"))
+    parser.add_argument("--target", default=None, help="SQLAlchemy URL (default: DATABASE_URL)")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--reset", action="store_true", help="discard saved progress and start over")
+    parser.add_argument("--yes", action="store_true", help="don't ask for confirmation")
+    args = parser.parse_args()
+
+    target = args.target or default_target_url()
     print("=== Database Migration Tool ===")
-    print(f"Current database URL: {os.getenv('DATABASE_URL', 'sqlite:///database.db')}")
-    
+    print(f"Source: {args.source}")
+    print(f"Target: {target.split('@')[-1]}")
+
     # Ask for confirmation
-    response = input("Do you want to proceed with migration? (y/N): ")
-    if response.lower() in ['y', 'yes']:
-        backup_old_database()
-        migrate_data()
-    else:
-        print("Migration cancelled.")
+    if not args.yes:
+        response = input("Do you want to proceed with migration? (y/N): ")
+        if response.lower() not in ['y', 'yes']:
+            print("Migration cancelled.")
+            sys.exit(0)
+    backup_old_database(args.source)
+    started = time.perf_counter()
+    results = migrate_data(args.source, target, batch_size=args.batch_size, reset=args.reset)
+    print(f"✅ Migration completed: {sum(results.values())} rows in {time.perf_counter() - started:.1f}s")
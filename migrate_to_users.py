@@ -9,14 +9,14 @@ import os
 from dotenv import load_dotenv
 from app_with_users import app
 from models import db, User, Product, Order
+from backup import create_backup
 
 def backup_database():
-    """Create a backup of the current database"""
+    """Create a backup of the current database (online, safe while the app is running)"""
     db_path = "database.db"
     if os.path.exists(db_path):
-        backup_path = f"database_backup_{int(os.path.getctime(db_path))}.db"
-        import shutil
-        shutil.copy2(db_path, backup_path)
+        backup_path = create_backup(db_path, os.getenv("BACKUP_DIR", "backups"),
+                                    keep=int(os.getenv("BACKUP_KEEP", "14")), label="pre-users")
         print(f"✓ Database backed up to {backup_path}")
         return True
     return False
@@ -5,6 +5,20 @@ from werkzeug.security import generate_password_hash, check_password_hash
 
 db = SQLAlchemy()
 
+class Category(db.Model):
+    __tablename__ = 'categories'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(255), unique=True, nullable=False)
+    description = db.Column(db.Text)
+    # maintained by database triggers (see repository.TRIGGERS); never set it from Python
+    product_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    
+    products = db.relationship('Product', backref='category', lazy=True)
+    
+    def __repr__(self):
+        return f'<Category {self.name}>'
+
 class Product(db.Model):
     __tablename__ = 'products'
     
@@ -13,10 +27,17 @@ class Product(db.Model):
     price = db.Column(db.Float, nullable=False, default=0.0)
     desc = db.Column(db.Text)
     image = db.Column(db.String(255))
+    # displayed size and blurred placeholder of `image` (see uploads.py)
+    image_width = db.Column(db.Integer)
+    image_height = db.Column(db.Integer)
+    image_placeholder = db.Column(db.Text)
+    category_id = db.Column(db.Integer, db.ForeignKey('categories.id'))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationship with orders
     orders = db.relationship('Order', backref='product', lazy=True)
+    images = db.relationship('ProductImage', backref='product', lazy=True, cascade='all, delete-orphan',
+                             order_by='(ProductImage.is_primary.desc(), ProductImage.id)')
     
     def __repr__(self):
         return f'<Product {self.name}>'
@@ -52,7 +73,8 @@ class Order(db.Model):
     __tablename__ = 'orders'
     
     id = db.Column(db.Integer, primary_key=True)
-    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
+    # first product of the order; NULL once that product is deleted (the lines keep its name)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id', ondelete='SET NULL'))
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
     quantity = db.Column(db.Integer, nullable=False)
     first_name = db.Column(db.String(100), nullable=False)
@@ -64,7 +86,181 @@ class Order(db.Model):
     notes = db.Column(db.Text)
     total_price = db.Column(db.Float, nullable=False)
     status = db.Column(db.String(50), default='pending')
+    # workflow.py code of `status`; work queues are indexed on it
+    status_code = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Snapshot of the ordered products' names, written with the order
+    product_name = db.Column(db.Text)
+    item_count = db.Column(db.Integer, default=1)
+    
+    items = db.relationship('OrderItem', backref='order', lazy=True, cascade='all, delete-orphan',
+                            order_by='OrderItem.id')
     
     def __repr__(self):
         return f'<Order {self.id} - {self.first_name}>'
+
+class OrderItem(db.Model):
+    __tablename__ = 'order_items'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    order_id = db.Column(db.Integer, db.ForeignKey('orders.id', ondelete='CASCADE'), nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id', ondelete='SET NULL'))
+    # Name and price as they were when the order was placed
+    product_name = db.Column(db.Text, nullable=False)
+    unit_price = db.Column(db.Float, nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    line_total = db.Column(db.Float, nullable=False)
+    
+    def __repr__(self):
+        return f'<OrderItem {self.order_id} - {self.product_name} x {self.quantity}>'
+
+class SalesDaily(db.Model):
+    """Orders/units/revenue per day x product x wilaya, kept current by the repository"""
+    __tablename__ = 'sales_daily'
+    
+    day = db.Column(db.Text, primary_key=True)
+    product_id = db.Column(db.Integer, primary_key=True)
+    state = db.Column(db.Text, primary_key=True)
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+    units = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<SalesDaily {self.day} {self.product_id} {self.state}>'
+
+class OrdersDaily(db.Model):
+    """Whole orders per day x wilaya (multi-product orders counted once)"""
+    __tablename__ = 'orders_daily'
+    
+    day = db.Column(db.Text, primary_key=True)
+    state = db.Column(db.Text, primary_key=True)
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+    units = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<OrdersDaily {self.day} {self.state}>'
+
+class RequestStatusDaily(db.Model):
+    """Product request counts per day x product x wilaya x status"""
+    __tablename__ = 'request_status_daily'
+    
+    day = db.Column(db.Text, primary_key=True)
+    product_id = db.Column(db.Integer, primary_key=True)
+    state = db.Column(db.Text, primary_key=True)
+    status = db.Column(db.Text, primary_key=True)
+    request_count = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<RequestStatusDaily {self.day} {self.product_id} {self.status}>'
+
+class StatusCount(db.Model):
+    """Number of orders / product requests in each status, kept current by the repository"""
+    __tablename__ = 'status_counts'
+    
+    kind = db.Column(db.Text, primary_key=True)
+    status_code = db.Column(db.Integer, primary_key=True)
+    total = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<StatusCount {self.kind} {self.status_code}: {self.total}>'
+
+class ArchivePartition(db.Model):
+    """One monthly archive table (orders_2024_01, ...) created by archive.py"""
+    __tablename__ = 'archive_partitions'
+
+    table_name = db.Column(db.Text, primary_key=True)
+    base_table = db.Column(db.Text, nullable=False)
+    month = db.Column(db.Text, nullable=False)
+    row_count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<ArchivePartition {self.table_name}: {self.row_count}>'
+
+class ProductBundle(db.Model):
+    """Precomputed product page (product, images, related) as JSON; see Repository.product_bundle"""
+    __tablename__ = 'product_bundles'
+
+    product_id = db.Column(db.Integer, primary_key=True)
+    payload = db.Column(db.Text, nullable=False)
+    # ",3,17," - the related product ids, so their edits can drop this bundle
+    related_ids = db.Column(db.Text, nullable=False, default='', server_default='')
+    built_at = db.Column(db.Float, nullable=False)
+
+    def __repr__(self):
+        return f'<ProductBundle {self.product_id}>'
+
+class Job(db.Model):
+    """A background job for jobs.py workers; claimed and leased by Repository.claim_job"""
+    __tablename__ = 'jobs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.Text, nullable=False)
+    payload = db.Column(db.Text, nullable=False, default='{}', server_default='{}')
+    priority = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # queued -> running -> done | failed (running goes back to queued on a retry or an expired lease)
+    status = db.Column(db.Text, nullable=False, default='queued', server_default='queued')
+    run_at = db.Column(db.Float, nullable=False)
+    timeout = db.Column(db.Float, nullable=False)
+    attempts = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    max_attempts = db.Column(db.Integer, nullable=False)
+    locked_until = db.Column(db.Float)
+    worker = db.Column(db.Text)
+    unique_key = db.Column(db.Text, unique=True)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.Float, nullable=False)
+    started_at = db.Column(db.Float)
+    finished_at = db.Column(db.Float)
+
+    def __repr__(self):
+        return f'<Job {self.id} {self.kind} {self.status}>'
+
+class AdminEvent(db.Model):
+    """A new order/request or status change for the admin feed (admin_feed.py); its id is the feed's cursor"""
+    __tablename__ = 'admin_events'
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.Text, nullable=False)          # orders | requests
+    item_id = db.Column(db.Integer, nullable=False)
+    action = db.Column(db.Text, nullable=False)        # created | status
+    status = db.Column(db.Text)
+    payload = db.Column(db.Text, nullable=False, default='{}', server_default='{}')
+    created_at = db.Column(db.Float, nullable=False)
+
+    def __repr__(self):
+        return f'<AdminEvent {self.id} {self.kind} {self.item_id} {self.action}>'
+
+class ProductImage(db.Model):
+    __tablename__ = 'product_images'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id', ondelete='CASCADE'), nullable=False)
+    image_path = db.Column(db.String(255), nullable=False)
+    is_primary = db.Column(db.Boolean, default=False)
+    width = db.Column(db.Integer)
+    height = db.Column(db.Integer)
+    placeholder = db.Column(db.Text)
+    
+    def __repr__(self):
+        return f'<ProductImage {self.image_path}>'
+
+class ProductRequest(db.Model):
+    __tablename__ = 'product_requests'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id', ondelete='CASCADE'), nullable=False)
+    user_name = db.Column(db.String(200), nullable=False)
+    email = db.Column(db.String(120))
+    phone = db.Column(db.String(20), nullable=False)
+    state = db.Column(db.String(100), nullable=False)
+    address = db.Column(db.Text)
+    quantity = db.Column(db.Integer, nullable=False, default=1)
+    message = db.Column(db.Text)
+    status = db.Column(db.String(50), default='pending')
+    # workflow.py code of `status`; work queues are indexed on it
+    status_code = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    total_price = db.Column(db.Float)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<ProductRequest {self.id} - {self.status}>'
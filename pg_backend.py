@@ -0,0 +1,283 @@
+"""
+PostgreSQL Backend
+sqlite3-style connection adapter and per-worker connection pool used by
+repository.PostgresRepository when DATABASE_URL points at PostgreSQL.
+
+The adapter lets the existing `?`-placeholder SQL run unchanged: statements
+are translated once (cached) to psycopg2's `%s` style, `INSERT OR IGNORE`
+becomes `ON CONFLICT DO NOTHING`, rows support both `row['name']` and
+`row[0]`, `cursor.lastrowid` is served from `lastval()`, and every statement
+is reported to the query log like the instrumented sqlite3 connections.
+Timestamps are returned as text, as sqlite3 does.
+
+Environment:
+    DB_POOL_MIN               connections opened eagerly per worker (default 1)
+    DB_POOL_MAX               connections per worker (default 5)
+    DB_POOL_TIMEOUT_S         wait for a free connection before failing (default 10)
+    DB_STATEMENT_TIMEOUT_MS   server-side statement_timeout (default 15000)
+    DB_CONNECT_TIMEOUT_S      TCP connect timeout (default 5)
+"""
+
+import os
+import re
+import time
+import threading
+import functools
+
+import psycopg2
+import psycopg2.extras
+import psycopg2.pool
+from psycopg2 import extensions
+
+from query_log import stats
+
+_string_re = re.compile(r"('(?:[^']|'')*')")
+_insert_or_ignore_re = re.compile(r"^\s*INSERT\s+OR\s+IGNORE\s+INTO\b", re.I)
+
+
+@functools.lru_cache(maxsize=512)
+def translate(sql):
+    """sqlite3 statement -> psycopg2 statement"""
+    on_conflict = False
+    if _insert_or_ignore_re.match(sql):
+        sql = _insert_or_ignore_re.sub("INSERT INTO", sql, count=1)
+        on_conflict = True
+    parts = _string_re.split(sql.replace("%", "%%"))
+    # odd indexes are string literals; placeholders only live outside them
+    sql = "".join(part if i % 2 else part.replace("?", "%s") for i, part in enumerate(parts))
+    if on_conflict:
+        sql = sql.rstrip().rstrip(";") + " ON CONFLICT DO NOTHING"
+    return sql
+
+
+def _explain(raw_conn, sql, params):
+    """EXPLAIN inside a savepoint so a failing plan can't abort the transaction"""
+    try:
+        with raw_conn.cursor() as cursor:
+            in_txn = raw_conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE
+            if in_txn:
+                cursor.execute("SAVEPOINT query_log_explain")
+            try:
+                cursor.execute("EXPLAIN " + sql, params)
+                return [row[0] for row in cursor.fetchall()]
+            except psycopg2.Error:
+                if in_txn:
+                    cursor.execute("ROLLBACK TO SAVEPOINT query_log_explain")
+                return None
+            finally:
+                if in_txn:
+                    cursor.execute("RELEASE SAVEPOINT query_log_explain")
+    except psycopg2.Error:
+        return None
+
+
+# Timestamps come back as text, exactly like sqlite3, so templates slicing
+# `created_at[:16]` and JSON output behave the same on both backends.
+TIMESTAMP_AS_TEXT = extensions.new_type((1114,), "TIMESTAMP_AS_TEXT", lambda value, cursor: value)
+
+
+class PgCursor:
+    """Subset of sqlite3.Cursor over a psycopg2 DictCursor"""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self._cursor = connection.raw.cursor(cursor_factory=psycopg2.extras.DictCursor)
+        self._lastrowid = None
+        self._inserted = False
+
+    def execute(self, sql, params=()):
+        pg_sql = translate(sql)
+        started = time.perf_counter()
+        try:
+            self._cursor.execute(pg_sql, tuple(params))
+        finally:
+            elapsed = time.perf_counter() - started
+            plan = None
+            failed = self.connection.raw.info.transaction_status == extensions.TRANSACTION_STATUS_INERROR
+            if not failed and stats.needs_plan(elapsed, sql):
+                plan = _explain(self.connection.raw, pg_sql, tuple(params))
+            stats.record(sql, elapsed, plan)
+        self._lastrowid = None
+        self._inserted = pg_sql.lstrip()[:6].upper() == "INSERT"
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        started = time.perf_counter()
+        try:
+            psycopg2.extras.execute_batch(self._cursor, translate(sql), [tuple(p) for p in seq_of_params])
+        finally:
+            stats.record(sql, time.perf_counter() - started)
+        self._lastrowid = None
+        self._inserted = False
+        return self
+
+    @property
+    def lastrowid(self):
+        """Id generated by the last INSERT on this connection (like sqlite3)"""
+        if self._inserted and self._lastrowid is None:
+            with self.connection.raw.cursor() as cursor:
+                cursor.execute("SELECT lastval()")
+                self._lastrowid = cursor.fetchone()[0]
+        return self._lastrowid
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchmany(self, size=None):
+        return self._cursor.fetchmany(size or self._cursor.arraysize)
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def close(self):
+        self._cursor.close()
+
+
+class PgConnection:
+    """sqlite3.Connection look-alike: execute() shortcuts and commit/rollback context manager"""
+
+    def __init__(self, raw):
+        self.raw = raw
+        extensions.register_type(TIMESTAMP_AS_TEXT, raw)
+        self.row_factory = None  # accepted for sqlite3 compatibility; rows are always DictRows
+
+    def cursor(self):
+        return PgCursor(self)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
+
+    @property
+    def in_transaction(self):
+        return self.raw.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE
+
+    def commit(self):
+        self.raw.commit()
+
+    def rollback(self):
+        self.raw.rollback()
+
+    def close(self):
+        self.raw.close()
+
+    @property
+    def closed(self):
+        return bool(self.raw.closed)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.raw.commit()
+        else:
+            self.raw.rollback()
+        return False
+
+
+def connect_args(statement_timeout_ms=None, connect_timeout=None, read_only=False):
+    """libpq keyword arguments shared by the pool and one-off connections"""
+    if statement_timeout_ms is None:
+        statement_timeout_ms = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "15000"))
+    if connect_timeout is None:
+        connect_timeout = int(os.getenv("DB_CONNECT_TIMEOUT_S", "5"))
+    options = f"-c statement_timeout={int(statement_timeout_ms)}"
+    if read_only:
+        options += " -c default_transaction_read_only=on"
+    return {
+        "connect_timeout": connect_timeout,
+        "options": options,
+        "application_name": "luxora_dz",
+    }
+
+
+class ConnectionPool:
+    """Bounded, fork-safe pool of PgConnections with pre-ping on checkout.
+
+    The underlying psycopg2 pool is created lazily in each process, so
+    gunicorn workers never share sockets inherited from the master. Checkout
+    blocks up to `timeout` seconds when all connections are in use instead
+    of failing immediately.
+    """
+
+    def __init__(self, dsn, minconn=None, maxconn=None, timeout=None, statement_timeout_ms=None,
+                 connect_timeout=None, read_only=False):
+        self.dsn = dsn
+        self.minconn = int(os.getenv("DB_POOL_MIN", "1")) if minconn is None else minconn
+        self.maxconn = int(os.getenv("DB_POOL_MAX", "5")) if maxconn is None else maxconn
+        self.timeout = float(os.getenv("DB_POOL_TIMEOUT_S", "10")) if timeout is None else timeout
+        self.kwargs = connect_args(statement_timeout_ms, connect_timeout, read_only)
+        self._pid = None
+        self._pool = None
+        self._slots = None
+        self._lock = threading.Lock()
+
+    def _ensure_pool(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._pool = psycopg2.pool.ThreadedConnectionPool(
+                        self.minconn, self.maxconn, self.dsn, **self.kwargs)
+                    self._slots = threading.BoundedSemaphore(self.maxconn)
+                    self._pid = os.getpid()
+        return self._pool
+
+    def connect(self):
+        """Unpooled connection with the same settings (schema setup, scripts)"""
+        return PgConnection(psycopg2.connect(self.dsn, **self.kwargs))
+
+    def getconn(self):
+        pool = self._ensure_pool()
+        if not self._slots.acquire(timeout=self.timeout):
+            raise psycopg2.pool.PoolError(f"no database connection free after {self.timeout}s")
+        try:
+            for attempt in range(2):
+                raw = pool.getconn()
+                try:
+                    if raw.closed:
+                        raise psycopg2.InterfaceError("connection already closed")
+                    with raw.cursor() as cursor:
+                        cursor.execute("SELECT 1")
+                    raw.rollback()
+                    return PgConnection(raw)
+                except psycopg2.Error:
+                    # server restarted or the socket went stale: drop it and retry once
+                    pool.putconn(raw, close=True)
+                    if attempt:
+                        raise
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn):
+        pool = self._ensure_pool()
+        try:
+            discard = conn.closed
+            if not discard and conn.in_transaction:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    discard = True
+            pool.putconn(conn.raw, close=discard)
+        finally:
+            self._slots.release()
+
+    def closeall(self):
+        if self._pool is not None and self._pid == os.getpid():
+            self._pool.closeall()
+        self._pid = None
+        self._pool = None
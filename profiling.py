@@ -0,0 +1,261 @@
+"""
+Request Profiling
+Opt-in per-request profiling for the Flask apps. A request is profiled when
+an admin sends the `X-Profile` header (value `cprofile` or `sample`) or when
+it is picked by PROFILE_SAMPLE_RATE. Profiles slower than PROFILE_SLOW_MS (or
+explicitly requested) are stored under PROFILE_DIR with their route and
+duration, and can be listed/downloaded from /admin/profiles as collapsed
+("folded") stacks usable with flamegraph.pl or speedscope.
+
+Environment:
+    PROFILE_SAMPLE_RATE   fraction of requests profiled automatically (default 0)
+    PROFILE_MODE          'sample' (low overhead) or 'cprofile' for sampled requests
+    PROFILE_SLOW_MS       only keep sampled profiles slower than this (default 500)
+    PROFILE_INTERVAL_MS   stack sampling interval (default 5)
+    PROFILE_KEEP          number of profiles kept on disk (default 50)
+    PROFILE_DIR           storage directory (default ./profiles)
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import pstats
+import cProfile
+import threading
+from collections import Counter
+from datetime import datetime
+
+from flask import g, request, session, redirect, url_for, render_template, send_file, abort
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+PROFILE_HEADER = "X-Profile"
+PROFILE_MODES = ("sample", "cprofile")
+
+
+def _default_is_admin():
+    return bool(session.get("admin"))
+
+
+class StackSampler:
+    """Samples one thread's Python stack on a background thread"""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                frame = frame.f_back
+            self.samples[";".join(reversed(stack))] += 1
+
+    def folded(self):
+        """Collapsed stacks, one `frame;frame;... count` line per stack"""
+        return "\n".join(f"{stack} {count}" for stack, count in self.samples.most_common()) + "\n"
+
+
+def _func_label(func):
+    filename, line, name = func
+    if filename == "~":
+        return name
+    return f"{os.path.basename(filename)}:{name}:{line}"
+
+
+def cprofile_to_folded(profiler, max_depth=64):
+    """Approximate collapsed stacks from cProfile's caller/callee graph.
+
+    cProfile only records caller->callee edges, so each function's own time is
+    split across the paths reaching it in proportion to the cumulative time
+    that flowed through each edge. Counts are microseconds.
+    """
+    stats = pstats.Stats(profiler).stats
+    callees = {}
+    for func, (_cc, _nc, _tt, _ct, callers) in stats.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, []).append((func, edge[3]))
+
+    lines = Counter()
+
+    def walk(func, path, share):
+        _cc, _nc, tt, ct, _callers = stats[func]
+        path = path + [_func_label(func)]
+        own = tt * share
+        if own > 0:
+            lines[";".join(path)] += own
+        if len(path) >= max_depth:
+            return
+        for callee, edge_ct in callees.get(func, []):
+            if _func_label(callee) in path or not stats[callee][3]:
+                continue
+            if edge_ct * share < 1e-6:
+                continue  # prune sub-microsecond branches
+            walk(callee, path, min((edge_ct * share) / stats[callee][3], 1.0))
+
+    roots = [func for func, value in stats.items() if not value[4]]
+    for root in roots:
+        walk(root, [], 1.0)
+    return "\n".join(f"{stack} {int(us * 1e6)}" for stack, us in lines.most_common() if int(us * 1e6)) + "\n"
+
+
+class ProfileStore:
+    """Profiles on disk plus an append-only JSON lines index"""
+
+    def __init__(self, directory, keep):
+        self.directory = directory
+        self.keep = keep
+        self.index_path = os.path.join(directory, "index.jsonl")
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def save(self, meta, folded, raw_profiler=None):
+        profile_id = f"{datetime.now():%Y%m%d%H%M%S}-{uuid.uuid4().hex[:8]}"
+        meta = dict(meta, id=profile_id, files=["folded"])
+        with open(os.path.join(self.directory, f"{profile_id}.folded"), "w", encoding="utf-8") as fh:
+            fh.write(folded)
+        if raw_profiler is not None:
+            raw_profiler.dump_stats(os.path.join(self.directory, f"{profile_id}.prof"))
+            meta["files"].append("prof")
+        with self._lock:
+            with open(self.index_path, "a", encoding="utf-8") as fh:
+                fh.write(json.dumps(meta, ensure_ascii=False) + "\n")
+            self._prune()
+        return profile_id
+
+    def entries(self):
+        if not os.path.exists(self.index_path):
+            return []
+        with open(self.index_path, encoding="utf-8") as fh:
+            return [json.loads(line) for line in fh if line.strip()]
+
+    def _prune(self):
+        entries = self.entries()
+        if len(entries) <= self.keep:
+            return
+        stale, fresh = entries[:-self.keep], entries[-self.keep:]
+        for entry in stale:
+            for ext in entry.get("files", []):
+                try:
+                    os.remove(os.path.join(self.directory, f"{entry['id']}.{ext}"))
+                except OSError:
+                    pass
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fh:
+            fh.writelines(json.dumps(entry, ensure_ascii=False) + "\n" for entry in fresh)
+        os.replace(tmp_path, self.index_path)
+
+    def path_for(self, profile_id, ext):
+        for entry in self.entries():
+            if entry["id"] == profile_id and ext in entry.get("files", []):
+                return os.path.join(self.directory, f"{profile_id}.{ext}")
+        return None
+
+
+def init_profiling(app, is_admin=_default_is_admin):
+    """Install the profiling hooks and the /admin/profiles pages on app"""
+    sample_rate = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+    default_mode = os.getenv("PROFILE_MODE", "sample")
+    slow_ms = float(os.getenv("PROFILE_SLOW_MS", "500"))
+    interval = float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000.0
+    store = ProfileStore(os.getenv("PROFILE_DIR", os.path.join(BASE_DIR, "profiles")),
+                         int(os.getenv("PROFILE_KEEP", "50")))
+    app.extensions["profiling"] = store
+
+    @app.before_request
+    def _start_profile():
+        if request.path.startswith("/static/"):
+            return
+        mode = None
+        forced = False
+        requested = request.headers.get(PROFILE_HEADER, "").strip().lower()
+        if requested and is_admin():
+            mode = requested if requested in PROFILE_MODES else default_mode
+            forced = True
+        elif sample_rate and random.random() < sample_rate:
+            mode = default_mode
+        if not mode:
+            return
+        g._profile = {"mode": mode, "forced": forced, "started": time.perf_counter()}
+        if mode == "cprofile":
+            profiler = cProfile.Profile()
+            g._profile["profiler"] = profiler
+            profiler.enable()
+        else:
+            sampler = StackSampler(threading.get_ident(), interval)
+            g._profile["sampler"] = sampler
+            sampler.start()
+
+    @app.after_request
+    def _finish_profile(response):
+        state = g.pop("_profile", None)
+        if not state:
+            return response
+        duration_ms = (time.perf_counter() - state["started"]) * 1000
+        profiler = state.get("profiler")
+        if profiler is not None:
+            profiler.disable()
+        else:
+            state["sampler"].stop()
+
+        if state["forced"] or duration_ms >= slow_ms:
+            try:
+                if profiler is not None:
+                    folded = cprofile_to_folded(profiler)
+                else:
+                    folded = state["sampler"].folded()
+                profile_id = store.save({
+                    "route": request.url_rule.rule if request.url_rule else None,
+                    "endpoint": request.endpoint,
+                    "method": request.method,
+                    "path": request.full_path.rstrip("?"),
+                    "status": response.status_code,
+                    "duration_ms": round(duration_ms, 2),
+                    "mode": state["mode"],
+                    "created_at": datetime.now().isoformat(timespec="seconds"),
+                }, folded, profiler)
+                response.headers["X-Profile-Id"] = profile_id
+            except Exception as e:
+                app.logger.error(f"Failed to store profile: {e}")
+        return response
+
+    def admin_profiles():
+        if not is_admin():
+            return redirect(url_for("login"))
+        entries = store.entries()
+        entries.sort(key=lambda entry: entry["duration_ms"], reverse=True)
+        return render_template("admin_profiles.html", profiles=entries,
+                               sample_rate=sample_rate, slow_ms=slow_ms)
+
+    def admin_profile_download(profile_id, ext):
+        if not is_admin():
+            return redirect(url_for("login"))
+        path = store.path_for(profile_id, ext)
+        if not path:
+            abort(404)
+        mimetype = "text/plain" if ext == "folded" else "application/octet-stream"
+        return send_file(path, mimetype=mimetype, as_attachment=True,
+                         download_name=f"{profile_id}.{ext}")
+
+    app.add_url_rule("/admin/profiles", "admin_profiles", admin_profiles)
+    app.add_url_rule("/admin/profiles/<profile_id>.<any(folded, prof):ext>",
+                     "admin_profile_download", admin_profile_download)
+    return store
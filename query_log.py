@@ -0,0 +1,399 @@
+"""
+Query Log
+Times every SQL statement issued through instrumented sqlite3 connections
+and SQLAlchemy engines, aggregates them by normalized fingerprint
+(count/total/max), captures EXPLAIN QUERY PLAN for statements slower than
+SLOW_QUERY_MS and exposes the top offenders on /admin/queries.
+
+sqlite3 timings include fetching rows; SQLAlchemy timings cover statement
+execution only. Each gunicorn worker keeps its own statistics and periodically writes them
+to QUERY_LOG_DIR; the admin page merges the files of all workers.
+
+Environment:
+    QUERY_LOG           set to 0 to disable recording (default 1)
+    SLOW_QUERY_MS       statements slower than this are logged and EXPLAINed (default 50)
+    QUERY_LOG_DIR       where per-worker snapshots are written (default ./query_log)
+    QUERY_LOG_FLUSH_S   seconds between snapshot writes (default 10)
+    QUERY_LOG_TIMING    set to 1 to send the Server-Timing header to everyone,
+                        not only to admin sessions (default 0)
+"""
+
+import os
+import re
+import json
+import time
+import sqlite3
+import logging
+import threading
+
+from flask import request, session, redirect, url_for, render_template, jsonify
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+ENABLED = os.getenv("QUERY_LOG", "1") != "0"
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "50"))
+QUERY_LOG_DIR = os.getenv("QUERY_LOG_DIR", os.path.join(BASE_DIR, "query_log"))
+FLUSH_INTERVAL = float(os.getenv("QUERY_LOG_FLUSH_S", "10"))
+PUBLIC_TIMING = os.getenv("QUERY_LOG_TIMING", "0") == "1"
+
+_RESET_MARKER = "reset"
+
+_comment_re = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+_string_re = re.compile(r"'(?:[^']|'')*'")
+_number_re = re.compile(r"\b\d+(?:\.\d+)?\b")
+_in_list_re = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.I)
+_values_re = re.compile(r"\bVALUES\s*(\(\s*\?(?:\s*,\s*\?)*\s*\))(?:\s*,\s*\(\s*\?(?:\s*,\s*\?)*\s*\))+", re.I)
+_space_re = re.compile(r"\s+")
+
+
+def fingerprint(sql):
+    """Normalize a statement so queries differing only in literals group together"""
+    sql = _comment_re.sub(" ", sql)
+    sql = _string_re.sub("?", sql)
+    sql = _number_re.sub("?", sql)
+    sql = _space_re.sub(" ", sql).strip()
+    sql = _in_list_re.sub("IN (?...)", sql)
+    sql = _values_re.sub(r"VALUES \1...", sql)
+    return sql
+
+
+class QueryStats:
+    """Per-process aggregate of statement timings keyed by fingerprint"""
+
+    def __init__(self, directory=QUERY_LOG_DIR, slow_ms=SLOW_QUERY_MS):
+        self.directory = directory
+        self.slow_ms = slow_ms
+        self.entries = {}
+        self._lock = threading.Lock()
+        self._last_flush = time.time()
+        self._reset_seen = time.time()
+        self._local = threading.local()
+
+    # -- per request accounting -------------------------------------------
+
+    def begin_request(self):
+        self._local.db_time = 0.0
+        self._local.queries = 0
+
+    def request_totals(self):
+        return getattr(self._local, "db_time", 0.0), getattr(self._local, "queries", 0)
+
+    # -- recording ----------------------------------------------------------
+
+    def needs_plan(self, elapsed, sql):
+        """True when a slow statement has no plan yet (or a slower run was seen)"""
+        if elapsed * 1000 < self.slow_ms:
+            return False
+        entry = self.entries.get(fingerprint(sql))
+        return entry is None or entry.get("plan") is None or elapsed * 1000 > entry["max_ms"]
+
+    def record(self, sql, elapsed, plan=None):
+        """Account one execution; returns the fingerprint used for later fetches"""
+        if not ENABLED:
+            return None
+        self._local.db_time = getattr(self._local, "db_time", 0.0) + elapsed
+        self._local.queries = getattr(self._local, "queries", 0) + 1
+        elapsed_ms = elapsed * 1000
+        key = fingerprint(sql)
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                entry = self.entries[key] = {"fingerprint": key, "count": 0, "total_ms": 0.0,
+                                             "max_ms": 0.0, "slow_count": 0, "plan": None,
+                                             "example": sql.strip()[:2000]}
+            entry["count"] += 1
+            entry["total_ms"] += elapsed_ms
+            if elapsed_ms >= self.slow_ms:
+                entry["slow_count"] += 1
+            if elapsed_ms > entry["max_ms"]:
+                entry["max_ms"] = elapsed_ms
+                entry["example"] = sql.strip()[:2000]
+            if plan is not None:
+                entry["plan"] = plan
+        if elapsed_ms >= self.slow_ms:
+            logging.warning(f"Slow query ({elapsed_ms:.1f} ms): {key[:300]}")
+        if time.time() - self._last_flush >= FLUSH_INTERVAL:
+            self.flush()
+        return key
+
+    def add_fetch(self, key, delta, running):
+        """Add row fetching time to an execution; True if it just became slow"""
+        self._local.db_time = getattr(self._local, "db_time", 0.0) + delta
+        running_ms = running * 1000
+        crossed = (running - delta) * 1000 < self.slow_ms <= running_ms
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return False
+            entry["total_ms"] += delta * 1000
+            if running_ms > entry["max_ms"]:
+                entry["max_ms"] = running_ms
+            if crossed:
+                entry["slow_count"] += 1
+        if crossed:
+            logging.warning(f"Slow query ({running_ms:.1f} ms incl. fetch): {key[:300]}")
+        return crossed and entry.get("plan") is None
+
+    def set_plan(self, key, plan):
+        with self._lock:
+            if key in self.entries and plan is not None:
+                self.entries[key]["plan"] = plan
+
+    # -- persistence shared between workers ----------------------------------
+
+    def _snapshot_path(self):
+        return os.path.join(self.directory, f"worker-{os.getpid()}.json")
+
+    def flush(self):
+        self._last_flush = time.time()
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            marker = os.path.join(self.directory, _RESET_MARKER)
+            if os.path.exists(marker) and os.path.getmtime(marker) > self._reset_seen:
+                with self._lock:
+                    self.entries.clear()
+                self._reset_seen = os.path.getmtime(marker)
+            with self._lock:
+                data = list(self.entries.values())
+            tmp_path = self._snapshot_path() + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as fh:
+                json.dump(data, fh, ensure_ascii=False)
+            os.replace(tmp_path, self._snapshot_path())
+        except OSError as e:
+            logging.error(f"Failed to write query log snapshot: {e}")
+
+    def merged(self):
+        """Aggregate the snapshots of every worker (including this one)"""
+        self.flush()
+        merged = {}
+        if not os.path.isdir(self.directory):
+            return []
+        for name in os.listdir(self.directory):
+            if not (name.startswith("worker-") and name.endswith(".json")):
+                continue
+            try:
+                with open(os.path.join(self.directory, name), encoding="utf-8") as fh:
+                    rows = json.load(fh)
+            except (OSError, ValueError):
+                continue
+            for row in rows:
+                entry = merged.get(row["fingerprint"])
+                if entry is None:
+                    merged[row["fingerprint"]] = dict(row)
+                    continue
+                entry["count"] += row["count"]
+                entry["total_ms"] += row["total_ms"]
+                entry["slow_count"] += row["slow_count"]
+                if row["max_ms"] > entry["max_ms"]:
+                    entry["max_ms"] = row["max_ms"]
+                    entry["example"] = row["example"]
+                    entry["plan"] = row["plan"] or entry["plan"]
+                elif entry["plan"] is None:
+                    entry["plan"] = row["plan"]
+        for entry in merged.values():
+            entry["avg_ms"] = entry["total_ms"] / entry["count"] if entry["count"] else 0.0
+        return list(merged.values())
+
+    def top(self, limit=20, order_by="total_ms"):
+        rows = self.merged()
+        rows.sort(key=lambda row: row.get(order_by, 0), reverse=True)
+        return rows[:limit]
+
+    def reset(self):
+        os.makedirs(self.directory, exist_ok=True)
+        for name in os.listdir(self.directory):
+            if name.startswith("worker-"):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+        with open(os.path.join(self.directory, _RESET_MARKER), "w") as fh:
+            fh.write(str(time.time()))
+        with self._lock:
+            self.entries.clear()
+        self._reset_seen = time.time()
+
+
+stats = QueryStats()
+
+
+# ---------------------------------------------------------------------------
+# sqlite3
+# ---------------------------------------------------------------------------
+
+def _explain_sqlite(conn, sql, params):
+    try:
+        cursor = sqlite3.Cursor(conn)
+        rows = sqlite3.Cursor.execute(cursor, "EXPLAIN QUERY PLAN " + sql, params).fetchall()
+        return [row[-1] for row in rows]
+    except sqlite3.Error:
+        return None
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that reports statement (execute + fetch) timings to the query log"""
+
+    _qlog = None
+
+    def execute(self, sql, params=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, params)
+        finally:
+            elapsed = time.perf_counter() - started
+            plan = _explain_sqlite(self.connection, sql, params) if stats.needs_plan(elapsed, sql) else None
+            key = stats.record(sql, elapsed, plan)
+            self._qlog = (key, sql, params, elapsed) if key else None
+
+    def executemany(self, sql, seq_of_params):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_params)
+        finally:
+            stats.record(sql, time.perf_counter() - started)
+            self._qlog = None
+
+    def _timed_fetch(self, method, *args):
+        started = time.perf_counter()
+        try:
+            return method(self, *args)
+        finally:
+            if self._qlog is not None:
+                key, sql, params, running = self._qlog
+                delta = time.perf_counter() - started
+                self._qlog = (key, sql, params, running + delta)
+                if stats.add_fetch(key, delta, running + delta):
+                    stats.set_plan(key, _explain_sqlite(self.connection, sql, params))
+
+    def fetchone(self):
+        return self._timed_fetch(sqlite3.Cursor.fetchone)
+
+    def fetchmany(self, size=None):
+        return self._timed_fetch(sqlite3.Cursor.fetchmany, self.arraysize if size is None else size)
+
+    def fetchall(self):
+        return self._timed_fetch(sqlite3.Cursor.fetchall)
+
+    def __next__(self):
+        return self._timed_fetch(sqlite3.Cursor.__next__)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """sqlite3 connection whose statements are timed (use as connect(factory=...))"""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
+
+
+# ---------------------------------------------------------------------------
+# SQLAlchemy
+# ---------------------------------------------------------------------------
+
+_sqlalchemy_installed = False
+
+
+def instrument_sqlalchemy():
+    """Time statements of every SQLAlchemy engine in this process"""
+    global _sqlalchemy_installed
+    if _sqlalchemy_installed:
+        return
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    @event.listens_for(Engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("_query_started", []).append(time.perf_counter())
+
+    @event.listens_for(Engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["_query_started"].pop()
+        plan = None
+        if not executemany and stats.needs_plan(elapsed, statement):
+            plan = _explain_sqlalchemy(conn, statement, parameters)
+        stats.record(statement, elapsed, plan)
+
+    _sqlalchemy_installed = True
+
+
+def _explain_sqlalchemy(conn, statement, parameters):
+    """EXPLAIN on the caller's connection; on PostgreSQL inside a savepoint so a
+    failing plan can't abort the caller's transaction (as pg_backend._explain)"""
+    prefix = {"sqlite": "EXPLAIN QUERY PLAN ", "postgresql": "EXPLAIN "}.get(conn.dialect.name)
+    if prefix is None:
+        return None
+    savepoint = conn.dialect.name == "postgresql" and not getattr(conn.connection.dbapi_connection,
+                                                                  "autocommit", False)
+    try:
+        cursor = conn.connection.cursor()
+        try:
+            if savepoint:
+                cursor.execute("SAVEPOINT query_log_explain")
+            try:
+                cursor.execute(prefix + statement, parameters)
+                return [str(row[-1]) for row in cursor.fetchall()]
+            except Exception:
+                if savepoint:
+                    cursor.execute("ROLLBACK TO SAVEPOINT query_log_explain")
+                return None
+            finally:
+                if savepoint:
+                    cursor.execute("RELEASE SAVEPOINT query_log_explain")
+        finally:
+            cursor.close()
+    except Exception:
+        return None
+
+
+# ---------------------------------------------------------------------------
+# Flask integration
+# ---------------------------------------------------------------------------
+
+def _default_is_admin():
+    return bool(session.get("admin"))
+
+
+def init_query_log(app, is_admin=_default_is_admin):
+    """Per-request DB timing (a Server-Timing header for admins) and the /admin/queries page"""
+
+    @app.before_request
+    def _begin_query_accounting():
+        stats.begin_request()
+
+    @app.after_request
+    def _add_server_timing(response):
+        # DB time and statement counts tell visitors how pages are built
+        if not (PUBLIC_TIMING or is_admin()):
+            return response
+        db_time, queries = stats.request_totals()
+        response.headers.add("Server-Timing", f'db;dur={db_time * 1000:.2f};desc="{queries} queries"')
+        return response
+
+    def admin_queries():
+        if not is_admin():
+            if request.args.get("format") == "json":
+                return jsonify({"error": "Admin access required"}), 401
+            return redirect(url_for("login"))
+        limit = request.args.get("limit", 20, type=int)
+        order_by = request.args.get("sort", "total_ms")
+        if order_by not in ("total_ms", "max_ms", "avg_ms", "count", "slow_count"):
+            order_by = "total_ms"
+        queries = stats.top(limit, order_by)
+        if request.args.get("format") == "json":
+            return jsonify({"success": True, "slow_query_ms": stats.slow_ms, "queries": queries})
+        return render_template("admin_queries.html", queries=queries, sort_by=order_by,
+                               limit=limit, slow_ms=stats.slow_ms)
+
+    def admin_queries_reset():
+        if not is_admin():
+            return redirect(url_for("login"))
+        stats.reset()
+        return redirect(url_for("admin_queries"))
+
+    app.add_url_rule("/admin/queries", "admin_queries", admin_queries)
+    app.add_url_rule("/admin/queries/reset", "admin_queries_reset", admin_queries_reset, methods=["POST"])
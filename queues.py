@@ -0,0 +1,94 @@
+"""
+Work Queues
+Admin views of orders and product requests one status at a time, oldest
+first. Pages are keyset-paged on the (status_code, created_at, id) index, so
+page 50 costs the same as page 1. The per-status tab counts come from the
+status_counts table instead of COUNT(*) scans.
+
+Routes (registered on the app by init_queues; kind is "orders" or "requests"):
+    GET  /admin/queue/<kind>/<status>          queue page (?after=<cursor>)
+    GET  /api/queue/<kind>/<status>            JSON {rows, counts, next}; ?after=<cursor>&limit=
+    POST /admin/queue/<kind>/<item_id>         move one item to the form's `status`
+"""
+
+from flask import render_template, request, redirect, url_for, session, flash, jsonify, abort
+
+from workflow import WORKFLOWS, InvalidTransition
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+KIND_LABELS = {"orders": "الطلبات", "requests": "طلبات المنتجات"}
+
+
+def _default_is_admin():
+    return bool(session.get("admin"))
+
+
+def encode_cursor(row):
+    """Opaque `after` value for the row a page ended on"""
+    return f"{row['created_at'] or ''}|{row['id']}"
+
+
+def decode_cursor(cursor):
+    """(created_at or None, id) from encode_cursor(); None when missing or malformed"""
+    if not cursor:
+        return None
+    created_at, _, item_id = cursor.rpartition("|")
+    try:
+        return created_at or None, int(item_id)
+    except ValueError:
+        return None
+
+
+def init_queues(app, repo, is_admin=_default_is_admin):
+    """The admin work queues and the status change endpoint they post to"""
+
+    def page(kind, status):
+        workflow = WORKFLOWS.get(kind)
+        if workflow is None or status not in workflow.codes:
+            abort(404)
+        limit = max(1, min(request.args.get("limit", PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+        rows = repo.queue(kind, status, after=decode_cursor(request.args.get("after")), limit=limit)
+        next_cursor = encode_cursor(rows[-1]) if len(rows) == limit else None
+        return workflow, rows, next_cursor
+
+    def admin_queue(kind, status):
+        if not is_admin():
+            return redirect(url_for("login"))
+        workflow, rows, next_cursor = page(kind, status)
+        return render_template("admin_queue.html", kind=kind, kind_label=KIND_LABELS[kind], status=status,
+                               workflow=workflow, rows=rows, counts=repo.status_counts(kind),
+                               next_cursor=next_cursor, paged=bool(request.args.get("after")))
+
+    def api_queue(kind, status):
+        if not is_admin():
+            return jsonify({"error": "Admin access required"}), 401
+        _workflow, rows, next_cursor = page(kind, status)
+        return jsonify({"success": True, "rows": [dict(row) for row in rows],
+                        "counts": repo.status_counts(kind), "next": next_cursor})
+
+    def admin_queue_update(kind, item_id):
+        if not is_admin():
+            return redirect(url_for("login"))
+        if kind not in WORKFLOWS:
+            abort(404)
+        status = request.form.get("status", "")
+        update = repo.update_order_status if kind == "orders" else repo.update_request_status
+        try:
+            if update(item_id, status):
+                flash(f"#{item_id}: {WORKFLOWS[kind].label(status)}", "success")
+            else:
+                flash("العنصر غير موجود.", "error")
+        except InvalidTransition:
+            flash("لا يمكن الانتقال إلى هذه الحالة من الحالة الحالية.", "error")
+        except ValueError:
+            flash("حالة غير صحيحة.", "error")
+        back = request.form.get("from")
+        if back not in WORKFLOWS[kind].codes:
+            back = "pending"
+        return redirect(url_for("admin_queue", kind=kind, status=back))
+
+    app.add_url_rule("/admin/queue/<kind>/<status>", "admin_queue", admin_queue)
+    app.add_url_rule("/api/queue/<kind>/<status>", "api_queue", api_queue)
+    app.add_url_rule("/admin/queue/<kind>/<int:item_id>", "admin_queue_update", admin_queue_update,
+                     methods=["POST"])
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+Co-purchase Recommendations
+"Customers also ordered" for every product, learned from the order and
+product request history: two products are related by the number of
+customers (by phone) who ordered or requested both.
+
+The job turns the history into a sparse customer x product matrix B (SciPy
+CSR, 1 where the customer took the product) and gets every item-item count
+at once as C = BᵀB. The RECOMMEND_TOP_K best neighbours of each product are
+written to also_ordered.bin, a flat little-endian int32 file: a header, the
+sorted product ids, row offsets, then neighbour ids and customer counts.
+`update` folds in only the orders/requests since the last run (watermarks
+kept with C in cooccurrence.npz): for the customers they touch,
+C += B_newᵀB_new - B_oldᵀB_old.
+
+Workers never parse or rebuild anything: they mmap also_ordered.bin (one
+copy in the page cache for all workers), look a product up by bisection and
+remap the file after the job replaces it. Only the job needs NumPy/SciPy.
+
+Routes (registered on the app by init_recommendations):
+    GET  /api/products/<id>/also-ordered    ?limit=
+
+Usage:
+    python recommend.py build                    # from the whole history
+    python recommend.py update                   # new orders/requests only (builds on first run)
+    python recommend.py watch --every 600        # update periodically (run next to the app)
+
+Environment:
+    DB_PATH / DATABASE_URL   database (default database.db next to app.py)
+    RECOMMEND_DIR            where the files live (default recommendations/ next to app.py)
+    RECOMMEND_TOP_K          neighbours kept per product (default 12)
+    RECOMMEND_INTERVAL_S     period for `watch` (default 600)
+    RECOMMEND_RELOAD_S       how often workers look for a new file (default 60)
+"""
+
+import os
+import mmap
+import time
+import bisect
+import struct
+import argparse
+import threading
+
+from dotenv import load_dotenv
+from flask import request, jsonify
+
+from http_cache import product_keys
+from repository import open_repository, is_postgres_url, RELATED_COLUMNS
+
+try:  # only the build job needs them; workers read the file with mmap
+    import numpy as np
+    from scipy import sparse
+except ImportError:
+    np = sparse = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+RECOMMEND_DIR = os.getenv("RECOMMEND_DIR", os.path.join(BASE_DIR, "recommendations"))
+TOP_K = int(os.getenv("RECOMMEND_TOP_K", "12"))
+RELOAD_S = float(os.getenv("RECOMMEND_RELOAD_S", "60"))
+SHOWN = 4  # on the product page
+MAX_LIMIT = 50
+
+TOPK_FILE = "also_ordered.bin"
+STATE_FILE = "cooccurrence.npz"
+MAGIC = b"ALSOORD1"
+HEADER = struct.Struct("<8sII")  # magic, product count, neighbour count
+
+
+def _require_numpy():
+    if sparse is None:
+        raise RuntimeError("building recommendations needs NumPy and SciPy (pip install numpy scipy)")
+
+
+def cooccurrence(pairs, items):
+    """Item-item customer counts (CSR over the sorted product ids `items`) from (phone, product id) pairs"""
+    n = len(items)
+    if not pairs:
+        return sparse.csr_matrix((n, n), dtype=np.int32)
+    phones, products = zip(*pairs)
+    _, customer = np.unique(np.array(phones, dtype=object), return_inverse=True)
+    item = np.searchsorted(items, np.array(products, dtype=np.int64))
+    basket = sparse.csr_matrix((np.ones(len(pairs), dtype=np.int32), (customer, item)),
+                               shape=(customer.max() + 1, n))
+    basket.data[:] = 1  # bought twice is still one customer
+    counts = (basket.T @ basket).tocsr()
+    # a product is not its own neighbour
+    counts = counts - sparse.diags(counts.diagonal(), dtype=counts.dtype)
+    counts.eliminate_zeros()
+    return counts.tocsr()
+
+
+def _reindex(counts, items, new_items):
+    """`counts` over `items` moved onto the (superset) sorted ids `new_items`"""
+    if len(new_items) == len(items):
+        return counts
+    where = np.searchsorted(new_items, items)
+    coo = counts.tocoo()
+    return sparse.csr_matrix((coo.data, (where[coo.row], where[coo.col])), shape=(len(new_items),) * 2)
+
+
+def top_k(counts, items, k=TOP_K):
+    """(ids, offsets, neighbours, customers): the k best neighbours of each product, most customers first
+    (newest product first on ties), as int32 arrays"""
+    counts = counts.tocsr()
+    counts.sort_indices()
+    per_row = np.diff(counts.indptr)
+    rows = np.repeat(np.arange(len(items)), per_row)
+    order = np.lexsort((-items[counts.indices], -counts.data, rows))
+    rank = np.arange(len(order)) - np.repeat(counts.indptr[:-1], per_row)
+    keep = order[rank < k]
+    offsets = np.concatenate(([0], np.cumsum(np.minimum(per_row, k))))
+    return (items.astype(np.int32), offsets.astype(np.int32),
+            items[counts.indices[keep]].astype(np.int32), counts.data[keep].astype(np.int32))
+
+
+def write_topk(path, ids, offsets, neighbours, customers):
+    """Write the top-K file next to `path` and swap it in (readers keep the old one until they remap)"""
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(ids), len(neighbours)))
+        for array in (ids, offsets, neighbours, customers):
+            f.write(array.astype("<i4").tobytes())
+    os.replace(tmp, path)
+
+
+def _save_state(directory, items, counts, watermarks):
+    path = os.path.join(directory, STATE_FILE)
+    with open(f"{path}.tmp", "wb") as f:
+        np.savez(f, items=items, indptr=counts.indptr, indices=counts.indices, data=counts.data,
+                 watermarks=np.array(watermarks, dtype=np.int64))
+    os.replace(f"{path}.tmp", path)
+
+
+def _load_state(directory):
+    path = os.path.join(directory, STATE_FILE)
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as state:
+        items = state["items"]
+        counts = sparse.csr_matrix((state["data"], state["indices"], state["indptr"]), shape=(len(items),) * 2)
+        return items, counts, tuple(int(w) for w in state["watermarks"])
+
+
+def _publish(directory, items, counts, watermarks, k):
+    _save_state(directory, items, counts, watermarks)
+    write_topk(os.path.join(directory, TOPK_FILE), *top_k(counts, items, k))
+
+
+def build(repo, directory=RECOMMEND_DIR, k=TOP_K):
+    """Recount everything from the history; returns (customers, products)"""
+    _require_numpy()
+    os.makedirs(directory, exist_ok=True)
+    watermarks = repo.purchase_watermarks()
+    pairs = repo.customer_products(watermarks)
+    items = np.unique(np.array([product for _phone, product in pairs], dtype=np.int64))
+    _publish(directory, items, cooccurrence(pairs, items), watermarks, k)
+    return len({phone for phone, _product in pairs}), len(items)
+
+
+def update(repo, directory=RECOMMEND_DIR, k=TOP_K):
+    """Fold in the orders/requests since the last run; returns (customers touched, products)"""
+    _require_numpy()
+    state = _load_state(directory)
+    if state is None:
+        return build(repo, directory, k)
+    items, counts, after = state
+    upto = repo.purchase_watermarks()
+    phones = repo.new_customers(after, upto)
+    if not phones:
+        return 0, len(items)
+    before = repo.customer_products(after, phones)
+    now = repo.customer_products(upto, phones)
+    new_items = np.union1d(items, np.array([product for _phone, product in before + now], dtype=np.int64))
+    counts = _reindex(counts, items, new_items) + cooccurrence(now, new_items) - cooccurrence(before, new_items)
+    counts.eliminate_zeros()
+    _publish(directory, new_items, counts.tocsr(), upto, k)
+    return len(phones), len(new_items)
+
+
+class AlsoOrdered:
+    """The mmap'ed top-K file of this worker; remapped when the job swaps in a new one"""
+
+    def __init__(self, path, check_every=RELOAD_S):
+        self.path = path
+        self.check_every = check_every
+        self._table = None  # (file identity, ids, offsets, neighbours, customers)
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def _identity(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _map(self, identity):
+        with open(self.path, "rb") as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, n, nnz = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not a recommendations file")
+        values = memoryview(data)[HEADER.size:].cast("i")
+        ids, offsets = values[:n], values[n:2 * n + 1]
+        rest = values[2 * n + 1:]
+        return identity, ids, offsets, rest[:nnz], rest[nnz:2 * nnz]
+
+    def _current(self):
+        now = time.monotonic()
+        if now >= self._checked:
+            with self._lock:
+                if now >= self._checked:
+                    identity = self._identity()
+                    if identity is None:
+                        self._table = None
+                    elif self._table is None or self._table[0] != identity:
+                        self._table = self._map(identity)  # the old mapping goes when its last reader is done
+                    self._checked = now + self.check_every
+        return self._table
+
+    def neighbours(self, pid, limit=TOP_K):
+        """[(product id, customers who also took it)] for `pid`, best first"""
+        table = self._current()
+        if table is None:
+            return []
+        _identity, ids, offsets, neighbours, customers = table
+        i = bisect.bisect_left(ids, pid)
+        if i == len(ids) or ids[i] != pid:
+            return []
+        start = offsets[i]
+        end = min(offsets[i + 1], start + limit)
+        return list(zip(neighbours[start:end].tolist(), customers[start:end].tolist()))
+
+
+class Recommendations:
+    """Product rows for the "customers also ordered" lists"""
+
+    def __init__(self, repo, path, check_every=RELOAD_S):
+        self.repo = repo
+        self.file = AlsoOrdered(path, check_every)
+
+    def products(self, pid, limit=SHOWN):
+        """Up to `limit` products (dicts with a `customers` count), skipping deleted ones"""
+        ranked = self.file.neighbours(pid, TOP_K)
+        rows = {row["id"]: row for row in self.repo.get_products([other for other, _count in ranked])}
+        found = [dict({column: rows[other][column] for column in RELATED_COLUMNS}, customers=count)
+                 for other, count in ranked if other in rows]
+        return found[:limit]
+
+
+def init_recommendations(app, repo, directory=RECOMMEND_DIR, check_every=RELOAD_S):
+    """Register the also-ordered API; returns the Recommendations for the product page"""
+    recommendations = Recommendations(repo, os.path.join(directory, TOPK_FILE), check_every)
+
+    def api_also_ordered(pid):
+        limit = max(1, min(request.args.get("limit", SHOWN, type=int), MAX_LIMIT))
+        rows = recommendations.products(pid, limit)
+        product_keys(*rows)
+        return jsonify({"success": True, "product_id": pid, "rows": rows})
+
+    app.add_url_rule("/api/products/<int:pid>/also-ordered", "api_also_ordered", api_also_ordered)
+    return recommendations
+
+
+def main():
+    load_dotenv()
+    database_url = os.getenv("DATABASE_URL", "")
+    default = database_url if is_postgres_url(database_url) else \
+        os.getenv("DB_PATH", os.path.join(BASE_DIR, "database.db"))
+
+    parser = argparse.ArgumentParser(description="Build the customers-also-ordered recommendations")
+    parser.add_argument("--db", default=default, help="SQLite path or PostgreSQL URL")
+    parser.add_argument("--dir", default=RECOMMEND_DIR, help="where the recommendation files live")
+    parser.add_argument("--top-k", type=int, default=TOP_K, help="neighbours kept per product")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("build", help="recount from the whole history")
+    commands.add_parser("update", help="add the orders/requests since the last run")
+    watch = commands.add_parser("watch", help="update periodically")
+    watch.add_argument("--every", type=float, default=float(os.getenv("RECOMMEND_INTERVAL_S", "600")))
+    args = parser.parse_args()
+
+    if sparse is None:
+        print("❌ NumPy and SciPy are needed to build recommendations (pip install numpy scipy)")
+        raise SystemExit(1)
+    repo = open_repository(args.db)
+    repo.init_schema()
+    try:
+        if args.command == "build":
+            started = time.perf_counter()
+            customers, products = build(repo, args.dir, args.top_k)
+            print(f"✓ {customers} customers, {products} products in {time.perf_counter() - started:.1f}s")
+        else:
+            if args.command == "watch":
+                print(f"🛒 Updating recommendations every {args.every:.0f}s")
+            while True:
+                started = time.perf_counter()
+                try:
+                    customers, products = update(repo, args.dir, args.top_k)
+                    print(f"✓ {customers} customers updated, {products} products "
+                          f"in {time.perf_counter() - started:.1f}s")
+                except Exception as e:
+                    if args.command == "update":
+                        raise
+                    print(f"❌ Update failed: {e}")
+                finally:
+                    repo.release()
+                if args.command == "update":
+                    break
+                time.sleep(args.every)
+    finally:
+        repo.close()
+
+
+if __name__ == "__main__":
+    main()
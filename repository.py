@@ -0,0 +1,2013 @@
+"""
+Data Access Layer
+Single repository shared by app.py, app_sql.py and app_with_users.py. It owns
+the canonical schema, hands out one long-lived connection per thread (so
+sqlite3's prepared statement cache is reused across requests) and implements
+the hot queries once, so caching, pooling and instrumentation apply to every
+entry point.
+
+SQLite is the default; when DATABASE_URL points at PostgreSQL the same
+queries run through PostgresRepository, which checks connections out of a
+bounded per-worker pool (see pg_backend.py).
+"""
+
+import os
+import re
+import json
+import time
+import sqlite3
+import threading
+import urllib.parse
+import contextlib
+from datetime import datetime, timedelta
+
+from query_log import InstrumentedConnection
+from workflow import ORDERS, REQUESTS, WORKFLOWS
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS categories (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL UNIQUE,
+        description TEXT,
+        product_count INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS products (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        price REAL NOT NULL DEFAULT 0,
+        desc TEXT,
+        image TEXT,
+        image_width INTEGER,
+        image_height INTEGER,
+        image_placeholder TEXT,
+        category_id INTEGER,
+        created_at DATETIME DEFAULT (datetime('now')),
+        FOREIGN KEY(category_id) REFERENCES categories(id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS orders (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        product_id INTEGER,
+        user_id INTEGER,
+        quantity INTEGER,
+        first_name TEXT,
+        last_name TEXT,
+        state TEXT,
+        phone TEXT,
+        email TEXT,
+        address TEXT,
+        notes TEXT,
+        total_price REAL,
+        status TEXT DEFAULT 'pending',
+        status_code INTEGER NOT NULL DEFAULT 0,
+        created_at DATETIME DEFAULT (datetime('now')),
+        product_name TEXT,
+        item_count INTEGER DEFAULT 1,
+        FOREIGN KEY(product_id) REFERENCES products(id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS order_items (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        order_id INTEGER NOT NULL,
+        product_id INTEGER,
+        product_name TEXT NOT NULL,
+        unit_price REAL NOT NULL,
+        quantity INTEGER NOT NULL,
+        line_total REAL NOT NULL,
+        FOREIGN KEY(order_id) REFERENCES orders(id) ON DELETE CASCADE,
+        FOREIGN KEY(product_id) REFERENCES products(id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS product_requests (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        product_id INTEGER NOT NULL,
+        user_name TEXT NOT NULL,
+        email TEXT,
+        phone TEXT NOT NULL,
+        state TEXT NOT NULL,
+        address TEXT,
+        quantity INTEGER NOT NULL DEFAULT 1,
+        message TEXT,
+        status TEXT DEFAULT 'pending',
+        status_code INTEGER NOT NULL DEFAULT 0,
+        total_price REAL,
+        created_at DATETIME NOT NULL DEFAULT (datetime('now')),
+        FOREIGN KEY(product_id) REFERENCES products(id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS admins (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE NOT NULL,
+        password_hash TEXT NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS product_images (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        product_id INTEGER NOT NULL,
+        image_path TEXT NOT NULL,
+        is_primary BOOLEAN DEFAULT FALSE,
+        width INTEGER,
+        height INTEGER,
+        placeholder TEXT,
+        FOREIGN KEY(product_id) REFERENCES products(id) ON DELETE CASCADE
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS sales_daily (
+        day TEXT NOT NULL,
+        product_id INTEGER NOT NULL,
+        state TEXT NOT NULL,
+        order_count INTEGER NOT NULL DEFAULT 0,
+        units INTEGER NOT NULL DEFAULT 0,
+        revenue REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, product_id, state)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS orders_daily (
+        day TEXT NOT NULL,
+        state TEXT NOT NULL,
+        order_count INTEGER NOT NULL DEFAULT 0,
+        units INTEGER NOT NULL DEFAULT 0,
+        revenue REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, state)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS request_status_daily (
+        day TEXT NOT NULL,
+        product_id INTEGER NOT NULL,
+        state TEXT NOT NULL,
+        status TEXT NOT NULL,
+        request_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, product_id, state, status)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS status_counts (
+        kind TEXT NOT NULL,
+        status_code INTEGER NOT NULL,
+        total INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (kind, status_code)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS archive_partitions (
+        table_name TEXT PRIMARY KEY,
+        base_table TEXT NOT NULL,
+        month TEXT NOT NULL,
+        row_count INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS product_bundles (
+        product_id INTEGER PRIMARY KEY,
+        payload TEXT NOT NULL,
+        related_ids TEXT NOT NULL DEFAULT '',
+        built_at REAL NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT NOT NULL,
+        payload TEXT NOT NULL DEFAULT '{}',
+        priority INTEGER NOT NULL DEFAULT 0,
+        status TEXT NOT NULL DEFAULT 'queued',
+        run_at REAL NOT NULL,
+        timeout REAL NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        max_attempts INTEGER NOT NULL,
+        locked_until REAL,
+        worker TEXT,
+        unique_key TEXT UNIQUE,
+        last_error TEXT,
+        created_at REAL NOT NULL,
+        started_at REAL,
+        finished_at REAL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS admin_events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT NOT NULL,
+        item_id INTEGER NOT NULL,
+        action TEXT NOT NULL,
+        status TEXT,
+        payload TEXT NOT NULL DEFAULT '{}',
+        created_at REAL NOT NULL
+    )
+    """,
+]
+
+POSTGRES_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS categories (
+        id SERIAL PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE,
+        description TEXT,
+        product_count INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS products (
+        id SERIAL PRIMARY KEY,
+        name TEXT NOT NULL,
+        price DOUBLE PRECISION NOT NULL DEFAULT 0,
+        "desc" TEXT,
+        image TEXT,
+        image_width INTEGER,
+        image_height INTEGER,
+        image_placeholder TEXT,
+        category_id INTEGER REFERENCES categories(id),
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS orders (
+        id SERIAL PRIMARY KEY,
+        product_id INTEGER REFERENCES products(id) ON DELETE SET NULL,
+        user_id INTEGER,
+        quantity INTEGER,
+        first_name TEXT,
+        last_name TEXT,
+        state TEXT,
+        phone TEXT,
+        email TEXT,
+        address TEXT,
+        notes TEXT,
+        total_price DOUBLE PRECISION,
+        status TEXT DEFAULT 'pending',
+        status_code INTEGER NOT NULL DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        product_name TEXT,
+        item_count INTEGER DEFAULT 1
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS order_items (
+        id SERIAL PRIMARY KEY,
+        order_id INTEGER NOT NULL REFERENCES orders(id) ON DELETE CASCADE,
+        product_id INTEGER REFERENCES products(id) ON DELETE SET NULL,
+        product_name TEXT NOT NULL,
+        unit_price DOUBLE PRECISION NOT NULL,
+        quantity INTEGER NOT NULL,
+        line_total DOUBLE PRECISION NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS product_requests (
+        id SERIAL PRIMARY KEY,
+        product_id INTEGER NOT NULL REFERENCES products(id) ON DELETE CASCADE,
+        user_name TEXT NOT NULL,
+        email TEXT,
+        phone TEXT NOT NULL,
+        state TEXT NOT NULL,
+        address TEXT,
+        quantity INTEGER NOT NULL DEFAULT 1,
+        message TEXT,
+        status TEXT DEFAULT 'pending',
+        status_code INTEGER NOT NULL DEFAULT 0,
+        total_price DOUBLE PRECISION,
+        created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS admins (
+        id SERIAL PRIMARY KEY,
+        username TEXT UNIQUE NOT NULL,
+        password_hash TEXT NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS product_images (
+        id SERIAL PRIMARY KEY,
+        product_id INTEGER NOT NULL REFERENCES products(id) ON DELETE CASCADE,
+        image_path TEXT NOT NULL,
+        is_primary BOOLEAN DEFAULT FALSE,
+        width INTEGER,
+        height INTEGER,
+        placeholder TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS sales_daily (
+        day TEXT NOT NULL,
+        product_id INTEGER NOT NULL,
+        state TEXT NOT NULL,
+        order_count INTEGER NOT NULL DEFAULT 0,
+        units INTEGER NOT NULL DEFAULT 0,
+        revenue DOUBLE PRECISION NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, product_id, state)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS orders_daily (
+        day TEXT NOT NULL,
+        state TEXT NOT NULL,
+        order_count INTEGER NOT NULL DEFAULT 0,
+        units INTEGER NOT NULL DEFAULT 0,
+        revenue DOUBLE PRECISION NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, state)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS request_status_daily (
+        day TEXT NOT NULL,
+        product_id INTEGER NOT NULL,
+        state TEXT NOT NULL,
+        status TEXT NOT NULL,
+        request_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, product_id, state, status)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS status_counts (
+        kind TEXT NOT NULL,
+        status_code INTEGER NOT NULL,
+        total INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (kind, status_code)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS archive_partitions (
+        table_name TEXT PRIMARY KEY,
+        base_table TEXT NOT NULL,
+        month TEXT NOT NULL,
+        row_count INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS product_bundles (
+        product_id INTEGER PRIMARY KEY,
+        payload TEXT NOT NULL,
+        related_ids TEXT NOT NULL DEFAULT '',
+        built_at DOUBLE PRECISION NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS jobs (
+        id SERIAL PRIMARY KEY,
+        kind TEXT NOT NULL,
+        payload TEXT NOT NULL DEFAULT '{}',
+        priority INTEGER NOT NULL DEFAULT 0,
+        status TEXT NOT NULL DEFAULT 'queued',
+        run_at DOUBLE PRECISION NOT NULL,
+        timeout DOUBLE PRECISION NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        max_attempts INTEGER NOT NULL,
+        locked_until DOUBLE PRECISION,
+        worker TEXT,
+        unique_key TEXT UNIQUE,
+        last_error TEXT,
+        created_at DOUBLE PRECISION NOT NULL,
+        started_at DOUBLE PRECISION,
+        finished_at DOUBLE PRECISION
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS admin_events (
+        id SERIAL PRIMARY KEY,
+        kind TEXT NOT NULL,
+        item_id INTEGER NOT NULL,
+        action TEXT NOT NULL,
+        status TEXT,
+        payload TEXT NOT NULL DEFAULT '{}',
+        created_at DOUBLE PRECISION NOT NULL
+    )
+    """,
+]
+
+# Columns added after the first release; ALTER TABLE can't use expression
+# defaults, so writers always set created_at explicitly.
+COLUMN_MIGRATIONS = {
+    "categories": [("product_count", "INTEGER NOT NULL DEFAULT 0")],
+    "products": [("category_id", "INTEGER"), ("created_at", "TIMESTAMP"),
+                 ("image_width", "INTEGER"), ("image_height", "INTEGER"), ("image_placeholder", "TEXT")],
+    "product_images": [("width", "INTEGER"), ("height", "INTEGER"), ("placeholder", "TEXT")],
+    "orders": [("user_id", "INTEGER"), ("email", "TEXT"),
+               ("status", "TEXT DEFAULT 'pending'"), ("created_at", "TIMESTAMP"),
+               ("product_name", "TEXT"), ("item_count", "INTEGER DEFAULT 1"),
+               ("status_code", "INTEGER NOT NULL DEFAULT 0")],
+    "product_requests": [("status_code", "INTEGER NOT NULL DEFAULT 0")],
+}
+
+INDEXES = [
+    # category pages: one range scan, newest first
+    "CREATE INDEX IF NOT EXISTS idx_products_category_id ON products(category_id, id)",
+    "CREATE INDEX IF NOT EXISTS idx_product_images_product ON product_images(product_id, is_primary DESC, id)",
+    "CREATE INDEX IF NOT EXISTS idx_orders_product ON orders(product_id)",
+    "CREATE INDEX IF NOT EXISTS idx_orders_user ON orders(user_id)",
+    "CREATE INDEX IF NOT EXISTS idx_order_items_order ON order_items(order_id)",
+    "CREATE INDEX IF NOT EXISTS idx_order_items_product ON order_items(product_id)",
+    # work queues: one status, oldest first ({nulls_first} keeps legacy rows without a
+    # timestamp at the front on PostgreSQL too, where NULLs otherwise sort last)
+    "CREATE INDEX IF NOT EXISTS idx_orders_status_queue ON orders(status_code, created_at{nulls_first}, id)",
+    "CREATE INDEX IF NOT EXISTS idx_product_requests_status_queue "
+    "ON product_requests(status_code, created_at{nulls_first}, id)",
+    "CREATE INDEX IF NOT EXISTS idx_product_requests_created_at ON product_requests(created_at DESC)",
+    # job queue: the next job to claim, and leases that ran out
+    "CREATE INDEX IF NOT EXISTS idx_jobs_ready ON jobs(status, priority DESC, run_at, id)",
+    "CREATE INDEX IF NOT EXISTS idx_jobs_locked ON jobs(status, locked_until)",
+    # admin feed: pruning old events (reads go by the primary key)
+    "CREATE INDEX IF NOT EXISTS idx_admin_events_created_at ON admin_events(created_at)",
+]
+
+# Superseded by the status_code queue indexes and the (category_id, id) index
+DROPPED_INDEXES = ["idx_product_requests_status", "idx_products_category"]
+
+# categories.product_count follows every insert/delete/re-categorization of a
+# product, whichever code path (raw SQL, SQLAlchemy, bulk imports) makes it
+TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS products_category_insert AFTER INSERT ON products
+    WHEN NEW.category_id IS NOT NULL
+    BEGIN
+        UPDATE categories SET product_count = product_count + 1 WHERE id = NEW.category_id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS products_category_delete AFTER DELETE ON products
+    WHEN OLD.category_id IS NOT NULL
+    BEGIN
+        UPDATE categories SET product_count = product_count - 1 WHERE id = OLD.category_id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS products_category_update AFTER UPDATE OF category_id ON products
+    WHEN OLD.category_id IS NOT NEW.category_id
+    BEGIN
+        UPDATE categories SET product_count = product_count - 1 WHERE id = OLD.category_id;
+        UPDATE categories SET product_count = product_count + 1 WHERE id = NEW.category_id;
+    END
+    """,
+]
+POSTGRES_TRIGGERS = [
+    """
+    CREATE OR REPLACE FUNCTION products_category_count() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'UPDATE' AND OLD.category_id IS NOT DISTINCT FROM NEW.category_id THEN
+            RETURN NULL;
+        END IF;
+        IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.category_id IS NOT NULL THEN
+            UPDATE categories SET product_count = product_count - 1 WHERE id = OLD.category_id;
+        END IF;
+        IF TG_OP IN ('UPDATE', 'INSERT') AND NEW.category_id IS NOT NULL THEN
+            UPDATE categories SET product_count = product_count + 1 WHERE id = NEW.category_id;
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS products_category_count ON products",
+    """
+    CREATE TRIGGER products_category_count AFTER INSERT OR DELETE OR UPDATE OF category_id ON products
+    FOR EACH ROW EXECUTE FUNCTION products_category_count()
+    """,
+]
+SQL_REBUILD_CATEGORY_COUNTS = """
+    UPDATE categories SET product_count =
+        (SELECT COUNT(*) FROM products WHERE products.category_id = categories.id)
+"""
+
+# Hot statements are module constants so every call hits the per-connection
+# statement cache with the exact same SQL text.
+SQL_PRODUCT_BY_ID = "SELECT * FROM products WHERE id = ?"
+SQL_PRODUCT_IMAGES = "SELECT * FROM product_images WHERE product_id = ? ORDER BY is_primary DESC, id ASC"
+SQL_PRODUCT_LIST = "SELECT * FROM products ORDER BY id DESC"
+SQL_PRODUCT_PAGE = "SELECT * FROM products ORDER BY id DESC LIMIT ? OFFSET ?"
+SQL_CATEGORIES = "SELECT * FROM categories ORDER BY name"
+SQL_CATEGORY_BY_ID = "SELECT * FROM categories WHERE id = ?"
+SQL_CATEGORY_NAV = "SELECT id, name, product_count FROM categories WHERE product_count > 0 ORDER BY name"
+# Category pages are keyset-paged on (category_id, id): `after` is the last id shown
+SQL_CATEGORY_PRODUCTS = "SELECT * FROM products WHERE category_id = ? ORDER BY id DESC LIMIT ?"
+SQL_CATEGORY_PRODUCTS_AFTER = "SELECT * FROM products WHERE category_id = ? AND id < ? ORDER BY id DESC LIMIT ?"
+SQL_PRODUCTS_BY_IDS = "SELECT * FROM products WHERE id IN ({})"
+# Product page bundles: everything the page shows, stored as one JSON row and
+# rebuilt when stale (PRODUCT_BUNDLE_TTL_S) or after the product is edited
+PRODUCT_BUNDLE_TTL_S = float(os.getenv("PRODUCT_BUNDLE_TTL_S", "86400"))
+SQL_PRODUCT_BUNDLE = "SELECT payload, built_at FROM product_bundles WHERE product_id = ?"
+SQL_SAVE_PRODUCT_BUNDLE = """
+    INSERT INTO product_bundles (product_id, payload, related_ids, built_at) VALUES (?, ?, ?, ?)
+    ON CONFLICT (product_id) DO UPDATE SET
+        payload = excluded.payload, related_ids = excluded.related_ids, built_at = excluded.built_at
+"""
+SQL_DROP_PRODUCT_BUNDLES = "DELETE FROM product_bundles WHERE product_id = ? OR related_ids LIKE ?"
+SQL_PRODUCT_WITH_CATEGORY = """
+    SELECT p.*, c.name as category_name
+    FROM products p LEFT JOIN categories c ON c.id = p.category_id
+    WHERE p.id = ?
+"""
+# "Bought together": products sharing the most orders with this one
+SQL_RELATED_BY_ORDERS = """
+    SELECT b.product_id, COUNT(DISTINCT b.order_id) AS together
+    FROM order_items a JOIN order_items b ON b.order_id = a.order_id
+    WHERE a.product_id = ? AND b.product_id IS NOT NULL AND b.product_id != a.product_id
+    GROUP BY b.product_id
+    ORDER BY together DESC, b.product_id DESC
+    LIMIT ?
+"""
+SQL_RELATED_BY_CATEGORY = """
+    SELECT id FROM products WHERE category_id = ? AND id != ? ORDER BY id DESC LIMIT ?
+"""
+RELATED_COLUMNS = ("id", "name", "price", "image", "image_width", "image_height", "image_placeholder")
+# Deleting a product: what PostgreSQL's ON DELETE actions do, spelled out so
+# SQLite databases created before those actions existed behave the same
+SQL_DETACH_PRODUCT = (
+    "UPDATE orders SET product_id = NULL WHERE product_id = ?",
+    "UPDATE order_items SET product_id = NULL WHERE product_id = ?",
+    "DELETE FROM product_images WHERE product_id = ?",
+)
+SQL_PRODUCT_REQUEST_CODES = """
+    SELECT status_code, COUNT(*) AS total FROM product_requests WHERE product_id = ? GROUP BY status_code
+"""
+# Every upload a product still uses, for image_gc.py
+SQL_IMAGE_REFERENCES = """
+    SELECT id AS product_id, image AS path FROM products WHERE image IS NOT NULL
+    UNION
+    SELECT i.product_id, i.image_path FROM product_images i JOIN products p ON p.id = i.product_id
+"""
+SQL_DROP_ORPHAN_IMAGE_ROWS = "DELETE FROM product_images WHERE product_id NOT IN (SELECT id FROM products)"
+# Images stored before their sizes were recorded, and recording them (by path:
+# uploads are named by content, so a path always has the same size)
+SQL_UNMEASURED_IMAGES = """
+    SELECT image_path AS path FROM product_images WHERE width IS NULL
+    UNION
+    SELECT image FROM products WHERE image IS NOT NULL AND image_width IS NULL
+"""
+SQL_MEASURE_IMAGE = (
+    "UPDATE product_images SET width = ?, height = ?, placeholder = ? WHERE image_path = ?",
+    "UPDATE products SET image_width = ?, image_height = ?, image_placeholder = ? WHERE image = ?",
+)
+# Everything the facet index needs, one row per product, newest first
+SQL_FACET_ROWS = """
+    SELECT p.id, p.price, p.category_id, p.created_at,
+           CASE WHEN p.image IS NOT NULL OR EXISTS (SELECT 1 FROM product_images i WHERE i.product_id = p.id)
+                THEN 1 ELSE 0 END AS has_image
+    FROM products p
+    ORDER BY p.id DESC
+"""
+# Co-purchase history for recommend.py: who (by phone) ordered or requested
+# what, up to a watermark id, over the live tables and their archives
+SQL_CUSTOMER_ORDERED = """
+    SELECT DISTINCT o.phone AS phone, i.product_id AS product_id
+    FROM {orders} o JOIN {items} i ON i.order_id = o.id
+    WHERE o.id <= ? AND o.phone IS NOT NULL AND o.phone != '' AND i.product_id IS NOT NULL{phones}
+"""
+SQL_CUSTOMER_REQUESTED = """
+    SELECT DISTINCT phone, product_id FROM {requests}
+    WHERE id <= ? AND phone IS NOT NULL AND phone != ''{phones}
+"""
+SQL_NEW_CUSTOMERS = "SELECT DISTINCT phone FROM {table} WHERE id > ? AND id <= ? AND phone IS NOT NULL AND phone != ''"
+SQL_INSERT_ORDER = """
+    INSERT INTO orders
+    (product_id, user_id, quantity, first_name, last_name, phone, state, email, address, notes,
+     total_price, status, status_code, created_at, product_name, item_count)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'pending', 0, ?, ?, ?)
+"""
+SQL_INSERT_ORDER_ITEM = """
+    INSERT INTO order_items (order_id, product_id, product_name, unit_price, quantity, line_total)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+SQL_INSERT_REQUEST = """
+    INSERT INTO product_requests
+    (product_id, user_name, email, phone, state, address, quantity, message, total_price, status,
+     status_code, created_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+# Orders are headers carrying the totals and a product_name summary fixed at
+# write time, so listings and exports read one table and never re-price
+# old orders with today's product prices.
+SQL_ORDER_BY_ID = "SELECT * FROM orders WHERE id = ?"
+SQL_ORDER_ITEMS = "SELECT * FROM order_items WHERE order_id = ? ORDER BY id"
+SQL_ORDER_LIST = """
+    SELECT id, product_name, quantity, first_name, last_name, state, phone, total_price, status
+    FROM orders
+    ORDER BY id DESC
+"""
+SQL_ORDER_EXPORT = "SELECT * FROM orders ORDER BY id DESC"
+# Orders written before order_items existed get one line each, priced from
+# what they were charged (the current product price only if that is missing)
+SQL_BACKFILL_ORDER_ITEMS = """
+    INSERT INTO order_items (order_id, product_id, product_name, unit_price, quantity, line_total)
+    SELECT o.id, p.id, COALESCE(p.name, ''),
+           COALESCE(o.total_price / NULLIF(o.quantity, 0), p.price, 0), COALESCE(o.quantity, 1),
+           COALESCE(o.total_price, COALESCE(o.quantity, 1) * p.price, 0)
+    FROM orders o LEFT JOIN products p ON p.id = o.product_id
+    WHERE o.product_name IS NULL
+"""
+SQL_BACKFILL_ORDER_HEADERS = """
+    UPDATE orders SET
+        total_price = COALESCE(total_price,
+                               COALESCE(quantity, 1) * (SELECT price FROM products WHERE id = orders.product_id), 0),
+        product_name = COALESCE((SELECT name FROM products WHERE id = orders.product_id), ''),
+        item_count = 1
+    WHERE product_name IS NULL
+"""
+SQL_REQUEST_LIST = """
+    SELECT pr.*, p.name as product_name, p.price as unit_price, p.image as product_image
+    FROM product_requests pr
+    JOIN products p ON pr.product_id = p.id
+    ORDER BY pr.created_at DESC
+"""
+SQL_UPDATE_REQUEST_STATUS = "UPDATE product_requests SET status = ?, status_code = ? WHERE id = ?"
+SQL_REQUEST_FOR_UPDATE = "SELECT product_id, state, status_code, created_at FROM product_requests WHERE id = ?"
+SQL_UPDATE_ORDER_STATUS = "UPDATE orders SET status = ?, status_code = ? WHERE id = ?"
+SQL_ORDER_FOR_UPDATE = "SELECT state, status_code, created_at, quantity, total_price FROM orders WHERE id = ?"
+SQL_ORDER_ITEM_TOTALS = "SELECT COALESCE(product_id, 0), quantity, line_total FROM order_items WHERE order_id = ?"
+
+# Per-status totals, bumped in the same transaction as every insert and
+# status change, so queue badges never count rows
+SQL_BUMP_STATUS_COUNT = """
+    INSERT INTO status_counts (kind, status_code, total) VALUES (?, ?, ?)
+    ON CONFLICT (kind, status_code) DO UPDATE SET total = status_counts.total + excluded.total
+"""
+SQL_STATUS_COUNTS = "SELECT status_code, total FROM status_counts WHERE kind = ?"
+SQL_REBUILD_STATUS_COUNTS = """
+    INSERT INTO status_counts (kind, status_code, total)
+    SELECT '{kind}', status_code, COUNT(*) FROM {table} GROUP BY status_code
+"""
+# Work queues page through one status oldest first on the (status_code,
+# created_at, id) index; `after` is the last row of the previous page.
+# Rows from before created_at existed have none and come first.
+QUEUE_TABLES = {"orders": "orders", "requests": "product_requests"}
+SQL_QUEUE = {
+    "orders": """
+        SELECT id, product_name, item_count, quantity, first_name, last_name, phone, state,
+               total_price, status, status_code, created_at
+        FROM orders
+        WHERE status_code = ?{after}
+        ORDER BY created_at NULLS FIRST, id
+        LIMIT ?
+    """,
+    "requests": """
+        SELECT pr.id, pr.product_id, p.name as product_name, pr.user_name, pr.phone, pr.state,
+               pr.quantity, pr.total_price, pr.status, pr.status_code, pr.created_at
+        FROM product_requests pr LEFT JOIN products p ON p.id = pr.product_id
+        WHERE pr.status_code = ?{after}
+        ORDER BY pr.created_at NULLS FIRST, pr.id
+        LIMIT ?
+    """,
+}
+SQL_QUEUE_AFTER = {
+    "orders": (" AND (created_at, id) > (?, ?)", " AND (created_at IS NOT NULL OR id > ?)"),
+    "requests": (" AND (pr.created_at, pr.id) > (?, ?)", " AND (pr.created_at IS NOT NULL OR pr.id > ?)"),
+}
+
+# Rollups: one row per day x product x wilaya (plus one per day x wilaya for
+# whole orders, which a multi-product order would otherwise count once per
+# line), bumped in the same transaction as the write they summarize, so
+# reports never scan orders/product_requests. Cancelled orders are taken back
+# out. Deleted products roll up under product_id 0, unknown wilayas under ''.
+SQL_ROLLUP_SALES = """
+    INSERT INTO sales_daily (day, product_id, state, order_count, units, revenue)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT (day, product_id, state) DO UPDATE SET
+        order_count = sales_daily.order_count + excluded.order_count,
+        units = sales_daily.units + excluded.units,
+        revenue = sales_daily.revenue + excluded.revenue
+"""
+SQL_ROLLUP_ORDERS = """
+    INSERT INTO orders_daily (day, state, order_count, units, revenue)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (day, state) DO UPDATE SET
+        order_count = orders_daily.order_count + excluded.order_count,
+        units = orders_daily.units + excluded.units,
+        revenue = orders_daily.revenue + excluded.revenue
+"""
+SQL_ROLLUP_REQUESTS = """
+    INSERT INTO request_status_daily (day, product_id, state, status, request_count)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (day, product_id, state, status) DO UPDATE SET
+        request_count = request_status_daily.request_count + excluded.request_count
+"""
+# Rebuilds run once per source (the live table, then each archive month) and
+# add up on conflict
+SQL_REBUILD_SALES = """
+    INSERT INTO sales_daily (day, product_id, state, order_count, units, revenue)
+    SELECT {day}, COALESCE(i.product_id, 0), COALESCE(o.state, ''), COUNT(DISTINCT o.id),
+           SUM(i.quantity), SUM(i.line_total)
+    FROM {orders} o JOIN {items} i ON i.order_id = o.id
+    WHERE o.created_at IS NOT NULL AND o.status_code != {cancelled}{since}
+    GROUP BY 1, 2, 3
+    ON CONFLICT (day, product_id, state) DO UPDATE SET
+        order_count = sales_daily.order_count + excluded.order_count,
+        units = sales_daily.units + excluded.units,
+        revenue = sales_daily.revenue + excluded.revenue
+"""
+SQL_REBUILD_ORDERS = """
+    INSERT INTO orders_daily (day, state, order_count, units, revenue)
+    SELECT {day}, COALESCE(state, ''), COUNT(*), COALESCE(SUM(quantity), 0), COALESCE(SUM(total_price), 0)
+    FROM {orders}
+    WHERE created_at IS NOT NULL AND status_code != {cancelled}{since}
+    GROUP BY 1, 2
+    ON CONFLICT (day, state) DO UPDATE SET
+        order_count = orders_daily.order_count + excluded.order_count,
+        units = orders_daily.units + excluded.units,
+        revenue = orders_daily.revenue + excluded.revenue
+"""
+SQL_REBUILD_REQUESTS = """
+    INSERT INTO request_status_daily (day, product_id, state, status, request_count)
+    SELECT {day}, product_id, COALESCE(state, ''), COALESCE(status, 'pending'), COUNT(*)
+    FROM {requests}
+    WHERE created_at IS NOT NULL{since}
+    GROUP BY 1, 2, 3, 4
+    ON CONFLICT (day, product_id, state, status) DO UPDATE SET
+        request_count = request_status_daily.request_count + excluded.request_count
+"""
+SQL_TOP_PRODUCTS = """
+    SELECT s.product_id, COALESCE(p.name, '') as name, SUM(s.order_count) as order_count,
+           SUM(s.units) as units, SUM(s.revenue) as revenue
+    FROM sales_daily s LEFT JOIN products p ON p.id = s.product_id
+    WHERE s.day >= ? AND s.day <= ?
+    GROUP BY s.product_id, p.name
+    ORDER BY revenue DESC
+    LIMIT ?
+"""
+SQL_REVENUE_BY_STATE = """
+    SELECT state, SUM(order_count) as order_count, SUM(units) as units, SUM(revenue) as revenue
+    FROM orders_daily
+    WHERE day >= ? AND day <= ?
+    GROUP BY state
+    ORDER BY revenue DESC
+"""
+SQL_SALES_BY_DAY = """
+    SELECT day, SUM(order_count) as order_count, SUM(units) as units, SUM(revenue) as revenue
+    FROM orders_daily
+    WHERE day >= ? AND day <= ?
+    GROUP BY day
+    ORDER BY day
+"""
+SQL_REQUEST_STATUS_TOTALS = """
+    SELECT status, SUM(request_count) as request_count
+    FROM request_status_daily
+    WHERE day >= ? AND day <= ?
+    GROUP BY status
+    ORDER BY request_count DESC
+"""
+
+# Archives: terminal orders/requests older than a horizon move to one table per
+# month (orders_2024_01, order_items_2024_01, product_requests_2024_01),
+# listed in archive_partitions. Listings read only the live tables unless
+# given a date range, which pulls in the months it overlaps.
+ARCHIVE_CHILDREN = {"orders": [("order_items", "order_id")]}
+SQL_ARCHIVE_CANDIDATES = """
+    SELECT id, created_at FROM {table}
+    WHERE status_code = ? AND created_at < ?
+    ORDER BY created_at, id
+    LIMIT ?
+"""
+SQL_REGISTER_PARTITION = """
+    INSERT INTO archive_partitions (table_name, base_table, month, row_count) VALUES (?, ?, ?, 0)
+    ON CONFLICT (table_name) DO NOTHING
+"""
+SQL_PARTITION_ROWS = "UPDATE archive_partitions SET row_count = row_count + ? WHERE table_name = ?"
+SQL_PARTITIONS = """
+    SELECT table_name, month FROM archive_partitions
+    WHERE base_table = ? AND month >= ? AND month <= ?
+    ORDER BY month DESC
+"""
+SQL_ORDER_RANGE = "SELECT {columns} FROM {table} WHERE created_at >= ? AND created_at < ?"
+SQL_REQUEST_RANGE = """
+    SELECT {columns}, p.name as product_name, p.price as unit_price, p.image as product_image
+    FROM {table} pr
+    JOIN products p ON pr.product_id = p.id
+    WHERE pr.created_at >= ? AND pr.created_at < ?
+"""
+# Background jobs (jobs.py): claimed one at a time by a single UPDATE, so two
+# workers never get the same job; a claim is a lease of `timeout` seconds
+# after which the job goes back to the queue (or fails, out of attempts)
+SQL_ENQUEUE_JOB = """
+    INSERT INTO jobs (kind, payload, priority, run_at, timeout, max_attempts, unique_key, created_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (unique_key) DO NOTHING
+    RETURNING id
+"""
+SQL_CLAIM_JOB = """
+    UPDATE jobs SET status = 'running', attempts = attempts + 1, worker = ?, started_at = ?, locked_until = ? + timeout
+    WHERE id = (SELECT id FROM jobs WHERE status = 'queued' AND run_at <= ?
+                ORDER BY priority DESC, run_at, id LIMIT 1{skip_locked})
+    RETURNING *
+"""
+SQL_EXPIRE_JOBS = """
+    UPDATE jobs SET status = CASE WHEN attempts < max_attempts THEN 'queued' ELSE 'failed' END,
+                    finished_at = CASE WHEN attempts < max_attempts THEN NULL ELSE ? END,
+                    worker = NULL, locked_until = NULL, last_error = 'lease expired (worker died or job too slow)'
+    WHERE status = 'running' AND locked_until < ?
+"""
+SQL_FINISH_JOB = """
+    UPDATE jobs SET status = 'done', finished_at = ?, locked_until = NULL, last_error = NULL
+    WHERE id = ? AND worker = ? AND status = 'running'
+"""
+SQL_FAIL_JOB = """
+    UPDATE jobs SET status = ?, run_at = COALESCE(?, run_at), finished_at = ?, last_error = ?, locked_until = NULL
+    WHERE id = ? AND worker = ? AND status = 'running'
+"""
+SQL_RETRY_JOB = """
+    UPDATE jobs SET status = 'queued', run_at = ?, attempts = 0, finished_at = NULL, worker = NULL
+    WHERE id = ? AND status = 'failed'
+"""
+SQL_JOB_DEPTH = """
+    SELECT kind, status, COUNT(*) AS total,
+           SUM(CASE WHEN run_at <= ? THEN 1 ELSE 0 END) AS due, MIN(run_at) AS oldest_run_at
+    FROM jobs WHERE status IN ('queued', 'running', 'failed')
+    GROUP BY kind, status ORDER BY kind, status
+"""
+# latency of the jobs finished since a time: wait = due -> picked up, run = picked up -> done
+SQL_JOB_LATENCY = """
+    SELECT kind, COUNT(*) AS done, AVG(started_at - run_at) AS avg_wait_s, MAX(started_at - run_at) AS max_wait_s,
+           AVG(finished_at - started_at) AS avg_run_s, MAX(finished_at - started_at) AS max_run_s
+    FROM jobs WHERE status = 'done' AND finished_at >= ?
+    GROUP BY kind ORDER BY kind
+"""
+SQL_FAILED_JOBS = """
+    SELECT id, kind, payload, attempts, last_error, finished_at FROM jobs
+    WHERE status = 'failed' ORDER BY finished_at DESC, id DESC LIMIT ?
+"""
+SQL_PRUNE_JOBS = "DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?"
+# Admin feed (admin_feed.py): one row per new order/request or status change,
+# written in the same transaction. Its id is the change cursor open admin
+# pages resume from - orders.id alone can't tell them about status changes.
+SQL_RECORD_EVENT = """
+    INSERT INTO admin_events (kind, item_id, action, status, payload, created_at)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+SQL_EVENTS_AFTER = "SELECT * FROM admin_events WHERE id > ? ORDER BY id LIMIT ?"
+SQL_LATEST_EVENT = "SELECT COALESCE(MAX(id), 0) FROM admin_events"
+SQL_PRUNE_EVENTS = "DELETE FROM admin_events WHERE created_at < ?"
+# every ADMIN_EVENTS_PRUNE_EVERY events a process writes, it also drops those
+# older than ADMIN_EVENTS_KEEP_S, so the table stays bounded without a worker
+ADMIN_EVENTS_KEEP_S = float(os.getenv("ADMIN_EVENTS_KEEP_S", str(7 * 24 * 3600)))
+ADMIN_EVENTS_PRUNE_EVERY = int(os.getenv("ADMIN_EVENTS_PRUNE_EVERY", "1000"))
+ORDER_LIST_COLUMNS = ["id", "product_name", "quantity", "first_name", "last_name", "state", "phone", "total_price",
+                      "status"]
+
+PRODUCT_SORT_COLUMNS = ("id", "name", "price")
+SORT_ORDERS = ("ASC", "DESC")
+
+
+def utcnow():
+    """Timestamp in the format SQLite's datetime('now') produces"""
+    return datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def partition_name(base, month):
+    """Archive table of `base` for a "YYYY-MM" month"""
+    if not re.fullmatch(r"\d{4}-\d{2}", month):
+        raise ValueError(f"invalid archive month {month!r}")
+    return f"{base}_{month.replace('-', '_')}"
+
+
+def _day_after(day):
+    return (datetime.strptime(day[:10], "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+
+
+def backfill_order_items(conn):
+    """Give orders from before order_items their line and header summary (runs in the caller's transaction)"""
+    conn.execute(SQL_BACKFILL_ORDER_ITEMS)
+    conn.execute(SQL_BACKFILL_ORDER_HEADERS)
+
+
+def backfill_status_codes(conn, kinds=("orders", "requests")):
+    """Derive status_code from the text status for rows written without it.
+
+    Statuses the workflow doesn't know become pending. Runs in the caller's
+    transaction.
+    """
+    for kind in kinds:
+        workflow = WORKFLOWS[kind]
+        names = ", ".join(f"'{name}'" for name in workflow.statuses)
+        conn.execute(f"UPDATE {QUEUE_TABLES[kind]} SET status_code = {workflow.case_sql()}, "
+                     f"status = CASE WHEN status IN ({names}) THEN status ELSE 'pending' END")
+
+
+class Repository:
+    """Connection management and hot queries for one SQLite database.
+
+    Read-only queries (catalog, admin listings, exports) use a separate
+    read-only connection: by default on the same file, which in WAL mode
+    never blocks or is blocked by order writes, or on `replica_path` (a
+    snapshot copy) when one is given. After a write, the client's session is
+    pinned to the primary for `sticky_seconds` so it reads its own writes.
+    """
+
+    STICKY_SESSION_KEY = "_db_primary_until"
+    # ASC indexes already put NULLs first in SQLite (which rejects the keyword there)
+    NULLS_FIRST = ""
+    TRIGGERS = TRIGGERS
+    # SQLite serializes writers, so a claim never races another
+    SKIP_LOCKED = ""
+
+    def __init__(self, db_path, cached_statements=256, timeout=5.0, replica_path=None, sticky_seconds=5.0):
+        self.db_path = db_path
+        self.replica_path = replica_path
+        self.sticky_seconds = sticky_seconds
+        self.cached_statements = cached_statements
+        self.timeout = timeout
+        self._local = threading.local()
+
+    @property
+    def has_lagging_replica(self):
+        """True when reads may not see the latest writes yet (stickiness needed)"""
+        return bool(self.replica_path) and self.replica_path != self.db_path
+
+    # -- connections --------------------------------------------------------
+
+    def connect(self):
+        """Open a new instrumented connection (callers own its lifetime)"""
+        conn = sqlite3.connect(self.db_path, timeout=self.timeout, factory=InstrumentedConnection,
+                               cached_statements=self.cached_statements)
+        conn.row_factory = sqlite3.Row
+        conn.execute(f"PRAGMA busy_timeout = {int(self.timeout * 1000)}")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute("PRAGMA foreign_keys = ON")  # off by default in SQLite, per connection
+        return conn
+
+    def connect_readonly(self):
+        """Open a new read-only connection on the replica (or the primary file)"""
+        path = os.path.abspath(self.replica_path or self.db_path)
+        conn = sqlite3.connect(f"file:{urllib.parse.quote(path)}?mode=ro", uri=True, timeout=self.timeout,
+                               factory=InstrumentedConnection, cached_statements=self.cached_statements)
+        conn.row_factory = sqlite3.Row
+        conn.execute(f"PRAGMA busy_timeout = {int(self.timeout * 1000)}")
+        conn.execute("PRAGMA query_only = ON")
+        return conn
+
+    def connection(self):
+        """The calling thread's long-lived connection"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self.connect()
+        return conn
+
+    def read_connection(self):
+        """Connection for read-only queries: the replica unless this client must read its writes"""
+        if getattr(self._local, "primary_reads", False):
+            return self.connection()
+        conn = getattr(self._local, "read_conn", None)
+        if self.has_lagging_replica:
+            # refresh_replica() swaps the snapshot file; reopen to see the new one
+            try:
+                st = os.stat(self.replica_path)
+                version = (st.st_ino, st.st_mtime_ns)
+            except OSError:
+                return self.connection()  # no snapshot yet
+            if conn is not None and getattr(self._local, "read_version", None) != version:
+                conn.close()
+                conn = None
+            self._local.read_version = version
+        if conn is None:
+            conn = self._local.read_conn = self.connect_readonly()
+        return conn
+
+    def refresh_replica(self):
+        """Rewrite the SQLite snapshot from the primary (online backup, atomic swap)"""
+        if not self.has_lagging_replica:
+            return
+        tmp_path = f"{self.replica_path}.tmp-{os.getpid()}"
+        source = sqlite3.connect(self.db_path, timeout=self.timeout)
+        target = sqlite3.connect(tmp_path)
+        try:
+            source.backup(target)
+            target.execute("PRAGMA journal_mode = DELETE")
+        finally:
+            target.close()
+            source.close()
+        os.replace(tmp_path, self.replica_path)
+
+    @contextlib.contextmanager
+    def read_snapshot(self):
+        """Run several reads against one consistent snapshot"""
+        conn = self.read_connection()
+        if conn.in_transaction:
+            yield conn
+            return
+        self._begin_snapshot(conn)
+        try:
+            yield conn
+        finally:
+            conn.rollback()
+
+    def _begin_snapshot(self, conn):
+        conn.execute("BEGIN")
+
+    def pin_to_primary(self, pinned=True):
+        """Route this thread's reads to the primary (set per request by init_app)"""
+        self._local.primary_reads = pinned
+
+    def release(self):
+        """End-of-request hook: never leak an open transaction into the next request"""
+        for name in ("conn", "read_conn"):
+            conn = getattr(self._local, name, None)
+            if conn is not None and conn.in_transaction:
+                conn.rollback()
+        self._local.primary_reads = False
+
+    def close(self):
+        for name in ("conn", "read_conn"):
+            conn = getattr(self._local, name, None)
+            if conn is not None:
+                conn.close()
+                setattr(self._local, name, None)
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """Commit on success, roll back on error"""
+        conn = self.connection()
+        with conn:
+            yield conn
+
+    def init_app(self, app, refresh_seconds=None):
+        """Per-request connection housekeeping and read-your-writes stickiness.
+
+        With a SQLite snapshot replica, a background thread refreshes it
+        every `refresh_seconds` (DB_REPLICA_REFRESH_S, default 60; 0 disables).
+        """
+        from flask import request, session
+        app.extensions["repository"] = self
+        if refresh_seconds is None:
+            refresh_seconds = float(os.getenv("DB_REPLICA_REFRESH_S", "60"))
+        refresher_pending = self.dialect == "sqlite" and self.has_lagging_replica and refresh_seconds > 0
+
+        @app.before_request
+        def _route_reads():
+            nonlocal refresher_pending
+            if refresher_pending:
+                # started on the first request, once the app has created its schema
+                refresher_pending = False
+                self._start_refresher(app, refresh_seconds)
+            if self.has_lagging_replica:
+                self.pin_to_primary(session.get(self.STICKY_SESSION_KEY, 0) > time.time())
+
+        @app.after_request
+        def _stick_after_write(response):
+            if (self.has_lagging_replica and request.method not in ("GET", "HEAD", "OPTIONS")
+                    and response.status_code < 400):
+                session[self.STICKY_SESSION_KEY] = time.time() + self.sticky_seconds
+            return response
+
+        @app.teardown_request
+        def _release_connection(exc):
+            self.release()
+
+    def _start_refresher(self, app, interval):
+        def run():
+            while True:
+                try:
+                    # several workers share the snapshot: skip if another one just refreshed it
+                    age = time.time() - os.stat(self.replica_path).st_mtime
+                except OSError:
+                    age = interval
+                if age >= interval:
+                    age = 0
+                    try:
+                        self.refresh_replica()
+                    except Exception as e:
+                        app.logger.error(f"Replica refresh failed: {e}")
+                time.sleep(max(interval - age, 1.0))
+
+        threading.Thread(target=run, name="replica-refresh", daemon=True).start()
+
+    # -- schema -------------------------------------------------------------
+
+    dialect = "sqlite"
+
+    def init_schema(self):
+        """Create all tables, then apply column migrations and indexes"""
+        conn = self.connect()
+        try:
+            with conn:
+                for ddl in SCHEMA:
+                    conn.execute(ddl)
+            self.migrate(conn)
+        finally:
+            conn.close()
+
+    def migrate(self, conn=None):
+        """Add columns/indexes missing from databases created by older versions"""
+        own = conn is None
+        conn = conn or self.connect()
+        try:
+            if self.dialect == "sqlite" and not conn.in_transaction:
+                # readers stop blocking writers (and the read-only connections need it)
+                conn.execute("PRAGMA journal_mode = WAL")
+            with conn:
+                tables = self._tables(conn)
+                added = set()
+                archives = self.partitions_by_base(conn) if "archive_partitions" in tables else {}
+                for base, columns in COLUMN_MIGRATIONS.items():
+                    if base not in tables:
+                        continue
+                    # archive tables get the same columns so listings can UNION them
+                    for table in [base] + archives.get(base, []):
+                        existing = self._columns(conn, table)
+                        for name, decl in columns:
+                            if name not in existing:
+                                conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {decl}")
+                                added.add((table, name))
+                backfill_status_codes(conn, [kind for kind, table in QUEUE_TABLES.items()
+                                             if (table, "status_code") in added])
+                for name in DROPPED_INDEXES:
+                    conn.execute(f"DROP INDEX IF EXISTS {name}")
+                for ddl in INDEXES:
+                    table = ddl.split(" ON ")[1].split("(")[0].strip()
+                    if table in tables:
+                        conn.execute(ddl.format(nulls_first=self.NULLS_FIRST))
+                if "orders" in tables and "order_items" in tables:
+                    backfill_order_items(conn)
+                if "categories" in tables and "products" in tables:
+                    for ddl in self.TRIGGERS:
+                        conn.execute(ddl)
+                    if ("categories", "product_count") in added:
+                        self.rebuild_category_counts(conn)
+                if ({"status_counts", "orders", "product_requests"} <= tables
+                        and not conn.execute("SELECT 1 FROM status_counts LIMIT 1").fetchone()):
+                    self.rebuild_status_counts(conn)
+                if ({"sales_daily", "orders_daily", "request_status_daily", "orders", "order_items",
+                     "product_requests"} <= tables
+                        and not conn.execute("SELECT 1 FROM orders_daily LIMIT 1").fetchone()
+                        and not conn.execute("SELECT 1 FROM request_status_daily LIMIT 1").fetchone()):
+                    # first start with rollups: summarize the existing history once
+                    self.rebuild_rollups(conn=conn)
+        finally:
+            if own:
+                conn.close()
+
+    def _tables(self, conn):
+        return {row["name"] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+
+    def _columns(self, conn, table):
+        """Column names of `table` in table order"""
+        return [row["name"] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+    # -- products -----------------------------------------------------------
+
+    def get_product(self, pid):
+        return self.read_connection().execute(SQL_PRODUCT_BY_ID, (pid,)).fetchone()
+
+    def get_product_images(self, pid):
+        return self.read_connection().execute(SQL_PRODUCT_IMAGES, (pid,)).fetchall()
+
+    def list_products(self, limit=None, offset=0):
+        if limit is None:
+            return self.read_connection().execute(SQL_PRODUCT_LIST).fetchall()
+        return self.read_connection().execute(SQL_PRODUCT_PAGE, (limit, offset)).fetchall()
+
+    def search_products(self, search="", category_id=None, sort_by="id", sort_order="DESC"):
+        """Admin product listing; returns (rows, matching product count)"""
+        where, params = [], []
+        if search:
+            where.append("(p.name LIKE ? OR p.desc LIKE ?)")
+            params.extend([f"%{search}%", f"%{search}%"])
+        if category_id:
+            where.append("p.category_id = ?")
+            params.append(category_id)
+        where_sql = f" WHERE {' AND '.join(where)}" if where else ""
+        if sort_by not in PRODUCT_SORT_COLUMNS or sort_order not in SORT_ORDERS:
+            sort_by, sort_order = "id", "DESC"
+
+        with self.read_snapshot() as conn:
+            rows = conn.execute(
+                "SELECT p.*, c.name as category_name FROM products p "
+                "LEFT JOIN categories c ON p.category_id = c.id"
+                f"{where_sql} ORDER BY p.{sort_by} {sort_order}", params
+            ).fetchall()
+            total = conn.execute(f"SELECT COUNT(*) as count FROM products p{where_sql}", params).fetchone()["count"]
+        return rows, total
+
+    def product_bundle(self, pid, max_age=None):
+        """The product page data for `pid` (None if no such product): {"product", "images", "related"}.
+
+        One primary-key read when the stored bundle is fresh; otherwise it is
+        rebuilt (product + category, images, related products) and saved.
+        The read goes to the primary: a lagging replica could still hold a
+        bundle that a catalog edit has just dropped.
+        """
+        max_age = PRODUCT_BUNDLE_TTL_S if max_age is None else max_age
+        row = self.connection().execute(SQL_PRODUCT_BUNDLE, (pid,)).fetchone()
+        if row is not None and time.time() - row["built_at"] < max_age:
+            return json.loads(row["payload"])
+        return self.build_product_bundle(pid)
+
+    def build_product_bundle(self, pid, related=8):
+        conn = self.connection()
+        product = conn.execute(SQL_PRODUCT_WITH_CATEGORY, (pid,)).fetchone()
+        if product is None:
+            return None
+        images = conn.execute(SQL_PRODUCT_IMAGES, (pid,)).fetchall()
+        related_ids = [r["product_id"] for r in conn.execute(SQL_RELATED_BY_ORDERS, (pid, related))]
+        if len(related_ids) < related and product["category_id"] is not None:
+            # too few co-orders yet: fill with the newest products of the same category
+            for r in conn.execute(SQL_RELATED_BY_CATEGORY, (product["category_id"], pid, related)):
+                if len(related_ids) < related and r["id"] not in related_ids:
+                    related_ids.append(r["id"])
+        rows = {r["id"]: r for r in self.get_products(related_ids, conn=conn)}
+        bundle = {
+            "product": dict(product),
+            "images": [dict(image) for image in images],
+            "related": [{column: rows[rid][column] for column in RELATED_COLUMNS}
+                        for rid in related_ids if rid in rows],
+        }
+        with self.transaction() as conn:
+            conn.execute(SQL_SAVE_PRODUCT_BUNDLE, (pid, json.dumps(bundle, default=str),
+                                                   "".join(f",{rid}" for rid in related_ids) + ",", time.time()))
+        return bundle
+
+    def delete_product(self, pid):
+        """Delete a product with its images and requests; orders keep their lines, unlinked.
+        Returns False when there was no such product."""
+        with self.transaction() as conn:
+            requests = conn.execute(SQL_PRODUCT_REQUEST_CODES, (pid,)).fetchall()
+            for sql in SQL_DETACH_PRODUCT:
+                conn.execute(sql, (pid,))
+            conn.execute("DELETE FROM product_requests WHERE product_id = ?", (pid,))
+            conn.executemany(SQL_BUMP_STATUS_COUNT, [("requests", row["status_code"], -row["total"])
+                                                     for row in requests])
+            return conn.execute("DELETE FROM products WHERE id = ?", (pid,)).rowcount > 0
+
+    def image_references(self):
+        """{upload path ("uploads/x.jpg"): {product ids using it}} from products.image and product_images"""
+        references = {}
+        for row in self.connection().execute(SQL_IMAGE_REFERENCES):
+            references.setdefault(row["path"], set()).add(row["product_id"])
+        return references
+
+    def unmeasured_images(self):
+        """Image paths without a recorded width/height"""
+        return [row["path"] for row in self.connection().execute(SQL_UNMEASURED_IMAGES)]
+
+    def set_image_sizes(self, sizes):
+        """Record [(path, width, height, placeholder)] on every product and image row using the path"""
+        rows = [(width, height, placeholder, path) for path, width, height, placeholder in sizes]
+        with self.transaction() as conn:
+            for sql in SQL_MEASURE_IMAGE:
+                conn.executemany(sql, rows)
+
+    def drop_orphan_image_rows(self):
+        """Delete product_images rows of products deleted while foreign keys were off; returns the count"""
+        with self.transaction() as conn:
+            return conn.execute(SQL_DROP_ORPHAN_IMAGE_ROWS).rowcount
+
+    def invalidate_product_bundles(self, pid=None):
+        """Drop the bundle of `pid` and those listing it as related (all bundles when None)"""
+        with self.transaction() as conn:
+            if pid is None:
+                conn.execute("DELETE FROM product_bundles")
+            else:
+                conn.execute(SQL_DROP_PRODUCT_BUNDLES, (pid, f"%,{pid},%"))
+
+    def get_products(self, ids, conn=None):
+        """Products with the given ids in one query (missing ids are simply absent)"""
+        ids = list(ids)
+        if not ids:
+            return []
+        conn = conn or self.read_connection()
+        return conn.execute(SQL_PRODUCTS_BY_IDS.format(", ".join("?" * len(ids))), ids).fetchall()
+
+    def list_categories(self):
+        return self.read_connection().execute(SQL_CATEGORIES).fetchall()
+
+    def facet_rows(self):
+        """(id, price, category_id, created_at, has_image) of every product, newest first"""
+        return self.read_connection().execute(SQL_FACET_ROWS).fetchall()
+
+    def category_nav(self):
+        """Non-empty categories with their product counts, for the storefront menu"""
+        return self.read_connection().execute(SQL_CATEGORY_NAV).fetchall()
+
+    def get_category(self, category_id):
+        return self.read_connection().execute(SQL_CATEGORY_BY_ID, (category_id,)).fetchone()
+
+    def category_products(self, category_id, after=None, limit=24):
+        """One page of a category's products, newest first, after product id `after`"""
+        if after is None:
+            return self.read_connection().execute(SQL_CATEGORY_PRODUCTS, (category_id, limit)).fetchall()
+        return self.read_connection().execute(SQL_CATEGORY_PRODUCTS_AFTER, (category_id, after, limit)).fetchall()
+
+    def rebuild_category_counts(self, conn=None):
+        """Recount categories.product_count (the triggers keep it current after that)"""
+        if conn is not None:
+            conn.execute(SQL_REBUILD_CATEGORY_COUNTS)
+            return
+        with self.transaction() as conn:
+            self._begin_write(conn)
+            conn.execute(SQL_REBUILD_CATEGORY_COUNTS)
+
+    # -- orders ---------------------------------------------------------------
+
+    def create_order(self, product, quantity, first_name, phone, state, **customer):
+        """Single-product order; see place_order()"""
+        return self.place_order([(product, quantity)], first_name, phone, state, **customer)
+
+    def place_order(self, lines, first_name, phone, state, **customer):
+        """Insert an order header and its lines (and optionally product_requests entries) in one transaction.
+
+        `lines` is a list of (product row, quantity); repeated products are
+        merged. Unit prices are copied from the rows, so later price edits
+        don't change what the customer was charged.
+        """
+        with self.transaction() as conn:
+            return self._insert_order(conn, lines, first_name, phone, state, **customer)
+
+    def checkout(self, quantities, first_name, phone, state, **customer):
+        """Order a cart ({product id: quantity}) in one write transaction.
+
+        The products are read back from the primary with one query inside
+        the transaction, so the order is priced at current prices. Returns
+        (order id, missing product ids); nothing is written when any product
+        no longer exists.
+        """
+        with self.transaction() as conn:
+            self._begin_write(conn)
+            products = {row["id"]: row for row in self.get_products(quantities, conn)}
+            missing = [pid for pid in quantities if pid not in products]
+            if missing:
+                return None, missing
+            lines = [(products[pid], quantity) for pid, quantity in quantities.items()]
+            return self._insert_order(conn, lines, first_name, phone, state, **customer), []
+
+    def _begin_write(self, conn):
+        # take the write lock up front so the prices read are the ones committed with the order
+        if not conn.in_transaction:
+            conn.execute("BEGIN IMMEDIATE")
+
+    def _insert_order(self, conn, lines, first_name, phone, state, last_name="", email=None, address="",
+                      notes="", user_id=None, log_request=False):
+        merged = {}
+        for product, quantity in lines:
+            quantity = int(quantity)
+            if quantity < 1:
+                raise ValueError(f"invalid quantity {quantity} for product {product['id']}")
+            if product["id"] in merged:
+                merged[product["id"]][1] += quantity
+            else:
+                merged[product["id"]] = [product, quantity]
+        if not merged:
+            raise ValueError("an order needs at least one product")
+
+        items = [(product["id"], product["name"], float(product["price"]), quantity,
+                  float(product["price"]) * quantity) for product, quantity in merged.values()]
+        total_price = sum(item[4] for item in items)
+        total_quantity = sum(item[3] for item in items)
+        summary = "، ".join(item[1] for item in items)
+        now = utcnow()
+        cursor = conn.execute(SQL_INSERT_ORDER, (
+            items[0][0], user_id, total_quantity, first_name, last_name, phone, state, email,
+            address, notes, total_price, now, summary, len(items)))
+        order_id = cursor.lastrowid
+        conn.executemany(SQL_INSERT_ORDER_ITEM, [(order_id,) + item for item in items])
+        day = now[:10]
+        conn.executemany(SQL_ROLLUP_SALES, [(day, product_id, state or "", 1, quantity, line_total)
+                                            for product_id, _name, _price, quantity, line_total in items])
+        conn.execute(SQL_ROLLUP_ORDERS, (day, state or "", 1, total_quantity, total_price))
+        counts = [("orders", ORDERS.code("pending"), 1)]
+        events = [("orders", order_id, "created", "pending", {
+            "product_name": summary, "quantity": total_quantity, "first_name": first_name,
+            "last_name": last_name, "phone": phone, "state": state, "total_price": total_price})]
+        if log_request:
+            full_name = f"{first_name} {last_name}".strip()
+            ordered = REQUESTS.code("ordered")
+            for product, quantity in merged.values():
+                line_total = float(product["price"]) * quantity
+                # one at a time: the feed needs each request's id
+                request_id = conn.execute(SQL_INSERT_REQUEST, (
+                    product["id"], full_name, email, phone, state, address, quantity, notes, line_total,
+                    "ordered", ordered, now)).lastrowid
+                events.append(("requests", request_id, "created", "ordered", self._request_event(
+                    product, full_name, email, phone, state, address, quantity, notes, line_total, now)))
+            conn.executemany(SQL_ROLLUP_REQUESTS, [(day, item[0], state or "", "ordered", 1) for item in items])
+            counts.append(("requests", ordered, len(items)))
+        conn.executemany(SQL_BUMP_STATUS_COUNT, counts)
+        self._record_events(conn, events)
+        return order_id
+
+    def get_order(self, order_id):
+        """The order, looked up in the archives when it is no longer live"""
+        conn = self.connection()
+        order = conn.execute(SQL_ORDER_BY_ID, (order_id,)).fetchone()
+        if order is None:
+            for table in self.partitions("orders", conn=conn):
+                order = conn.execute(f"SELECT * FROM {table} WHERE id = ?", (order_id,)).fetchone()
+                if order is not None:
+                    break
+        return order
+
+    def get_order_items(self, order_id):
+        conn = self.connection()
+        items = conn.execute(SQL_ORDER_ITEMS, (order_id,)).fetchall()
+        if not items:
+            for table in self.partitions("order_items", conn=conn):
+                items = conn.execute(f"SELECT * FROM {table} WHERE order_id = ? ORDER BY id", (order_id,)).fetchall()
+                if items:
+                    break
+        return items
+
+    def list_orders(self, since=None, until=None):
+        """Live orders, newest first; with a date range (YYYY-MM-DD, inclusive) archived ones too"""
+        if since is None and until is None:
+            return self.read_connection().execute(SQL_ORDER_LIST).fetchall()
+        return self._ranged("orders", SQL_ORDER_RANGE, ORDER_LIST_COLUMNS, since, until, "id DESC").fetchall()
+
+    def export_orders(self, since=None, until=None):
+        if since is None and until is None:
+            return self.read_connection().execute(SQL_ORDER_EXPORT)
+        return self._ranged("orders", SQL_ORDER_RANGE, None, since, until, "id DESC")
+
+    # -- product requests -------------------------------------------------------
+
+    def create_request(self, product, user_name, phone, state, quantity=1, email=None, address=None,
+                       message=None, status="pending"):
+        code = REQUESTS.code(status)
+        total_price = float(product["price"]) * quantity
+        now = utcnow()
+        with self.transaction() as conn:
+            cursor = conn.execute(SQL_INSERT_REQUEST, (
+                product["id"], user_name, email, phone, state, address, quantity, message,
+                total_price, status, code, now))
+            request_id = cursor.lastrowid
+            conn.execute(SQL_ROLLUP_REQUESTS, (now[:10], product["id"], state or "", status, 1))
+            conn.execute(SQL_BUMP_STATUS_COUNT, ("requests", code, 1))
+            self._record_events(conn, [("requests", request_id, "created", status, self._request_event(
+                product, user_name, email, phone, state, address, quantity, message, total_price, now))])
+        return request_id, total_price
+
+    @staticmethod
+    def _request_event(product, user_name, email, phone, state, address, quantity, message, total_price, now):
+        # what a row of /admin/requests shows
+        return {"product_id": product["id"], "product_name": product["name"], "unit_price": float(product["price"]),
+                "product_image": product["image"], "user_name": user_name, "email": email, "phone": phone,
+                "state": state, "address": address, "quantity": quantity, "message": message,
+                "total_price": total_price, "created_at": now}
+
+    def list_requests(self, since=None, until=None):
+        """Live product requests, newest first; with a date range archived ones too"""
+        if since is None and until is None:
+            return self.read_connection().execute(SQL_REQUEST_LIST).fetchall()
+        return self._ranged("product_requests", SQL_REQUEST_RANGE, None, since, until, "created_at DESC",
+                            alias="pr.").fetchall()
+
+    # -- status workflow ------------------------------------------------------
+
+    def update_request_status(self, request_id, status):
+        """Move a request to `status`; returns the number of rows updated (0 when it doesn't exist).
+
+        Raises ValueError for an unknown status and InvalidTransition for a
+        move the workflow doesn't allow.
+        """
+        code = REQUESTS.code(status)
+        with self.transaction() as conn:
+            self._begin_write(conn)
+            old = conn.execute(self._for_update(SQL_REQUEST_FOR_UPDATE), (request_id,)).fetchone()
+            if old is None:
+                return 0
+            old_status = REQUESTS.name(old["status_code"])
+            REQUESTS.check(old_status, status)
+            if old_status == status:
+                return 1
+            updated = conn.execute(SQL_UPDATE_REQUEST_STATUS, (status, code, request_id)).rowcount
+            conn.executemany(SQL_BUMP_STATUS_COUNT, [("requests", old["status_code"], -1), ("requests", code, 1)])
+            if old["created_at"]:
+                day, state = str(old["created_at"])[:10], old["state"] or ""
+                conn.executemany(SQL_ROLLUP_REQUESTS, [(day, old["product_id"], state, old_status, -1),
+                                                       (day, old["product_id"], state, status, 1)])
+            self._record_events(conn, [("requests", request_id, "status", status, {"from": old_status})])
+            return updated
+
+    def update_order_status(self, order_id, status):
+        """Move an order to `status`; returns the number of rows updated (0 when it doesn't exist).
+
+        Cancelling takes the order back out of the sales rollups. Raises
+        ValueError / InvalidTransition like update_request_status().
+        """
+        code = ORDERS.code(status)
+        with self.transaction() as conn:
+            self._begin_write(conn)
+            old = conn.execute(self._for_update(SQL_ORDER_FOR_UPDATE), (order_id,)).fetchone()
+            if old is None:
+                return 0
+            old_status = ORDERS.name(old["status_code"])
+            ORDERS.check(old_status, status)
+            if old_status == status:
+                return 1
+            updated = conn.execute(SQL_UPDATE_ORDER_STATUS, (status, code, order_id)).rowcount
+            conn.executemany(SQL_BUMP_STATUS_COUNT, [("orders", old["status_code"], -1), ("orders", code, 1)])
+            if status == "cancelled" and old["created_at"]:
+                day, state = str(old["created_at"])[:10], old["state"] or ""
+                conn.executemany(SQL_ROLLUP_SALES, [
+                    (day, product_id, state, -1, -quantity, -line_total)
+                    for product_id, quantity, line_total in conn.execute(SQL_ORDER_ITEM_TOTALS, (order_id,))])
+                conn.execute(SQL_ROLLUP_ORDERS, (day, state, -1, -(old["quantity"] or 0),
+                                                 -(old["total_price"] or 0)))
+            self._record_events(conn, [("orders", order_id, "status", status, {"from": old_status})])
+            return updated
+
+    def _for_update(self, sql):
+        # SQLite: _begin_write already holds the database write lock
+        return sql
+
+    def status_counts(self, kind):
+        """{status: number of rows} for "orders" or "requests", every status included"""
+        workflow = WORKFLOWS[kind]
+        counts = dict.fromkeys(workflow.statuses, 0)
+        for code, total in self.read_connection().execute(SQL_STATUS_COUNTS, (kind,)):
+            if 0 <= code < len(workflow.statuses):
+                counts[workflow.name(code)] = total
+        return counts
+
+    def rebuild_status_counts(self, conn=None):
+        """Recount status_counts from the base tables"""
+        def rebuild(conn):
+            conn.execute("DELETE FROM status_counts")
+            for kind, table in QUEUE_TABLES.items():
+                conn.execute(SQL_REBUILD_STATUS_COUNTS.format(kind=kind, table=table))
+
+        if conn is not None:
+            rebuild(conn)
+            return
+        with self.transaction() as conn:
+            self._begin_write(conn)
+            rebuild(conn)
+
+    def queue(self, kind, status, after=None, limit=50):
+        """One page of `kind` rows in `status`, oldest first.
+
+        `after` is (created_at, id) of the last row of the previous page;
+        paging is a range scan on the queue index however deep it goes.
+        """
+        params = [WORKFLOWS[kind].code(status)]
+        after_sql = ""
+        if after is not None:
+            created_at, last_id = after
+            if created_at:
+                after_sql = SQL_QUEUE_AFTER[kind][0]
+                params += [created_at, last_id]
+            else:
+                after_sql = SQL_QUEUE_AFTER[kind][1]
+                params.append(last_id)
+        params.append(limit)
+        return self.read_connection().execute(SQL_QUEUE[kind].format(after=after_sql), params).fetchall()
+
+    # -- archives -------------------------------------------------------------
+
+    def partitions(self, base, since=None, until=None, conn=None):
+        """Archive tables of `base` whose month overlaps since..until (days), newest first"""
+        conn = conn or self.read_connection()
+        bounds = (base, since[:7] if since else "0000-00", until[:7] if until else "9999-99")
+        return [row["table_name"] for row in conn.execute(SQL_PARTITIONS, bounds)]
+
+    def _ranged(self, base, sql, columns, since, until, order_by, alias=""):
+        """`sql` over the live table and the archives overlapping since..until (inclusive days)"""
+        conn = self.read_connection()
+        select = ", ".join(f"{alias}{column} AS {column}" for column in columns or self._columns(conn, base))
+        tables = [base] + self.partitions(base, since, until, conn=conn)
+        query = " UNION ALL ".join(sql.format(columns=select, table=table) for table in tables)
+        bounds = (since or "0001-01-01", _day_after(until) if until else "9999-12-31")
+        return conn.execute(f"{query} ORDER BY {order_by}", bounds * len(tables))
+
+    def _partition(self, conn, base, month):
+        """The archive table of `base` for `month`, created (empty, same columns) on first use"""
+        table = partition_name(base, month)
+        if conn.execute("SELECT 1 FROM archive_partitions WHERE table_name = ?", (table,)).fetchone() is None:
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {table} AS SELECT * FROM {base} WHERE 1 = 0")
+            key = "order_id" if base == "order_items" else "id"
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_{key} ON {table}({key})")
+            conn.execute(SQL_REGISTER_PARTITION, (table, base, month))
+        return table
+
+    def _move_rows(self, conn, base, key, ids, month):
+        """Copy the `base` rows whose `key` is in `ids` into the month's archive, then delete them"""
+        table = self._partition(conn, base, month)
+        archived = self._columns(conn, table)
+        columns = ", ".join(column for column in self._columns(conn, base) if column in archived)
+        marks = ", ".join("?" * len(ids))
+        conn.execute(f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {base} WHERE {key} IN ({marks})", ids)
+        moved = conn.execute(f"DELETE FROM {base} WHERE {key} IN ({marks})", ids).rowcount
+        conn.execute(SQL_PARTITION_ROWS, (moved, table))
+        return moved
+
+    def archive(self, kind, before, statuses, batch_size=500):
+        """Move `kind` rows ("orders" or "requests") in one of `statuses` created
+        before `before` into their month's archive tables; returns {month: rows}.
+
+        Runs in batches of `batch_size` rows, one short write transaction
+        each. Rollups already count the archived rows and keep them; status
+        counters only count live rows.
+        """
+        workflow, base = WORKFLOWS[kind], QUEUE_TABLES[kind]
+        moved = {}
+        for status in statuses:
+            code = workflow.code(status)
+            while True:
+                with self.transaction() as conn:
+                    self._begin_write(conn)
+                    rows = conn.execute(SQL_ARCHIVE_CANDIDATES.format(table=base),
+                                        (code, before, batch_size)).fetchall()
+                    months = {}
+                    for row in rows:
+                        months.setdefault(str(row["created_at"])[:7], []).append(row["id"])
+                    for month, ids in months.items():
+                        for child, key in ARCHIVE_CHILDREN.get(base, ()):
+                            self._move_rows(conn, child, key, ids, month)
+                        moved[month] = moved.get(month, 0) + self._move_rows(conn, base, "id", ids, month)
+                    if rows:
+                        conn.execute(SQL_BUMP_STATUS_COUNT, (kind, code, -len(rows)))
+                if len(rows) < batch_size:
+                    break
+        return moved
+
+    def partitions_by_base(self, conn):
+        archives = {}
+        for row in conn.execute("SELECT table_name, base_table FROM archive_partitions ORDER BY month"):
+            archives.setdefault(row["base_table"], []).append(row["table_name"])
+        return archives
+
+    def archive_summary(self):
+        return self.read_connection().execute(
+            "SELECT * FROM archive_partitions ORDER BY base_table, month").fetchall()
+
+    def compact(self, full=False):
+        """Give the pages freed by archiving back to the filesystem.
+
+        Incremental when the database was set up for it; `full` converts it
+        (one VACUUM, which rewrites the file and blocks writers meanwhile).
+        """
+        conn = self.connect()
+        try:
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+                conn.execute("PRAGMA incremental_vacuum").fetchall()
+            elif full:
+                conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                conn.execute("VACUUM")
+            conn.execute("PRAGMA optimize")
+        finally:
+            conn.close()
+
+    # -- recommendations ------------------------------------------------------
+
+    def _history_tables(self, conn):
+        """[(orders table, order_items table)] and [product_requests tables], live first"""
+        months = conn.execute("SELECT base_table, month FROM archive_partitions ORDER BY month").fetchall()
+        orders = [("orders", "order_items")] + [
+            (partition_name("orders", row["month"]), partition_name("order_items", row["month"]))
+            for row in months if row["base_table"] == "orders"]
+        requests = ["product_requests"] + [partition_name("product_requests", row["month"])
+                                           for row in months if row["base_table"] == "product_requests"]
+        return orders, requests
+
+    def purchase_watermarks(self):
+        """(highest order id, highest product request id) ever written, archives included"""
+        conn = self.read_connection()
+        orders, requests = self._history_tables(conn)
+        highest = [0, 0]
+        for i, tables in enumerate(([table for table, _items in orders], requests)):
+            for table in tables:
+                highest[i] = max(highest[i], conn.execute(f"SELECT MAX(id) FROM {table}").fetchone()[0] or 0)
+        return tuple(highest)
+
+    def new_customers(self, after, upto):
+        """Phones with an order or request between the (order id, request id) watermarks `after` and `upto`"""
+        conn = self.read_connection()
+        orders, requests = self._history_tables(conn)
+        phones = set()
+        for tables, low, high in (([table for table, _items in orders], after[0], upto[0]),
+                                  (requests, after[1], upto[1])):
+            if high > low:
+                for table in tables:
+                    phones.update(row[0] for row in conn.execute(SQL_NEW_CUSTOMERS.format(table=table), (low, high)))
+        return sorted(phones)
+
+    def customer_products(self, upto, phones=None, chunk=500):
+        """Distinct (phone, product id) pairs ordered or requested up to the watermarks `upto`,
+        of every customer or only of `phones`"""
+        conn = self.read_connection()
+        orders, requests = self._history_tables(conn)
+        pairs = set()
+        groups = [None] if phones is None else [phones[i:i + chunk] for i in range(0, len(phones), chunk)]
+        for group in groups:
+            where = f" AND phone IN ({', '.join('?' * len(group))})" if group else ""
+            for table, items in orders:
+                sql = SQL_CUSTOMER_ORDERED.format(orders=table, items=items, phones=where.replace("phone", "o.phone"))
+                pairs.update((row[0], row[1]) for row in conn.execute(sql, [upto[0]] + list(group or ())))
+            for table in requests:
+                sql = SQL_CUSTOMER_REQUESTED.format(requests=table, phones=where)
+                pairs.update((row[0], row[1]) for row in conn.execute(sql, [upto[1]] + list(group or ())))
+        return sorted(pairs)
+
+    # -- analytics ------------------------------------------------------------
+
+    def _day(self, column):
+        """SQL expression for the YYYY-MM-DD day of a timestamp column"""
+        return f"substr({column}, 1, 10)"
+
+    def rebuild_rollups(self, since=None, conn=None):
+        """Recompute the rollup rows for days >= `since` (all days when None) from
+        the base tables and their archives, and the (live) status counters.
+
+        The write paths keep rollups current; this backfills them on upgrade
+        and repairs drift after manual edits or bulk imports.
+        """
+        def rebuild(conn):
+            params = (since,) if since else ()
+            cancelled = ORDERS.code("cancelled")
+            for table in ("sales_daily", "orders_daily", "request_status_daily"):
+                conn.execute(f"DELETE FROM {table}" + (" WHERE day >= ?" if since else ""), params)
+            months = [""] + [table[len("orders"):] for table in self.partitions("orders", since, conn=conn)]
+            for suffix in months:
+                conn.execute(SQL_REBUILD_SALES.format(
+                    orders="orders" + suffix, items="order_items" + suffix, day=self._day("o.created_at"),
+                    cancelled=cancelled, since=" AND o.created_at >= ?" if since else ""), params)
+                conn.execute(SQL_REBUILD_ORDERS.format(
+                    orders="orders" + suffix, day=self._day("created_at"), cancelled=cancelled,
+                    since=" AND created_at >= ?" if since else ""), params)
+            for table in ["product_requests"] + self.partitions("product_requests", since, conn=conn):
+                conn.execute(SQL_REBUILD_REQUESTS.format(
+                    requests=table, day=self._day("created_at"),
+                    since=" AND created_at >= ?" if since else ""), params)
+            self.rebuild_status_counts(conn)
+
+        if conn is not None:
+            rebuild(conn)
+            return
+        with self.transaction() as conn:
+            self._begin_write(conn)
+            rebuild(conn)
+
+    def top_products(self, since, until, limit=10):
+        return self.read_connection().execute(SQL_TOP_PRODUCTS, (since, until, limit)).fetchall()
+
+    def revenue_by_state(self, since, until):
+        return self.read_connection().execute(SQL_REVENUE_BY_STATE, (since, until)).fetchall()
+
+    def sales_by_day(self, since, until):
+        return self.read_connection().execute(SQL_SALES_BY_DAY, (since, until)).fetchall()
+
+    def request_status_totals(self, since, until):
+        return self.read_connection().execute(SQL_REQUEST_STATUS_TOTALS, (since, until)).fetchall()
+
+    # -- jobs -------------------------------------------------------------------
+
+    def enqueue_job(self, kind, payload, priority, run_at, timeout, max_attempts, unique_key=None):
+        """Queue a job (payload: JSON text); returns its id, or None when `unique_key` is already queued"""
+        with self.transaction() as conn:
+            row = conn.execute(SQL_ENQUEUE_JOB, (kind, payload, priority, run_at, timeout, max_attempts,
+                                                 unique_key, time.time())).fetchone()
+        return None if row is None else row["id"]
+
+    def claim_job(self, worker, now=None):
+        """Lease the most urgent due job to `worker`; returns its row, or None when nothing is due.
+        Jobs whose lease ran out are requeued (or failed) first."""
+        now = time.time() if now is None else now
+        with self.transaction() as conn:
+            conn.execute(SQL_EXPIRE_JOBS, (now, now))
+            return conn.execute(SQL_CLAIM_JOB.format(skip_locked=self.SKIP_LOCKED),
+                                (worker, now, now, now)).fetchone()
+
+    def finish_job(self, job_id, worker, now=None):
+        """Mark a claimed job done; False when its lease had already passed to someone else"""
+        with self.transaction() as conn:
+            return conn.execute(SQL_FINISH_JOB, (time.time() if now is None else now, job_id, worker)).rowcount > 0
+
+    def fail_job(self, job_id, worker, error, retry_at=None, now=None):
+        """Record a failed attempt: queued again for `retry_at`, or failed for good when None"""
+        now = time.time() if now is None else now
+        with self.transaction() as conn:
+            if retry_at is None:
+                params = ("failed", None, now, error, job_id, worker)
+            else:
+                params = ("queued", retry_at, None, error, job_id, worker)
+            return conn.execute(SQL_FAIL_JOB, params).rowcount > 0
+
+    def retry_job(self, job_id, now=None):
+        """Queue a failed job again with fresh attempts; False when it isn't failed"""
+        with self.transaction() as conn:
+            return conn.execute(SQL_RETRY_JOB, (time.time() if now is None else now, job_id)).rowcount > 0
+
+    def job_stats(self, since, now=None, failed=20):
+        """{"depth": per kind/status counts, "latency": of jobs done since `since`, "failed": latest failures}"""
+        conn = self.connection()
+        return {
+            "depth": conn.execute(SQL_JOB_DEPTH, (time.time() if now is None else now,)).fetchall(),
+            "latency": conn.execute(SQL_JOB_LATENCY, (since,)).fetchall(),
+            "failed": conn.execute(SQL_FAILED_JOBS, (failed,)).fetchall(),
+        }
+
+    def prune_jobs(self, before):
+        """Delete jobs that finished (done or failed) before `before`; returns the count"""
+        with self.transaction() as conn:
+            return conn.execute(SQL_PRUNE_JOBS, (before,)).rowcount
+
+    # -- admin feed -------------------------------------------------------------
+
+    def _record_events(self, conn, events):
+        """Append (kind, item id, action, status, payload) rows to the admin feed, last in the write
+        transaction. Readers follow the feed by id, so ids must become visible in order."""
+        self._lock_events(conn)
+        now = time.time()
+        conn.executemany(SQL_RECORD_EVENT, [
+            (kind, item_id, action, status, json.dumps(payload), now)
+            for kind, item_id, action, status, payload in events])
+        written = getattr(self, "_events_written", 0) + len(events)
+        if written >= ADMIN_EVENTS_PRUNE_EVERY:
+            conn.execute(SQL_PRUNE_EVENTS, (now - ADMIN_EVENTS_KEEP_S,))  # on created_at's index
+            written = 0
+        self._events_written = written
+
+    def _lock_events(self, conn):
+        # SQLite serializes writers, so events commit in id order
+        pass
+
+    def admin_events(self, after, limit=500):
+        """Feed events with id > `after`, oldest first (from the primary: the feed must not lag)"""
+        return self.connection().execute(SQL_EVENTS_AFTER, (after, limit)).fetchall()
+
+    def latest_admin_event(self, primary=False):
+        """Id of the newest event, by default read where the admin pages read their lists: a page
+        resumes the feed from here, so nothing between its snapshot and its stream is lost"""
+        conn = self.connection() if primary else self.read_connection()
+        return conn.execute(SQL_LATEST_EVENT).fetchone()[0]
+
+    def prune_admin_events(self, before):
+        """Delete feed events older than `before` (a unix time); returns the count"""
+        with self.transaction() as conn:
+            return conn.execute(SQL_PRUNE_EVENTS, (before,)).rowcount
+
+
+class PostgresRepository(Repository):
+    """Same queries against PostgreSQL, one pooled connection per request.
+
+    With `replica_dsn`, read-only queries check out a connection from a
+    second pool on the replica (sessions are read-only there too).
+    """
+
+    dialect = "postgresql"
+    # serializes schema setup when several workers boot at once
+    SCHEMA_LOCK_ID = 720311
+    # makes admin_events ids commit in order (see _lock_events)
+    EVENTS_LOCK_ID = 720312
+    NULLS_FIRST = " NULLS FIRST"
+    TRIGGERS = POSTGRES_TRIGGERS
+    # concurrent claims pass over the job another worker is taking
+    SKIP_LOCKED = " FOR UPDATE SKIP LOCKED"
+
+    def __init__(self, dsn, replica_dsn=None, sticky_seconds=5.0, **pool_options):
+        from pg_backend import ConnectionPool  # psycopg2 is only needed for PostgreSQL
+        self.dsn = dsn
+        self.replica_dsn = replica_dsn
+        self.sticky_seconds = sticky_seconds
+        self.pool = ConnectionPool(dsn, **pool_options)
+        self.replica_pool = ConnectionPool(replica_dsn, read_only=True, **pool_options) if replica_dsn else None
+        self._local = threading.local()
+
+    @property
+    def has_lagging_replica(self):
+        return self.replica_pool is not None and self.replica_dsn != self.dsn
+
+    def connect(self):
+        return self.pool.connect()
+
+    def connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self.pool.getconn()
+        return conn
+
+    def read_connection(self):
+        if self.replica_pool is None or getattr(self._local, "primary_reads", False):
+            return self.connection()
+        conn = getattr(self._local, "read_conn", None)
+        if conn is None:
+            conn = self._local.read_conn = self.replica_pool.getconn()
+        return conn
+
+    def _begin_snapshot(self, conn):
+        # psycopg2 opens the transaction implicitly; this must be its first statement
+        conn.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+
+    def _begin_write(self, conn):
+        # the transaction opens implicitly; the order is priced from what the cart query sees
+        pass
+
+    def _day(self, column):
+        return f"to_char({column}, 'YYYY-MM-DD')"
+
+    def _for_update(self, sql):
+        # lock the row so concurrent status changes apply one after the other
+        return sql + " FOR UPDATE"
+
+    def _lock_events(self, conn):
+        # a SERIAL id is taken at insert but seen at commit: without the lock a reader
+        # could move past id 8 while id 7's transaction is still open, and never see 7
+        conn.execute("SELECT pg_advisory_xact_lock(?)", (self.EVENTS_LOCK_ID,))
+
+    def release(self):
+        """Return the request's connections to their pools"""
+        for name, pool in (("conn", self.pool), ("read_conn", self.replica_pool)):
+            conn = getattr(self._local, name, None)
+            if conn is not None:
+                setattr(self._local, name, None)
+                pool.putconn(conn)
+        self._local.primary_reads = False
+
+    def close(self):
+        self.release()
+
+    def init_schema(self):
+        conn = self.connect()
+        try:
+            with conn:
+                conn.execute("SELECT pg_advisory_xact_lock(?)", (self.SCHEMA_LOCK_ID,))
+                for ddl in POSTGRES_SCHEMA:
+                    conn.execute(ddl)
+                self.migrate(conn)
+        finally:
+            conn.close()
+
+    def _tables(self, conn):
+        return {row["table_name"] for row in conn.execute(
+            "SELECT table_name FROM information_schema.tables WHERE table_schema = current_schema()")}
+
+    def _columns(self, conn, table):
+        return [row["column_name"] for row in conn.execute(
+            "SELECT column_name FROM information_schema.columns "
+            "WHERE table_schema = current_schema() AND table_name = ? ORDER BY ordinal_position", (table,))]
+
+    def compact(self, full=False):
+        """VACUUM (ANALYZE) the live tables archiving deletes from (`full` is SQLite-only)"""
+        conn = self.connect()
+        try:
+            conn.raw.autocommit = True
+            for table in ("orders", "order_items", "product_requests"):
+                conn.execute(f"VACUUM (ANALYZE) {table}")
+        finally:
+            conn.close()
+
+
+def is_postgres_url(url):
+    return bool(url) and url.split(":", 1)[0].split("+", 1)[0] in ("postgres", "postgresql")
+
+
+def normalize_database_url(url):
+    """SQLAlchemy URL for DATABASE_URL: accepts the postgres:// scheme many hosts
+    hand out and pins the psycopg2 driver used by the raw repository"""
+    if url and url.split("://", 1)[0] in ("postgres", "postgresql"):
+        return "postgresql+psycopg2://" + url.split("://", 1)[1]
+    return url
+
+
+def _sqlite_path(target):
+    return target[len("sqlite:///"):] if target.startswith("sqlite:///") else target
+
+
+def open_repository(target, replica=None, sticky_seconds=None):
+    """Repository for a PostgreSQL URL, a sqlite:/// URL or a plain SQLite path.
+
+    `replica` is the read replica in the same form (a replica DSN, or the
+    path of a SQLite snapshot); stickiness after writes lasts `sticky_seconds`
+    (REPLICA_STICKY_S, default 5).
+    """
+    if sticky_seconds is None:
+        sticky_seconds = float(os.getenv("REPLICA_STICKY_S", "5"))
+    if is_postgres_url(target):
+        replica_dsn = "postgresql://" + replica.split("://", 1)[1] if replica else None
+        return PostgresRepository("postgresql://" + target.split("://", 1)[1], replica_dsn=replica_dsn,
+                                  sticky_seconds=sticky_seconds)
+    return Repository(_sqlite_path(target), replica_path=_sqlite_path(replica) if replica else None,
+                      sticky_seconds=sticky_seconds)
+
+
+def engine_options(url):
+    """SQLALCHEMY_ENGINE_OPTIONS matching the raw pool: bounded, pre-pinged, statement timeout"""
+    if not is_postgres_url(url):
+        return {}
+    from pg_backend import connect_args
+    return {
+        "pool_pre_ping": True,
+        "pool_size": int(os.getenv("DB_POOL_MAX", "5")),
+        "max_overflow": 0,
+        "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT_S", "10")),
+        "connect_args": connect_args(),
+    }
+
+
+def repository_for_engine(engine, replica=None):
+    """Repository over the database behind a Flask-SQLAlchemy engine"""
+    if engine.dialect.name == "postgresql":
+        return open_repository(engine.url.set(drivername="postgresql").render_as_string(hide_password=False),
+                               replica)
+    if engine.dialect.name != "sqlite":
+        raise ValueError(f"Unsupported database backend: {engine.dialect.name}")
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "connect")
+    def _foreign_keys(dbapi_connection, _record):
+        dbapi_connection.execute("PRAGMA foreign_keys = ON")
+
+    return open_repository(engine.url.database, replica)
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Admin Live Feed Test Script
+Checks that order/request writes and status changes append feed events in
+their transaction, that the in-process feed hands new events to waiting
+streams (and sends streams that fell behind its buffer to the database),
+the per-process stream cap, and the /admin/events stream and its JSON
+fallback, including resuming from Last-Event-ID.
+"""
+
+import os
+import json
+import time
+import tempfile
+
+import admin_feed
+import repository
+from admin_feed import EventFeed, init_admin_feed
+from repository import Repository
+from testing import admin_app
+from workflow import InvalidTransition
+
+
+def _app(repo, feed):
+    app = admin_app(repo)
+    init_admin_feed(app, repo, feed=feed)
+    return app
+
+
+def _events(body):
+    """(id, event) pairs of a text/event-stream body"""
+    events = []
+    for block in body.split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines() if not line.startswith(":"))
+        if "data" in fields:
+            events.append((int(fields["id"]), json.loads(fields["data"])))
+    return events
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_admin_feed():
+    """Test the admin event feed, its stream and its JSON fallback"""
+
+    print("=== Admin Live Feed Test ===")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        repo = Repository(os.path.join(tmp, "test.db"))
+        repo.init_schema()
+        with repo.transaction() as conn:
+            conn.execute("INSERT INTO products (name, price, image) VALUES ('هاتف', 100, 'uploads/a.jpg')")
+            conn.execute("INSERT INTO products (name, price) VALUES ('ساعة', 50)")
+        phone, watch = repo.get_product(1), repo.get_product(2)
+        assert repo.latest_admin_event() == 0
+
+        order_id = repo.place_order([(phone, 1), (watch, 2)], "علي", "0550", "الجزائر", log_request=True)
+        request_id, _ = repo.create_request(watch, "سارة", "0660", "وهران", email="s@example.com")
+        assert repo.update_request_status(request_id, "approved") == 1
+        assert repo.update_request_status(request_id, "approved") == 1  # no change, no event
+        assert repo.update_order_status(order_id, "shipped") == 1
+        try:
+            repo.update_order_status(order_id, "pending")
+            raise AssertionError("shipped orders can't go back to pending")
+        except InvalidTransition:
+            pass
+        events = [admin_feed.event(row) for row in repo.admin_events(0)]
+        assert [(e["kind"], e["action"], e["status"]) for e in events] == [
+            ("orders", "created", "pending"), ("requests", "created", "ordered"),
+            ("requests", "created", "ordered"), ("requests", "created", "pending"),
+            ("requests", "status", "approved"), ("orders", "status", "shipped")]
+        order = events[0]
+        assert order["item_id"] == order_id and order["data"]["total_price"] == 200
+        assert order["data"]["product_name"] == "هاتف، ساعة" and order["data"]["quantity"] == 3
+        logged = {e["item_id"] for e in events[1:3]}
+        assert logged == {row["id"] for row in repo.list_requests() if row["status"] == "ordered"}
+        created = events[3]["data"]
+        assert (created["user_name"], created["product_name"], created["unit_price"]) == ("سارة", "ساعة", 50)
+        assert events[4]["data"] == {"from": "pending"} and events[5]["data"] == {"from": "pending"}
+        assert repo.latest_admin_event() == 6
+        assert [row["id"] for row in repo.admin_events(2, limit=2)] == [3, 4]
+        print("✓ Orders, requests and status changes are recorded in their transaction")
+
+        feed = EventFeed(repo, poll=0.02, size=3, max_streams=2)
+        assert feed.subscribe()
+        _wait_for(lambda: feed.cursor == 6)
+        assert feed.wait(6, 0.05) == []
+        repo.create_request(phone, "كريم", "0770", "سطيف")
+        assert [e["id"] for e in feed.wait(6, 2)] == [7]
+        for _ in range(4):
+            repo.create_request(phone, "كريم", "0770", "سطيف")
+        _wait_for(lambda: feed.cursor == 11)
+        assert [e["id"] for e in feed.events] == [9, 10, 11] and feed.floor == 8
+        assert [e["id"] for e in feed.wait(7, 0)] == [8, 9, 10, 11]  # behind the buffer: from the database
+        assert [e["id"] for e in feed.wait(9, 0)] == [10, 11]
+        assert feed.subscribe() and not feed.subscribe()
+        feed.unsubscribe()
+        feed.unsubscribe()
+        _wait_for(lambda: not feed.running)
+        print("✓ The feed hands new events to streams; late ones catch up from the database")
+
+        stream_s, heartbeat_s = admin_feed.STREAM_S, admin_feed.HEARTBEAT_S
+        admin_feed.STREAM_S, admin_feed.HEARTBEAT_S = 0.5, 0.1
+        try:
+            feed = EventFeed(repo, poll=0.02, max_streams=1)
+            client = _app(repo, feed).test_client()
+            assert client.get("/admin/events").status_code == 401
+            assert client.get("/api/admin/events?after=0").status_code == 401
+            client.get("/test-login")
+
+            response = client.get("/admin/events?after=9")
+            assert response.mimetype == "text/event-stream"
+            body = response.get_data(as_text=True)
+            assert body.startswith("retry: ") and ": ping" in body
+            assert [event_id for event_id, _ in _events(body)] == [10, 11]
+            response.close()
+            assert feed.streams == 0  # closed streams are counted out
+
+            response = client.get("/admin/events", headers={"Last-Event-ID": "10"}, buffered=False)
+            assert feed.streams == 1
+            assert client.get("/admin/events?after=0").status_code == 503  # one stream per process here
+            assert [event_id for event_id, _ in _events(response.get_data(as_text=True))] == [11]
+            response.close()
+            assert feed.streams == 0
+
+            response = client.get("/admin/events", buffered=False)  # from the newest event on
+            chunks = iter(response.response)
+            assert next(chunks).startswith(b"retry: ")
+            repo.update_order_status(order_id, "delivered")
+            body = b"".join(chunks).decode()
+            response.close()
+            [(event_id, event)] = _events(body)
+            assert event_id == 12 and (event["kind"], event["status"]) == ("orders", "delivered")
+            print("✓ /admin/events streams new events and resumes from Last-Event-ID")
+        finally:
+            admin_feed.STREAM_S, admin_feed.HEARTBEAT_S = stream_s, heartbeat_s
+
+        data = client.get("/api/admin/events").get_json()
+        assert data == {"success": True, "events": [], "cursor": 12}
+        data = client.get("/api/admin/events?after=4&limit=2").get_json()
+        assert [e["id"] for e in data["events"]] == [5, 6] and data["cursor"] == 6
+        assert client.get("/api/admin/events?after=12").get_json()["cursor"] == 12
+        print("✓ /api/admin/events serves pages that poll instead")
+
+        assert repo.prune_admin_events(time.time() + 1) == 12
+        assert repo.latest_admin_event() == 0
+
+        prune_every = repository.ADMIN_EVENTS_PRUNE_EVERY
+        repository.ADMIN_EVENTS_PRUNE_EVERY = 3
+        try:
+            repo._events_written = 0
+            repo.create_request(phone, "كريم", "0770", "سطيف")
+            repo.create_request(phone, "كريم", "0770", "سطيف")
+            with repo.transaction() as conn:
+                conn.execute("UPDATE admin_events SET created_at = ?", (time.time() - repository.ADMIN_EVENTS_KEEP_S - 1,))
+            repo.create_request(phone, "كريم", "0770", "سطيف")  # the third write drops the two old ones
+            assert [row["id"] for row in repo.admin_events(0)] == [15]
+        finally:
+            repository.ADMIN_EVENTS_PRUNE_EVERY = prune_every
+        repo.close()
+        print("✓ Old events are pruned, by the job and every few writes")
+
+    print("\n🎉 Admin live feed tests passed!")
+
+
+if __name__ == "__main__":
+    test_admin_feed()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Analytics Test Script
+Places orders and product requests through the repository and checks that
+the incrementally maintained rollups match a full rebuild, that status
+changes move requests between counts, and that the dashboard and JSON API
+report them.
+"""
+
+import os
+import tempfile
+
+from analytics import init_analytics, date_range
+from repository import Repository
+from testing import admin_app
+
+
+def _app(repo):
+    app = admin_app(repo)
+    init_analytics(app, repo)
+    return app
+
+
+def _rollups(conn):
+    return (conn.execute("SELECT * FROM sales_daily ORDER BY 1, 2, 3").fetchall()
+            + conn.execute("SELECT * FROM orders_daily ORDER BY 1, 2").fetchall(),
+            conn.execute("SELECT * FROM request_status_daily WHERE request_count != 0 "
+                         "ORDER BY 1, 2, 3, 4").fetchall())
+
+
+def test_analytics():
+    """Test rollup maintenance and the analytics reports"""
+
+    print("=== Analytics Test ===")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        repo = Repository(os.path.join(tmp, "test.db"))
+        repo.init_schema()
+        with repo.transaction() as conn:
+            conn.execute("INSERT INTO products (name, price) VALUES ('هاتف', 100)")
+            conn.execute("INSERT INTO products (name, price) VALUES ('ساعة', 50)")
+        phone, watch = repo.get_product(1), repo.get_product(2)
+
+        repo.create_order(phone, 2, "أحمد", "0550000000", "الجزائر")
+        repo.create_order(phone, 1, "سارة", "0660000000", "وهران", log_request=True)
+        repo.place_order([(phone, 1), (watch, 3)], "علي", "0770000000", "الجزائر")
+        request_id, _ = repo.create_request(watch, "كريم", "0550000001", "سطيف")
+        repo.create_request(watch, "ليلى", "0550000002", "سطيف")
+        assert repo.update_request_status(request_id, "completed") == 1
+        assert repo.update_request_status(999, "completed") == 0
+
+        conn = repo.connection()
+        incremental = _rollups(conn)
+        repo.rebuild_rollups()
+        assert [tuple(r) for r in _rollups(conn)[0]] == [tuple(r) for r in incremental[0]]
+        assert [tuple(r) for r in _rollups(conn)[1]] == [tuple(r) for r in incremental[1]]
+        print("✓ Incremental rollups match a full rebuild")
+
+        since, until = date_range(7)
+        top = repo.top_products(since, until)
+        assert [(r["name"], r["order_count"], r["units"], r["revenue"]) for r in top] == \
+            [("هاتف", 3, 4, 400.0), ("ساعة", 1, 3, 150.0)]
+        states = {r["state"]: r["revenue"] for r in repo.revenue_by_state(since, until)}
+        assert states == {"الجزائر": 450.0, "وهران": 100.0}
+        statuses = {r["status"]: r["request_count"] for r in repo.request_status_totals(since, until)}
+        assert statuses == {"ordered": 1, "pending": 1, "completed": 1}
+        print("✓ Reports read from the rollups")
+
+        client = _app(repo).test_client()
+        assert client.get("/api/analytics/by_day").status_code == 401
+        client.get("/test-login")
+        data = client.get("/api/analytics/by_day?days=30").get_json()
+        assert data["rows"][-1]["order_count"] == 3 and data["rows"][-1]["revenue"] == 550.0
+        assert client.get("/api/analytics/nope").status_code == 404
+        page = client.get("/admin/analytics").data.decode()
+        assert "هاتف" in page and "550.00" in page
+        assert client.post("/admin/analytics/rebuild").status_code == 302
+        repo.close()
+        print("✓ Dashboard and JSON API")
+
+
+if __name__ == "__main__":
+    test_analytics()
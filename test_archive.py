@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Archive Test Script
+Checks that archive.py moves only old finished orders (with their lines) and
+product requests into monthly tables, that live listings ignore them while
+a date range brings them back, that archived orders are still found by id,
+and that rollups and status counters come out the same after a rebuild.
+"""
+
+import os
+import tempfile
+from datetime import datetime
+
+from archive import archive_all, cutoff
+from repository import Repository, partition_name
+
+
+def _backdate(repo, table, row_id, created_at):
+    with repo.transaction() as conn:
+        conn.execute(f"UPDATE {table} SET created_at = ? WHERE id = ?", (created_at, row_id))
+
+
+def test_archive():
+    """Test archiving old orders and product requests"""
+
+    print("=== Archive Test ===")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        repo = Repository(os.path.join(tmp, "test.db"))
+        repo.init_schema()
+        with repo.transaction() as conn:
+            conn.execute("INSERT INTO products (name, price) VALUES ('هاتف', 100)")
+            conn.execute("INSERT INTO products (name, price) VALUES ('حاسوب', 500)")
+        phone, laptop = repo.get_product(1), repo.get_product(2)
+
+        old_delivered = repo.place_order([(phone, 1), (laptop, 1)], "قديم", "0555", "الجزائر")
+        old_cancelled = repo.create_order(phone, 2, "ملغي", "0555", "وهران")
+        old_pending = repo.create_order(phone, 1, "معلق", "0555", "عنابة")
+        recent = repo.create_order(laptop, 1, "حديث", "0555", "الجزائر")
+        for order_id, status in ((old_delivered, "shipped"), (old_delivered, "delivered"),
+                                 (old_cancelled, "cancelled"), (recent, "cancelled")):
+            repo.update_order_status(order_id, status)
+        for order_id, created_at in ((old_delivered, "2024-01-15 10:00:00"), (old_cancelled, "2024-02-03 09:00:00"),
+                                     (old_pending, "2024-01-20 12:00:00")):
+            _backdate(repo, "orders", order_id, created_at)
+        old_request, _ = repo.create_request(phone, "سارة", "0666", "وهران")
+        repo.update_request_status(old_request, "completed")
+        _backdate(repo, "product_requests", old_request, "2024-01-10 08:00:00")
+        repo.create_request(laptop, "علي", "0777", "سطيف")
+        repo.rebuild_rollups()
+        rollups_before = [dict(r) for r in repo.sales_by_day("2024-01-01", "2024-12-31")]
+        assert cutoff(30, now=datetime(2024, 3, 1)) == "2024-01-31"
+
+        moved = archive_all(repo, days=180, batch_size=1)
+        assert moved == {"orders": {"2024-01": 1, "2024-02": 1}, "requests": {"2024-01": 1}}, moved
+        print("✓ Only old orders/requests in a final status are archived")
+
+        live = [o["id"] for o in repo.list_orders()]
+        assert live == [recent, old_pending]
+        assert [r["user_name"] for r in repo.list_requests()] == ["علي"]
+        conn = repo.connection()
+        assert conn.execute("SELECT COUNT(*) FROM order_items WHERE order_id = ?", (old_delivered,)).fetchone()[0] == 0
+        assert conn.execute(f"SELECT COUNT(*) FROM {partition_name('order_items', '2024-01')}").fetchone()[0] == 2
+        summary = {row["table_name"]: row["row_count"] for row in repo.archive_summary()}
+        assert summary == {"order_items_2024_01": 2, "order_items_2024_02": 1, "orders_2024_01": 1,
+                           "orders_2024_02": 1, "product_requests_2024_01": 1}, summary
+        print("✓ Live listings skip the archives; orders move with their lines")
+
+        january = [o["id"] for o in repo.list_orders("2024-01-01", "2024-01-31")]
+        assert january == [old_pending, old_delivered]
+        assert [o["id"] for o in repo.list_orders("2024-02-03", "2024-02-03")] == [old_cancelled]
+        assert [o["id"] for o in repo.export_orders("2024-01-01", None)] == [recent, old_pending, old_cancelled,
+                                                                            old_delivered]
+        assert [r["user_name"] for r in repo.list_requests("2024-01-01", "2024-01-31")] == ["سارة"]
+        assert repo.get_order(old_delivered)["status"] == "delivered"
+        assert [i["product_name"] for i in repo.get_order_items(old_delivered)] == ["هاتف", "حاسوب"]
+        assert repo.get_order(9999) is None
+        print("✓ Date ranges and lookups by id reach the archives")
+
+        assert repo.status_counts("orders")["delivered"] == 0 and repo.status_counts("orders")["cancelled"] == 1
+        counts = repo.status_counts("orders")
+        repo.rebuild_status_counts()
+        assert repo.status_counts("orders") == counts
+        repo.rebuild_rollups()
+        assert [dict(r) for r in repo.sales_by_day("2024-01-01", "2024-12-31")] == rollups_before
+        print("✓ Counters and rollups agree with a rebuild")
+
+        # new columns reach the archive tables, and a second run finds nothing left
+        repo.init_schema()
+        assert archive_all(repo, days=180, vacuum=True) == {"orders": {}, "requests": {}}
+        repo.close()
+        conn = repo.connect()
+        assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+        conn.close()
+        print("✓ Re-running is a no-op; --vacuum switches to incremental auto-vacuum")
+
+    print("\n🎉 Archive tests passed!")
+
+
+if __name__ == "__main__":
+    test_archive()
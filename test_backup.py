@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Backup Test Script
+Takes online snapshots while another thread keeps inserting orders, then
+checks retention, change detection, verification and restore.
+"""
+
+import os
+import gzip
+import sqlite3
+import tempfile
+import threading
+
+from repository import Repository
+from backup import BackupError, create_backup, list_backups, verify_backup, restore_backup
+
+
+def _quiet(*args, **kwargs):
+    pass
+
+
+def test_backup_and_restore():
+    """Test online backup, verification and restore"""
+
+    print("=== Backup Test ===")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "database.db")
+        backup_dir = os.path.join(tmp, "backups")
+        repo = Repository(db_path)
+        repo.init_schema()
+        with repo.connection() as conn:
+            conn.execute("INSERT INTO products (name, price) VALUES ('هاتف', 100)")
+            conn.executemany("INSERT INTO orders (product_id, quantity, first_name, total_price) "
+                             "VALUES (1, 1, ?, 100)", [(f"زبون {i}",) for i in range(2000)])
+
+        stop = threading.Event()
+
+        def writer():
+            conn = sqlite3.connect(db_path, timeout=10)
+            while not stop.is_set():
+                with conn:
+                    conn.execute("INSERT INTO orders (product_id, quantity, first_name, total_price) "
+                                 "VALUES (1, 1, 'كاتب', 100)")
+            conn.close()
+
+        thread = threading.Thread(target=writer)
+        thread.start()
+        try:
+            first = create_backup(db_path, backup_dir, keep=2, pages=4, log=_quiet)
+        finally:
+            stop.set()
+            thread.join()
+        assert verify_backup(first)
+        print("✓ Snapshot taken while writing")
+
+        # nothing changed -> no new snapshot
+        second = create_backup(db_path, backup_dir, keep=2, log=_quiet)
+        assert second != first
+        assert create_backup(db_path, backup_dir, keep=2, log=_quiet) == second
+        assert len(list_backups(backup_dir)) == 2
+        print("✓ Unchanged database not snapshotted again")
+
+        with repo.connection() as conn:
+            conn.execute("DELETE FROM orders")
+        restore_backup(second, db_path, backup_dir=backup_dir, log=_quiet)
+        count = repo.connection().execute("SELECT COUNT(*) FROM orders").fetchone()[0]
+        assert count >= 2000
+        assert any("pre-restore" in p for p in list_backups(backup_dir))
+        print("✓ Restored into the live database")
+
+        # a corrupted snapshot is refused
+        with gzip.open(second, "wb") as f:
+            f.write(b"not a database")
+        try:
+            verify_backup(second)
+            raise AssertionError("corrupted backup should fail verification")
+        except BackupError:
+            pass
+        repo.close()
+        print("✓ Corruption detected")
+
+
+if __name__ == "__main__":
+    test_backup_and_restore()
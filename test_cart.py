@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Cart Test Script
+Adds several products to the session cart and checks that checkout writes a
+single order with all its lines, and that a product deleted in the meantime
+blocks the order instead of being silently dropped.
+"""
+
+import os
+import tempfile
+
+from cart import init_cart
+from repository import Repository
+from testing import admin_app
+
+
+def _app(repo):
+    app = admin_app(repo)
+    init_cart(app, repo)
+    # storefront endpoints the cart templates also link to
+    app.add_url_rule("/product/<int:pid>", "product", lambda pid: "product")
+    app.add_url_rule("/order/confirmation/<int:order_id>", "order_confirmation", lambda order_id: "ok")
+    return app
+
+
+def test_cart_checkout():
+    """Test the cart and single-transaction checkout"""
+
+    print("=== Cart Test ===")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        repo = Repository(os.path.join(tmp, "test.db"))
+        repo.init_schema()
+        with repo.transaction() as conn:
+            conn.execute("INSERT INTO products (name, price) VALUES ('هاتف', 100)")
+            conn.execute("INSERT INTO products (name, price) VALUES ('ساعة', 50)")
+            conn.execute("INSERT INTO products (name, price) VALUES ('سماعة', 20)")
+        client = _app(repo).test_client()
+
+        client.post("/cart/add/1", data={"quantity": 2})
+        client.post("/cart/add/2")
+        response = client.post("/cart/add/2", headers={"Accept": "application/json"})
+        assert response.get_json() == {"success": True, "count": 4}
+        assert client.post("/cart/add/999", headers={"Accept": "application/json"}).status_code == 400
+        page = client.get("/cart").data.decode()
+        assert "هاتف" in page and "300.00" in page
+        print("✓ Products added to the cart")
+
+        client.post("/cart/add/3")
+        client.post("/cart/update", data={"qty_3": 0})
+        page = client.get("/checkout").data.decode()
+        assert "سماعة" not in page and "300.00" in page
+        assert client.post("/checkout", data={"first_name": "أحمد"}).status_code == 200  # missing fields
+
+        response = client.post("/checkout", data={"first_name": "أحمد", "phone": "0555", "state": "الجزائر"})
+        assert response.status_code == 302 and response.location.endswith("/order/confirmation/1")
+        order = repo.get_order(1)
+        assert order["total_price"] == 300 and order["item_count"] == 2
+        assert [(i["product_name"], i["quantity"]) for i in repo.get_order_items(1)] == [("هاتف", 2), ("ساعة", 2)]
+        assert len(repo.list_requests()) == 2
+        assert client.get("/checkout").status_code == 302  # cart emptied
+        print("✓ Checkout wrote one order with two lines")
+
+        client.post("/cart/add/1")
+        client.post("/cart/add/2")
+        assert repo.delete_product(2)
+        response = client.post("/checkout", data={"first_name": "سارة", "phone": "0666", "state": "وهران"})
+        assert response.location.endswith("/cart")
+        assert len(repo.list_orders()) == 1
+        with client.session_transaction() as session:
+            assert session["cart"] == {"1": 1}
+        print("✓ Deleted product blocks checkout")
+        repo.close()
+
+
+if __name__ == "__main__":
+    test_cart_checkout()
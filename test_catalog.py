@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Category Browsing Test Script
+Checks that categories.product_count follows product inserts, deletes and
+moves (through triggers, whatever code path writes), that category pages
+page by product id without gaps or repeats, and that the cached category
+menu is shared until invalidated.
+"""
+
+import os
+import tempfile
+
+from flask import Flask
+
+from catalog import init_catalog
+from repository import Repository
+from vendor_assets import register_vendor_assets
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _app(repo):
+    app = Flask(__name__, template_folder=os.path.join(BASE_DIR, "templates"))
+    app.secret_key = "test"
+    register_vendor_assets(app)
+    repo.init_app(app)
+    nav = init_catalog(app, repo, ttl=3600)
+    # endpoints the storefront templates link to
+    for rule, endpoint in (("/", "index"), ("/admin", "admin"), ("/login", "login"), ("/logout", "logout"),
+                           ("/product/<int:pid>", "product")):
+        app.add_url_rule(rule, endpoint, lambda **kwargs: "ok")
+    return app, nav
+
+
+def _counts(repo):
+    return {row["name"]: row["product_count"] for row in repo.list_categories()}
+
+
+def test_catalog():
+    """Test category counts, keyset pages and the cached menu"""
+
+    print("=== Category Browsing Test ===")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        repo = Repository(os.path.join(tmp, "test.db"))
+        repo.init_schema()
+        with repo.transaction() as conn:
+            conn.executemany("INSERT INTO categories (name) VALUES (?)", [("هواتف",), ("حواسيب",), ("فارغة",)])
+            conn.executemany("INSERT INTO products (name, price, category_id) VALUES (?, ?, ?)",
+                             [(f"هاتف {i}", 100 + i, 1) for i in range(50)] + [("حاسوب", 900, 2), ("بدون فئة", 5, None)])
+        assert _counts(repo) == {"هواتف": 50, "حواسيب": 1, "فارغة": 0}
+        with repo.transaction() as conn:
+            conn.execute("UPDATE products SET category_id = 2 WHERE id IN (1, 2)")
+            conn.execute("UPDATE products SET price = 1 WHERE id = 3")  # not a move
+            conn.execute("UPDATE products SET category_id = 3 WHERE category_id IS NULL")
+            conn.execute("DELETE FROM products WHERE id = 4")
+        assert _counts(repo) == {"هواتف": 47, "حواسيب": 3, "فارغة": 1}
+        stored = _counts(repo)
+        repo.rebuild_category_counts()
+        assert _counts(repo) == stored
+        print("✓ Product counts follow inserts, moves and deletes")
+
+        # databases from before product_count get it backfilled on upgrade
+        with repo.transaction() as conn:
+            for trigger in ("insert", "delete", "update"):
+                conn.execute(f"DROP TRIGGER products_category_{trigger}")
+            conn.execute("ALTER TABLE categories DROP COLUMN product_count")
+        repo.init_schema()
+        assert _counts(repo) == stored
+        print("✓ Counts are backfilled when the column is added")
+
+        seen, after = [], None
+        while True:
+            page = repo.category_products(1, after=after, limit=20)
+            seen += [row["id"] for row in page]
+            if len(page) < 20:
+                break
+            after = page[-1]["id"]
+        assert seen == sorted(seen, reverse=True) and len(seen) == len(set(seen)) == 47
+        plan = " ".join(row[-1] for row in repo.connection().execute(
+            "EXPLAIN QUERY PLAN SELECT * FROM products WHERE category_id = 1 AND id < 30 ORDER BY id DESC LIMIT 20"))
+        assert "idx_products_category_id" in plan and "TEMP B-TREE" not in plan, plan
+        print("✓ Category pages are keyset range scans")
+
+        app, nav = _app(repo)
+        client = app.test_client()
+        response = client.get("/category/1")
+        html = response.get_data(as_text=True)
+        assert response.status_code == 200 and "هاتف 49" in html and "after=27" in html
+        assert "هاتف 25" in client.get("/category/1?after=27").get_data(as_text=True)
+        assert client.get("/category/99").status_code == 302
+        assert "فارغة" in html and ">47<" in html
+        with repo.transaction() as conn:
+            conn.execute("INSERT INTO categories (name) VALUES ('جديدة')")
+            conn.execute("INSERT INTO products (name, price, category_id) VALUES ('x', 1, 4)")
+        assert "جديدة" not in client.get("/category/2").get_data(as_text=True)
+        nav.invalidate()
+        assert "جديدة" in client.get("/category/2").get_data(as_text=True)
+        repo.close()
+        print("✓ The category menu is cached until invalidated")
+
+    print("\n🎉 Category browsing tests passed!")
+
+
+if __name__ == "__main__":
+    test_catalog()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Faceted Filtering Test Script
+Checks the bitset facet index against plain Python filtering of the same
+products: filtered pages (keyset-paged by product id), totals, and facet
+counts that apply every other selected facet. Also checks the API answers
+from one cached index until it is invalidated.
+"""
+
+import os
+import random
+import tempfile
+from datetime import datetime
+
+from flask import Flask
+
+from facets import init_facets, FacetIndex, price_bucket
+from repository import Repository
+
+
+def _expected(rows, selected, skip=None):
+    def keep(row):
+        for facet, values in selected.items():
+            if facet == skip or not values:
+                continue
+            value = {"category": str(row["category_id"]), "price": price_bucket(row["price"]),
+                     "has_image": "1" if row["has_image"] else None,
+                     "new": "1" if row["created_at"] >= "2024-05-02" else None}[facet]
+            if value not in values:
+                return False
+        return True
+    return [row for row in rows if keep(row)]
+
+
+def test_facets():
+    """Test the facet index and API"""
+
+    print("=== Faceted Filtering Test ===")
+
+    rng = random.Random(7)
+    rows = [{"id": pid, "price": rng.choice([500, 1500, 5000, 20000, 90000, 300000]),
+             "category_id": rng.choice([1, 2, 3, None]), "has_image": rng.random() < 0.6,
+             "created_at": rng.choice(["2024-01-10 10:00:00", "2024-05-20 10:00:00"])}
+            for pid in range(3000, 0, -1)]
+    index = FacetIndex(rows, {1: "هواتف", 2: "حواسيب", 3: "إكسسوارات"}, now=datetime(2024, 6, 1))
+    for selected in ({}, {"category": ["1"]}, {"category": ["1", "3"], "price": ["2000-10000", "200000+"]},
+                     {"has_image": ["1"], "new": ["1"], "price": ["0-2000"]}):
+        expected = _expected(rows, selected)
+        page, total, counts, next_after = index.search(selected, limit=50)
+        assert total == len(expected) and page == [row["id"] for row in expected[:50]]
+        for facet, values in counts.items():
+            others = _expected(rows, selected, skip=facet)
+            for value, count in values.items():
+                assert count == len(_expected(others, {facet: [value]})), (selected, facet, value)
+        seen, after = page, next_after
+        while after is not None:
+            page, _, _, after = index.search(selected, after=after, limit=50)
+            seen += page
+        assert seen == [row["id"] for row in expected]
+    print("✓ Bitset pages, totals and facet counts match a plain filter")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        repo = Repository(os.path.join(tmp, "test.db"))
+        repo.init_schema()
+        with repo.transaction() as conn:
+            conn.executemany("INSERT INTO categories (name) VALUES (?)", [("هواتف",), ("حواسيب",)])
+            conn.executemany("INSERT INTO products (name, price, category_id, image) VALUES (?, ?, ?, ?)",
+                             [("هاتف", 1500, 1, "uploads/a.jpg"), ("هاتف 2", 25000, 1, None),
+                              ("حاسوب", 120000, 2, None)])
+            conn.execute("INSERT INTO product_images (product_id, image_path, is_primary) VALUES (3, 'b.jpg', 1)")
+        app = Flask(__name__)
+        repo.init_app(app)
+        cache = init_facets(app, repo, ttl=3600)
+        client = app.test_client()
+
+        data = client.get("/api/products/facets?category=1&has_image=1").get_json()
+        assert data["total"] == 1 and [row["name"] for row in data["rows"]] == ["هاتف"]
+        categories = {f["label"]: (f["count"], f["selected"]) for f in data["facets"]["category"]}
+        assert categories == {"هواتف": (1, True), "حواسيب": (1, False)}
+        assert [f["value"] for f in data["facets"]["price"]] == ["0-2000", "10000-50000", "50000-200000"]
+        assert {f["value"]: f["count"] for f in data["facets"]["has_image"]} == {"1": 1}
+        assert data["facets"]["new"][0]["count"] == 1  # just created, within the other filters
+
+        page = client.get("/api/products/facets?limit=2").get_json()
+        assert [row["id"] for row in page["rows"]] == [3, 2] and page["next"] == 2
+        assert [row["id"] for row in client.get("/api/products/facets?after=2").get_json()["rows"]] == [1]
+
+        with repo.transaction() as conn:
+            conn.execute("DELETE FROM products WHERE id = 1")
+        assert client.get("/api/products/facets").get_json()["total"] == 3  # cached index
+        cache.invalidate()
+        assert client.get("/api/products/facets").get_json()["total"] == 2
+        repo.close()
+        print("✓ The API serves one cached index until the catalog changes")
+
+    print("\n🎉 Faceted filtering tests passed!")
+
+
+if __name__ == "__main__":
+    test_facets()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Synthetic Data and Benchmark Test Script
+Checks that generate_data.py creates the schema itself and fills it with
+consistent products, users, orders, requests and rollups, that it refuses
+a database that already has rows unless --force is given, and that
+benchmark.py's measurements, baseline comparison and a tiny end-to-end
+run work.
+"""
+
+import os
+import sys
+import sqlite3
+import tempfile
+import subprocess
+
+import pytest
+
+import generate_data
+from generate_data import generate, existing_rows, WILAYAS, CATALOG
+from benchmark import percentile, summarize, server_db_time, compare_to_baseline
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def test_generate():
+    """Test the generated rows and the --force guard"""
+
+    print("=== Synthetic Data Test ===")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "synthetic.db")
+        assert existing_rows(db_path) == 0
+        gen = generate(db_path, products=40, orders=600, requests=150, users=20, batch_size=100,
+                       verbose=False)
+        conn = sqlite3.connect(db_path)
+        count = lambda sql: conn.execute(sql).fetchone()[0]
+        assert count("SELECT COUNT(*) FROM products") == 40 == len(gen.product_ids)
+        assert count("SELECT COUNT(*) FROM users") == 20
+        assert count("SELECT COUNT(*) FROM orders") == 600
+        assert count("SELECT COUNT(*) FROM product_requests") == 150
+        assert {row[0] for row in conn.execute("SELECT name FROM categories")} == set(CATALOG)
+        assert count("SELECT COUNT(*) FROM admins") == 0  # no app import, so no seeded admin
+        print("✓ The schema is created without importing the app, and filled")
+
+        assert count("SELECT COUNT(*) FROM orders o JOIN products p ON p.id = o.product_id "
+                     "WHERE o.total_price != p.price * o.quantity") == 0
+        assert count("SELECT COUNT(*) FROM order_items") == 600
+        wilayas = {name for name, _ in WILAYAS}
+        assert {row[0] for row in conn.execute("SELECT DISTINCT state FROM orders")} <= wilayas
+        assert count("SELECT COUNT(*) FROM orders WHERE state = 'الجزائر'") > \
+            count("SELECT COUNT(*) FROM orders WHERE state = 'إليزي'")
+        assert count("SELECT SUM(order_count) FROM orders_daily") == \
+            count("SELECT COUNT(*) FROM orders WHERE status != 'cancelled'")
+        conn.close()
+        print("✓ Orders are priced, itemized, spread over the wilayas and rolled up")
+
+        assert existing_rows(db_path) == 640
+        with pytest.raises(SystemExit) as refused:
+            generate_data.main(["--db", db_path, "--products", "5", "--orders", "0", "--requests", "0"])
+        assert "--force" in str(refused.value)
+        generate_data.main(["--db", db_path, "--products", "5", "--orders", "0", "--requests", "0", "--force"])
+        assert existing_rows(db_path) == 645
+        print("✓ A database with rows is only written with --force")
+
+    print("\n🎉 Synthetic data tests passed!")
+
+
+def test_benchmark():
+    """Test the benchmark measurements and a tiny run"""
+
+    print("=== Benchmark Test ===")
+
+    assert percentile([], 95) == 0.0
+    assert percentile([0.1, 0.2, 0.3, 0.4], 50) == 0.2 and percentile([0.1, 0.2, 0.3, 0.4], 99) == 0.4
+    result = summarize([0.002, 0.001, 0.003, 0.004], 0.5, db_times=[0.001] * 4)
+    assert result == {"requests": 4, "rps": 8.0, "p50_ms": 2.0, "p95_ms": 4.0, "p99_ms": 4.0, "db_ms": 1.0}
+    assert server_db_time('app;dur=9, db;dur=12.5;desc="3 queries"') == 0.0125
+    assert server_db_time(None) == 0.0
+    baseline = {"results": {"client": {"index": {"p95_ms": 10.0, "rps": 100.0}}}}
+    report = {"results": {"client": {"index": {"p95_ms": 12.0, "rps": 80.0},
+                                     "product": {"p95_ms": 50.0, "rps": 1.0}}}}
+    assert compare_to_baseline(report, baseline, 0.25) == []
+    assert compare_to_baseline(report, baseline, 0.1) == [
+        "client/index: p95 10.0 → 12.0 ms", "client/index: throughput 100.0 → 80.0 req/s"]
+    print("✓ Percentiles, summaries, Server-Timing parsing and baseline comparison")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        baseline_path = os.path.join(tmp, "baseline.json")
+        run = [sys.executable, os.path.join(BASE_DIR, "benchmark.py"), "--scale", "tiny",
+               "--iterations", "5", "--baseline", baseline_path]
+        result = subprocess.run(run + ["--save-baseline"], capture_output=True, text=True, timeout=120)
+        assert result.returncode == 0, result.stderr
+        assert all(name in result.stdout for name in ("index", "product", "order", "api_request", "admin"))
+        assert os.path.exists(baseline_path)
+        result = subprocess.run(run + ["--compare", "--tolerance", "1000"], capture_output=True, text=True,
+                                timeout=120)
+        assert result.returncode == 0 and "No regressions" in result.stdout, result.stdout + result.stderr
+    print("✓ A tiny run drives every scenario, saves a baseline and compares against it")
+
+    print("\n🎉 Benchmark tests passed!")
+
+
+if __name__ == "__main__":
+    test_generate()
+    test_benchmark()
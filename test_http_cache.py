@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+HTTP Caching Test Script
+Checks the Cache-Control policy per route (public catalog pages for
+anonymous visitors only, private everything else, immutable hashed
+uploads), that public responses vary on Cookie, carry surrogate keys and
+never set a cookie, and that purges reach the proxy with the right keys.
+"""
+
+import os
+import time
+import tempfile
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from flask import Flask, session, jsonify
+
+from catalog import init_catalog
+from http_cache import init_http_cache, product_keys, HttpCache
+from repository import Repository
+from vendor_assets import register_vendor_assets
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class _Proxy(BaseHTTPRequestHandler):
+    purges = []
+
+    def do_PURGE(self):
+        self.purges.append((self.path, self.headers["xkey"]))
+        self.send_response(200)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def _app(repo, static):
+    app = Flask(__name__, template_folder=os.path.join(BASE_DIR, "templates"), static_folder=static)
+    app.secret_key = "test"
+    register_vendor_assets(app)
+    init_http_cache(app)
+    repo.init_app(app)
+    init_catalog(app, repo, ttl=3600)
+
+    def index():
+        session.pop("seen", None)  # touches the session without leaving anything in it
+        return "home"
+
+    def product(pid):
+        product_keys({"id": 7}, {"id": 9})
+        return jsonify({"id": pid})
+
+    def remember():
+        session["cart"] = {"1": 1}
+        return "ok"
+
+    for rule, endpoint, view in (("/", "index", index), ("/product/<int:pid>", "product", product),
+                                 ("/cart/add", "cart_add", remember), ("/admin", "admin", lambda: "admin"),
+                                 ("/login", "login", lambda: "login"), ("/logout", "logout", lambda: "bye")):
+        app.add_url_rule(rule, endpoint, view)
+    return app
+
+
+def test_http_cache():
+    """Test per-route cache policies, cookie suppression and purges"""
+
+    print("=== HTTP Caching Test ===")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        repo = Repository(os.path.join(tmp, "test.db"))
+        repo.init_schema()
+        with repo.transaction() as conn:
+            conn.execute("INSERT INTO categories (name) VALUES ('هواتف')")
+            conn.execute("INSERT INTO products (name, price, category_id) VALUES ('هاتف', 100, 1)")
+        static = os.path.join(tmp, "static")
+        os.makedirs(os.path.join(static, "uploads"))
+        for name in ("photo-0123456789ab.png", "logo.jpg"):
+            with open(os.path.join(static, "uploads", name), "wb") as f:
+                f.write(b"image")
+        client = _app(repo, static).test_client()
+
+        response = client.get("/category/1")
+        assert response.headers["Cache-Control"].startswith("public, max-age=60, s-maxage=600")
+        assert "stale-while-revalidate=60" in response.headers["Cache-Control"]
+        assert {"Cookie", "Accept-Encoding"} <= set(response.vary) and response.headers["xkey"] == "catalog"
+        response = client.get("/")
+        assert response.cache_control.public and "Set-Cookie" not in response.headers
+        response = client.get("/product/3")
+        assert response.headers["xkey"] == "product-3 product-7 product-9"
+        assert client.get("/admin").headers["Cache-Control"] == "private, no-store"
+        assert client.get("/missing").headers["Cache-Control"] == "private, no-store"
+        print("✓ Anonymous catalog pages are public, tagged and cookie-free; the rest is no-store")
+
+        response = client.get("/category/99")  # flashes "not found" and redirects
+        assert response.status_code == 302 and response.headers["Cache-Control"] == "private, no-cache"
+        response = client.get("/category/1")  # shows (and consumes) the message
+        assert response.headers["Cache-Control"] == "private, no-cache" and "xkey" not in response.headers
+        client.get("/cart/add")
+        assert client.get("/").headers["Cache-Control"] == "private, no-cache"
+        print("✓ Visitors with a session (cart, login, messages) get private pages")
+
+        hashed = client.get("/static/uploads/photo-0123456789ab.png")
+        assert hashed.headers["Cache-Control"] == "public, max-age=31536000, immutable"
+        assert client.get("/static/uploads/logo.jpg").headers["Cache-Control"] == "no-cache"  # Flask's default
+        repo.close()
+        print("✓ Content-hashed uploads are cached for a year")
+
+    proxy = ThreadingHTTPServer(("127.0.0.1", 0), _Proxy)
+    threading.Thread(target=proxy.serve_forever, daemon=True).start()
+    cache = HttpCache(f"http://127.0.0.1:{proxy.server_port}/", repurge_after=0.1)
+    assert cache.purge(5).result(timeout=5) == 200
+    assert cache.purge().result(timeout=5) == 200
+    for _ in range(50):
+        if len(_Proxy.purges) == 4:
+            break
+        time.sleep(0.1)
+    assert sorted(_Proxy.purges) == [("/", "catalog")] * 2 + [("/", "catalog product-5")] * 2  # again, later
+    proxy.shutdown()
+    assert HttpCache("").purge(5) is None
+    assert HttpCache("http://127.0.0.1:9/", repurge_after=0).purge(5).result(timeout=5) is None  # proxy down
+    print("✓ Purges send the changed keys to the proxy, twice")
+
+    print("\n🎉 HTTP caching tests passed!")
+
+
+if __name__ == "__main__":
+    test_http_cache()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Upload Garbage Collection Test Script
+Checks that foreign keys are enforced on every SQLite connection, that
+deleting a product takes its images and requests with it while its orders
+stay (unlinked), and that the collector deletes only old, unreferenced
+uploads and stale upload parts, dropping orphan image rows and reporting
+disk usage per product.
+"""
+
+import os
+import time
+import sqlite3
+import tempfile
+
+from sqlalchemy import create_engine, text
+
+from image_gc import collect, usage, template_images
+from repository import Repository, repository_for_engine
+
+
+def _touch(directory, name, size, age):
+    path = os.path.join(directory, name)
+    with open(path, "wb") as f:
+        f.write(b"\0" * size)
+    os.utime(path, (time.time() - age, time.time() - age))
+
+
+def test_image_gc():
+    """Test foreign keys, product deletion and the upload collector"""
+
+    print("=== Upload Garbage Collection Test ===")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        repo = Repository(os.path.join(tmp, "test.db"))
+        repo.init_schema()
+        with repo.transaction() as conn:
+            conn.executemany("INSERT INTO products (name, price, image) VALUES (?, ?, ?)",
+                             [("هاتف", 100, "uploads/phone.jpg"), ("غلاف", 10, "uploads/shared.png"),
+                              ("شاحن", 20, None)])
+            conn.executemany("INSERT INTO product_images (product_id, image_path, is_primary) VALUES (?, ?, ?)",
+                             [(1, "uploads/phone.jpg", 1), (1, "uploads/phone-back.jpg", 0),
+                              (2, "uploads/shared.png", 1), (3, "uploads/shared.png", 1),
+                              (3, "uploads/gone.webp", 0)])
+        try:
+            with repo.transaction() as conn:
+                conn.execute("INSERT INTO product_images (product_id, image_path) VALUES (99, 'x.jpg')")
+            raise AssertionError("foreign keys must be enforced")
+        except sqlite3.IntegrityError:
+            pass
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'orm.db')}")
+        repository_for_engine(engine).close()
+        with engine.connect() as conn:
+            assert conn.execute(text("PRAGMA foreign_keys")).scalar() == 1
+        print("✓ Foreign keys are enforced on raw and SQLAlchemy connections")
+
+        products = {row["id"]: row for row in repo.get_products([1, 2])}
+        order_id = repo.place_order([(products[1], 1), (products[2], 2)], "علي", "0550", "الجزائر", log_request=True)
+        repo.create_request(products[1], "سارة", "0660", "وهران")
+        pending = repo.status_counts("requests")
+        assert repo.delete_product(1) and not repo.delete_product(1)
+        assert repo.get_product_images(1) == [] and repo.get_order(order_id)["product_id"] is None
+        assert [item["product_id"] for item in repo.get_order_items(order_id)] == [None, 2]  # lines stay
+        assert [r["product_id"] for r in repo.connection().execute("SELECT product_id FROM product_requests")] == [2]
+        after = repo.status_counts("requests")
+        assert sum(pending.values()) - sum(after.values()) == 2
+        print("✓ Deleting a product removes its images and requests and unlinks its orders")
+
+        uploads = os.path.join(tmp, "uploads")
+        os.mkdir(uploads)
+        day = 86400
+        for name, size, age in (("phone.jpg", 5000, day), ("phone-back.jpg", 3000, day), ("shared.png", 2000, day),
+                                ("fresh.jpg", 100, 60), ("logo.jpg", 700, day), ("desktop.ini", 10, day),
+                                (".upload-abc.part", 900, day), (".upload-new.part", 50, 1)):
+            _touch(uploads, name, size, age)
+        # a row left by a delete made while foreign keys were off
+        legacy = sqlite3.connect(os.path.join(tmp, "test.db"))
+        legacy.execute("INSERT INTO product_images (product_id, image_path) VALUES (42, 'uploads/phone.jpg')")
+        legacy.commit()
+        legacy.close()
+
+        dry = collect(repo, uploads, grace=3600, dry_run=True, keep={"logo.jpg"})
+        assert dry["rows"] == 0 and len(os.listdir(uploads)) == 8
+        result = collect(repo, uploads, grace=3600, keep={"logo.jpg"})
+        assert result["rows"] == 1 and result["files"] == dry["files"]
+        assert sorted(name for name, _size in result["files"]) == [".upload-abc.part", "phone-back.jpg", "phone.jpg"]
+        assert result["missing"] == ["uploads/gone.webp"]
+        assert sorted(os.listdir(uploads)) == [".upload-new.part", "desktop.ini", "fresh.jpg", "logo.jpg", "shared.png"]
+        assert collect(repo, uploads, grace=3600, keep={"logo.jpg"})["files"] == []
+        assert "logo.jpg" in template_images()
+        print("✓ Only old, unreferenced uploads and stale parts are collected")
+
+        per_product, totals = usage(repo, uploads)
+        assert [(entry["product_id"], entry["files"], entry["bytes"]) for entry in per_product] == \
+            [(2, 1, 2000), (3, 1, 2000)]  # a shared file counts for each product using it
+        assert totals["referenced"] == 2000 and totals["parts"] == 50 and totals["unreferenced"] == 810
+        assert 0 < totals["disk_free"] <= totals["disk_total"]
+        repo.close()
+        print("✓ Disk usage is reported per product")
+
+    print("\n🎉 Upload garbage collection tests passed!")
+
+
+if __name__ == "__main__":
+    test_image_gc()
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Background Jobs Test Script
+Checks the job queue: priorities and scheduled jobs, one claim per job under
+concurrent workers, retries with backoff until a job fails for good, leases
+that run out and hand the job to another worker, recurring jobs enqueued
+once per period, worker processes draining the queue, and the /admin/jobs
+page, the deferred image placeholders and the queued analytics rebuild.
+"""
+
+import os
+import sys
+import json
+import time
+import tempfile
+import threading
+import subprocess
+
+import jobs
+import uploads
+from analytics import init_analytics
+from jobs import Handler, Schedule, enqueue, work, run_job, summary, parse_schedule, backoff, init_jobs
+from repository import Repository
+from testing import admin_app, BASE_DIR
+
+
+def _app(repo, enabled):
+    app = admin_app(repo)
+    queue = init_jobs(app, repo, enabled=enabled)
+    init_analytics(app, repo, jobs=queue)
+    return app, queue
+
+
+def test_jobs():
+    """Test the job queue, its workers and the admin page"""
+
+    print("=== Background Jobs Test ===")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = os.path.join(tmp, "test.db")
+        repo = Repository(db)
+        repo.init_schema()
+        ran = []
+        handlers = {
+            "ok": Handler(lambda repo, payload: ran.append(payload["n"]), 0, 30, 3),
+            "urgent": Handler(lambda repo, payload: ran.append(payload["n"]), 10, 30, 3),
+            "boom": Handler(lambda repo, payload: 1 / 0, 0, 30, 2),
+        }
+
+        now = time.time()
+        first = enqueue(repo, "ok", {"n": 1}, handlers=handlers)
+        enqueue(repo, "ok", {"n": 2}, delay=3600, handlers=handlers)
+        enqueue(repo, "urgent", {"n": 3}, handlers=handlers)
+        assert enqueue(repo, "ok", {"n": 4}, unique_key="once", handlers=handlers) is not None
+        assert enqueue(repo, "ok", {"n": 5}, unique_key="once", handlers=handlers) is None
+        try:
+            enqueue(repo, "missing", handlers=handlers)
+            raise AssertionError("unknown kinds are refused")
+        except ValueError:
+            pass
+        assert work(repo, threading.Event(), handlers=handlers, burst=True) == 3
+        assert ran == [3, 1, 4]  # priority first, then oldest; the scheduled job is not due yet
+        job = repo.claim_job("w", now=now + 3601)
+        assert json.loads(job["payload"]) == {"n": 2} and job["attempts"] == 1
+        assert repo.finish_job(job["id"], "w")
+        done = repo.connection().execute("SELECT status, worker, finished_at FROM jobs WHERE id = ?",
+                                         (first,)).fetchone()
+        assert done["status"] == "done" and done["finished_at"] >= now
+        print("✓ Priorities, scheduled jobs and unique keys")
+
+        for n in range(60):
+            enqueue(repo, "ok", {"n": n}, handlers=handlers)
+        claimed = []
+
+        def claim(name):
+            while True:
+                job = repo.claim_job(name)
+                if job is None:
+                    break
+                claimed.append(job["id"])
+                repo.finish_job(job["id"], name)
+            repo.close()
+        threads = [threading.Thread(target=claim, args=(f"t{i}",)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(claimed) == 60 and len(set(claimed)) == 60
+        print("✓ Concurrent workers claim each job once")
+
+        failing = enqueue(repo, "boom", handlers=handlers)
+        job = repo.claim_job("w")
+        assert not run_job(repo, job, "w", handlers)
+        row = repo.connection().execute("SELECT * FROM jobs WHERE id = ?", (failing,)).fetchone()
+        assert row["status"] == "queued" and row["last_error"].startswith("ZeroDivisionError")
+        assert now + jobs.BACKOFF_S * 0.5 <= row["run_at"] <= time.time() + jobs.BACKOFF_S
+        assert repo.claim_job("w") is None  # backing off
+        job = repo.claim_job("w", now=row["run_at"] + 1)
+        assert job["attempts"] == 2 and not run_job(repo, job, "w", handlers)
+        row = repo.connection().execute("SELECT * FROM jobs WHERE id = ?", (failing,)).fetchone()
+        assert row["status"] == "failed" and row["finished_at"] is not None
+        assert 5 <= backoff(2, base=10, cap=60) <= 20 and backoff(9, base=10, cap=60) <= 60
+        data = summary(repo)
+        assert [(r["kind"], r["status"], r["total"]) for r in data["depth"]] == [("boom", "failed", 1)]
+        assert {r["kind"]: r["done"] for r in data["latency"]} == {"ok": 63, "urgent": 1}
+        assert [r["id"] for r in data["failed"]] == [failing]
+        assert repo.retry_job(failing) and not repo.retry_job(failing)
+        row = repo.connection().execute("SELECT status, attempts FROM jobs WHERE id = ?", (failing,)).fetchone()
+        assert (row["status"], row["attempts"]) == ("queued", 0)
+        print("✓ Failed attempts back off, then fail for good until retried")
+
+        now = time.time() + 1
+        leased = repo.claim_job("dead", now=now)
+        assert leased["id"] == failing and leased["locked_until"] == now + 30
+        assert repo.claim_job("alive", now=now + 10) is None  # still leased
+        taken = repo.claim_job("alive", now=now + 31)
+        assert taken["id"] == failing and taken["worker"] == "alive" and taken["attempts"] == 2
+        assert not repo.finish_job(failing, "dead") and repo.finish_job(failing, "alive")
+        print("✓ Expired leases go to another worker; the late one can't finish the job")
+
+        assert parse_schedule("jobs.prune=3600, recommend.update=600") == [("jobs.prune", 3600.0),
+                                                                           ("recommend.update", 600.0)]
+        first, second = Schedule([("jobs.prune", 60)]), Schedule([("jobs.prune", 60)])
+        first.enqueue_due(repo, now=6000.5)
+        second.enqueue_due(repo, now=6030)  # another worker, same minute
+        first.enqueue_due(repo, now=6061)
+        keys = [row["unique_key"] for row in repo.connection().execute(
+            "SELECT unique_key FROM jobs WHERE unique_key IS NOT NULL ORDER BY id")]
+        assert keys == ["once", "jobs.prune@100", "jobs.prune@101"]
+        assert repo.prune_jobs(time.time() + 1) == 65  # everything finished
+        assert repo.connection().execute("SELECT COUNT(*) FROM jobs WHERE status = 'done'").fetchone()[0] == 0
+        print("✓ Recurring jobs are enqueued once per period")
+
+        for spec in ("jobs.prun=3600", "jobs.prune=0", "jobs.prune=soon"):
+            try:
+                parse_schedule(spec)
+                raise AssertionError(f"{spec} must be rejected")
+            except ValueError:
+                pass
+        other = Repository(os.path.join(tmp, "other.db"))
+        other.init_schema()
+        enqueue(other, "jobs.prune")
+        # a schedule entry that can't be enqueued doesn't keep the worker from its jobs
+        assert work(other, threading.Event(), schedule=[("jobs.prun", 60)], burst=True) == 1
+        other.close()
+        result = subprocess.run([sys.executable, os.path.join(BASE_DIR, "jobs.py"), "--db", db, "work",
+                                 "--burst", "--schedule", "jobs.prun=3600"], capture_output=True, text=True, timeout=60)
+        assert result.returncode == 2 and "unknown job kind 'jobs.prun'" in result.stderr
+        print("✓ Bad schedule entries fail at startup and never block claims")
+
+        for _ in range(20):
+            enqueue(repo, "jobs.prune")
+        repo.close()
+        result = subprocess.run([sys.executable, os.path.join(BASE_DIR, "jobs.py"), "--db", db, "work",
+                                 "--processes", "2", "--burst", "--schedule", ""],
+                                capture_output=True, text=True, timeout=60)
+        assert result.returncode == 0, result.stderr
+        assert result.stdout.count("✓ Worker") == 2
+        statuses = dict(repo.connection().execute(
+            "SELECT status, COUNT(*) FROM jobs WHERE kind = 'jobs.prune' GROUP BY status").fetchall())
+        assert statuses == {"done": 22}  # with the two recurring ones
+        print("✓ Worker processes drain the queue")
+
+        directory = os.path.join(tmp, "uploads")
+        os.mkdir(directory)
+        uploads.Image.new("RGB", (40, 30), (200, 10, 10)).save(os.path.join(directory, "a.png"))
+        with repo.transaction() as conn:
+            conn.execute("INSERT INTO products (name, price, image, image_width, image_height) "
+                         "VALUES ('هاتف', 100, 'uploads/a.png', 40, 30)")
+        repo.product_bundle(1)
+        jobs.UPLOAD_DIR, upload_dir = directory, jobs.UPLOAD_DIR
+        try:
+            enqueue(repo, "images.measure", {"paths": ["uploads/a.png"]})
+            assert work(repo, threading.Event(), burst=True) == 1
+        finally:
+            jobs.UPLOAD_DIR = upload_dir
+        assert repo.get_product(1)["image_placeholder"].startswith("data:image/png;base64,")
+        assert repo.product_bundle(1)["product"]["image_placeholder"] is not None
+        print("✓ Placeholders deferred from the upload are made by a job")
+
+        app, queue = _app(repo, enabled=True)
+        client = app.test_client()
+        assert client.get("/admin/jobs").status_code == 302
+        assert client.get("/admin/jobs?format=json").status_code == 401
+        client.get("/test-login")
+        assert client.post("/admin/analytics/rebuild").status_code == 302
+        client.post("/admin/analytics/rebuild")
+        queued = repo.connection().execute("SELECT COUNT(*) FROM jobs WHERE kind = 'analytics.rebuild'").fetchone()[0]
+        assert queued == 1  # the second press found it already queued
+        assert queue.enqueue("recommend.update") is not None
+        repo.fail_job(repo.claim_job("w", now=time.time() + 3600)["id"], "w", "boom")
+        data = client.get("/admin/jobs?format=json").get_json()
+        assert data["success"] and data["enabled"]
+        depth = {(r["kind"], r["status"]): r for r in data["depth"]}
+        assert depth[("analytics.rebuild", "failed")]["total"] == 1 and depth[("recommend.update", "queued")]["due"] == 1
+        html = client.get("/admin/jobs").get_data(as_text=True)
+        assert "analytics.rebuild" in html and "إعادة المحاولة" in html
+        failed_id = data["failed"][0]["id"]
+        assert client.post(f"/admin/jobs/{failed_id}/retry").status_code == 302
+        assert repo.connection().execute("SELECT status FROM jobs WHERE id = ?", (failed_id,)).fetchone()[0] == "queued"
+        repo.close()
+        print("✓ The admin page shows depth, latency and failures; rebuilds are queued")
+
+    print("\n🎉 Background jobs tests passed!")
+
+
+if __name__ == "__main__":
+    test_jobs()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Lazy Image Test Script
+Checks that image sizes and placeholders are recorded per path on products
+and product_images (and backfilled for older images by image_gc.py
+measure), that product page bundles carry them, and
+that pages emit lazy images with a reserved box and an inline placeholder.
+"""
+
+import os
+import struct
+import tempfile
+
+from flask import Flask, render_template_string
+
+import uploads
+from catalog import init_catalog
+from image_gc import measure
+from repository import Repository
+from vendor_assets import register_vendor_assets
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _image(directory, name, width, height):
+    """A real PNG when Pillow is installed, else just a valid header"""
+    with open(os.path.join(directory, name), "wb") as f:
+        if uploads.Image is not None:
+            uploads.Image.new("RGB", (width, height), (20, 120, 200)).save(f, "PNG")
+        else:
+            f.write(b"\x89PNG\r\n\x1a\n" + struct.pack(">I", 13) + b"IHDR" +
+                    struct.pack(">II", width, height) + b"\x08\x02\x00\x00\x00")
+
+
+def test_lazy_images():
+    """Test recorded image sizes, their backfill and the lazy image markup"""
+
+    print("=== Lazy Image Test ===")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        repo = Repository(os.path.join(tmp, "test.db"))
+        repo.init_schema()
+        with repo.transaction() as conn:
+            conn.execute("INSERT INTO categories (name) VALUES ('هواتف')")
+            conn.executemany("INSERT INTO products (name, price, category_id, image) VALUES (?, ?, 1, ?)",
+                             [("هاتف", 100, "uploads/a.png"), ("غلاف", 10, "uploads/b.png"),
+                              ("قديم", 5, "images/legacy.jpg")])
+            conn.executemany("INSERT INTO product_images (product_id, image_path, is_primary) VALUES (?, ?, ?)",
+                             [(1, "uploads/a.png", 1), (1, "uploads/c.png", 0), (2, "uploads/b.png", 1)])
+        assert sorted(repo.unmeasured_images()) == ["images/legacy.jpg", "uploads/a.png", "uploads/b.png",
+                                                    "uploads/c.png"]
+        bundle = repo.product_bundle(1)  # stored before the sizes are known
+
+        directory = os.path.join(tmp, "uploads")
+        os.mkdir(directory)
+        _image(directory, "a.png", 640, 480)
+        _image(directory, "c.png", 300, 900)
+        with open(os.path.join(directory, "b.png"), "wb") as f:
+            f.write(b"not an image")
+        measured, unreadable = measure(repo, directory)
+        assert measured == 2 and unreadable == ["images/legacy.jpg", "uploads/b.png"]
+        product = repo.get_product(1)
+        assert (product["image_width"], product["image_height"]) == (640, 480)
+        images = {row["image_path"]: row for row in repo.get_product_images(1)}
+        assert (images["uploads/c.png"]["width"], images["uploads/c.png"]["height"]) == (300, 900)
+        assert (images["uploads/c.png"]["placeholder"] is None) == (uploads.Image is None)
+        assert sorted(repo.unmeasured_images()) == ["images/legacy.jpg", "uploads/b.png"]
+        assert repo.product_bundle(1) != bundle and repo.product_bundle(1)["images"][0]["width"] == 640
+        related = {item["id"]: item for item in repo.product_bundle(2)["related"]}
+        assert related[1]["image_height"] == 480 and related[3]["image_width"] is None
+        assert measure(repo, directory, everything=True)[0] == 2
+        print("✓ Sizes and placeholders are recorded by path and backfilled for older images")
+
+        app = Flask(__name__, template_folder=os.path.join(BASE_DIR, "templates"))
+        register_vendor_assets(app)
+        repo.init_app(app)
+        init_catalog(app, repo, ttl=3600)
+        for rule, endpoint in (("/", "index"), ("/admin", "admin"), ("/login", "login"), ("/logout", "logout"),
+                               ("/product/<int:pid>", "product")):
+            app.add_url_rule(rule, endpoint, lambda **kwargs: "ok")
+        html = app.test_client().get("/category/1").get_data(as_text=True)
+        assert 'src="/static/uploads/a.png"' in html and 'width="640" height="480"' in html
+        assert html.count('loading="lazy"') == 3 and html.count("fetchpriority") == 0
+        assert ("data:image/png;base64," in html) == (uploads.Image is not None)
+        with app.test_request_context():
+            main = render_template_string('{% from "_image.html" import product_img with context %}'
+                                          '{{ product_img("uploads/a.png", 640, 480, "data:x", "هاتف", '
+                                          'id="mainImage", eager=true) }}')
+            assert 'fetchpriority="high"' in main and "loading" not in main and 'id="mainImage"' in main
+            assert "url(data:x)" in main and "onload=" in main
+        repo.close()
+        print("✓ Pages emit lazy images with their size and placeholder")
+
+    print("\n🎉 Lazy image tests passed!")
+
+
+if __name__ == "__main__":
+    test_lazy_images()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Data Migration Test Script
+Migrates a legacy database.db (old app.py schema, no email/notes/status
+columns) into a fresh SQLAlchemy database, interrupts the run half way and
+checks that resuming neither loses nor duplicates rows.
+"""
+
+import os
+import sqlite3
+import tempfile
+
+from sqlalchemy import create_engine
+
+from migrate_data import Migration, migrate_data
+
+LEGACY_SCHEMA = """
+CREATE TABLE products (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, price REAL NOT NULL,
+                       desc TEXT, image TEXT);
+CREATE TABLE orders (id INTEGER PRIMARY KEY AUTOINCREMENT, product_id INTEGER, quantity INTEGER,
+                     first_name TEXT, last_name TEXT, state TEXT, phone TEXT, address TEXT, total_price REAL);
+"""
+
+
+class Interrupted(Exception):
+    pass
+
+
+def _legacy_database(path):
+    conn = sqlite3.connect(path)
+    conn.executescript(LEGACY_SCHEMA)
+    conn.executemany("INSERT INTO products (name, price, desc) VALUES (?, ?, 'وصف')",
+                     [(f"منتج {i}", i * 10) for i in range(1, 21)])
+    conn.execute("INSERT INTO products (name, price) VALUES ('منتج 1', 999)")  # duplicate name
+    conn.executemany("INSERT INTO orders (product_id, quantity, first_name, state, phone, address, total_price) "
+                     "VALUES (?, 2, 'أحمد', 'الجزائر', '0555', NULL, ?)",
+                     [(i % 21 + 1, None if i % 5 == 0 else 1.0) for i in range(230)])
+    conn.execute("INSERT INTO orders (product_id, quantity, first_name) VALUES (999, 1, 'orphan')")
+    conn.commit()
+    conn.close()
+
+
+def test_migrate_and_resume():
+    """Test batched migration, interruption and resume"""
+
+    print("=== Data Migration Test ===")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "database.db")
+        target = f"sqlite:///{os.path.join(tmp, 'target.db')}"
+        _legacy_database(source)
+
+        engine = create_engine(target)
+        migration = Migration(source, engine, batch_size=50, verbose=False)
+        original = migration._order
+        calls = []
+
+        def failing_order(row, columns):
+            calls.append(row["id"])
+            if len(calls) == 120:  # inside the third batch
+                raise Interrupted()
+            return original(row, columns)
+
+        migration._order = failing_order
+        try:
+            migration.run()
+            raise AssertionError("migration should have been interrupted")
+        except Interrupted:
+            pass
+        engine.dispose()
+        print("✓ Interrupted after two order batches")
+
+        results = migrate_data(source, target, batch_size=50, verbose=False)
+        assert results["products"] == 21 and results["orders"] == 230
+
+        conn = sqlite3.connect(os.path.join(tmp, "target.db"))
+        assert conn.execute("SELECT COUNT(*) FROM products").fetchone()[0] == 20
+        assert conn.execute("SELECT COUNT(*) FROM orders").fetchone()[0] == 230
+        # orders of the duplicate product land on the first product with that name
+        assert conn.execute("SELECT COUNT(*) FROM orders WHERE product_id = 1").fetchone()[0] == 21
+        # missing total_price is rebuilt from the legacy price
+        assert conn.execute("SELECT total_price FROM orders WHERE id = 1").fetchone()[0] == 10 * 2
+        assert conn.execute("SELECT COUNT(*) FROM orders WHERE address = '' AND status = 'pending' "
+                            "AND created_at IS NOT NULL").fetchone()[0] == 230
+        conn.close()
+        print("✓ Resumed without duplicates")
+
+        # finished tables are not copied again
+        results = migrate_data(source, target, batch_size=50, verbose=False)
+        assert results["orders"] == 230
+        conn = sqlite3.connect(os.path.join(tmp, "target.db"))
+        assert conn.execute("SELECT COUNT(*) FROM orders").fetchone()[0] == 230
+        conn.close()
+        print("✓ Re-running is a no-op")
+
+
+if __name__ == "__main__":
+    test_migrate_and_resume()
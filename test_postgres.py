@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+PostgreSQL Backend Test Script
+Runs the repository and the SQLite -> PostgreSQL migration against a real
+server: TEST_DATABASE_URL if set, otherwise a throwaway local instance from
+the `pgserver` package (pip install pgserver). Skipped when neither is
+available; the SQL translation checks always run.
+"""
+
+import os
+import sqlite3
+import tempfile
+import threading
+
+from repository import Repository, open_repository, is_postgres_url, normalize_database_url
+from workflow import InvalidTransition
+
+try:
+    import psycopg2
+    from pg_backend import translate
+except ImportError:  # psycopg2 not installed
+    psycopg2 = None
+
+
+def _server_url(tmp):
+    url = os.getenv("TEST_DATABASE_URL")
+    if url:
+        return url
+    try:
+        import pgserver
+    except ImportError:
+        return None
+    return pgserver.get_server(tmp, cleanup_mode="stop").get_uri()
+
+
+def _reset(url):
+    conn = psycopg2.connect(url)
+    conn.autocommit = True
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT table_name FROM information_schema.tables "
+                       "WHERE table_schema = current_schema() AND table_name ~ '_[0-9]{4}_[0-9]{2}$'")
+        archives = "".join(f"{name}, " for (name,) in cursor.fetchall())
+        cursor.execute("DROP TABLE IF EXISTS product_images, product_requests, order_items, orders, products, "
+                       f"sales_daily, orders_daily, request_status_daily, archive_partitions, {archives}"
+                       "categories, admins CASCADE")
+    conn.close()
+
+
+def test_urls():
+    assert is_postgres_url("postgres://u@h/db") and is_postgres_url("postgresql+psycopg2://u@h/db")
+    assert not is_postgres_url("sqlite:///database.db") and not is_postgres_url("")
+    assert normalize_database_url("postgres://u@h/db") == "postgresql+psycopg2://u@h/db"
+    assert normalize_database_url("postgresql+psycopg2://u@h/db") == "postgresql+psycopg2://u@h/db"
+    assert isinstance(open_repository("sqlite:////tmp/x.db"), Repository)
+    print("✓ DATABASE_URL parsing")
+
+
+def test_translate():
+    if psycopg2 is None:
+        print("⚠ psycopg2 not installed - skipping")
+        return
+    assert translate("SELECT * FROM products WHERE id = ?") == "SELECT * FROM products WHERE id = %s"
+    assert translate("SELECT '?', name FROM t WHERE name LIKE ?") == "SELECT '?', name FROM t WHERE name LIKE %s"
+    assert translate("SELECT '100%' WHERE a = ?") == "SELECT '100%%' WHERE a = %s"
+    assert translate("INSERT OR IGNORE INTO categories (name) VALUES (?)") == \
+        "INSERT INTO categories (name) VALUES (%s) ON CONFLICT DO NOTHING"
+    print("✓ SQL translation")
+
+
+def test_postgres_repository():
+    if psycopg2 is None:
+        print("⚠ psycopg2 not installed - skipping")
+        return
+    with tempfile.TemporaryDirectory() as tmp:
+        url = _server_url(tmp)
+        if not url:
+            print("⚠ no PostgreSQL available (set TEST_DATABASE_URL or pip install pgserver) - skipping")
+            return
+        _reset(url)
+
+        repo = open_repository(url)
+        repo.init_schema()
+        repo.init_schema()  # idempotent
+        conn = repo.connection()
+        with conn:
+            conn.execute("INSERT OR IGNORE INTO categories (name) VALUES (?)", ("إلكترونيات",))
+            conn.execute("INSERT OR IGNORE INTO categories (name) VALUES (?)", ("إلكترونيات",))
+            cursor = conn.execute('INSERT INTO products (name, price, "desc", category_id) VALUES (?, ?, ?, 1)',
+                                  ("هاتف", 100, "ذكي 100%"))
+            assert cursor.lastrowid == 1
+            conn.execute("INSERT INTO product_images (product_id, image_path, is_primary) VALUES (1, 'a.jpg', ?)",
+                         (True,))
+        assert conn.execute("SELECT COUNT(*) FROM categories").fetchone()[0] == 1
+
+        product = repo.get_product(1)
+        assert product["name"] == "هاتف" and dict(product)["desc"] == "ذكي 100%"
+        assert [i["image_path"] for i in repo.get_product_images(1)] == ["a.jpg"]
+        rows, total = repo.search_products("هاتف", 1)
+        assert total == 1 and rows[0]["category_name"] == "إلكترونيات"
+        assert [(c["name"], c["product_count"]) for c in repo.category_nav()] == [("إلكترونيات", 1)]
+        assert [p["id"] for p in repo.category_products(1)] == [1] and repo.category_products(1, after=1) == []
+        assert [(r["id"], r["category_id"], r["has_image"]) for r in repo.facet_rows()] == [(1, 1, 1)]
+
+        order_id = repo.create_order(product, 2, "أحمد", "0555", "الجزائر", log_request=True)
+        order = repo.get_order(order_id)
+        assert order["total_price"] == 200 and order["status"] == "pending"
+        assert repo.list_requests()[0]["status"] == "ordered"
+        order_id = repo.place_order([(product, 1), (product, 2)], "ليلى", "0777", "عنابة")
+        assert repo.get_order(order_id)["total_price"] == 300
+        assert [i["quantity"] for i in repo.get_order_items(order_id)] == [3]
+        assert repo.checkout({1: 1, 99: 1}, "x", "1", "s") == (None, [99])
+        request_id, _ = repo.create_request(product, "سارة", "0666", "وهران")
+        assert repo.update_request_status(request_id, "approved") == 1
+        today = repo.connection().execute("SELECT to_char(now() AT TIME ZONE 'UTC', 'YYYY-MM-DD')").fetchone()[0]
+        assert [(r["order_count"], r["revenue"]) for r in repo.sales_by_day(today, today)] == [(2, 500)]
+        statuses = {r["status"]: r["request_count"] for r in repo.request_status_totals(today, today)}
+        assert statuses == {"ordered": 1, "approved": 1, "pending": 0}
+        repo.rebuild_rollups()
+        assert dict((r["status"], r["request_count"]) for r in repo.request_status_totals(today, today)) == \
+            {"ordered": 1, "approved": 1}
+        # status workflow: row-locked transitions, counters, queue paging with a legacy NULL timestamp
+        assert repo.update_order_status(order_id, "cancelled") == 1
+        assert [(r["order_count"], r["revenue"]) for r in repo.sales_by_day(today, today)] == [(1, 200)]
+        try:
+            repo.update_order_status(order_id, "pending")
+            raise AssertionError("cancelled orders are final")
+        except InvalidTransition:
+            pass
+        assert repo.status_counts("orders") == {"pending": 1, "processing": 0, "shipped": 0,
+                                                "delivered": 0, "cancelled": 1}
+        legacy = repo.create_order(product, 1, "قديم", "0555", "الجزائر")
+        with repo.transaction() as conn:
+            conn.execute("UPDATE orders SET created_at = NULL WHERE id = ?", (legacy,))
+        first = repo.queue("orders", "pending", limit=1)
+        assert [r["id"] for r in first] == [legacy]
+        rest = repo.queue("orders", "pending", after=(first[0]["created_at"], first[0]["id"]), limit=5)
+        assert [r["id"] for r in rest] == [order_id - 1]
+        assert repo.queue("orders", "pending", after=(rest[0]["created_at"], rest[0]["id"])) == []
+        # archiving: the cancelled order moves to its month's table and stays reachable
+        with repo.transaction() as conn:
+            conn.execute("UPDATE orders SET created_at = '2024-01-15 10:00:00' WHERE id = ?", (order_id,))
+        assert repo.archive("orders", "2024-06-01", ["cancelled"]) == {"2024-01": 1}
+        assert order_id not in [o["id"] for o in repo.list_orders()]
+        assert [o["id"] for o in repo.list_orders("2024-01-01", "2024-01-31")] == [order_id]
+        assert repo.get_order(order_id)["status"] == "cancelled" and len(repo.get_order_items(order_id)) == 1
+        repo.rebuild_rollups()
+        repo.compact()
+        # product page bundle: JSON row upsert, category fallback, LIKE-based invalidation
+        with repo.transaction() as conn:
+            conn.execute("INSERT INTO products (name, price, category_id) VALUES ('هاتف 2', 150, 1)")
+        bundle = repo.product_bundle(1)
+        assert bundle["product"]["category_name"] == "إلكترونيات" and bundle["product"]["price"] == 100
+        assert [i["image_path"] for i in bundle["images"]] == ["a.jpg"] and [r["id"] for r in bundle["related"]] == [2]
+        assert repo.product_bundle(1) == bundle
+        repo.invalidate_product_bundles(2)
+        # co-purchase history for recommend.py, archived orders included
+        upto = repo.purchase_watermarks()
+        assert upto[0] >= order_id and {"0555", "0666", "0777"} <= set(repo.new_customers((0, 0), upto))
+        assert ("0777", 1) in repo.customer_products(upto) and repo.customer_products(upto, ["0666"]) == [("0666", 1)]
+        assert repo.delete_product(2) and not repo.delete_product(2)
+        assert repo.connection().execute("SELECT COUNT(*) FROM product_bundles").fetchone()[0] == 0
+        assert repo.image_references() == {"a.jpg": {1}} and repo.drop_orphan_image_rows() == 0
+        # job queue: unique keys, claims passing over a job another worker is locking, leases
+        assert repo.enqueue_job("jobs.prune", "{}", 0, 0, 30, 3, "k") == 1
+        assert repo.enqueue_job("jobs.prune", "{}", 0, 0, 30, 3, "k") is None
+        assert repo.enqueue_job("jobs.prune", "{}", 5, 0, 30, 3) == 3
+        other = repo.connect()
+        other.execute("SELECT id FROM jobs WHERE id = 3 FOR UPDATE")
+        assert repo.claim_job("w", now=100)["id"] == 1
+        other.rollback()
+        other.close()
+        job = repo.claim_job("w", now=100)
+        assert (job["id"], job["attempts"], job["locked_until"]) == (3, 1, 130)
+        assert repo.claim_job("x", now=131)["worker"] == "x" and not repo.finish_job(3, "w")
+        assert repo.finish_job(3, "x") and not repo.fail_job(1, "w", "boom", retry_at=200)  # its lease ran out too
+        assert [(r["kind"], r["status"], r["due"]) for r in repo.job_stats(0, now=150)["depth"]] == \
+            [("jobs.prune", "queued", 1)]
+        # admin feed: events written with the orders, ids visible in commit order
+        assert [(r["kind"], r["action"]) for r in repo.admin_events(0, limit=2)] == \
+            [("orders", "created"), ("requests", "created")]
+        latest = repo.latest_admin_event()
+        other = repo.connect()
+        repo._record_events(other, [("orders", legacy, "status", "processing", {})])  # takes the feed lock
+
+        def place():
+            repo.create_request(product, "كريم", "0555", "سطيف")
+            repo.release()
+        writer = threading.Thread(target=place)
+        writer.start()
+        writer.join(0.5)
+        assert writer.is_alive() and repo.admin_events(latest) == []  # waits for the first writer
+        other.commit()
+        other.close()
+        writer.join()
+        assert [r["kind"] for r in repo.admin_events(latest)] == ["orders", "requests"]
+        assert repo.prune_admin_events(0) == 0
+
+        # a failed statement must not poison the pooled connection for the next request
+        try:
+            repo.connection().execute("SELECT * FROM missing_table")
+        except psycopg2.Error:
+            pass
+        repo.release()
+        assert repo.get_product(1)["id"] == 1
+        repo.release()
+        repo.pool.closeall()
+        print("✓ PostgreSQL repository")
+
+        # replica routing: reads use their own read-only pool
+        repo = open_repository(url, replica=url)
+        read_conn = repo.read_connection()
+        assert read_conn is not repo.connection()
+        with repo.read_snapshot():
+            rows, total = repo.search_products()
+            assert total == 1 and len(repo.list_orders()) == 2
+        try:
+            read_conn.execute("DELETE FROM products")
+            raise AssertionError("replica sessions must be read-only")
+        except psycopg2.Error:
+            pass
+        repo.release()
+        repo.pin_to_primary()
+        assert repo.read_connection() is repo.connection()
+        repo.release()
+        repo.pool.closeall()
+        repo.replica_pool.closeall()
+        print("✓ PostgreSQL replica routing")
+
+
+def test_query_log_explain():
+    """A failing EXPLAIN of a slow SQLAlchemy statement must not abort the caller's transaction"""
+    if psycopg2 is None:
+        print("⚠ psycopg2 not installed - skipping")
+        return
+    import query_log
+    from sqlalchemy import create_engine, text
+
+    with tempfile.TemporaryDirectory() as tmp:
+        url = _server_url(tmp)
+        if not url:
+            print("⚠ no PostgreSQL available - skipping")
+            return
+        query_log.instrument_sqlalchemy()
+        stats = query_log.stats
+        saved = stats.directory, stats.slow_ms
+        stats.directory, stats.slow_ms = os.path.join(tmp, "query_log"), 0  # every statement is "slow"
+        engine = create_engine(normalize_database_url(url))
+        try:
+            with engine.begin() as conn:
+                conn.execute(text("SET LOCAL work_mem = '8MB'"))  # runs, but can't be EXPLAINed
+                assert conn.execute(text("SELECT current_setting('work_mem')")).scalar() == "8MB"
+            plans = {entry["fingerprint"]: entry["plan"] for entry in stats.entries.values()}
+            assert plans["SET LOCAL work_mem = ?"] is None
+            assert plans["SELECT current_setting(?)"] and "Result" in plans["SELECT current_setting(?)"][0]
+        finally:
+            engine.dispose()
+            stats.directory, stats.slow_ms = saved
+            stats.entries.clear()
+        print("✓ SQLAlchemy EXPLAINs run in a savepoint")
+
+
+def test_migrate_sqlite_to_postgres():
+    if psycopg2 is None:
+        print("⚠ psycopg2 not installed - skipping")
+        return
+    from migrate_to_postgres import migrate
+
+    with tempfile.TemporaryDirectory() as tmp:
+        url = _server_url(tmp)
+        if not url:
+            print("⚠ no PostgreSQL available - skipping")
+            return
+        _reset(url)
+
+        sqlite_path = os.path.join(tmp, "source.db")
+        Repository(sqlite_path).init_schema()
+        src = sqlite3.connect(sqlite_path)
+        src.execute("INSERT INTO categories (name) VALUES ('أجهزة منزلية')")
+        src.executemany('INSERT INTO products (name, price, "desc", category_id) VALUES (?, ?, ?, 1)',
+                        [(f"منتج {i}", i, 'وصف "مقتبس", مع فاصلة' if i % 2 else None) for i in range(1, 51)])
+        src.executemany("INSERT INTO product_images (product_id, image_path, is_primary) VALUES (?, ?, ?)",
+                        [(i, f"uploads/{i}.jpg", True) for i in range(1, 51)])
+        src.executemany("INSERT INTO orders (product_id, quantity, first_name, total_price, created_at) "
+                        "VALUES (?, 1, 'a', 1, '2024-01-01 10:00:00')", [(i % 50 + 1,) for i in range(500)])
+        # orphans left behind by product deletes made before foreign keys were enforced
+        src.execute("INSERT INTO orders (product_id, quantity, first_name) VALUES (999, 1, 'orphan')")
+        src.execute("INSERT INTO product_requests (product_id, user_name, phone, state) VALUES (999, 'x', '1', 's')")
+        src.execute("UPDATE orders SET status = 'delivered', status_code = 3 WHERE id <= 10")
+        src.commit()
+        src.close()
+        Repository(sqlite_path).archive("orders", "2024-06-01", ["delivered"])
+
+        results = migrate(sqlite_path, url, batch_size=64, verbose=False)
+        assert results["products"] == 50 and results["orders"] == 491 and results["product_requests"] == 0
+        assert results["orders_2024_01"] == 10
+
+        repo = open_repository(url)
+        conn = repo.connection()
+        assert conn.execute("SELECT COUNT(*) FROM orders WHERE product_id IS NULL").fetchone()[0] == 1
+        assert repo.get_product(1)["desc"] == 'وصف "مقتبس", مع فاصلة'
+        assert repo.get_product(2)["desc"] is None
+        assert repo.get_product_images(3)[0]["is_primary"] is True
+        # sequences continue after the copied ids
+        order_id = repo.create_order(repo.get_product(1), 1, "b", "1", "s")
+        assert order_id == 502
+        assert repo.get_category(1)["product_count"] == 50
+        assert len(repo.list_orders("2024-01-01", "2024-01-01")) == 500
+        assert sum(r["order_count"] for r in repo.revenue_by_state("2024-01-01", "2024-01-01")) == 500
+        repo.release()
+        repo.pool.closeall()
+        print("✓ SQLite -> PostgreSQL migration")
+
+
+if __name__ == "__main__":
+    test_urls()
+    test_translate()
+    test_postgres_repository()
+    test_query_log_explain()
+    test_migrate_sqlite_to_postgres()
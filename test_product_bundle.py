@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Product Page Bundle Test Script
+Checks that a product page bundle holds the product (with its category
+name), its images and related products (most often ordered together first,
+then the same category), that a fresh bundle is served from its stored row,
+and that editing or deleting a product drops every bundle that shows it,
+even while reads go to a lagging replica.
+"""
+
+import os
+import tempfile
+
+from repository import Repository
+
+
+def test_product_bundle():
+    """Test building, serving and invalidating product page bundles"""
+
+    print("=== Product Page Bundle Test ===")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        repo = Repository(os.path.join(tmp, "test.db"))
+        repo.init_schema()
+        with repo.transaction() as conn:
+            conn.execute("INSERT INTO categories (name) VALUES ('هواتف')")
+            conn.executemany("INSERT INTO products (name, price, category_id, image) VALUES (?, ?, ?, ?)",
+                             [("هاتف", 1000, 1, "uploads/phone.jpg"), ("غلاف", 50, None, None),
+                              ("شاحن", 80, None, None), ("هاتف 2", 2000, 1, None), ("هاتف 3", 3000, 1, None),
+                              ("بدون طلبات", 10, None, None)])
+            conn.executemany("INSERT INTO product_images (product_id, image_path, is_primary) VALUES (?, ?, ?)",
+                             [(1, "uploads/phone-back.jpg", 0), (1, "uploads/phone.jpg", 1)])
+        product = {row["id"]: row for row in repo.get_products(range(1, 7))}
+        for lines in ([1, 2, 3], [1, 2], [2, 3], [1, 3, 2]):
+            repo.place_order([(product[pid], 1) for pid in lines], "علي", "0550000000", "الجزائر")
+        repo.place_order([(product[3], 1)], "علي", "0550000000", "الجزائر")
+
+        bundle = repo.product_bundle(1)
+        assert bundle["product"]["name"] == "هاتف" and bundle["product"]["category_name"] == "هواتف"
+        assert [image["image_path"] for image in bundle["images"]] == ["uploads/phone.jpg", "uploads/phone-back.jpg"]
+        # bought together three times, twice, then the newest phones of the category
+        assert [item["id"] for item in bundle["related"]] == [2, 3, 5, 4]
+        assert set(bundle["related"][0]) == {"id", "name", "price", "image", "image_width", "image_height",
+                                             "image_placeholder"}
+        assert repo.product_bundle(6)["related"] == [] and repo.product_bundle(99) is None
+        print("✓ Bundles hold the product, its images and related products")
+
+        with repo.transaction() as conn:
+            conn.execute("UPDATE products SET name = 'هاتف جديد' WHERE id = 1")
+            conn.execute("UPDATE products SET price = 60 WHERE id = 2")
+        assert repo.product_bundle(1)["product"]["name"] == "هاتف"  # stored row, no rebuild
+        assert repo.product_bundle(1, max_age=0)["product"]["name"] == "هاتف جديد"  # stale: rebuilt
+        print("✓ Fresh bundles are served from their stored row")
+
+        repo.product_bundle(3)
+        repo.product_bundle(4)
+        repo.invalidate_product_bundles(2)
+        repo.delete_product(2)
+        stored = {row["product_id"] for row in repo.connection().execute("SELECT product_id FROM product_bundles")}
+        assert stored == {4, 6}  # 1 and 3 listed product 2
+        assert [item["id"] for item in repo.product_bundle(1)["related"]] == [3, 5, 4]
+        repo.invalidate_product_bundles()
+        assert repo.connection().execute("SELECT COUNT(*) FROM product_bundles").fetchone()[0] == 0
+
+        # category changes reach no single product: the apps drop every bundle
+        repo.product_bundle(4)
+        with repo.transaction() as conn:
+            conn.execute("UPDATE categories SET name = 'هواتف ذكية' WHERE id = 1")
+            conn.execute("INSERT INTO products (name, price, category_id) VALUES ('هاتف 4', 4000, 1)")
+        assert repo.product_bundle(4)["product"]["category_name"] == "هواتف"  # until dropped
+        repo.invalidate_product_bundles()
+        bundle = repo.product_bundle(4)
+        assert bundle["product"]["category_name"] == "هواتف ذكية"
+        assert [item["id"] for item in bundle["related"]][:1] == [7]  # the newest of the category
+        repo.close()
+        print("✓ Editing or deleting a product drops the bundles that show it")
+
+        # behind a lagging replica, an edit shows up on the next page view
+        repo = Repository(os.path.join(tmp, "test.db"), replica_path=os.path.join(tmp, "replica.db"))
+        repo.product_bundle(1)
+        repo.refresh_replica()
+        with repo.transaction() as conn:
+            conn.execute("UPDATE products SET name = 'هاتف أحدث' WHERE id = 1")
+        repo.invalidate_product_bundles(1)
+        assert repo.product_bundle(1)["product"]["name"] == "هاتف أحدث"
+        repo.close()
+        print("✓ Bundles are read from the primary, not a lagging replica")
+
+    print("\n🎉 Product page bundle tests passed!")
+
+
+if __name__ == "__main__":
+    test_product_bundle()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Request Profiling Test Script
+Checks that requests are profiled on an admin's X-Profile header (and never
+on anyone else's) or when sampled, that sampled profiles are only kept above
+PROFILE_SLOW_MS, that the store keeps the newest PROFILE_KEEP profiles, that
+both modes produce collapsed stacks naming the slow code, and that the
+/admin/profiles pages are admin-only.
+"""
+
+import os
+import time
+import tempfile
+from unittest import mock
+
+from profiling import init_profiling
+from testing import admin_app
+
+
+def _busy():
+    deadline = time.perf_counter() + 0.05
+    while time.perf_counter() < deadline:
+        sum(range(1000))
+
+
+def _app(directory, **env):
+    settings = {"PROFILE_DIR": directory, "PROFILE_SAMPLE_RATE": "0", "PROFILE_SLOW_MS": "500",
+                "PROFILE_INTERVAL_MS": "1", "PROFILE_KEEP": "50"}
+    settings.update(env)
+    with mock.patch.dict(os.environ, settings):
+        app = admin_app()
+        store = init_profiling(app)
+
+    def slow():
+        _busy()
+        return "done"
+    app.add_url_rule("/slow", "slow", slow)
+    return app, store
+
+
+def _folded(text):
+    """{stack: count} of a collapsed-stack file, checking every line's format"""
+    stacks = {}
+    for line in text.splitlines():
+        stack, count = line.rsplit(" ", 1)
+        assert int(count) > 0 and stack
+        stacks[stack] = int(count)
+    return stacks
+
+
+def test_profiling():
+    """Test profile triggers, storage, retention and the admin pages"""
+
+    print("=== Request Profiling Test ===")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app, store = _app(os.path.join(tmp, "on-demand"))
+        client = app.test_client()
+
+        response = client.get("/slow", headers={"X-Profile": "cprofile"})
+        assert response.status_code == 200 and "X-Profile-Id" not in response.headers
+        assert store.entries() == []
+        print("✓ X-Profile is ignored without an admin session")
+
+        client.get("/test-login")
+        response = client.get("/slow?x=1", headers={"X-Profile": "cprofile"})
+        profile_id = response.headers["X-Profile-Id"]
+        [entry] = store.entries()
+        assert entry["id"] == profile_id and entry["mode"] == "cprofile" and entry["files"] == ["folded", "prof"]
+        assert (entry["route"], entry["endpoint"], entry["path"]) == ("/slow", "slow", "/slow?x=1")
+        assert entry["status"] == 200 and entry["duration_ms"] >= 50
+        stacks = _folded(open(store.path_for(profile_id, "folded"), encoding="utf-8").read())
+        assert any(stack.split(";")[-1].startswith("test_profiling.py:_busy:") for stack in stacks)
+        assert os.path.getsize(store.path_for(profile_id, "prof")) > 0
+
+        response = client.get("/slow", headers={"X-Profile": "sample"})
+        sampled = response.headers["X-Profile-Id"]
+        assert store.entries()[-1]["mode"] == "sample" and store.entries()[-1]["files"] == ["folded"]
+        stacks = _folded(open(store.path_for(sampled, "folded"), encoding="utf-8").read())
+        assert any("test_profiling.py:_busy:" in stack for stack in stacks)
+        assert store.path_for(sampled, "prof") is None
+        print("✓ Admin X-Profile requests are stored as collapsed stacks (and .prof for cProfile)")
+
+        page = client.get("/admin/profiles")
+        assert page.status_code == 200 and profile_id in page.get_data(as_text=True)
+        download = client.get(f"/admin/profiles/{profile_id}.folded")
+        assert download.status_code == 200 and download.mimetype == "text/plain"
+        assert "attachment" in download.headers["Content-Disposition"]
+        _folded(download.get_data(as_text=True))
+        assert client.get(f"/admin/profiles/{profile_id}.prof").status_code == 200
+        assert client.get(f"/admin/profiles/{sampled}.prof").status_code == 404
+        assert client.get("/admin/profiles/nope.folded").status_code == 404
+        anonymous = app.test_client()
+        for path in ("/admin/profiles", f"/admin/profiles/{profile_id}.folded"):
+            response = anonymous.get(path)
+            assert response.status_code == 302 and response.headers["Location"].endswith("/login")
+        print("✓ /admin/profiles lists and serves profiles to admins only")
+
+        app, store = _app(os.path.join(tmp, "sampled"), PROFILE_SAMPLE_RATE="1", PROFILE_SLOW_MS="100000")
+        client = app.test_client()
+        assert "X-Profile-Id" not in client.get("/slow").headers
+        assert store.entries() == []
+        app, store = _app(os.path.join(tmp, "kept"), PROFILE_SAMPLE_RATE="1", PROFILE_SLOW_MS="10",
+                          PROFILE_KEEP="3")
+        client = app.test_client()
+        assert "X-Profile-Id" not in client.get("/static/missing.css").headers  # static files are skipped
+        ids = [client.get("/slow").headers["X-Profile-Id"] for _ in range(5)]
+        assert [entry["id"] for entry in store.entries()] == ids[2:]
+        assert all(entry["mode"] == "sample" for entry in store.entries())
+        assert sorted(os.listdir(store.directory)) == sorted([f"{i}.folded" for i in ids[2:]] + ["index.jsonl"])
+        print("✓ Sampled requests are kept above PROFILE_SLOW_MS; only the newest PROFILE_KEEP stay")
+
+    print("\n🎉 Request profiling tests passed!")
+
+
+if __name__ == "__main__":
+    test_profiling()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Query Log Test Script
+Checks statement fingerprints, that sqlite3 and SQLAlchemy statements are
+timed and counted per fingerprint (fetch time included for sqlite3), that
+plans are captured only for statements slower than SLOW_QUERY_MS, the
+per-request Server-Timing header sent only to admins, and the admin-only /admin/queries top-N
+page with its JSON form and reset.
+"""
+
+import os
+import time
+import sqlite3
+import tempfile
+from unittest import mock
+
+import query_log
+from query_log import fingerprint, instrument_sqlalchemy, init_query_log, InstrumentedConnection
+from testing import admin_app
+
+
+def _pause(ms):
+    time.sleep(ms / 1000)
+    return ms
+
+
+def _entry(sql):
+    return query_log.stats.entries.get(fingerprint(sql))
+
+
+def test_fingerprint():
+    assert fingerprint("SELECT * FROM products WHERE id = 42 AND name = 'it''s' -- trailing\n") == \
+        "SELECT * FROM products WHERE id = ? AND name = ?"
+    assert fingerprint("SELECT /* hint */ id FROM t WHERE id IN (?, ?,  ?) AND price > 9.5") == \
+        "SELECT id FROM t WHERE id IN (?...) AND price > ?"
+    assert fingerprint("INSERT INTO t (a, b) VALUES (?, ?), (?, ?), (?, ?)") == "INSERT INTO t (a, b) VALUES (?, ?)..."
+    assert fingerprint("SELECT 1\n\n  FROM   t") == "SELECT ? FROM t"
+    print("✓ Fingerprints group statements that differ only in literals")
+
+
+def test_query_log():
+    """Test statement timing, plans and the /admin/queries page"""
+
+    print("=== Query Log Test ===")
+
+    stats = query_log.stats
+    saved = stats.directory, stats.slow_ms
+    with tempfile.TemporaryDirectory() as tmp:
+        stats.directory, stats.slow_ms = os.path.join(tmp, "query_log"), 20
+        stats.reset()
+        try:
+            db_path = os.path.join(tmp, "test.db")
+            conn = sqlite3.connect(db_path, factory=InstrumentedConnection)
+            conn.create_function("pause", 1, _pause)
+            conn.execute("CREATE TABLE products (id INTEGER PRIMARY KEY, name TEXT)")
+            conn.executemany("INSERT INTO products (name) VALUES (?)", [(f"p{i}",) for i in range(5)])
+            conn.commit()
+
+            stats.begin_request()
+            for pid in (1, 2, 3):
+                assert conn.execute(f"SELECT name FROM products WHERE id = {pid}").fetchone()[0] == f"p{pid - 1}"
+            entry = _entry("SELECT name FROM products WHERE id = 1")
+            assert entry["count"] == 3 and entry["slow_count"] == 0 and entry["plan"] is None
+            assert 0 < entry["max_ms"] <= entry["total_ms"] < 20
+            assert _entry("INSERT INTO products (name) VALUES (?)")["count"] == 1
+            assert stats.request_totals()[1] == 3
+            print("✓ sqlite3 statements are timed and counted per fingerprint")
+
+            conn.execute("SELECT pause(30), name FROM products WHERE id = ?", (1,)).fetchall()
+            entry = _entry("SELECT pause(30), name FROM products WHERE id = ?")
+            assert entry["slow_count"] == 1 and entry["max_ms"] >= 30
+            assert any("products" in line for line in entry["plan"])
+            # slow only once the rows are fetched: each row pauses 8 ms
+            cursor = conn.execute("SELECT pause(8) FROM products")
+            assert len(cursor.fetchall()) == 5
+            entry = _entry("SELECT pause(8) FROM products")
+            assert entry["slow_count"] == 1 and entry["max_ms"] >= 40 and entry["plan"]
+            conn.close()
+            print("✓ Plans are captured for statements slower than SLOW_QUERY_MS (fetch included)")
+
+            from sqlalchemy import create_engine, event, text
+            instrument_sqlalchemy()
+            engine = create_engine(f"sqlite:///{db_path}")
+            event.listen(engine, "connect", lambda dbapi_conn, _: dbapi_conn.create_function("pause", 1, _pause))
+            with engine.connect() as sa_conn:
+                assert sa_conn.execute(text("SELECT id FROM products WHERE name = :name"), {"name": "p1"}).scalar() == 2
+                sa_conn.execute(text("SELECT pause(25) FROM products WHERE id = :id"), {"id": 2}).fetchall()
+            fast = _entry("SELECT id FROM products WHERE name = ?")
+            slow = _entry("SELECT pause(25) FROM products WHERE id = ?")
+            assert fast["count"] == 1 and fast["plan"] is None
+            assert slow["slow_count"] == 1 and any("products" in line for line in slow["plan"])
+            engine.dispose()
+            print("✓ SQLAlchemy statements are timed and EXPLAINed the same way")
+
+            app = admin_app()
+            init_query_log(app)
+
+            def products():
+                with sqlite3.connect(db_path, factory=InstrumentedConnection) as db:
+                    db.execute("SELECT name FROM products WHERE id = 4").fetchall()
+                    db.execute("SELECT name FROM products WHERE id = 5").fetchall()
+                return "ok"
+            app.add_url_rule("/products", "products", products)
+            client = app.test_client()
+            assert "Server-Timing" not in client.get("/products").headers
+            admin = app.test_client()
+            admin.get("/test-login")
+            timing = admin.get("/products").headers["Server-Timing"]
+            assert timing.startswith("db;dur=") and timing.endswith('desc="2 queries"')
+            with mock.patch.object(query_log, "PUBLIC_TIMING", True):
+                assert client.get("/products").headers["Server-Timing"].endswith('desc="2 queries"')
+            print("✓ Server-Timing reports each request's DB time and statement count to admins")
+
+            response = client.get("/admin/queries")
+            assert response.status_code == 302 and response.headers["Location"].endswith("/login")
+            assert client.get("/admin/queries?format=json").status_code == 401
+            assert client.post("/admin/queries/reset").status_code == 302
+            assert _entry("SELECT name FROM products WHERE id = 1") is not None  # not reset by anyone
+
+            client.get("/test-login")
+            data = client.get("/admin/queries?format=json&limit=2&sort=count").get_json()
+            assert data["slow_query_ms"] == 20 and len(data["queries"]) == 2
+            assert data["queries"][0]["fingerprint"] == "SELECT name FROM products WHERE id = ?"
+            assert data["queries"][0]["count"] == 9 and data["queries"][0]["count"] >= data["queries"][1]["count"]
+            data = client.get("/admin/queries?format=json&sort=max_ms").get_json()
+            assert [row["max_ms"] for row in data["queries"]] == sorted(
+                (row["max_ms"] for row in data["queries"]), reverse=True)
+            assert data["queries"][0]["fingerprint"] == "SELECT pause(?) FROM products"
+            assert all(abs(row["avg_ms"] - row["total_ms"] / row["count"]) < 1e-9 for row in data["queries"])
+            page = client.get("/admin/queries?sort=bogus")
+            assert page.status_code == 200 and "SELECT pause(?) FROM products" in page.get_data(as_text=True)
+            assert client.post("/admin/queries/reset").status_code == 302
+            assert client.get("/admin/queries?format=json").get_json()["queries"] == []
+            print("✓ /admin/queries ranks the top statements for admins only")
+        finally:
+            stats.directory, stats.slow_ms = saved
+            stats.entries.clear()
+
+    print("\n🎉 Query log tests passed!")
+
+
+if __name__ == "__main__":
+    test_fingerprint()
+    test_query_log()
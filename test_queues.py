@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Work Queue Test Script
+Checks the order/request status workflow: allowed and refused transitions,
+status counters kept in step with the tables, keyset paging through one
+status (legacy rows without a timestamp included), cancelled orders leaving
+the sales rollups, and status codes derived for databases that only had
+the text column.
+"""
+
+import os
+import sqlite3
+import tempfile
+
+from queues import init_queues, decode_cursor
+from repository import Repository
+from testing import admin_app
+from workflow import ORDERS, InvalidTransition
+
+
+def _app(repo):
+    app = admin_app(repo)
+    init_queues(app, repo)
+    return app
+
+
+def _counts_match(repo):
+    stored = {kind: repo.status_counts(kind) for kind in ("orders", "requests")}
+    repo.rebuild_status_counts()
+    return stored == {kind: repo.status_counts(kind) for kind in ("orders", "requests")}
+
+
+def test_queues():
+    """Test the status workflow and work queues"""
+
+    print("=== Work Queue Test ===")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        repo = Repository(os.path.join(tmp, "test.db"))
+        repo.init_schema()
+        with repo.transaction() as conn:
+            conn.execute("INSERT INTO products (name, price) VALUES ('هاتف', 100)")
+        phone = repo.get_product(1)
+        order_ids = [repo.create_order(phone, 1, f"زبون {i}", "0550000000", "الجزائر") for i in range(7)]
+
+        assert repo.update_order_status(order_ids[0], "processing") == 1
+        assert repo.update_order_status(order_ids[0], "shipped") == 1
+        assert repo.update_order_status(order_ids[0], "shipped") == 1  # no-op
+        for bad in ("pending", "nope"):
+            try:
+                repo.update_order_status(order_ids[0], bad)
+                raise AssertionError(f"shipped -> {bad} should be refused")
+            except InvalidTransition:
+                assert bad == "pending"
+            except ValueError:
+                assert bad == "nope"
+        assert repo.get_order(order_ids[0])["status"] == "shipped"
+        assert repo.update_order_status(9999, "processing") == 0
+        request_id, _ = repo.create_request(phone, "كريم", "0550000001", "سطيف")
+        assert repo.update_request_status(request_id, "completed") == 1
+        try:
+            repo.update_request_status(request_id, "pending")
+            raise AssertionError("completed requests are final")
+        except InvalidTransition:
+            pass
+        counts = repo.status_counts("orders")
+        assert counts == {"pending": 6, "processing": 0, "shipped": 1, "delivered": 0, "cancelled": 0}
+        assert repo.status_counts("requests")["completed"] == 1
+        assert _counts_match(repo)
+        print("✓ Transitions validated, counters in step")
+
+        day = repo.get_order(order_ids[1])["created_at"][:10]
+        assert repo.update_order_status(order_ids[1], "cancelled") == 1
+        assert [tuple(r)[1:] for r in repo.sales_by_day(day, day)] == [(6, 6, 600.0)]
+        repo.rebuild_rollups()
+        assert [tuple(r)[1:] for r in repo.sales_by_day(day, day)] == [(6, 6, 600.0)]
+        print("✓ Cancelled orders leave the sales rollups")
+
+        # two legacy orders without a timestamp, and a shared timestamp across the rest
+        with repo.transaction() as conn:
+            conn.execute("UPDATE orders SET created_at = NULL WHERE id IN (?, ?)", (order_ids[4], order_ids[6]))
+            conn.execute("UPDATE orders SET created_at = '2024-01-01 10:00:00' WHERE id IN (?, ?)",
+                         (order_ids[2], order_ids[3]))
+        seen, after = [], None
+        while True:
+            page = repo.queue("orders", "pending", after=after, limit=2)
+            seen += [row["id"] for row in page]
+            if len(page) < 2:
+                break
+            after = (page[-1]["created_at"], page[-1]["id"])
+        assert seen == [order_ids[4], order_ids[6], order_ids[2], order_ids[3], order_ids[5]], seen
+        plan = " ".join(str(r[-1]) for r in repo.connection().execute(
+            "EXPLAIN QUERY PLAN SELECT id FROM orders WHERE status_code = 0 AND (created_at, id) > ('a', 1) "
+            "ORDER BY created_at NULLS FIRST, id LIMIT 2"))
+        assert "idx_orders_status_queue" in plan and "TEMP B-TREE" not in plan, plan
+        print("✓ Keyset paging on the queue index")
+
+        client = _app(repo).test_client()
+        assert client.get("/api/queue/orders/pending").status_code == 401
+        client.get("/test-login")
+        data = client.get("/api/queue/orders/pending?limit=3").get_json()
+        assert [r["id"] for r in data["rows"]] == seen[:3] and data["counts"]["pending"] == 5
+        data = client.get(f"/api/queue/orders/pending?limit=3&after={data['next']}").get_json()
+        assert [r["id"] for r in data["rows"]] == seen[3:] and data["next"] is None
+        assert client.get("/api/queue/orders/lost").status_code == 404
+        assert decode_cursor("garbage") is None
+        page = client.get("/admin/queue/orders/pending").data.decode()
+        assert "زبون 2" in page and ORDERS.label("processing") in page
+        client.post(f"/admin/queue/orders/{order_ids[2]}", data={"status": "delivered", "from": "pending"})
+        assert repo.get_order(order_ids[2])["status"] == "pending"
+        client.post(f"/admin/queue/orders/{order_ids[2]}", data={"status": "processing", "from": "pending"})
+        assert repo.get_order(order_ids[2])["status"] == "processing"
+        assert _counts_match(repo)
+        repo.close()
+        print("✓ Queue pages and status changes")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # text statuses only, as written before status_code existed
+        db_path = os.path.join(tmp, "old.db")
+        conn = sqlite3.connect(db_path)
+        conn.execute("CREATE TABLE orders (id INTEGER PRIMARY KEY AUTOINCREMENT, product_id INTEGER, "
+                     "quantity INTEGER, first_name TEXT, phone TEXT, state TEXT, total_price REAL, "
+                     "status TEXT DEFAULT 'pending')")
+        conn.executemany("INSERT INTO orders (product_id, quantity, first_name, status) VALUES (1, 1, 'x', ?)",
+                         [("shipped",), ("delivered",), ("lost in transit",)])
+        conn.commit()
+        conn.close()
+        repo = Repository(db_path)
+        repo.init_schema()
+        rows = repo.connection().execute("SELECT status, status_code FROM orders ORDER BY id").fetchall()
+        assert [tuple(r) for r in rows] == [("shipped", 2), ("delivered", 3), ("pending", 0)]
+        assert repo.status_counts("orders")["shipped"] == 1
+        repo.close()
+        print("✓ Status codes derived on upgrade")
+
+
+if __name__ == "__main__":
+    test_queues()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Co-purchase Recommendations Test Script
+Checks the sparse co-occurrence counts against a plain Python count of
+customers per product pair, that `update` over new orders and requests
+ends up with the same file as a full rebuild, that workers pick up a
+replaced file, and the also-ordered API (deleted products skipped).
+"""
+
+import os
+import random
+import tempfile
+from itertools import combinations
+
+from flask import Flask
+
+import recommend
+from recommend import init_recommendations, AlsoOrdered, build, update
+from repository import Repository
+
+
+def _place(repo, rng, products, phones, count):
+    for _ in range(count):
+        lines = rng.sample(products, rng.randint(1, 3))
+        phone = rng.choice(phones)
+        if rng.random() < 0.7:
+            repo.place_order([(product, 1) for product in lines], "زبون", phone, "الجزائر",
+                             log_request=rng.random() < 0.5)
+        else:
+            repo.create_request(lines[0], "زبون", phone, "وهران")
+
+
+def _expected(repo, k):
+    """{product: [(neighbour, customers)]} counted pair by pair"""
+    taken = {}
+    for phone, product in repo.customer_products(repo.purchase_watermarks()):
+        taken.setdefault(phone, set()).add(product)
+    together = {}
+    for products in taken.values():
+        for a, b in combinations(sorted(products), 2):
+            together[(a, b)] = together.get((a, b), 0) + 1
+            together[(b, a)] = together.get((b, a), 0) + 1
+    best = {}
+    for (a, b), count in together.items():
+        best.setdefault(a, []).append((b, count))
+    return {a: sorted(pairs, key=lambda pair: (-pair[1], -pair[0]))[:k] for a, pairs in best.items()}
+
+
+def test_recommendations():
+    """Test building, updating and serving co-purchase recommendations"""
+
+    print("=== Co-purchase Recommendations Test ===")
+    if recommend.sparse is None:
+        print("⚠ NumPy/SciPy not installed - skipping")
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        repo = Repository(os.path.join(tmp, "test.db"))
+        repo.init_schema()
+        with repo.transaction() as conn:
+            conn.executemany("INSERT INTO products (name, price) VALUES (?, ?)",
+                             [(f"منتج {i}", 100 * i) for i in range(1, 31)])
+        products = list(repo.get_products(range(1, 31)))
+        phones = [f"05500000{i:02}" for i in range(40)]
+        rng = random.Random(3)
+        _place(repo, rng, products, phones, 150)
+
+        full, incremental = os.path.join(tmp, "full"), os.path.join(tmp, "incremental")
+        customers, _ = build(repo, incremental, k=5)
+        assert customers == 40
+        served = AlsoOrdered(os.path.join(incremental, recommend.TOPK_FILE), check_every=0)
+        expected = _expected(repo, 5)
+        assert all(served.neighbours(pid, 5) == expected.get(pid, []) for pid in range(1, 32))
+        print("✓ Sparse counts match a pair-by-pair count")
+
+        # returning customers (and a few new ones) order again; archived orders still count
+        _place(repo, rng, products, phones + ["0770000000", "0770000001"], 60)
+        with repo.transaction() as conn:
+            conn.execute("UPDATE orders SET status = 'delivered', created_at = '2024-01-10 10:00:00' WHERE id <= 20")
+        repo.archive("orders", "2024-06-01", ["delivered"])
+        touched, _ = update(repo, incremental, k=5)
+        assert 0 < touched <= 42
+        build(repo, full, k=5)
+        with open(os.path.join(full, recommend.TOPK_FILE), "rb") as a, \
+                open(os.path.join(incremental, recommend.TOPK_FILE), "rb") as b:
+            assert a.read() == b.read()
+        assert update(repo, incremental, k=5)[0] == 0  # nothing new
+        assert all(served.neighbours(pid, 5) == _expected(repo, 5).get(pid, []) for pid in range(1, 32))
+        print("✓ Incremental updates equal a full rebuild and are picked up by workers")
+
+        app = Flask(__name__)
+        repo.init_app(app)
+        recommendations = init_recommendations(app, repo, directory=full, check_every=0)
+        client = app.test_client()
+        ranked = [pid for pid, _count in _expected(repo, 5)[1]]
+        data = client.get("/api/products/1/also-ordered?limit=5").get_json()
+        assert [row["id"] for row in data["rows"]] == ranked and data["rows"][0]["customers"] > 0
+        repo.delete_product(ranked[0])
+        assert [row["id"] for row in recommendations.products(1, limit=5)] == ranked[1:]
+        assert client.get("/api/products/999/also-ordered").get_json()["rows"] == []
+        assert init_recommendations(Flask(__name__), repo, directory=os.path.join(tmp, "none")).products(1) == []
+        repo.close()
+        print("✓ The API lists neighbours in order and skips deleted products")
+
+    print("\n🎉 Co-purchase recommendation tests passed!")
+
+
+if __name__ == "__main__":
+    test_recommendations()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Repository Test Script
+Tests the shared data-access layer against a throwaway SQLite database,
+including upgrading a database created by an older schema.
+"""
+
+import os
+import sqlite3
+import tempfile
+
+from repository import Repository
+
+
+def test_repository():
+    """Test schema creation and the hot queries"""
+
+    print("=== Repository Test ===")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        repo = Repository(os.path.join(tmp, "test.db"))
+        repo.init_schema()
+        print("✓ Schema created")
+
+        conn = repo.connection()
+        assert conn is repo.connection(), "connection should be reused within a thread"
+        with conn:
+            conn.execute("INSERT INTO categories (name) VALUES ('إلكترونيات')")
+            conn.execute("INSERT INTO products (name, price, desc, category_id) VALUES ('هاتف', 100, 'ذكي', 1)")
+            conn.execute("INSERT INTO products (name, price, desc) VALUES ('ساعة', 50, 'هاتف قديم')")
+            conn.execute("INSERT INTO product_images (product_id, image_path, is_primary) VALUES (1, 'b.jpg', 0)")
+            conn.execute("INSERT INTO product_images (product_id, image_path, is_primary) VALUES (1, 'a.jpg', 1)")
+
+        assert [p["name"] for p in repo.list_products()] == ["ساعة", "هاتف"]
+        assert [p["name"] for p in repo.list_products(limit=1, offset=1)] == ["هاتف"]
+        assert [i["image_path"] for i in repo.get_product_images(1)] == ["a.jpg", "b.jpg"]
+        print("✓ Product queries")
+
+        # search + category must not match the unrelated product through the OR
+        rows, total = repo.search_products("هاتف", 1)
+        assert [r["name"] for r in rows] == ["هاتف"] and total == 1
+        rows, total = repo.search_products("هاتف", sort_by="price; DROP TABLE products", sort_order="ASC")
+        assert total == 2 and rows[0]["name"] == "ساعة"
+        print("✓ Admin search")
+
+        product = repo.get_product(1)
+        order_id = repo.create_order(product, 3, "أحمد", "0555", "الجزائر", last_name="علي", log_request=True)
+        order = repo.get_order(order_id)
+        assert order["product_name"] == "هاتف" and order["total_price"] == 300
+        assert order["status"] == "pending" and order["created_at"]
+        requests = repo.list_requests()
+        assert len(requests) == 1 and requests[0]["status"] == "ordered"
+        assert requests[0]["user_name"] == "أحمد علي"
+        print("✓ Order written with its product request")
+
+        # multi-product order: prices are snapshotted, totals computed once
+        watch = repo.get_product(2)
+        order_id = repo.place_order([(product, 1), (watch, 2), (product, 1)], "ليلى", "0777", "عنابة",
+                                    log_request=True)
+        with conn:
+            conn.execute("UPDATE products SET price = 999 WHERE id = 1")
+        order = repo.get_order(order_id)
+        assert order["total_price"] == 300 and order["quantity"] == 4 and order["item_count"] == 2
+        assert order["product_name"] == "هاتف، ساعة"
+        items = repo.get_order_items(order_id)
+        assert [(i["product_name"], i["unit_price"], i["quantity"]) for i in items] == \
+            [("هاتف", 100, 2), ("ساعة", 50, 2)]
+        assert [o["total_price"] for o in repo.list_orders()] == [300, 300]
+        assert len(repo.list_requests()) == 3
+        try:
+            repo.place_order([], "x", "1", "s")
+            raise AssertionError("empty orders must be rejected")
+        except ValueError:
+            pass
+        print("✓ Multi-product order with price snapshots")
+
+        request_id, total_price = repo.create_request(product, "سارة", "0666", "وهران", quantity=2)
+        assert total_price == 200
+        assert repo.update_request_status(request_id, "approved") == 1
+        assert repo.update_request_status(9999, "approved") == 0
+        assert not conn.in_transaction
+        print("✓ Product requests")
+        repo.close()
+
+
+def test_migrate_old_schema():
+    """Databases created before orders had status/created_at get the new columns"""
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "old.db")
+        old = sqlite3.connect(path)
+        old.execute("CREATE TABLE products (id INTEGER PRIMARY KEY, name TEXT, price REAL, desc TEXT, image TEXT)")
+        old.execute("CREATE TABLE orders (id INTEGER PRIMARY KEY, product_id INTEGER, quantity INTEGER, "
+                    "first_name TEXT, last_name TEXT, state TEXT, phone TEXT, address TEXT, notes TEXT, "
+                    "total_price REAL)")
+        old.execute("INSERT INTO products (name, price) VALUES ('قديم', 10)")
+        old.execute("INSERT INTO orders (product_id, quantity, first_name, total_price) VALUES (1, 3, 'b', 24)")
+        old.commit()
+        old.close()
+
+        repo = Repository(path)
+        repo.init_schema()
+        columns = {row["name"] for row in repo.connection().execute("PRAGMA table_info(orders)")}
+        assert {"user_id", "email", "status", "created_at"} <= columns
+        order_id = repo.create_order(repo.get_product(1), 1, "a", "1", "s")
+        assert repo.get_order(order_id)["created_at"]
+        # existing orders get a line priced at what they were charged
+        assert repo.get_order(1)["product_name"] == "قديم"
+        item = repo.get_order_items(1)[0]
+        assert item["unit_price"] == 8 and item["quantity"] == 3 and item["line_total"] == 24
+        repo.migrate()
+        assert len(repo.get_order_items(1)) == 1
+        print("✓ Old schema migrated")
+        repo.close()
+
+
+def test_read_replica_routing():
+    """Reads go to the snapshot replica; a client that just wrote reads the primary"""
+    from flask import Flask
+
+    with tempfile.TemporaryDirectory() as tmp:
+        repo = Repository(os.path.join(tmp, "primary.db"), replica_path=os.path.join(tmp, "replica.db"))
+        repo.init_schema()
+        # no snapshot yet: reads fall back to the primary
+        assert repo.read_connection() is repo.connection()
+        with repo.transaction() as conn:
+            conn.execute("INSERT INTO products (name, price) VALUES ('قديم', 10)")
+        repo.refresh_replica()
+
+        read_conn = repo.read_connection()
+        assert read_conn is not repo.connection()
+        try:
+            read_conn.execute("DELETE FROM products")
+            raise AssertionError("replica connection must be read-only")
+        except sqlite3.OperationalError:
+            pass
+
+        app = Flask(__name__)
+        app.secret_key = "test"
+        repo.init_app(app, refresh_seconds=0)
+
+        @app.route("/products", methods=["GET", "POST"])
+        def products():
+            if app.config.get("WRITE"):
+                with repo.transaction() as conn:
+                    conn.execute("INSERT INTO products (name, price) VALUES ('جديد', 20)")
+            return ",".join(p["name"] for p in repo.list_products())
+
+        client = app.test_client()
+        assert client.get("/products").data.decode() == "قديم"
+        app.config["WRITE"] = True
+        client.post("/products")
+        app.config["WRITE"] = False
+        # the writer sees its product right away, other clients once the snapshot refreshes
+        assert client.get("/products").data.decode() == "جديد,قديم"
+        assert app.test_client().get("/products").data.decode() == "قديم"
+        repo.refresh_replica()
+        assert app.test_client().get("/products").data.decode() == "جديد,قديم"
+        repo.close()
+        print("✓ Read replica routing with read-your-writes")
+
+
+if __name__ == "__main__":
+    test_repository()
+    test_migrate_old_schema()
+    test_read_replica_routing()
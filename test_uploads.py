@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Image Upload Test Script
+Checks content sniffing and pixel-size limits for every accepted format,
+that uploads are streamed into temporary files in the uploads folder and
+published under content-hashed names (no leftovers), and that the per-file
+and per-request size limits answer 413 (a flash + redirect for pages).
+"""
+
+import io
+import os
+import base64
+import struct
+import tempfile
+
+from flask import Flask, request, jsonify
+
+import uploads
+from uploads import init_uploads, check_image, sniff, describe, UploadPart, UploadRejected
+
+
+def png(width, height, extra=b""):
+    return b"\x89PNG\r\n\x1a\n" + struct.pack(">I", 13) + b"IHDR" + struct.pack(">II", width, height) + \
+        b"\x08\x02\x00\x00\x00" + extra
+
+
+def jpeg(width, height):
+    app0 = b"\xff\xe0" + struct.pack(">H", 16) + b"JFIF\x00" + b"\x00" * 9
+    sof0 = b"\xff\xc0" + struct.pack(">HBHHB", 11, 8, height, width, 1) + b"\x01\x11\x00"
+    return b"\xff\xd8" + app0 + sof0 + b"\xff\xda" + b"\x00" * 16 + b"\xff\xd9"
+
+
+def gif(width, height):
+    return b"GIF89a" + struct.pack("<HH", width, height) + b"\x00" * 8
+
+
+def webp(width, height):
+    body = b"VP8X" + struct.pack("<I", 10) + b"\x00" * 4 + \
+        (width - 1).to_bytes(3, "little") + (height - 1).to_bytes(3, "little")
+    return b"RIFF" + struct.pack("<I", len(body) + 4) + b"WEBP" + body
+
+
+def _app(tmp):
+    app = Flask(__name__)
+    app.secret_key = "test"
+    uploads = init_uploads(app, tmp)
+    app.add_url_rule("/", "index", lambda: "ok")
+
+    def upload():
+        files = request.files.getlist("images")
+        streamed = all(isinstance(f.stream, UploadPart) for f in files if f.filename)
+        saved, errors = uploads.save(files)
+        return jsonify({"saved": [image.path for image in saved], "sizes": [image[1:3] for image in saved],
+                        "errors": errors, "streamed": streamed})
+
+    app.add_url_rule("/admin/upload", "upload", upload, methods=["POST"])
+    app.add_url_rule("/api/upload", "api_upload", upload, methods=["POST"])
+    return app
+
+
+def test_uploads():
+    """Test image sniffing, streaming saves and size limits"""
+
+    print("=== Image Upload Test ===")
+
+    for data, expected in ((png(640, 480), ("png", 640, 480)), (jpeg(1200, 800), ("jpeg", 1200, 800)),
+                           (gif(32, 16), ("gif", 32, 16)), (webp(3000, 2000), ("webp", 3000, 2000))):
+        assert check_image(io.BytesIO(data)) == expected
+    assert sniff(io.BytesIO(b"<?php echo 1; ?>")) is None
+    for bomb in (png(50000, 50000), png(20000, 10), gif(9000, 9000)):
+        try:
+            check_image(io.BytesIO(bomb))
+            raise AssertionError("oversized images must be refused")
+        except UploadRejected:
+            pass
+    print("✓ Types come from magic bytes; oversized images are refused unread")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = _app(tmp)
+        client = app.test_client()
+        photo = png(800, 600, b"\x00" * 300_000)
+        response = client.post("/admin/upload", content_type="multipart/form-data", data={"images": [
+            (io.BytesIO(photo), "صورة المنتج.jpg"), (io.BytesIO(jpeg(100, 100)), "front.jpeg"),
+            (io.BytesIO(b"MZ\x90\x00 not an image"), "shell.png"), (io.BytesIO(photo), "copy.png"),
+            (io.BytesIO(b""), "")]})
+        data = response.get_json()
+        assert data["streamed"] and data["errors"] == ["shell.png: نوع الصورة غير مدعوم"]
+        assert len(data["saved"]) == 3 and data["saved"][0].endswith(".png")  # named by content, not extension
+        assert data["saved"][1].startswith("uploads/front-") and data["saved"][1].endswith(".jpg")
+        assert data["saved"][0].split("-")[-1] == data["saved"][2].split("-")[-1]  # same bytes, same hash
+        assert data["sizes"] == [[800, 600], [100, 100], [800, 600]]
+        files = sorted(os.listdir(tmp))
+        assert not [name for name in files if name.endswith(".part")] and len(files) == 3
+        with open(os.path.join(tmp, data["saved"][0][len("uploads/"):]), "rb") as f:
+            assert f.read() == photo
+        print("✓ Uploads are streamed to disk and published under content-hashed names")
+
+        app.request_class.max_file_bytes = 100_000
+        response = client.post("/admin/upload", content_type="multipart/form-data",
+                               data={"images": [(io.BytesIO(photo), "big.png")]},
+                               headers={"Referer": "/admin/edit/1"})
+        assert response.status_code == 302 and response.headers["Location"] == "/admin/edit/1"
+        with client.session_transaction() as session:
+            assert "كبير جداً" in session["_flashes"][0][1]
+        app.config["MAX_CONTENT_LENGTH"] = 50_000
+        response = client.post("/api/upload", content_type="multipart/form-data",
+                               data={"images": [(io.BytesIO(photo[:60_000]), "a.png")]})
+        assert response.status_code == 413 and response.get_json()["success"] is False
+        assert len(os.listdir(tmp)) == 3  # nothing left behind by the rejected requests
+        print("✓ Per-file and per-request limits answer 413 without leftovers")
+
+    if uploads.Image is None:
+        print("⚠ Pillow not installed - skipping placeholders")
+    else:
+        # a portrait photo stored landscape with an EXIF rotation, as phones do
+        exif = uploads.Image.Exif()
+        exif[0x0112] = 6
+        photo = io.BytesIO()
+        uploads.Image.new("RGB", (1200, 800), (200, 30, 30)).save(photo, "JPEG", exif=exif)
+        width, height, placeholder = describe(photo, 1200, 800)
+        assert (width, height) == (800, 1200)
+        preview = uploads.Image.open(io.BytesIO(base64.b64decode(placeholder.split(",", 1)[1])))
+        assert placeholder.startswith("data:image/png;base64,") and len(placeholder) < 400
+        assert preview.size == (11, 16) and preview.getpixel((5, 8))[0] > 150
+        assert describe(io.BytesIO(png(640, 480)), 640, 480) == (640, 480, None)  # header only: no preview
+        print("✓ Saved images carry their displayed size and a tiny placeholder")
+
+    print("\n🎉 Image upload tests passed!")
+
+
+if __name__ == "__main__":
+    test_uploads()
@@ -0,0 +1,35 @@
+"""
+Test Helpers
+The bare Flask app the feature test scripts mount their module on: the
+repository, the endpoints the admin templates link to, and /test-login to
+get an admin session.
+"""
+
+import os
+
+from flask import Flask, session
+
+from vendor_assets import register_vendor_assets
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# endpoints the admin templates link to
+STUB_ENDPOINTS = (("/", "index"), ("/admin", "admin"), ("/login", "login"), ("/logout", "logout"))
+
+
+def _login():
+    session["admin"] = True
+    return "ok"
+
+
+def admin_app(repo=None):
+    """A test app on repo (if any); GET /test-login makes the client an admin"""
+    app = Flask(__name__, template_folder=os.path.join(BASE_DIR, "templates"))
+    app.secret_key = "test"
+    register_vendor_assets(app)
+    if repo is not None:
+        repo.init_app(app)
+    for rule, endpoint in STUB_ENDPOINTS:
+        app.add_url_rule(rule, endpoint, lambda endpoint=endpoint: endpoint)
+    app.add_url_rule("/test-login", "test_login", _login)
+    return app
@@ -0,0 +1,281 @@
+"""
+Image Uploads
+Product images are streamed by the multipart parser straight into a
+temporary file inside the uploads folder, in chunks, so no upload is ever
+held in memory and a finished image is published with one atomic rename
+(same filesystem). Limits:
+
+- the whole request: MAX_CONTENT_LENGTH (rejected before reading when the
+  client announces more, cut off when it sends more);
+- each file: UPLOAD_MAX_FILE_BYTES, enforced while the part is written;
+- each image: its type is sniffed from the magic bytes (JPEG, PNG, GIF,
+  WebP; the extension is ignored) and its pixel size read from the header,
+  so decompression bombs (UPLOAD_MAX_PIXELS, UPLOAD_MAX_SIDE) are refused
+  without decoding anything.
+
+The images of a product are checked, hashed and renamed in parallel on a
+per-worker pool of UPLOAD_WORKERS threads. Files are named
+<name>-<content hash>.<sniffed extension>, so uploads never overwrite an
+unrelated image and a re-uploaded image reuses its file.
+
+Each saved image comes with its displayed width and height (so pages can
+reserve its box before it loads) and, made with Pillow, a tiny
+PNG placeholder of at most UPLOAD_PLACEHOLDER_SIDE pixels per side as a
+data URI, shown blurred until the image itself arrives. Making one decodes
+the image, so with JOBS_ENABLED the apps leave that to a background job
+(jobs.py images.measure) and save only the header sizes in the request.
+"""
+
+import io
+import os
+import base64
+import struct
+import hashlib
+import tempfile
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import Request, request, flash, redirect, url_for, jsonify
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.utils import secure_filename
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # in requirements.txt; without it only the header sizes are saved
+    Image = None
+
+MAX_CONTENT_LENGTH = int(os.getenv("MAX_CONTENT_LENGTH", str(16 * 1024 * 1024)))
+MAX_FILE_BYTES = int(os.getenv("UPLOAD_MAX_FILE_BYTES", str(8 * 1024 * 1024)))
+MAX_PIXELS = int(os.getenv("UPLOAD_MAX_PIXELS", str(40_000_000)))
+MAX_SIDE = int(os.getenv("UPLOAD_MAX_SIDE", "12000"))
+WORKERS = int(os.getenv("UPLOAD_WORKERS", "4"))
+PLACEHOLDER_SIDE = int(os.getenv("UPLOAD_PLACEHOLDER_SIDE", "16"))
+CHUNK = 1024 * 1024
+
+EXTENSIONS = {"jpeg": ".jpg", "png": ".png", "gif": ".gif", "webp": ".webp"}
+ROTATED = (5, 6, 7, 8)  # EXIF orientations that swap width and height
+
+SavedImage = namedtuple("SavedImage", "path width height placeholder")
+
+_pool = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="upload")
+
+
+class UploadRejected(ValueError):
+    """An uploaded file that is not an acceptable image; the message is shown to the admin"""
+
+
+class UploadPart:
+    """A file part being received: a temporary file in the uploads folder with a size cap"""
+
+    def __init__(self, directory, limit):
+        self.limit = limit
+        self.size = 0
+        self.published = False
+        fd, self.path = tempfile.mkstemp(prefix=".upload-", suffix=".part", dir=directory)
+        self.file = os.fdopen(fd, "w+b")
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.limit:
+            raise RequestEntityTooLarge(f"file larger than {self.limit} bytes")
+        return self.file.write(data)
+
+    def __getattr__(self, name):  # read/seek/... for FileStorage
+        return getattr(self.file, name)
+
+    def publish(self, target):
+        """Move the finished file to `target` (atomic; an identical file already there is replaced)"""
+        self.file.close()
+        os.replace(self.path, target)
+        self.published = True
+
+    def discard(self):
+        self.file.close()
+        if not self.published:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+
+
+class UploadRequest(Request):
+    """Request whose multipart file parts are written to UploadParts"""
+
+    upload_dir = None
+    max_file_bytes = MAX_FILE_BYTES
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if not filename:  # an empty file input
+            return io.BytesIO()
+        part = UploadPart(self.upload_dir, self.max_file_bytes)
+        self.__dict__.setdefault("upload_parts", []).append(part)
+        return part
+
+
+def _jpeg_size(f):
+    """(width, height) from the first frame header, walking the segments from the start"""
+    f.seek(2)
+    while True:
+        if f.read(1) != b"\xff":
+            return None
+        marker = f.read(1)
+        while marker == b"\xff":  # fill bytes
+            marker = f.read(1)
+        if not marker:
+            return None
+        kind = marker[0]
+        if kind == 0x01 or 0xD0 <= kind <= 0xD8:  # no length field
+            continue
+        length = f.read(2)
+        if len(length) < 2:
+            return None
+        # SOF0-SOF15 carry the frame size (C4 DHT, C8 JPG and CC DAC do not)
+        if 0xC0 <= kind <= 0xCF and kind not in (0xC4, 0xC8, 0xCC):
+            frame = f.read(5)
+            if len(frame) < 5:
+                return None
+            height, width = struct.unpack(">HH", frame[1:5])
+            return width, height
+        if kind == 0xDA:  # image data before any frame header
+            return None
+        f.seek(struct.unpack(">H", length)[0] - 2, os.SEEK_CUR)
+
+
+def sniff(f):
+    """(kind, width, height) of an image file from its magic bytes and header, or None"""
+    f.seek(0)
+    head = f.read(32)
+    if head.startswith(b"\xff\xd8\xff"):
+        size = _jpeg_size(f)
+        return ("jpeg",) + size if size else None
+    if head.startswith(b"\x89PNG\r\n\x1a\n") and head[12:16] == b"IHDR":
+        return ("png",) + struct.unpack(">II", head[16:24])
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return ("gif",) + struct.unpack("<HH", head[6:10])
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        chunk = head[12:16]
+        if chunk == b"VP8 " and head[23:26] == b"\x9d\x01\x2a":
+            f.seek(26)
+            width, height = struct.unpack("<HH", f.read(4))
+            return "webp", width & 0x3FFF, height & 0x3FFF
+        if chunk == b"VP8L" and head[20:21] == b"\x2f":
+            f.seek(21)
+            bits = int.from_bytes(f.read(4), "little")
+            return "webp", (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+        if chunk == b"VP8X":
+            f.seek(24)
+            size = f.read(6)
+            return "webp", int.from_bytes(size[:3], "little") + 1, int.from_bytes(size[3:], "little") + 1
+    return None
+
+
+def check_image(f, max_pixels=MAX_PIXELS, max_side=MAX_SIDE):
+    """The sniffed (kind, width, height); raises UploadRejected for non-images and oversized images"""
+    image = sniff(f)
+    if image is None:
+        raise UploadRejected("نوع الصورة غير مدعوم")
+    _kind, width, height = image
+    if width < 1 or height < 1:
+        raise UploadRejected("تعذرت قراءة أبعاد الصورة")
+    if width > max_side or height > max_side or width * height > max_pixels:
+        raise UploadRejected(f"أبعاد الصورة كبيرة جداً ({width}×{height})")
+    return image
+
+
+def describe(f, width, height, side=PLACEHOLDER_SIDE):
+    """(width, height, placeholder data URI or None) of a checked image as browsers show it"""
+    if Image is None:
+        return width, height, None
+    f.seek(0)
+    try:
+        with Image.open(f) as image:
+            if image.getexif().get(0x0112) in ROTATED:
+                width, height = height, width
+            image.draft("RGB", (side * 8, side * 8))  # JPEG: decode at a fraction of the size
+            preview = ImageOps.exif_transpose(image).convert("RGB")
+        preview.thumbnail((side, side))
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return width, height, None
+    out = io.BytesIO()
+    preview.save(out, "PNG", optimize=True)
+    return width, height, "data:image/png;base64," + base64.b64encode(out.getvalue()).decode("ascii")
+
+
+def _digest(f):
+    f.seek(0)
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: f.read(CHUNK), b""):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+class Uploads:
+    """Validates and publishes the image files of a request into `directory`"""
+
+    def __init__(self, directory, max_pixels=MAX_PIXELS, max_side=MAX_SIDE, max_file_bytes=MAX_FILE_BYTES):
+        self.directory = directory
+        self.max_pixels = max_pixels
+        self.max_side = max_side
+        self.max_file_bytes = max_file_bytes
+
+    def _part(self, storage):
+        """The UploadPart holding `storage` (copied in chunks when the parser did not use one)"""
+        if isinstance(storage.stream, UploadPart):
+            return storage.stream
+        part = UploadPart(self.directory, self.max_file_bytes)
+        try:
+            storage.stream.seek(0)
+            for chunk in iter(lambda: storage.stream.read(CHUNK), b""):
+                part.write(chunk)
+        except RequestEntityTooLarge:
+            part.discard()
+            raise UploadRejected("حجم الصورة كبير جداً")
+        return part
+
+    def _publish(self, storage, placeholders=True):
+        part = self._part(storage)
+        try:
+            kind, width, height = check_image(part, self.max_pixels, self.max_side)
+            width, height, placeholder = describe(part, width, height) if placeholders else (width, height, None)
+            stem = secure_filename(os.path.splitext(storage.filename)[0])[:40] or "image"
+            filename = f"{stem}-{_digest(part)[:12]}{EXTENSIONS[kind]}"
+            part.publish(os.path.join(self.directory, filename))
+            return SavedImage(f"uploads/{filename}", width, height, placeholder)
+        finally:
+            part.discard()
+
+    def save(self, files, placeholders=True):
+        """Publish the non-empty `files` in parallel; returns ([SavedImage, ...], [error, ...]).
+        With `placeholders` off the images are not decoded (a job describes them later)."""
+        files = [storage for storage in files if storage and storage.filename]
+        futures = [_pool.submit(self._publish, storage, placeholders) for storage in files]
+        saved, errors = [], []
+        for storage, future in zip(files, futures):
+            try:
+                saved.append(future.result())
+            except UploadRejected as e:
+                errors.append(f"{storage.filename}: {e}")
+        return saved, errors
+
+
+def init_uploads(app, directory):
+    """Stream uploads into `directory` with the configured limits; returns the Uploads"""
+    app.config["MAX_CONTENT_LENGTH"] = MAX_CONTENT_LENGTH
+    app.request_class = type("AppUploadRequest", (UploadRequest,), {"upload_dir": directory})
+    uploads = Uploads(directory)
+
+    @app.teardown_request
+    def _discard_upload_parts(exc):
+        for part in request.__dict__.get("upload_parts", ()):
+            part.discard()
+
+    @app.errorhandler(RequestEntityTooLarge)
+    def _too_large(e):
+        message = f"حجم الطلب كبير جداً (الحد {MAX_FILE_BYTES // (1024 * 1024)} ميغابايت للصورة و" \
+                  f"{MAX_CONTENT_LENGTH // (1024 * 1024)} ميغابايت للطلب)"
+        if request.path.startswith("/api/"):
+            return jsonify({"success": False, "error": message}), 413
+        flash(message, "error")
+        return redirect(request.referrer or url_for("index"))
+
+    return uploads
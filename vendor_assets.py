@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+Vendor Assets Tool
+Downloads pinned front-end dependencies into static/vendor/ so pages are
+served without runtime CDN fetches, and exposes a template helper that
+points at the local copies (falling back to the CDN when not vendored).
+
+Usage:
+    python vendor_assets.py            # download everything
+    python vendor_assets.py --force    # re-download even if present
+
+Environment:
+    TAJAWAL_REVISION    google/fonts commit SHA to take the Tajawal TTFs from
+                        (Tajawal stays on Google Fonts until it is set)
+"""
+
+import os
+import re
+import sys
+import shutil
+import argparse
+import urllib.request
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+VENDOR_DIR = os.path.join(BASE_DIR, "static", "vendor")
+
+BOOTSTRAP_VERSION = "5.3.0"
+BOOTSTRAP_ICONS_VERSION = "1.10.0"
+AOS_VERSION = "2.3.1"
+FONT_AWESOME_VERSION = "6.4.0"
+# google/fonts commit the Tajawal TTFs are taken from: a full commit SHA, never
+# a branch, so every build subsets the same files
+TAJAWAL_REVISION = os.getenv("TAJAWAL_REVISION", "")
+
+# key -> (local path relative to static/, CDN url)
+ASSETS = {
+    "bootstrap_rtl_css": (
+        f"vendor/bootstrap-{BOOTSTRAP_VERSION}/bootstrap.rtl.min.css",
+        f"https://cdn.jsdelivr.net/npm/bootstrap@{BOOTSTRAP_VERSION}/dist/css/bootstrap.rtl.min.css",
+    ),
+    "bootstrap_css": (
+        f"vendor/bootstrap-{BOOTSTRAP_VERSION}/bootstrap.min.css",
+        f"https://cdn.jsdelivr.net/npm/bootstrap@{BOOTSTRAP_VERSION}/dist/css/bootstrap.min.css",
+    ),
+    "bootstrap_js": (
+        f"vendor/bootstrap-{BOOTSTRAP_VERSION}/bootstrap.bundle.min.js",
+        f"https://cdn.jsdelivr.net/npm/bootstrap@{BOOTSTRAP_VERSION}/dist/js/bootstrap.bundle.min.js",
+    ),
+    "bootstrap_icons_css": (
+        f"vendor/bootstrap-icons-{BOOTSTRAP_ICONS_VERSION}/bootstrap-icons.css",
+        f"https://cdn.jsdelivr.net/npm/bootstrap-icons@{BOOTSTRAP_ICONS_VERSION}/font/bootstrap-icons.css",
+    ),
+    "bootstrap_icons_woff2": (
+        f"vendor/bootstrap-icons-{BOOTSTRAP_ICONS_VERSION}/fonts/bootstrap-icons.woff2",
+        f"https://cdn.jsdelivr.net/npm/bootstrap-icons@{BOOTSTRAP_ICONS_VERSION}/font/fonts/bootstrap-icons.woff2",
+    ),
+    "bootstrap_icons_woff": (
+        f"vendor/bootstrap-icons-{BOOTSTRAP_ICONS_VERSION}/fonts/bootstrap-icons.woff",
+        f"https://cdn.jsdelivr.net/npm/bootstrap-icons@{BOOTSTRAP_ICONS_VERSION}/font/fonts/bootstrap-icons.woff",
+    ),
+    "aos_css": (
+        f"vendor/aos-{AOS_VERSION}/aos.css",
+        f"https://unpkg.com/aos@{AOS_VERSION}/dist/aos.css",
+    ),
+    "aos_js": (
+        f"vendor/aos-{AOS_VERSION}/aos.js",
+        f"https://unpkg.com/aos@{AOS_VERSION}/dist/aos.js",
+    ),
+    "font_awesome_css": (
+        f"vendor/font-awesome-{FONT_AWESOME_VERSION}/css/all.min.css",
+        f"https://cdnjs.cloudflare.com/ajax/libs/font-awesome/{FONT_AWESOME_VERSION}/css/all.min.css",
+    ),
+    "font_awesome_solid": (
+        f"vendor/font-awesome-{FONT_AWESOME_VERSION}/webfonts/fa-solid-900.woff2",
+        f"https://cdnjs.cloudflare.com/ajax/libs/font-awesome/{FONT_AWESOME_VERSION}/webfonts/fa-solid-900.woff2",
+    ),
+    "font_awesome_regular": (
+        f"vendor/font-awesome-{FONT_AWESOME_VERSION}/webfonts/fa-regular-400.woff2",
+        f"https://cdnjs.cloudflare.com/ajax/libs/font-awesome/{FONT_AWESOME_VERSION}/webfonts/fa-regular-400.woff2",
+    ),
+    "font_awesome_brands": (
+        f"vendor/font-awesome-{FONT_AWESOME_VERSION}/webfonts/fa-brands-400.woff2",
+        f"https://cdnjs.cloudflare.com/ajax/libs/font-awesome/{FONT_AWESOME_VERSION}/webfonts/fa-brands-400.woff2",
+    ),
+    "tajawal_css": (
+        "vendor/tajawal/tajawal.css",
+        "https://fonts.googleapis.com/css2?family=Tajawal:wght@300;400;500;700;800&display=swap",
+    ),
+    "placeholder": (
+        "vendor/placeholder.svg",
+        "https://via.placeholder.com/800x600/667eea/ffffff?text=LUXORA",
+    ),
+}
+
+# Tajawal weights shipped by Google Fonts (there is no 600 cut; browsers
+# synthesize it from 700).
+TAJAWAL_WEIGHTS = {
+    300: "Light",
+    400: "Regular",
+    500: "Medium",
+    700: "Bold",
+    800: "ExtraBold",
+}
+TAJAWAL_SOURCE = "https://github.com/google/fonts/raw/{rev}/ofl/tajawal/Tajawal-{style}.ttf"
+
+# Arabic (+ presentation forms) and Latin glyphs used across the storefront
+SUBSET_UNICODES = [
+    "U+0020-007E",  # Basic Latin
+    "U+00A0-00FF",  # Latin-1 supplement
+    "U+0600-06FF",  # Arabic
+    "U+0750-077F",  # Arabic supplement
+    "U+200C-200F",  # ZWNJ/ZWJ and direction marks
+    "U+2010-2027",  # dashes, quotes, ellipsis
+    "U+FB50-FDFF",  # Arabic presentation forms A
+    "U+FE70-FEFF",  # Arabic presentation forms B
+]
+
+# Font files referenced with <link rel="preload"> on every page
+PRELOAD_FONTS = [
+    "vendor/tajawal/tajawal-400.woff2",
+    "vendor/tajawal/tajawal-700.woff2",
+]
+
+PLACEHOLDER_SVG = """<svg xmlns="http://www.w3.org/2000/svg" width="800" height="600" viewBox="0 0 800 600">
+<defs><linearGradient id="g" x1="0" y1="0" x2="1" y2="1">
+<stop offset="0" stop-color="#667eea"/><stop offset="1" stop-color="#764ba2"/></linearGradient></defs>
+<rect width="800" height="600" fill="url(#g)"/>
+<g fill="none" stroke="#ffffff" stroke-opacity="0.85" stroke-width="14" stroke-linejoin="round">
+<rect x="290" y="210" width="220" height="170" rx="16"/>
+<circle cx="345" cy="262" r="22"/>
+<path d="M300 370l70-70 45 45 40-40 55 55"/></g>
+</svg>
+"""
+
+_local_cache = {}
+
+
+def _static_path(relative):
+    return os.path.join(BASE_DIR, "static", relative)
+
+
+def is_vendored(key):
+    """Return True when the asset has been downloaded into static/vendor/"""
+    if key not in _local_cache:
+        _local_cache[key] = os.path.exists(_static_path(ASSETS[key][0]))
+    return _local_cache[key]
+
+
+def register_vendor_assets(app):
+    """Expose vendor_url()/vendor_preloads() to templates of a Flask app"""
+    from flask import url_for
+
+    def vendor_url(key):
+        local, cdn = ASSETS[key]
+        if is_vendored(key):
+            return url_for("static", filename=local)
+        return cdn
+
+    def vendor_preloads():
+        if not is_vendored("tajawal_css"):
+            return []
+        return [url_for("static", filename=path) for path in PRELOAD_FONTS
+                if os.path.exists(_static_path(path))]
+
+    app.jinja_env.globals["vendor_url"] = vendor_url
+    app.jinja_env.globals["vendor_preloads"] = vendor_preloads
+
+
+def download(url, target, force=False):
+    """Download url into target, skipping files that already exist"""
+    if os.path.exists(target) and not force:
+        print(f"  = {os.path.relpath(target, BASE_DIR)} (cached)")
+        return target
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    tmp_path = target + ".part"
+    request = urllib.request.Request(url, headers={"User-Agent": "luxora-vendor/1.0"})
+    with urllib.request.urlopen(request, timeout=60) as response, open(tmp_path, "wb") as fh:
+        shutil.copyfileobj(response, fh)
+    os.replace(tmp_path, target)
+    print(f"  ✓ {os.path.relpath(target, BASE_DIR)}")
+    return target
+
+
+def subset_font(source, target):
+    """Subset a TTF to Arabic+Latin glyphs and write it as WOFF2"""
+    from fontTools import subset
+
+    options = subset.Options()
+    options.flavor = "woff2"
+    options.layout_features = ["*"]
+    options.name_IDs = ["*"]
+    options.notdef_outline = True
+    font = subset.load_font(source, options)
+    subsetter = subset.Subsetter(options)
+    subsetter.populate(unicodes=subset.parse_unicodes(",".join(SUBSET_UNICODES)))
+    subsetter.subset(font)
+    subset.save_font(font, target, options)
+    font.close()
+
+
+def vendor_tajawal(force=False):
+    """Fetch Tajawal TTFs, subset them and write the @font-face stylesheet"""
+    try:
+        import fontTools.subset  # noqa: F401
+    except ImportError:
+        print("  ⚠️ fontTools not installed - Tajawal stays on Google Fonts (pip install fonttools brotli)")
+        return
+
+    if not re.fullmatch(r"[0-9a-f]{40}", TAJAWAL_REVISION):
+        print("  ⚠️ TAJAWAL_REVISION is not a google/fonts commit SHA - Tajawal stays on Google Fonts")
+        return
+
+    font_dir = _static_path("vendor/tajawal")
+    cache_dir = os.path.join(font_dir, "src")
+    stamp = os.path.join(font_dir, "REVISION")
+
+    # files built from another revision are stale, TTFs left by a failed run included
+    if not force and tajawal_built_revision() not in (None, TAJAWAL_REVISION):
+        print(f"  ↻ Tajawal revision changed - rebuilding from {TAJAWAL_REVISION[:12]}")
+        force = True
+
+    faces = []
+    for weight, style in TAJAWAL_WEIGHTS.items():
+        woff2 = os.path.join(font_dir, f"tajawal-{weight}.woff2")
+        if force or not os.path.exists(woff2):
+            # only fetch the TTF when its subset has to be (re)built
+            ttf = download(TAJAWAL_SOURCE.format(rev=TAJAWAL_REVISION, style=style),
+                           os.path.join(cache_dir, f"Tajawal-{style}.ttf"), force)
+            subset_font(ttf, woff2)
+            print(f"  ✓ subset {os.path.basename(woff2)} ({os.path.getsize(woff2) // 1024} KB)")
+        else:
+            print(f"  = {os.path.relpath(woff2, BASE_DIR)} (cached)")
+        faces.append(
+            "@font-face {\n"
+            "    font-family: 'Tajawal';\n"
+            "    font-style: normal;\n"
+            f"    font-weight: {weight};\n"
+            "    font-display: swap;\n"
+            f"    src: url('tajawal-{weight}.woff2') format('woff2');\n"
+            f"    unicode-range: {', '.join(SUBSET_UNICODES)};\n"
+            "}\n"
+        )
+
+    with open(os.path.join(font_dir, "tajawal.css"), "w", encoding="utf-8") as fh:
+        fh.write("\n".join(faces))
+    with open(stamp, "w", encoding="utf-8") as fh:
+        fh.write(TAJAWAL_REVISION + "\n")
+    shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+def tajawal_built_revision():
+    """google/fonts revision the vendored Tajawal files were built from (None if unknown)"""
+    stamp = _static_path("vendor/tajawal/REVISION")
+    if not os.path.exists(stamp):
+        # files from before the stamp was written can't be trusted either
+        return "" if os.path.exists(_static_path("vendor/tajawal")) else None
+    with open(stamp, encoding="utf-8") as fh:
+        return fh.read().strip()
+
+
+def write_placeholder():
+    """Generate the local image used for products without a photo"""
+    target = _static_path(ASSETS["placeholder"][0])
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with open(target, "w", encoding="utf-8") as fh:
+        fh.write(PLACEHOLDER_SVG)
+    print(f"  ✓ {os.path.relpath(target, BASE_DIR)}")
+
+
+def vendor_all(force=False):
+    """Download every pinned asset into static/vendor/"""
+    print("📦 Vendoring front-end assets...")
+    write_placeholder()
+    for key, (local, cdn) in ASSETS.items():
+        if key in ("tajawal_css", "placeholder"):
+            continue
+        download(cdn, _static_path(local), force)
+    vendor_tajawal(force)
+    _local_cache.clear()
+    print("✅ Assets vendored into static/vendor/")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Download pinned front-end assets")
+    parser.add_argument("--force", action="store_true", help="re-download existing files")
+    args = parser.parse_args()
+    try:
+        vendor_all(force=args.force)
+    except Exception as e:
+        print(f"❌ Vendoring failed: {e}")
+        sys.exit(1)
@@ -0,0 +1,90 @@
+"""
+Order and Request Workflow
+The statuses an order or a product request can be in, their integer codes
+(stored in status_code, which the work queues are indexed on) and the
+transitions admins may make. The text `status` column is kept alongside for
+display and for older code reading it; the repository writes both together.
+
+Codes are part of the stored data: never renumber them, only append.
+"""
+
+
+class InvalidTransition(ValueError):
+    """A status change the workflow doesn't allow (e.g. reopening a delivered order)"""
+
+
+class Workflow:
+    def __init__(self, kind, statuses, transitions, labels):
+        self.kind = kind
+        self.statuses = tuple(statuses)          # index = code
+        self.codes = {name: code for code, name in enumerate(self.statuses)}
+        self.transitions = {name: tuple(transitions.get(name, ())) for name in self.statuses}
+        self.labels = labels
+
+    def code(self, status):
+        try:
+            return self.codes[status]
+        except KeyError:
+            raise ValueError(f"Invalid {self.kind} status {status!r}. Valid options: {list(self.statuses)}")
+
+    def name(self, code):
+        return self.statuses[code]
+
+    def label(self, status):
+        return self.labels.get(status, status)
+
+    def allowed(self, status):
+        """Statuses reachable from `status` in one step"""
+        return self.transitions.get(status, ())
+
+    def check(self, old, new):
+        """Raise InvalidTransition unless old -> new is allowed (staying put is always allowed)"""
+        self.code(new)
+        if old != new and new not in self.allowed(old):
+            raise InvalidTransition(f"{self.kind} cannot go from {old!r} to {new!r}; "
+                                    f"allowed: {list(self.allowed(old)) or 'none (final status)'}")
+
+    def case_sql(self, column="status"):
+        """SQL expression mapping a text status column to its code (unknown -> pending)"""
+        whens = " ".join(f"WHEN '{name}' THEN {code}" for code, name in enumerate(self.statuses))
+        return f"CASE {column} {whens} ELSE {self.codes['pending']} END"
+
+
+# Cash on delivery: a shipped parcel can still come back refused, hence shipped -> cancelled
+ORDERS = Workflow(
+    "orders",
+    ["pending", "processing", "shipped", "delivered", "cancelled"],
+    {
+        "pending": ["processing", "shipped", "cancelled"],
+        "processing": ["shipped", "cancelled"],
+        "shipped": ["delivered", "cancelled"],
+    },
+    {
+        "pending": "قيد الانتظار",
+        "processing": "قيد المعالجة",
+        "shipped": "تم الشحن",
+        "delivered": "تم التسليم",
+        "cancelled": "ملغي",
+    },
+)
+
+# "ordered" requests are the ones logged by a placed order
+REQUESTS = Workflow(
+    "requests",
+    ["pending", "approved", "rejected", "completed", "ordered"],
+    {
+        "pending": ["approved", "rejected", "completed", "ordered"],
+        "approved": ["completed", "rejected", "pending"],
+        "ordered": ["approved", "completed", "rejected"],
+        "rejected": ["pending"],
+    },
+    {
+        "pending": "قيد الانتظار",
+        "approved": "مقبول",
+        "rejected": "مرفوض",
+        "completed": "مكتمل",
+        "ordered": "تم الطلب",
+    },
+)
+
+WORKFLOWS = {workflow.kind: workflow for workflow in (ORDERS, REQUESTS)}